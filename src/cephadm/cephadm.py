@@ -17,6 +17,7 @@ import sys
 import tempfile
 import time
 import errno
+import hashlib
 import ssl
 from typing import Dict, List, Tuple, Optional, Union, Any, Callable, Sequence, TypeVar, cast
 
@@ -199,6 +200,7 @@ from cephadmlib.listing_updaters import (
     CPUUsageStatusUpdater,
     CoreStatusUpdater,
     DigestsStatusUpdater,
+    ImageCache,
     MemUsageStatusUpdater,
     VersionStatusUpdater,
 )
@@ -1268,6 +1270,10 @@ class CephadmAgent(DaemonForm):
     daemon_type = 'agent'
     default_port = 8498
     loop_interval = 30
+    # every so many reports carry all sections, changed or not
+    full_report_interval = 10
+    # host facts that change all the time and don't make a report "changed"
+    volatile_facts = ['timestamp', 'system_uptime', 'cpu_load', 'memory_free_kb', 'memory_available_kb']
     stop = False
 
     required_files = [
@@ -1314,6 +1320,9 @@ class CephadmAgent(DaemonForm):
         self.recent_iteration_run_times: List[float] = [0.0, 0.0, 0.0]
         self.recent_iteration_index: int = 0
         self.cached_ls_values: Dict[str, Dict[str, str]] = {}
+        self.report_seq = 0
+        self.full_report_seq = 0
+        self.acked_digests: Dict[str, str] = {}
         self.ssl_ctx = ssl.create_default_context()
         self.ssl_ctx.check_hostname = True
         self.ssl_ctx.verify_mode = ssl.CERT_REQUIRED
@@ -1447,13 +1456,16 @@ class CephadmAgent(DaemonForm):
                 for k, v in networks[key].items():
                     networks_list[key][k] = list(v)
 
+            report, digests = self._delta_report({
+                'ls': (self.ls_gatherer.data if self.ack == self.ls_gatherer.ack
+                       and self.ls_gatherer.data is not None else []),
+                'networks': networks_list,
+                'facts': HostFacts(self.ctx).dump(),
+                'volume': (self.volume_gatherer.data if self.ack == self.volume_gatherer.ack
+                           and self.volume_gatherer.data is not None else ''),
+            })
             data = json.dumps({'host': self.host,
-                               'ls': (self.ls_gatherer.data if self.ack == self.ls_gatherer.ack
-                                      and self.ls_gatherer.data is not None else []),
-                               'networks': networks_list,
-                               'facts': HostFacts(self.ctx).dump(),
-                               'volume': (self.volume_gatherer.data if self.ack == self.volume_gatherer.ack
-                                          and self.volume_gatherer.data is not None else ''),
+                               **report,
                                'ack': str(ack),
                                'keyring': self.keyring,
                                'port': self.listener_port})
@@ -1470,6 +1482,12 @@ class CephadmAgent(DaemonForm):
                     logger.error(f'HTTP error {status} while querying agent endpoint: {response}')
                     raise RuntimeError(f'non-200 response <{status}> from agent endpoint: {response}')
                 response_json = json.loads(response)
+                if response_json.get('seq') == report['seq']:
+                    self.acked_digests = digests
+                elif response_json.get('resync'):
+                    # the mgr could not apply our delta: send everything, now
+                    self.acked_digests = {}
+                    self.wakeup()
                 total_request_time = datetime.timedelta(seconds=(time.monotonic() - send_time)).total_seconds()
                 logger.info(f'Received mgr response: "{response_json["result"]}" {total_request_time} seconds after sending request.')
             except Exception as e:
@@ -1484,6 +1502,39 @@ class CephadmAgent(DaemonForm):
             self.event.wait(max(self.loop_interval - int(run_time_average), 0))
             self.event.clear()
 
+    @classmethod
+    def _section_digest(cls, name: str, value: Any) -> str:
+        if name == 'facts':
+            facts = json.loads(value)
+            for key in cls.volatile_facts:
+                facts.pop(key, None)
+            value = facts
+        return hashlib.sha1(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _delta_report(self, sections: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """Build the metadata sections of the next report to the mgr.
+
+        Sections whose digest matches the one of the last report the mgr
+        acknowledged are left out; the mgr finds them by their digest and
+        asks for a full report if it can't.
+        """
+        self.report_seq += 1
+        full = (not self.acked_digests
+                or self.report_seq - self.full_report_seq >= self.full_report_interval)
+        if full:
+            self.full_report_seq = self.report_seq
+        digests: Dict[str, str] = {}
+        report: Dict[str, Any] = {'seq': self.report_seq, 'digests': digests}
+        for name, value in sections.items():
+            if not value:
+                # not gathered (yet) for the current ack
+                report[name] = value
+                continue
+            digests[name] = self._section_digest(name, value)
+            if full or self.acked_digests.get(name) != digests[name]:
+                report[name] = value
+        return report, digests
+
     def _ceph_volume(self, enhanced: bool = False) -> Tuple[str, bool]:
         self.ctx.command = 'inventory --format=json'.split()
         if enhanced:
@@ -3358,11 +3409,16 @@ def list_daemons(
     type_of_daemon: Optional[str] = None,
 ) -> List[Dict[str, str]]:
     _updater: DaemonStatusUpdater = NoOpDaemonStatusUpdater()
+    # image digests and versions are kept on disk, keyed by image id, so
+    # that we don't have to exec into the containers on every listing
+    image_cache = ImageCache()
+    if legacy_dir is None:
+        image_cache = ImageCache.for_data_dir(ctx.data_dir)
     if detail:
         detail_updaters = [
             CoreStatusUpdater(),
-            DigestsStatusUpdater(),
-            VersionStatusUpdater(),
+            DigestsStatusUpdater(image_cache),
+            VersionStatusUpdater(image_cache),
             MemUsageStatusUpdater(),
             CPUUsageStatusUpdater(),
         ]
@@ -3374,7 +3430,9 @@ def list_daemons(
         daemon_name=daemon_name,
         daemon_type=type_of_daemon,
     )
-    return [_updater.expand(ctx, entry) for entry in daemon_entries]
+    result = [_updater.expand(ctx, entry) for entry in daemon_entries]
+    image_cache.save()
+    return result
 
 
 def get_daemon_description(ctx, fsid, name, detail=False, legacy_dir=None):
@@ -4375,6 +4433,57 @@ def command_gather_facts(ctx: CephadmContext) -> None:
     print(host.dump())
 
 
+def _gather_inventory(ctx: CephadmContext) -> Any:
+    if not ctx.command:
+        ctx.command = ['inventory', '--format=json']
+    stream = io.StringIO()
+    try:
+        with redirect_stdout(stream):
+            command_ceph_volume(ctx)
+    except RuntimeError:
+        # older ceph-volume releases do not know about --filter-for-batch
+        if '--filter-for-batch' not in ctx.command:
+            raise
+        ctx.command = [a for a in ctx.command if a != '--filter-for-batch']
+        stream = io.StringIO()
+        with redirect_stdout(stream):
+            command_ceph_volume(ctx)
+    return json.loads(stream.getvalue())
+
+
+def command_gather(ctx: CephadmContext) -> None:
+    """Return the requested sections of `ls`, `gather-facts`,
+    `list-networks` and `ceph-volume inventory` as a single JSON document.
+
+    A section that fails is left out and its error is reported under
+    "errors", so that one failing section does not hide the others.
+    """
+    sections: Dict[str, Callable[[CephadmContext], Any]] = {}
+    if ctx.ls:
+        sections['ls'] = lambda ctx: list_daemons(
+            ctx, detail=not ctx.no_detail, legacy_dir=ctx.legacy_dir)
+    if ctx.facts:
+        sections['facts'] = lambda ctx: json.loads(HostFacts(ctx).dump())
+    if ctx.networks:
+        sections['networks'] = list_networks
+    # run ceph-volume last: it takes the cluster lock
+    if ctx.inventory:
+        sections['inventory'] = _gather_inventory
+
+    result: Dict[str, Any] = {'errors': {}}
+    for name, func in sections.items():
+        try:
+            result[name] = func(ctx)
+        except Exception as e:
+            logger.debug(f'gather: {name} failed: {e}')
+            result['errors'][name] = str(e) or type(e).__name__
+
+    def serialize_sets(obj: Any) -> Any:
+        return list(obj) if isinstance(obj, set) else obj
+
+    print(json.dumps(result, indent=4, default=serialize_sets))
+
+
 ##################################
 
 
@@ -5240,6 +5349,40 @@ def _get_parser():
         'gather-facts', help='gather and return host related information (JSON format)')
     parser_gather_facts.set_defaults(func=command_gather_facts)
 
+    parser_gather = subparsers.add_parser(
+        'gather', help='gather several kinds of host information at once (JSON format)')
+    parser_gather.set_defaults(func=command_gather)
+    parser_gather.add_argument(
+        '--fsid',
+        help='cluster FSID')
+    parser_gather.add_argument(
+        '--ls',
+        action='store_true',
+        help='include the daemon listing (as `cephadm ls`)')
+    parser_gather.add_argument(
+        '--no-detail',
+        action='store_true',
+        help='Do not include daemon status')
+    parser_gather.add_argument(
+        '--legacy-dir',
+        default='/',
+        help='base directory for legacy daemon data')
+    parser_gather.add_argument(
+        '--facts',
+        action='store_true',
+        help='include host facts (as `cephadm gather-facts`)')
+    parser_gather.add_argument(
+        '--networks',
+        action='store_true',
+        help='include IP networks (as `cephadm list-networks`)')
+    parser_gather.add_argument(
+        '--inventory',
+        action='store_true',
+        help='include the device inventory (as `cephadm ceph-volume inventory`)')
+    parser_gather.add_argument(
+        'command', nargs=argparse.REMAINDER,
+        help='ceph-volume arguments used for the inventory (default: inventory --format=json)')
+
     parser_maintenance = subparsers.add_parser(
         'host-maintenance', help='Manage the maintenance state of a host')
     parser_maintenance.add_argument(
@@ -372,6 +372,76 @@ def parsed_container_stats(
     return _parse_container_stats(out, err, code)
 
 
+def _container_list_stats(
+    ctx: CephadmContext,
+    *,
+    container_path: str = '',
+    name_prefix: str = 'ceph-',
+) -> Tuple[str, str, int]:
+    """returns container name, id, image name, image id, created time, and
+    ceph version for all containers with a name starting with name_prefix,
+    using one ps and one inspect call
+    """
+    container_path = container_path or ctx.container_engine.path
+    out, err, code = call(
+        ctx,
+        [
+            container_path,
+            'ps',
+            '-a',
+            '--no-trunc',
+            '--format',
+            '{{.Names}}',
+        ],
+        verbosity=CallVerbosity.QUIET,
+    )
+    if code != 0:
+        return out, err, code
+    names = [n for n in out.split() if n.startswith(name_prefix)]
+    if not names:
+        return '', '', 0
+    cmd = [
+        container_path,
+        'inspect',
+        '--format',
+        '{{.Name}},{{.Id}},{{.Config.Image}},{{.Image}},{{.Created}},{{index .Config.Labels "io.ceph.version"}}',
+    ] + names
+    out, err, code = call(ctx, cmd, verbosity=CallVerbosity.QUIET)
+    return out, err, code
+
+
+def _parse_container_list_stats(
+    out: str, err: str, code: int
+) -> Optional[Dict[str, ContainerInfo]]:
+    if code != 0:
+        return None
+    result = {}
+    for line in out.splitlines():
+        fields = line.strip().split(',')
+        if len(fields) != 6:
+            logger.debug('unable to parse container stats line: %r', line)
+            continue
+        # docker reports container names with a leading slash
+        name = fields[0].lstrip('/')
+        result[name] = ContainerInfo(*fields[1:])
+    return result
+
+
+def parsed_container_list_stats(
+    ctx: CephadmContext,
+    *,
+    container_path: str = '',
+) -> Optional[Dict[str, ContainerInfo]]:
+    """Return a mapping of container name to ContainerInfo for all ceph
+    containers on the host, or None if the container engine could not be
+    queried.
+    """
+    out, err, code = _container_list_stats(
+        ctx, container_path=container_path
+    )
+    return _parse_container_list_stats(out, err, code)
+
+
 def _container_image_stats(
     ctx: CephadmContext, image_name: str, *, container_path: str = ''
 ) -> Tuple[str, str, int]:
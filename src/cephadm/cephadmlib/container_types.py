@@ -678,11 +678,25 @@ def get_mgr_images() -> dict:
 
 
 def get_container_stats(
-    ctx: CephadmContext, identity: DaemonIdentity, *, container_path: str = ''
+    ctx: CephadmContext,
+    identity: DaemonIdentity,
+    *,
+    container_path: str = '',
+    known: Optional[Dict[str, ContainerInfo]] = None,
 ) -> Optional[ContainerInfo]:
-    """returns container id, image name, image id, created time, and ceph version if available"""
+    """returns container id, image name, image id, created time, and ceph version if available
+
+    If known is given it should map container names to ContainerInfo objects
+    that were already gathered (see parsed_container_list_stats); only
+    containers missing from it are inspected individually.
+    """
     c = CephContainer.for_daemon(ctx, identity, 'bash')
-    for name in (c.cname, c.old_cname):
+    names = (c.cname, c.old_cname)
+    if known:
+        for name in names:
+            if name in known:
+                return known[name]
+    for name in names:
         ci = parsed_container_stats(ctx, name, container_path=container_path)
         if ci is not None:
             return ci
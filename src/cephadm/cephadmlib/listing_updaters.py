@@ -1,15 +1,19 @@
 # Additional types to help with container & daemon listing
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import json
 import logging
 import os
+import time
 
 from .call_wrappers import call, CallVerbosity
+from .constants import DATA_DIR_MODE
 from .container_engines import (
+    ContainerInfo,
     normalize_container_id,
     parsed_container_cpu_perc,
+    parsed_container_list_stats,
     parsed_container_mem_usage,
 )
 from .container_types import get_container_stats
@@ -28,19 +32,132 @@ from .daemons import (
 )
 from .daemons.ceph import ceph_daemons
 from .data_utils import normalize_image_digest, try_convert_datetime
-from .file_utils import get_file_timestamp
+from .file_utils import get_file_timestamp, write_new
 from .listing import DaemonStatusUpdater
-from .systemd import check_unit
+from .systemd import check_unit, check_unit_states
 
 
 logger = logging.getLogger()
 
 
+class ImageCache:
+    """Cache of container image metadata (repo digests and the software
+    versions found inside the image) keyed by image id. When a path is given
+    the cache is loaded from and saved to that file so that the values can
+    be reused across cephadm invocations.
+    """
+
+    # repo digests can change when an image is re-tagged or pushed to
+    # another registry, the versions inside an image id never do
+    digests_ttl = 600
+    # drop images that have not been used for this long
+    max_age = 30 * 24 * 60 * 60
+
+    def __init__(self, path: str = '') -> None:
+        self.path = path
+        self._images: Dict[str, Dict[str, Any]] = {}
+        self._loaded = False
+        self._dirty = False
+
+    @classmethod
+    def for_data_dir(cls, data_dir: str) -> 'ImageCache':
+        return cls(os.path.join(data_dir, 'cache', 'images.json'))
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'r') as f:
+                images = json.load(f).get('images', {})
+            if isinstance(images, dict):
+                self._images = images
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            logger.debug('ignoring image cache %s: %s', self.path, e)
+
+    def _entry(self, image_id: str, create: bool = False) -> Dict[str, Any]:
+        self._load()
+        now = int(time.time())
+        entry = self._images.get(image_id)
+        if entry is None:
+            if not create:
+                return {}
+            entry = self._images[image_id] = {'versions': {}}
+        if now - entry.get('used', 0) > 24 * 60 * 60:
+            entry['used'] = now
+            self._dirty = True
+        return entry
+
+    def get_version(self, image_id: str, kind: str) -> Optional[str]:
+        return self._entry(image_id).get('versions', {}).get(kind)
+
+    def set_version(self, image_id: str, kind: str, version: str) -> None:
+        entry = self._entry(image_id, create=True)
+        versions = entry.setdefault('versions', {})
+        if versions.get(kind) != version:
+            versions[kind] = version
+            self._dirty = True
+
+    def get_digests(self, image_id: str) -> Optional[List[str]]:
+        entry = self._entry(image_id)
+        if time.time() - entry.get('digests_updated', 0) > self.digests_ttl:
+            return None
+        return entry.get('digests')
+
+    def set_digests(self, image_id: str, digests: List[str]) -> None:
+        entry = self._entry(image_id, create=True)
+        entry['digests'] = digests
+        entry['digests_updated'] = int(time.time())
+        self._dirty = True
+
+    def save(self) -> None:
+        if not self.path or not self._dirty:
+            return
+        now = time.time()
+        self._images = {
+            image_id: entry
+            for image_id, entry in self._images.items()
+            if now - entry.get('used', 0) <= self.max_age
+        }
+        cache_dir = os.path.dirname(self.path)
+        try:
+            if not os.path.isdir(cache_dir):
+                if not os.path.isdir(os.path.dirname(cache_dir)):
+                    return  # no data dir, nothing is deployed here
+                os.mkdir(cache_dir, DATA_DIR_MODE)
+            with write_new(self.path, perms=0o600) as f:
+                json.dump({'images': self._images}, f)
+            self._dirty = False
+        except OSError as e:
+            logger.debug('unable to save image cache %s: %s', self.path, e)
+
+
 class CoreStatusUpdater(DaemonStatusUpdater):
     def __init__(self, keep_container_info: str = '') -> None:
         # set keep_container_info to a custom key that will be used to cache
         # the ContainerInfo object in the status dict.
         self.keep_container_info = keep_container_info
+        self._loaded = False
+        self.seen_containers: Optional[Dict[str, ContainerInfo]] = None
+        self.unit_states: Dict[str, Tuple[bool, str, bool]] = {}
+
+    def _load(self, ctx: CephadmContext) -> None:
+        # inspect all the ceph containers and query the state of all the
+        # ceph units at once, instead of once or twice per daemon. daemons
+        # missing from the results (or all of them, if this fails) are
+        # looked up individually by get_container_stats and check_unit
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            self.seen_containers = parsed_container_list_stats(ctx)
+        except Exception as e:
+            logger.debug('unable to list container stats: %s', e)
+        self.unit_states = check_unit_states(ctx, 'ceph-*@*.service')
 
     def update(
         self,
@@ -49,7 +166,11 @@ class CoreStatusUpdater(DaemonStatusUpdater):
         identity: DaemonIdentity,
         data_dir: str,
     ) -> None:
-        enabled, state, _ = check_unit(ctx, identity.unit_name)
+        self._load(ctx)
+        unit_state = self.unit_states.get(identity.unit_name)
+        if unit_state is None:
+            unit_state = check_unit(ctx, identity.unit_name)
+        enabled, state, _ = unit_state
         val['enabled'] = enabled
         val['state'] = state
 
@@ -58,7 +179,9 @@ class CoreStatusUpdater(DaemonStatusUpdater):
         daemon_dir = os.path.join(
             data_dir, identity.fsid, identity.daemon_name
         )
-        cinfo = get_container_stats(ctx, identity)
+        cinfo = get_container_stats(
+            ctx, identity, known=self.seen_containers
+        )
         if self.keep_container_info:
             val[self.keep_container_info] = cinfo
         if cinfo:
@@ -128,8 +251,8 @@ class CoreStatusUpdater(DaemonStatusUpdater):
 
 
 class DigestsStatusUpdater(DaemonStatusUpdater):
-    def __init__(self) -> None:
-        self.seen_digests: Dict[str, List[str]] = {}
+    def __init__(self, image_cache: Optional[ImageCache] = None) -> None:
+        self.image_cache = image_cache or ImageCache()
 
     def update(
         self,
@@ -145,7 +268,7 @@ class DigestsStatusUpdater(DaemonStatusUpdater):
             val['container_image_digests'] = None
             return  # container info missing or no longer running?
         container_path = ctx.container_engine.path
-        image_digests = self.seen_digests.get(image_id)
+        image_digests = self.image_cache.get_digests(image_id)
         if not image_digests:
             out, err, code = call(
                 ctx,
@@ -168,13 +291,40 @@ class DigestsStatusUpdater(DaemonStatusUpdater):
                         )
                     )
                 )
-                self.seen_digests[image_id] = image_digests
+                self.image_cache.set_digests(image_id, image_digests)
         val['container_image_digests'] = image_digests
 
 
 class VersionStatusUpdater(DaemonStatusUpdater):
-    def __init__(self) -> None:
-        self.seen_versions: Dict[str, Optional[str]] = {}
+    def __init__(self, image_cache: Optional[ImageCache] = None) -> None:
+        self.image_cache = image_cache or ImageCache()
+
+    @staticmethod
+    def _version_kind(daemon_type: str) -> str:
+        # all the ceph daemons share the version of the ceph packages
+        if daemon_type in ceph_daemons():
+            return 'ceph'
+        return daemon_type
+
+    def _seen_version(
+        self, image_id: Optional[str], daemon_type: str
+    ) -> Optional[str]:
+        if not image_id:
+            return None
+        return self.image_cache.get_version(
+            image_id, self._version_kind(daemon_type)
+        )
+
+    def _remember_version(
+        self,
+        image_id: Optional[str],
+        daemon_type: str,
+        version: Optional[str],
+    ) -> None:
+        if image_id and version:
+            self.image_cache.set_version(
+                image_id, self._version_kind(daemon_type), version
+            )
 
     def update(
         self,
@@ -193,7 +343,7 @@ class VersionStatusUpdater(DaemonStatusUpdater):
             return  # container info missing or no longer running?
         # identify software version inside the container (if we can)
         if not version or '.' not in version:
-            version = self.seen_versions.get(image_id, None)
+            version = self._seen_version(image_id, daemon_type)
         if daemon_type == NFSGanesha.daemon_type:
             version = NFSGanesha.get_version(ctx, container_id)
         if daemon_type == CephIscsi.daemon_type:
@@ -217,7 +367,7 @@ class VersionStatusUpdater(DaemonStatusUpdater):
                 )
                 if not code and out.startswith('ceph version '):
                     version = out.split(' ')[2]
-                    self.seen_versions[image_id] = version
+                    self._remember_version(image_id, daemon_type, version)
             elif daemon_type == 'grafana':
                 out, err, code = call(
                     ctx,
@@ -233,7 +383,7 @@ class VersionStatusUpdater(DaemonStatusUpdater):
                 )
                 if not code and out.startswith('Version '):
                     version = out.split(' ')[1]
-                    self.seen_versions[image_id] = version
+                    self._remember_version(image_id, daemon_type, version)
             elif daemon_type in [
                 'prometheus',
                 'alertmanager',
@@ -245,7 +395,7 @@ class VersionStatusUpdater(DaemonStatusUpdater):
                 version = Monitoring.get_version(
                     ctx, container_id, daemon_type
                 )
-                self.seen_versions[image_id] = version
+                self._remember_version(image_id, daemon_type, version)
             elif daemon_type == 'haproxy':
                 out, err, code = call(
                     ctx,
@@ -264,7 +414,7 @@ class VersionStatusUpdater(DaemonStatusUpdater):
                     or out.startswith('HAProxy version ')
                 ):
                     version = out.split(' ')[2]
-                    self.seen_versions[image_id] = version
+                    self._remember_version(image_id, daemon_type, version)
             elif daemon_type == 'keepalived':
                 out, err, code = call(
                     ctx,
@@ -281,7 +431,7 @@ class VersionStatusUpdater(DaemonStatusUpdater):
                     version = err.split(' ')[1]
                     if version[0] == 'v':
                         version = version[1:]
-                    self.seen_versions[image_id] = version
+                    self._remember_version(image_id, daemon_type, version)
             elif daemon_type == CustomContainer.daemon_type:
                 # Because a custom container can contain
                 # everything, we do not know which command
@@ -291,13 +441,13 @@ class VersionStatusUpdater(DaemonStatusUpdater):
                 version = SNMPGateway.get_version(
                     ctx, identity.fsid, identity.daemon_id
                 )
-                self.seen_versions[image_id] = version
+                self._remember_version(image_id, daemon_type, version)
             elif daemon_type == MgmtGateway.daemon_type:
                 version = MgmtGateway.get_version(ctx, container_id)
-                self.seen_versions[image_id] = version
+                self._remember_version(image_id, daemon_type, version)
             elif daemon_type == OAuth2Proxy.daemon_type:
                 version = OAuth2Proxy.get_version(ctx, container_id)
-                self.seen_versions[image_id] = version
+                self._remember_version(image_id, daemon_type, version)
             else:
                 logger.warning(
                     'version for unknown daemon type %s' % daemon_type
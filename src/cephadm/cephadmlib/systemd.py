@@ -2,7 +2,7 @@
 
 import logging
 
-from typing import Tuple, List
+from typing import Dict, Tuple, List
 
 from .context import CephadmContext
 from .call_wrappers import call, CallVerbosity
@@ -54,6 +54,70 @@ def check_unit(ctx: CephadmContext, unit_name: str) -> Tuple[bool, str, bool]:
     return (enabled, state, installed)
 
 
+# the states `systemctl is-enabled` exits with 0 for
+_ENABLED_UNIT_FILE_STATES = {
+    'enabled',
+    'enabled-runtime',
+    'alias',
+    'static',
+    'indirect',
+    'generated',
+    'transient',
+}
+
+
+def check_unit_states(
+    ctx: CephadmContext, pattern: str
+) -> Dict[str, Tuple[bool, str, bool]]:
+    """Return the result check_unit() would have for each loaded unit
+    matching pattern, keyed by unit name without the .service suffix, using
+    a single systemctl call. Units that are not loaded are left out.
+    """
+    try:
+        out, err, code = call(
+            ctx,
+            [
+                'systemctl',
+                'show',
+                '--property=Id,LoadState,UnitFileState,ActiveState,SubState',
+                '--',
+                pattern,
+            ],
+            verbosity=CallVerbosity.QUIET,
+        )
+    except Exception as e:
+        logger.warning('unable to run systemctl: %s' % e)
+        return {}
+    if code != 0:
+        return {}
+    result = {}
+    for block in out.split('\n\n'):
+        props = dict(
+            line.split('=', 1) for line in block.splitlines() if '=' in line
+        )
+        unit_name = props.get('Id', '')
+        if not unit_name or props.get('LoadState') != 'loaded':
+            continue
+        if unit_name.endswith('.service'):
+            unit_name = unit_name[: -len('.service')]
+        file_state = props.get('UnitFileState', '')
+        enabled = file_state in _ENABLED_UNIT_FILE_STATES
+        installed = enabled or file_state == 'disabled'
+        # ActiveState is what `systemctl is-active` prints, a unit waiting
+        # to auto-restart is 'activating' there
+        active = props.get('ActiveState', '')
+        if active == 'active':
+            state = 'running'
+        elif active == 'inactive':
+            state = 'stopped'
+        elif active == 'failed':
+            state = 'error'
+        else:
+            state = 'unknown'
+        result[unit_name] = (enabled, state, installed)
+    return result
+
+
 def check_units(ctx: CephadmContext, units: List[str]) -> bool:
     for u in units:
         (enabled, state, installed) = check_unit(ctx, u)
@@ -491,7 +491,7 @@ def test_agent_run(_pull_conf_settings, _port_in_use, _gatherer_start,
 
     _port_in_use.side_effect = _fake_port_in_use
     _is_alive.return_value = False
-    _HF_dump.return_value = 'Host Facts'
+    _HF_dump.return_value = json.dumps({'hostname': host, 'timestamp': 1.0})
     _list_networks.return_value = network_data
     _urlopen.side_effect = lambda *args, **kwargs: FakeHTTPResponse()
     _RQ_init.side_effect = lambda *args, **kwargs: None
@@ -526,12 +526,17 @@ def test_agent_run(_pull_conf_settings, _port_in_use, _gatherer_start,
         with pytest.raises(EventCleared, match='SUCCESS'):
             agent.run()
 
-        expected_data = {
-           'host': host,
+        sections = {
            'ls': [{'valid_daemon': 'valid_metadata'}],
            'networks': network_data_no_sets,
-           'facts': 'Host Facts',
+           'facts': _HF_dump.return_value,
            'volume': 'ceph-volume inventory data',
+        }
+        expected_data = {
+           'host': host,
+           'seq': 1,
+           'digests': {k: agent._section_digest(k, v) for k, v in sections.items()},
+           **sections,
            'ack': str(7),
            'keyring': 'agent keyring',
            'port': str(open_listener_port)
@@ -557,6 +562,41 @@ def test_agent_run(_pull_conf_settings, _port_in_use, _gatherer_start,
             agent.run()
 
 
+def test_agent_delta_report():
+    with with_cephadm_ctx([]) as ctx:
+        agent = _cephadm.CephadmAgent(ctx, FSID, AGENT_ID)
+        sections = {
+            'ls': [{'name': 'mon.a'}],
+            'networks': {'10.2.1.0/24': {'eth1': ['10.2.1.122']}},
+            'facts': json.dumps({'hostname': 'host1', 'timestamp': 1.0}),
+            'volume': '',
+        }
+
+        # nothing acknowledged yet: everything is sent
+        report, digests = agent._delta_report(sections)
+        assert report['seq'] == 1
+        assert [k for k in sections if k in report] == ['ls', 'networks', 'facts', 'volume']
+        assert set(digests) == {'ls', 'networks', 'facts'}
+        agent.acked_digests = digests
+
+        # only changed sections are sent, volatile facts don't count as a change
+        sections['ls'] = [{'name': 'mon.a'}, {'name': 'mgr.x'}]
+        sections['facts'] = json.dumps({'hostname': 'host1', 'timestamp': 2.0})
+        report, digests = agent._delta_report(sections)
+        assert report['seq'] == 2
+        assert [k for k in sections if k in report] == ['ls', 'volume']
+        assert report['digests'] == digests
+        agent.acked_digests = digests
+
+        # a full report every full_report_interval reports
+        for _ in range(agent.full_report_interval - 2):
+            report, _ = agent._delta_report(sections)
+            assert 'networks' not in report
+        report, _ = agent._delta_report(sections)
+        assert report['seq'] == agent.full_report_interval + 1
+        assert 'networks' in report
+
+
 @mock.patch("cephadm.CephadmAgent.pull_conf_settings")
 @mock.patch("cephadm.CephadmAgent.wakeup")
 def test_mgr_listener_handle_json_payload(_agent_wakeup, _pull_conf_settings, cephadm_fs):
@@ -2209,6 +2209,53 @@ class TestCephVolume(object):
             assert ctx.keyring == 'bar'
 
 
+class TestGather(object):
+
+    fsid = '00000000-0000-0000-0000-0000deadbeef'
+    image = 'quay.io/ceph/ceph:v18'
+
+    def test_sections(self, cephadm_fs, funkypatch, capsys):
+        _call = funkypatch.patch('cephadmlib.call_wrappers.call', force=True)
+        _call.side_effect = lambda ctx, cmd, *args, **kwargs: (
+            ('[{"path": "/dev/sdb"}]', '', 0) if 'inventory' in cmd else ('', '', 0))
+        funkypatch.patch('cephadm.list_daemons').return_value = [{'name': 'mon.a'}]
+        funkypatch.patch('cephadm.list_networks').return_value = {
+            '10.0.0.0/8': {'eth0': {'10.1.2.3'}},
+        }
+
+        cmd = ['--image', self.image, 'gather', '--fsid', self.fsid,
+               '--ls', '--networks', '--inventory']
+        with with_cephadm_ctx(cmd, mock_cephadm_call_fn=False) as ctx:
+            _cephadm.command_gather(ctx)
+        out = json.loads(capsys.readouterr().out)
+        assert out == {
+            'errors': {},
+            'ls': [{'name': 'mon.a'}],
+            'networks': {'10.0.0.0/8': {'eth0': ['10.1.2.3']}},
+            'inventory': [{'path': '/dev/sdb'}],
+        }
+        assert _call.call_args[0][1][-2:] == ['inventory', '--format=json']
+
+    def test_errors(self, cephadm_fs, funkypatch, capsys):
+        _call = funkypatch.patch('cephadmlib.call_wrappers.call', force=True)
+        _call.side_effect = lambda ctx, cmd, *args, **kwargs: (
+            ('', 'unrecognized arguments', 1) if 'inventory' in cmd else ('', '', 0))
+        funkypatch.patch('cephadm.list_daemons').return_value = []
+
+        cmd = ['--image', self.image, 'gather', '--fsid', self.fsid, '--ls', '--inventory',
+               '--', 'inventory', '--format=json', '--filter-for-batch']
+        with with_cephadm_ctx(cmd, mock_cephadm_call_fn=False) as ctx:
+            _cephadm.command_gather(ctx)
+        out = json.loads(capsys.readouterr().out)
+        assert out['ls'] == []
+        assert 'inventory' not in out
+        assert 'unrecognized arguments' in out['errors']['inventory']
+        # retried once without --filter-for-batch
+        inventory_calls = [c[0][1] for c in _call.call_args_list if 'inventory' in c[0][1]]
+        assert len(inventory_calls) == 2
+        assert '--filter-for-batch' not in inventory_calls[-1]
+
+
 class TestIscsi:
     def test_unit_run(self, cephadm_fs, funkypatch):
         funkypatch.patch(
@@ -1,5 +1,6 @@
 import pathlib
 import json
+from unittest import mock
 
 import pytest
 
@@ -229,6 +230,58 @@ def test_list_daemons_detail_minimal(cephadm_fs, funkypatch):
     edl.assert_checked_all()
 
 
+def test_list_daemons_detail_unit_states(cephadm_fs, funkypatch):
+    _cephadm = import_cephadm()
+    _call = funkypatch.patch('cephadmlib.call_wrappers.call')
+
+    fsid = 'dc93cfee-ddc5-11ef-a056-525400220000'
+    unit_cmds = []
+
+    def _fake_call(ctx, cmd, *args, **kwargs):
+        out = ''
+        if 'show' in cmd and cmd[0] == 'systemctl':
+            out = '\n'.join([
+                f'Id=ceph-{fsid}@mon.ceph0.service',
+                'LoadState=loaded',
+                'ActiveState=active',
+                'SubState=running',
+                'UnitFileState=enabled',
+                '',
+                f'Id=ceph-{fsid}@mgr.ceph0.zzzabc.service',
+                'LoadState=loaded',
+                'ActiveState=failed',
+                'SubState=failed',
+                'UnitFileState=enabled',
+                '',
+            ])
+        elif 'is-active' in cmd or 'is-enabled' in cmd:
+            unit_cmds.append(cmd)
+            out = 'active'
+        elif 'inspect' in cmd:
+            # no containers
+            return '', '', 1
+        return out, '', 0
+
+    _call.side_effect = _fake_call
+
+    fake_ceph = pathlib.Path('/var/tmp/_lib/fake/ceph')
+    cluster_dir = fake_ceph / fsid
+    for name in ['mon.ceph0', 'mgr.ceph0.zzzabc', 'osd.3']:
+        (cluster_dir / name).mkdir(parents=True)
+
+    with with_cephadm_ctx([], mock_cephadm_call_fn=False) as ctx:
+        ctx.data_dir = str(fake_ceph)
+        dl = _cephadm.list_daemons(ctx)
+    edl = _EntryHelper(dl)
+    assert edl.get('mon.ceph0')['state'] == 'running'
+    assert edl.get('mon.ceph0')['enabled'] == True
+    assert edl.get('mgr.ceph0.zzzabc')['state'] == 'error'
+    # osd.3 is not loaded, it is checked on its own
+    assert edl.get('osd.3')['state'] == 'running'
+    edl.assert_checked_all()
+    assert [cmd[-1] for cmd in unit_cmds] == [f'ceph-{fsid}@osd.3'] * 2
+
+
 def test_core_status_update_no_cinfo(cephadm_fs, funkypatch):
     _cephadm = import_cephadm()
 
@@ -558,3 +611,114 @@ fsid = {fsid}
     assert losd_entry['state'] == 'running'
     assert losd_entry['host_version'] == 'v1.2.3'
     edl.assert_checked_all()
+
+
+def test_list_daemons_detail_batched(cephadm_fs, funkypatch):
+    _cephadm = import_cephadm()
+    _call = funkypatch.patch('cephadmlib.call_wrappers.call')
+
+    # container command fakery
+    fsid = 'dc93cfee-ddc5-11ef-a056-525400220000'
+    img = 'quay.io/fake/ceph:ci'
+    img_id = 'fd6b0fb89677f907edf0f5dbec41b2d09850d58ff860a8a0671ad24fafa1e889'
+    img_sha = 'sha256:c217e3d06df0334fba3f33242e76548a4f71cec619dfa29f64dec9321bd518f3'
+    ctr1 = 'cd9ceec3fc3aa59901e3ced4f4eab8557d067cf05cbc24fa2521962d4bef3b92'
+    ctr2 = '7d067cf05cbc24fa2521962d4bef3b92cd9ceec3fc3aa59901e3ced4f4eab855'
+    date = '2025-01-31 08:13:30.148338962 -0500 EST'
+    mon_cname = f'ceph-{fsid}-mon-ceph0'
+    mgr_cname = f'ceph-{fsid}-mgr-ceph0-zzzabc'
+    calls = []
+
+    def _fake_call(ctx, cmd, *args, **kwargs):
+        calls.append(cmd)
+        out = ''
+        if 'ps' in cmd:
+            out = '\n'.join([mon_cname, mgr_cname, 'unrelated'])
+        elif 'stats' in cmd:
+            out = ''
+        elif 'inspect' in cmd and any('RepoDigests' in a for a in cmd):
+            out = f'[{img}@{img_sha}]'
+        elif 'is-active' in cmd:
+            out = 'active'
+        elif 'inspect' in cmd:
+            assert cmd[-2:] == [mon_cname, mgr_cname]
+            out = '\n'.join([
+                f'/{mon_cname},{ctr1},{img},{img_id},{date},',
+                f'/{mgr_cname},{ctr2},{img},{img_id},{date},',
+            ])
+        elif 'exec' in cmd and cmd[-2:] == ['ceph', '-v']:
+            out = 'ceph version 19.2.0 (abcdef) squid (stable)'
+        return out, '', 0
+
+    _call.side_effect = _fake_call
+
+    fake_ceph = pathlib.Path('/var/tmp/_lib/fake/ceph')
+    cluster_dir = fake_ceph / fsid
+    (cluster_dir / 'mon.ceph0').mkdir(parents=True)
+    (cluster_dir / 'mgr.ceph0.zzzabc').mkdir(parents=True)
+
+    with with_cephadm_ctx([], mock_cephadm_call_fn=False) as ctx:
+        ctx.data_dir = str(fake_ceph)
+        dl = _cephadm.list_daemons(ctx)
+    edl = _EntryHelper(dl)
+    mon_entry = edl.get('mon.ceph0')
+    assert mon_entry['container_id'] == ctr1
+    assert mon_entry['container_image_id'] == img_id
+    assert mon_entry['container_image_digests'] == [f'{img}@{img_sha}']
+    assert mon_entry['version'] == '19.2.0'
+    mgr_entry = edl.get('mgr.ceph0.zzzabc')
+    assert mgr_entry['container_id'] == ctr2
+    assert mgr_entry['version'] == '19.2.0'
+    edl.assert_checked_all()
+    # one ps and one inspect for all the containers
+    assert len([c for c in calls if 'ps' in c]) == 1
+    assert len([c for c in calls if 'inspect' in c and 'image' not in c]) == 1
+    # the version and digests are only looked up once per image
+    assert len([c for c in calls if 'exec' in c]) == 1
+    assert len([c for c in calls if 'image' in c]) == 1
+
+    # a new process reuses the versions and digests saved on disk
+    cache_file = fake_ceph / 'cache' / 'images.json'
+    cached = json.loads(cache_file.read_text())
+    assert cached['images'][img_id]['versions'] == {'ceph': '19.2.0'}
+    calls.clear()
+    with with_cephadm_ctx([], mock_cephadm_call_fn=False) as ctx:
+        ctx.data_dir = str(fake_ceph)
+        dl = _cephadm.list_daemons(ctx)
+    assert len(dl) == 2
+    assert all(d['version'] == '19.2.0' for d in dl)
+    assert all(
+        d['container_image_digests'] == [f'{img}@{img_sha}'] for d in dl
+    )
+    assert not [c for c in calls if 'exec' in c or 'image' in c]
+
+
+@mock.patch('cephadmlib.listing_updaters.time.time')
+def test_image_cache_expiry(_time, cephadm_fs):
+    _cephadm = import_cephadm()
+    _time.return_value = 1000000
+
+    path = '/var/lib/ceph/cache/images.json'
+    pathlib.Path('/var/lib/ceph').mkdir(parents=True, exist_ok=True)
+    cache = _cephadm.ImageCache(path)
+    cache.set_version('abc', 'ceph', '19.2.0')
+    cache.set_digests('abc', ['quay.io/fake/ceph@sha256:1234'])
+    cache.save()
+
+    cache = _cephadm.ImageCache(path)
+    assert cache.get_version('abc', 'ceph') == '19.2.0'
+    assert cache.get_version('abc', 'grafana') is None
+    assert cache.get_digests('abc') == ['quay.io/fake/ceph@sha256:1234']
+    # digests need to be refreshed from time to time, versions do not
+    _time.return_value += cache.digests_ttl + 1
+    assert cache.get_digests('abc') is None
+    assert cache.get_version('abc', 'ceph') == '19.2.0'
+    cache.save()
+
+    # unused images are dropped eventually
+    _time.return_value += cache.max_age + 1
+    cache = _cephadm.ImageCache(path)
+    cache.set_version('def', 'ceph', '20.1.0')
+    cache.save()
+    cached = json.loads(pathlib.Path(path).read_text())
+    assert list(cached['images']) == ['def']
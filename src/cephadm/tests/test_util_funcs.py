@@ -397,6 +397,12 @@ def _mk_fake_call(enabled, active):
             ("auto-restart", "", 0),
             (True, "error", True),
         ),
+        (
+            # is-enabled ok, waiting to auto-restart is unknown
+            ("", "", 0),
+            ("activating", "", 3),
+            (True, "unknown", True),
+        ),
         (
             # error exec'ing is-enabled cmd
             ValueError("bonk"),
@@ -422,6 +428,76 @@ def test_check_unit(enabled_out, active_out, expected):
     assert (enabled, state, installed) == expected
 
 
+_SYSTEMCTL_SHOW = """Id=ceph-fsid@mon.a.service
+LoadState=loaded
+ActiveState=active
+SubState=running
+UnitFileState=enabled
+
+Id=ceph-fsid@mgr.a.service
+LoadState=loaded
+ActiveState=inactive
+SubState=dead
+UnitFileState=disabled
+
+Id=ceph-fsid@osd.0.service
+LoadState=loaded
+ActiveState=activating
+SubState=auto-restart
+UnitFileState=enabled
+
+Id=ceph-fsid@osd.1.service
+LoadState=loaded
+ActiveState=failed
+SubState=failed
+UnitFileState=indirect
+
+Id=ceph-fsid@osd.2.service
+LoadState=not-found
+ActiveState=inactive
+SubState=dead
+UnitFileState=
+"""
+
+
+def test_check_unit_states():
+    from cephadmlib.systemd import check_unit_states
+
+    with with_cephadm_ctx([]) as ctx:
+        with mock.patch('cephadmlib.systemd.call') as _call:
+            _call.return_value = (_SYSTEMCTL_SHOW, '', 0)
+            states = check_unit_states(ctx, 'ceph-*@*.service')
+    assert _call.call_count == 1
+    assert _call.call_args[0][1][:2] == ['systemctl', 'show']
+    assert _call.call_args[0][1][-1] == 'ceph-*@*.service'
+    assert states == {
+        'ceph-fsid@mon.a': (True, 'running', True),
+        'ceph-fsid@mgr.a': (False, 'stopped', True),
+        # is-active prints activating for auto-restart
+        'ceph-fsid@osd.0': (True, 'unknown', True),
+        'ceph-fsid@osd.1': (True, 'error', True),
+    }
+
+
+@pytest.mark.parametrize(
+    "call_result",
+    [
+        ("", "", 1),
+        ValueError("bonk"),
+    ],
+)
+def test_check_unit_states_error(call_result):
+    from cephadmlib.systemd import check_unit_states
+
+    with with_cephadm_ctx([]) as ctx:
+        with mock.patch('cephadmlib.systemd.call') as _call:
+            if isinstance(call_result, Exception):
+                _call.side_effect = call_result
+            else:
+                _call.return_value = call_result
+            assert check_unit_states(ctx, 'ceph-*@*.service') == {}
+
+
 @pytest.mark.parametrize(
     "call_fn, expected",
     [
@@ -20,6 +20,7 @@
 #include <rocksdb/version.h>
 
 #include "common/errno.h"
+#include "common/strtol.h"
 #include "common/perf_counters_key.h"
 #include "crush/CrushWrapper.h"
 #include "include/stringify.h"
@@ -210,6 +211,96 @@ PyObject *ActivePyModules::cacheable_get_python(const std::string &what)
   return obj;
 }
 
+uint64_t ActivePyModules::get_data_version(const std::string &what)
+{
+  without_gil_t no_gil;
+  auto osdmap_epoch = [this] {
+    return cluster_state.with_osdmap([](const OSDMap &osd_map) {
+      return (uint64_t)osd_map.get_epoch();
+    });
+  };
+  auto pgmap_version = [this] {
+    return cluster_state.with_pgmap([](const PGMap &pg_map) {
+      return (uint64_t)pg_map.version;
+    });
+  };
+
+  if (what == "osd_map" || what == "osd_map_tree" || what == "osd_map_crush" ||
+      what == "osdmap_crush_map_text") {
+    return osdmap_epoch();
+  } else if (what == "fs_map") {
+    return cluster_state.with_fsmap([](const FSMap &fsmap) {
+      return (uint64_t)fsmap.get_epoch();
+    });
+  } else if (what == "mon_map") {
+    return cluster_state.with_monmap([](const MonMap &monmap) {
+      return (uint64_t)monmap.get_epoch();
+    });
+  } else if (what == "mgr_map") {
+    return cluster_state.with_mgrmap([](const MgrMap &mgr_map) {
+      return (uint64_t)mgr_map.get_epoch();
+    });
+  } else if (what == "service_map") {
+    return cluster_state.with_servicemap([](const ServiceMap &service_map) {
+      return (uint64_t)service_map.epoch;
+    });
+  } else if (what == "pg_summary" || what == "pg_status" ||
+             what == "pg_dump" || what == "pg_stats" ||
+             what == "pool_stats" || what == "osd_stats" ||
+             what == "osd_ping_times") {
+    return pgmap_version();
+  } else if (what == "df" || what == "osd_pool_stats") {
+    // both maps are involved: a change of either one is a new version
+    return (osdmap_epoch() << 40) ^ pgmap_version();
+  }
+  // everything else is not versioned and has to be fetched every time
+  return 0;
+}
+
+PyObject *ActivePyModules::get_versioned_python(
+  const std::string &module_name,
+  const std::string &what,
+  uint64_t known_version)
+{
+  const uint64_t version = get_data_version(what);
+  const bool hit = version != 0 && version == known_version;
+  {
+    std::lock_guard l(get_cache_stats_lock);
+    auto &stats = get_cache_stats[std::make_pair(module_name, what)];
+    if (hit) {
+      ++stats.hits;
+    } else {
+      ++stats.misses;
+    }
+  }
+  PyObject *obj = nullptr;
+  if (hit) {
+    Py_INCREF(Py_None);
+    obj = Py_None;
+  } else {
+    // not from the TTL cache: what it holds may predate version. The data
+    // is read after the version, so it is at least as new as version.
+    obj = get_python(what);
+  }
+  PyObject *result = Py_BuildValue("(KN)", (unsigned long long)version, obj);
+  return result;
+}
+
+void ActivePyModules::dump_get_cache_stats(ceph::Formatter *f) const
+{
+  std::lock_guard l(get_cache_stats_lock);
+  f->open_array_section("get_cache");
+  for (const auto &[key, stats] : get_cache_stats) {
+    f->open_object_section("entry");
+    f->dump_string("module", key.first);
+    f->dump_string("data_name", key.second);
+    f->dump_unsigned("hits", stats.hits);
+    f->dump_unsigned("misses", stats.misses);
+    f->close_section();
+  }
+  f->close_section();
+}
+
 PyObject *ActivePyModules::get_python(const std::string &what)
 {
   uint64_t ttl_seconds = g_conf().get_val<uint64_t>("mgr_ttl_cache_expire_seconds");
@@ -438,6 +529,29 @@ PyObject *ActivePyModules::get_python(const std::string &what)
       pg_map.dump_pg_progress(&f);
       server.dump_pg_ready(&f);
     });
+  } else if (what.size() > 18 &&
+	     what.substr(0, 18) == "pg_progress_since ") {
+    // the pg_progress of the PGs that changed after a PGMap version, or
+    // of all PGs if that was too long ago
+    std::string err;
+    version_t since = strict_strtoll(what.substr(18), 10, &err);
+    if (!err.empty()) {
+      derr << "Python module requested '" << what << "': " << err << dendl;
+      Py_RETURN_NONE;
+    }
+    without_gil_t no_gil;
+    cluster_state.with_pgmap_changes_since(since,
+      [&](const PGMap &pg_map, const std::optional<std::set<pg_t>>& changed) {
+        no_gil.acquire_gil();
+        f.dump_unsigned("version", pg_map.version);
+        f.dump_bool("delta", changed.has_value());
+        if (changed) {
+          pg_map.dump_pg_progress(&f, *changed);
+        } else {
+          pg_map.dump_pg_progress(&f);
+        }
+        server.dump_pg_ready(&f);
+      });
   } else if (what == "osd_stats") {
     without_gil_t no_gil;
     cluster_state.with_pgmap([&](const PGMap &pg_map) {
@@ -1093,6 +1207,132 @@ PyObject* ActivePyModules::get_unlabeled_perf_schema_python(
   return f.get();
 }
 
+PyObject* ActivePyModules::get_unlabeled_perf_counters_bulk_python(
+    const std::string &svc_type,
+    int prio_limit,
+    uint64_t known_schema_version)
+{
+  without_gil_t no_gil;
+  std::lock_guard l(lock);
+
+  auto daemons = daemon_state.get_by_service(svc_type);
+
+  // The columns are the union of the unlabeled counters of all daemons of
+  // this type with a priority of at least prio_limit, in path order.
+  std::map<std::string, PerfCounterType> columns;
+  std::vector<std::string> daemon_names;
+  daemon_names.reserve(daemons.size());
+  for (auto& [key, state] : daemons) {
+    std::lock_guard l2(state->lock);
+    daemon_names.push_back(key.name);
+    for (const auto& [path, instance] : state->perf_counters.instances) {
+      auto labels = ceph::perf_counters::key_labels(path);
+      if (labels.begin() != labels.end()) {
+        continue;
+      }
+      auto type = state->perf_counters.types.find(path);
+      if (type == state->perf_counters.types.end() ||
+          type->second.priority < prio_limit) {
+        continue;
+      }
+      columns.emplace(path, type->second);
+    }
+  }
+
+  // The schema version changes whenever a column is added, removed or
+  // changes its type, priority or unit.
+  std::map<std::string, size_t> column_index;
+  uint64_t schema_version = 14695981039346656037ull;  // FNV-1a
+  auto hash = [&schema_version](const void *data, size_t len) {
+    auto p = static_cast<const unsigned char*>(data);
+    for (size_t i = 0; i < len; ++i) {
+      schema_version = (schema_version ^ p[i]) * 1099511628211ull;
+    }
+  };
+  for (const auto& [path, type] : columns) {
+    column_index.emplace(path, column_index.size());
+    hash(path.data(), path.size() + 1);
+    uint8_t attrs[] = {(uint8_t)type.type, type.priority, (uint8_t)type.unit};
+    hash(attrs, sizeof(attrs));
+  }
+  if (schema_version == 0) {
+    // 0 is reserved for "no schema known"
+    schema_version = 1;
+  }
+
+  // present[i] is 1 if the daemon of that row has the counter of that
+  // column, the value and count of the cells it doesn't have are 0
+  const size_t ncols = columns.size();
+  std::vector<int64_t> values(daemon_names.size() * ncols, 0);
+  std::vector<int64_t> counts(daemon_names.size() * ncols, 0);
+  std::vector<char> present(daemon_names.size() * ncols, 0);
+  size_t row = 0;
+  for (auto& [key, state] : daemons) {
+    std::lock_guard l2(state->lock);
+    for (const auto& [path, instance] : state->perf_counters.instances) {
+      auto col = column_index.find(path);
+      if (col == column_index.end()) {
+        continue;
+      }
+      const size_t i = row * ncols + col->second;
+      present[i] = 1;
+      if (columns.at(path).type & PERFCOUNTER_LONGRUNAVG) {
+        const auto &avg_data = instance.get_data_avg();
+        if (!avg_data.empty()) {
+          values[i] = avg_data.back().s;
+          counts[i] = avg_data.back().c;
+        }
+      } else {
+        const auto &data = instance.get_data();
+        if (!data.empty()) {
+          values[i] = data.back().v;
+        }
+      }
+    }
+    ++row;
+  }
+
+  return with_gil(no_gil, [&] {
+    PyObject *result = PyDict_New();
+    PyObject *version = PyLong_FromUnsignedLongLong(schema_version);
+    PyDict_SetItemString(result, "schema_version", version);
+    Py_DECREF(version);
+
+    PyObject *names = PyList_New(daemon_names.size());
+    for (size_t i = 0; i < daemon_names.size(); ++i) {
+      PyList_SET_ITEM(names, i, PyUnicode_FromString(daemon_names[i].c_str()));
+    }
+    PyDict_SetItemString(result, "daemons", names);
+    Py_DECREF(names);
+
+    if (schema_version != known_schema_version) {
+      PyObject *schema = PyList_New(ncols);
+      size_t col = 0;
+      for (const auto& [path, type] : columns) {
+        PyList_SET_ITEM(schema, col++, Py_BuildValue(
+          "(sssiii)", path.c_str(), type.description.c_str(), type.nick.c_str(),
+          (int)type.type, (int)type.priority, (int)type.unit));
+      }
+      PyDict_SetItemString(result, "schema", schema);
+      Py_DECREF(schema);
+    }
+
+    PyObject *values_bytes = PyBytes_FromStringAndSize(
+      reinterpret_cast<const char*>(values.data()), values.size() * sizeof(int64_t));
+    PyDict_SetItemString(result, "values", values_bytes);
+    Py_DECREF(values_bytes);
+    PyObject *counts_bytes = PyBytes_FromStringAndSize(
+      reinterpret_cast<const char*>(counts.data()), counts.size() * sizeof(int64_t));
+    PyDict_SetItemString(result, "counts", counts_bytes);
+    Py_DECREF(counts_bytes);
+    PyObject *present_bytes = PyBytes_FromStringAndSize(
+      present.data(), present.size());
+    PyDict_SetItemString(result, "present", present_bytes);
+    Py_DECREF(present_bytes);
+    return result;
+  });
+}
+
 PyObject* ActivePyModules::get_perf_schema_python(
     const std::string& svc_type,
     const std::string& svc_id)
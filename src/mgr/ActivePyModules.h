@@ -72,6 +72,15 @@ private:
 
   mutable ceph::mutex lock = ceph::make_mutex("ActivePyModules::lock");
 
+  // per module and data name: hits and misses of versioned get() calls
+  struct GetCacheStats {
+    uint64_t hits = 0;
+    uint64_t misses = 0;
+  };
+  std::map<std::pair<std::string, std::string>, GetCacheStats> get_cache_stats;
+  mutable ceph::mutex get_cache_stats_lock =
+    ceph::make_mutex("ActivePyModules::get_cache_stats_lock");
+
 public:
   ActivePyModules(
     PyModuleConfig &module_config,
@@ -87,6 +96,11 @@ public:
   MonClient &get_monc() {return monc;}
   Objecter  &get_objecter() {return objecter;}
   PyObject *cacheable_get_python(const std::string &what);
+  uint64_t get_data_version(const std::string &what);
+  PyObject *get_versioned_python(const std::string &module_name,
+                                 const std::string &what,
+                                 uint64_t known_version);
+  void dump_get_cache_stats(ceph::Formatter *f) const;
   PyObject *get_python(const std::string &what);
   PyObject *get_server_python(const std::string &hostname);
   PyObject *list_servers_python();
@@ -114,6 +128,10 @@ public:
   PyObject *get_perf_schema_python(
       const std::string &svc_type,
       const std::string &svc_id);
+  PyObject *get_unlabeled_perf_counters_bulk_python(
+      const std::string &svc_type,
+      int prio_limit,
+      uint64_t known_schema_version);
   PyObject *get_rocksdb_version();
   PyObject *get_context();
   PyObject *get_osdmap();
@@ -391,6 +391,30 @@ ceph_state_get(BaseMgrModule *self, PyObject *args)
 }
 
 
+static PyObject*
+ceph_get_data_version(BaseMgrModule *self, PyObject *args)
+{
+  char *what = NULL;
+  if (!PyArg_ParseTuple(args, "s:ceph_get_data_version", &what)) {
+    return NULL;
+  }
+
+  return PyLong_FromUnsignedLongLong(self->py_modules->get_data_version(what));
+}
+
+static PyObject*
+ceph_get_versioned(BaseMgrModule *self, PyObject *args)
+{
+  char *what = NULL;
+  unsigned long long known_version = 0;
+  if (!PyArg_ParseTuple(args, "sK:ceph_get_versioned", &what, &known_version)) {
+    return NULL;
+  }
+
+  return self->py_modules->get_versioned_python(
+    self->this_module->get_name(), what, known_version);
+}
+
 static PyObject*
 ceph_get_server(BaseMgrModule *self, PyObject *args)
 {
@@ -719,6 +743,21 @@ get_unlabeled_perf_schema(BaseMgrModule *self, PyObject *args)
   return self->py_modules->get_unlabeled_perf_schema_python(type_str, svc_id);
 }
 
+static PyObject*
+get_unlabeled_perf_counters_bulk(BaseMgrModule *self, PyObject *args)
+{
+  char *type_str = nullptr;
+  int prio_limit = 0;
+  unsigned long long known_schema_version = 0;
+  if (!PyArg_ParseTuple(args, "siK:get_unlabeled_perf_counters_bulk",
+                        &type_str, &prio_limit, &known_schema_version)) {
+    return nullptr;
+  }
+
+  return self->py_modules->get_unlabeled_perf_counters_bulk_python(
+      type_str, prio_limit, known_schema_version);
+}
+
 static PyObject* get_perf_schema(BaseMgrModule *self, PyObject *args)
 {
   char *type_str = nullptr;
@@ -1493,6 +1532,12 @@ PyMethodDef BaseMgrModule_methods[] = {
   {"_ceph_get", (PyCFunction)ceph_state_get, METH_VARARGS,
    "Get a cluster object"},
 
+  {"_ceph_get_data_version", (PyCFunction)ceph_get_data_version, METH_VARARGS,
+   "Get the version of a cluster object, 0 if it is not versioned"},
+
+  {"_ceph_get_versioned", (PyCFunction)ceph_get_versioned, METH_VARARGS,
+   "Get a cluster object unless the given version is still current"},
+
   {"_ceph_notify_all", (PyCFunction)ceph_notify_all, METH_VARARGS,
    "notify all modules"},
 
@@ -1553,6 +1598,9 @@ PyMethodDef BaseMgrModule_methods[] = {
   {"_ceph_get_perf_schema", (PyCFunction)get_perf_schema, METH_VARARGS,
    "Get the performance counter schema"},
 
+  {"_ceph_get_unlabeled_perf_counters_bulk", (PyCFunction)get_unlabeled_perf_counters_bulk,
+   METH_VARARGS, "Get the latest values of all unlabeled performance counters of a daemon type"},
+
   {"_ceph_get_rocksdb_version", (PyCFunction)ceph_get_rocksdb_version, METH_NOARGS,
     "Get the current RocksDB version number"},
 
@@ -152,10 +152,71 @@ void ClusterState::update_delta_stats()
   jf.dump_object("pending_inc", pending_inc);
   jf.flush(*_dout);
   *_dout << dendl;
+  record_pg_changes();
   pg_map.apply_incremental(g_ceph_context, pending_inc);
   pending_inc = PGMap::Incremental();
 }
 
+void ClusterState::record_pg_changes()
+{
+  ceph_assert(ceph_mutex_is_locked(lock));
+  // PG entries kept in the history, about 4 MiB of pg_t; as only PGs whose
+  // progress changed are recorded, this covers many stats periods even
+  // while a large cluster is recovering
+  static constexpr size_t max_pg_change_entries = 1 << 18;
+
+  if (!pg_changes_valid) {
+    // changes are known from here on
+    pg_changes_valid = true;
+    pg_changes_oldest = pg_map.version;
+  }
+
+  // OSDs report the stats of all their primary PGs every time, only record
+  // the PGs whose progress (see PGMap::dump_pg_progress) changed
+  std::vector<pg_t> pgs;
+  for (auto& [pgid, stats] : pending_inc.pg_stat_updates) {
+    auto i = pg_map.pg_stat.find(pgid);
+    if (i == pg_map.pg_stat.end() ||
+        i->second.state != stats.state ||
+        i->second.reported_epoch != stats.reported_epoch ||
+        i->second.stats.sum.num_bytes_recovered != stats.stats.sum.num_bytes_recovered ||
+        i->second.stats.sum.num_bytes != stats.stats.sum.num_bytes) {
+      pgs.push_back(pgid);
+    }
+  }
+  pgs.insert(pgs.end(), pending_inc.pg_remove.begin(), pending_inc.pg_remove.end());
+  if (!pgs.empty()) {
+    pg_change_entries += pgs.size();
+    pg_changes.emplace_back(pending_inc.version, std::move(pgs));
+  }
+  while (pg_change_entries > max_pg_change_entries && !pg_changes.empty()) {
+    // the changes after the dropped version are still complete
+    pg_changes_oldest = pg_changes.front().first;
+    pg_change_entries -= pg_changes.front().second.size();
+    pg_changes.pop_front();
+  }
+}
+
+std::optional<std::set<pg_t>> ClusterState::pg_changes_since(version_t since) const
+{
+  ceph_assert(ceph_mutex_is_locked(lock));
+  if (since == pg_map.version) {
+    return std::set<pg_t>{};
+  }
+  if (!pg_changes_valid ||
+      since > pg_map.version ||
+      since < pg_changes_oldest) {
+    return std::nullopt;
+  }
+  std::set<pg_t> pgs;
+  for (auto& [version, changed] : pg_changes) {
+    if (version > since) {
+      pgs.insert(changed.begin(), changed.end());
+    }
+  }
+  return pgs;
+}
+
 void ClusterState::notify_osdmap(const OSDMap &osd_map)
 {
   assert(ceph_mutex_is_locked(lock));
@@ -190,6 +251,7 @@ void ClusterState::notify_osdmap(const OSDMap &osd_map)
   jf.flush(*_dout);
   *_dout << dendl;
 
+  record_pg_changes();
   pg_map.apply_incremental(g_ceph_context, pending_inc);
   pending_inc = PGMap::Incremental();
   // TODO: Complete the separation of PG state handling so
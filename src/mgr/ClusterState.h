@@ -15,6 +15,9 @@
 #ifndef CLUSTER_STATE_H_
 #define CLUSTER_STATE_H_
 
+#include <deque>
+#include <optional>
+
 #include "mds/FSMap.h"
 #include "mon/MgrMap.h"
 #include "common/ceph_mutex.h"
@@ -47,12 +50,21 @@ protected:
   std::map<int64_t,unsigned> existing_pools; ///< pools that exist, and pg_num, as of PGMap epoch
   PGMap pg_map;
   PGMap::Incremental pending_inc;
+  /// PGs whose progress changed or that were removed, by PGMap version;
+  /// complete for all versions after pg_changes_oldest
+  std::deque<std::pair<version_t, std::vector<pg_t>>> pg_changes;
+  size_t pg_change_entries = 0;
+  version_t pg_changes_oldest = 0;
+  bool pg_changes_valid = false;
 
   bufferlist health_json;
   bufferlist mon_status_json;
 
   class ClusterSocketHook *asok_hook;
 
+  void record_pg_changes();
+  std::optional<std::set<pg_t>> pg_changes_since(version_t since) const;
+
 public:
 
   void load_digest(MMgrDigest *m);
@@ -103,6 +115,17 @@ public:
     return std::forward<Callback>(cb)(pg_map, std::forward<Args>(args)...);
   }
 
+  /**
+   * Call cb(pg_map, changed) with the PGs updated or removed after PGMap
+   * version `since`, or std::nullopt if that is too long ago to tell.
+   */
+  template<typename Callback>
+  auto with_pgmap_changes_since(version_t since, Callback&& cb) const
+  {
+    std::lock_guard l(lock);
+    return std::forward<Callback>(cb)(pg_map, pg_changes_since(since));
+  }
+
   template<typename Callback, typename...Args>
   auto with_mutable_pgmap(Callback&& cb, Args&&...args) ->
     decltype(cb(pg_map, std::forward<Args>(args)...))
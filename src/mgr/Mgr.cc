@@ -363,6 +363,10 @@ void Mgr::init()
     "mgr_status", this,
     "Dump mgr status");
   ceph_assert(r == 0);
+  r = admin_socket->register_command(
+    "mgr_get_cache_stats", this,
+    "Dump hit/miss statistics of the versioned python module get() cache");
+  ceph_assert(r == 0);
 
 #ifdef WITH_LIBCEPHSQLITE
   dout(4) << "Using sqlite3 version: " << sqlite3_libversion() << dendl;
@@ -809,6 +813,9 @@ int Mgr::call(
       f->dump_bool("initialized", initialized);
       f->close_section();
       return 0;
+    } else if (admin_command == "mgr_get_cache_stats") {
+      py_module_registry->dump_get_cache_stats(f);
+      return 0;
     } else {
       return -ENOSYS;
     }
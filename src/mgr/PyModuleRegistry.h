@@ -167,6 +167,14 @@ public:
    */
   void get_health_checks(health_check_map_t *checks);
 
+  void dump_get_cache_stats(ceph::Formatter *f)
+  {
+    std::lock_guard l(lock);
+    if (active_modules) {
+      active_modules->dump_get_cache_stats(f);
+    }
+  }
+
   void get_progress_events(std::map<std::string,ProgressEvent> *events) {
     if (active_modules) {
       active_modules->get_progress_events(events);
@@ -524,6 +524,38 @@ static PyObject *osdmap_inc_set_compat_weight_set_weights(
   Py_RETURN_NONE;
 }
 
+static PyObject *osdmap_inc_merge_upmaps(BasePyOSDMapIncremental *self,
+    PyObject *obj)
+{
+  if (!PyObject_TypeCheck(obj, &BasePyOSDMapIncrementalType)) {
+    PyErr_SetString(PyExc_TypeError, "expected an OSDMapIncremental");
+    return nullptr;
+  }
+  auto other = reinterpret_cast<BasePyOSDMapIncremental*>(obj)->inc;
+  // a change of other replaces the change of the same PG in this one: an
+  // upmap it sets is no longer removed, an upmap it removes no longer set
+  auto merge = [](auto& new_upmaps, auto& old_upmaps,
+                  const auto& other_new, const auto& other_old) {
+    for (auto& [pg, v] : other_new) {
+      new_upmaps[pg] = v;
+      old_upmaps.erase(pg);
+    }
+    for (auto& pg : other_old) {
+      if (!other_new.count(pg)) {
+        new_upmaps.erase(pg);
+      }
+      old_upmaps.insert(pg);
+    }
+  };
+  merge(self->inc->new_pg_upmap, self->inc->old_pg_upmap,
+        other->new_pg_upmap, other->old_pg_upmap);
+  merge(self->inc->new_pg_upmap_items, self->inc->old_pg_upmap_items,
+        other->new_pg_upmap_items, other->old_pg_upmap_items);
+  merge(self->inc->new_pg_upmap_primary, self->inc->old_pg_upmap_primary,
+        other->new_pg_upmap_primary, other->old_pg_upmap_primary);
+  Py_RETURN_NONE;
+}
+
 PyMethodDef BasePyOSDMapIncremental_methods[] = {
   {"_get_epoch", (PyCFunction)osdmap_inc_get_epoch, METH_NOARGS,
     "Get OSDMap::Incremental epoch"},
@@ -534,6 +566,8 @@ PyMethodDef BasePyOSDMapIncremental_methods[] = {
   {"_set_crush_compat_weight_set_weights",
    (PyCFunction)osdmap_inc_set_compat_weight_set_weights, METH_O,
    "Set weight values in the pending CRUSH compat weight-set"},
+  {"_merge_upmaps", (PyCFunction)osdmap_inc_merge_upmaps, METH_O,
+   "Add the pg-upmap changes of another OSDMap::Incremental"},
   {NULL, NULL, 0, NULL}
 };
 
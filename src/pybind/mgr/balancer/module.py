@@ -9,43 +9,223 @@ import json
 import math
 import random
 import time
+from array import array
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from mgr_module import CLIReadCommand, CLICommand, CommandResult, MgrModule, Option, OSDMap, CephReleases
-from threading import Event
-from typing import cast, Any, Dict, List, Optional, Sequence, Tuple, Union
-from mgr_module import CRUSHMap
+from threading import Event, Lock
+from typing import cast, Any, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple, Union
+from mgr_module import CRUSHMap, OSDMapIncremental
 import datetime
 
 TIME_FORMAT = '%Y-%m-%d_%H:%M:%S'
 
 
+# stands in for CRUSHMap.ITEM_NONE and pads the up sets in UpSets.osds
+NO_OSD = -1
+
+
+class PgStats:
+    """
+    The object and byte counts of all PGs, as one packed column per pool
+    indexed by the placement seed of the PG.
+    """
+
+    def __init__(self, raw_pg_stats: Dict[str, Any], raw_pool_stats: Dict[str, Any]) -> None:
+        self.poolids = set(p['poolid'] for p in raw_pool_stats.get('pool_stats', []))
+        by_pool: Dict[int, List[Tuple[int, Dict[str, int]]]] = defaultdict(list)
+        for i in raw_pg_stats.get('pg_stats', []):
+            pool, _, ps = i['pgid'].partition('.')
+            by_pool[int(pool)].append((int(ps, 16), i['stat_sum']))
+        self.num_objects: Dict[int, 'array[int]'] = {}
+        self.num_bytes: Dict[int, 'array[int]'] = {}
+        for poolid, stats in by_pool.items():
+            pg_num = max(ps for ps, _ in stats) + 1
+            objects = [0] * pg_num
+            num_bytes = [0] * pg_num
+            for ps, stat_sum in stats:
+                objects[ps] = stat_sum['num_objects']
+                num_bytes[ps] = stat_sum['num_bytes']
+            self.num_objects[poolid] = array('q', objects)
+            self.num_bytes[poolid] = array('q', num_bytes)
+
+    def columns(self, poolid: int, pg_num: int) -> Tuple['array[int]', 'array[int]']:
+        """
+        The object and byte counts of the first ``pg_num`` PGs of a pool, 0
+        for PGs without statistics yet.
+        """
+        ret = []
+        for column in (self.num_objects, self.num_bytes):
+            c = column.get(poolid, array('q'))
+            if len(c) < pg_num:
+                c = c + array('q', bytes(8 * (pg_num - len(c))))
+            ret.append(c)
+        return ret[0], ret[1]
+
+
+class UpSets(NamedTuple):
+    """
+    The up sets of all PGs of a pool, packed row-major: the up set of PG
+    ``ps`` is ``osds[ps * width:(ps + 1) * width]``, with CRUSHMap.ITEM_NONE
+    and the padding of shorter up sets stored as NO_OSD.
+    """
+    pg_num: int
+    width: int
+    osds: 'array[int]'
+
+    @classmethod
+    def pack(cls, pgs_up: Dict[str, List[int]]) -> 'UpSets':
+        width = max((len(up) for up in pgs_up.values()), default=0)
+        pss = [int(pgid.partition('.')[2], 16) for pgid in pgs_up]
+        pg_num = max(pss, default=-1) + 1
+        flat = [NO_OSD] * (pg_num * width)
+        for ps, up in zip(pss, pgs_up.values()):
+            flat[ps * width:ps * width + len(up)] = up
+        osds = array('i', flat)
+        if CRUSHMap.ITEM_NONE in osds:
+            osds = array('i', [NO_OSD if osd == CRUSHMap.ITEM_NONE else osd for osd in osds])
+        return cls(pg_num, width, osds)
+
+    def row(self, ps: int) -> 'array[int]':
+        if ps >= self.pg_num:
+            return array('i')
+        row = self.osds[ps * self.width:(ps + 1) * self.width]
+        while row and row[-1] == NO_OSD:
+            row.pop()
+        return row
+
+    def sum_by_osd(self, *columns: 'array[int]') -> List[Dict[int, int]]:
+        """
+        Group the PGs by the OSDs in their up sets: the number of PGs by OSD,
+        followed by the sum of each of the per-PG ``columns`` by OSD.
+        """
+        counts = Counter(self.osds)
+        counts.pop(NO_OSD, None)
+        # one slot per OSD id, NO_OSD ends up in the last one
+        size = max(counts, default=0) + 2
+        ret: List[Dict[int, int]] = [dict(counts)]
+        for column in columns:
+            acc = [0] * size
+            for r in range(self.width):
+                for osd, v in zip(self.osds[r::self.width], column):
+                    acc[osd] += v
+            ret.append({osd: acc[osd] for osd in counts})
+        return ret
+
+
 class MappingState:
-    def __init__(self, osdmap, raw_pg_stats, raw_pool_stats, desc=''):
+    """
+    The up sets of all PGs of an OSDMap along with the PG statistics.
+
+    Given the state ``prev`` of an earlier OSDMap, the up sets of the pools
+    that cannot have moved since are taken over from it instead of being
+    mapped again, see unchanged_pools(). ``changed_osds`` are the OSDs whose
+    CRUSH weights changed since ``prev``: if given, the CRUSH maps are
+    otherwise taken to be the same, if not, a new CRUSH version maps all
+    pools again. ``osdmap_dump`` is the dump of ``osdmap`` if the caller has
+    it already; it is not modified.
+    """
+
+    def __init__(self, osdmap, pg_stats: PgStats, desc='',
+                 prev: Optional['MappingState'] = None,
+                 changed_osds: Optional[Set[int]] = None,
+                 osdmap_dump: Optional[Dict[str, Any]] = None):
         self.desc = desc
         self.osdmap = osdmap
-        self.osdmap_dump = self.osdmap.dump()
+        self.osdmap_dump = osdmap_dump if osdmap_dump is not None else osdmap.dump()
         self.crush = osdmap.get_crush()
-        self.crush_dump = self.crush.dump()
-        self.raw_pg_stats = raw_pg_stats
-        self.raw_pool_stats = raw_pool_stats
-        self.pg_stat = {
-            i['pgid']: i['stat_sum'] for i in raw_pg_stats.get('pg_stats', [])
-        }
+        self._crush_dump: Optional[Dict[str, Any]] = None
+        self.pg_stats = pg_stats
         osd_poolids = [p['pool'] for p in self.osdmap_dump.get('pools', [])]
-        pg_poolids = [p['poolid'] for p in raw_pool_stats.get('pool_stats', [])]
-        self.poolids = set(osd_poolids) & set(pg_poolids)
-        self.pg_up = {}
-        self.pg_up_by_poolid = {}
+        self.poolids = set(osd_poolids) & pg_stats.poolids
+        self.pg_up: Dict[int, UpSets] = {}
+        self._sums: Dict[int, List[Dict[int, int]]] = {}
+        unchanged = set()
+        if prev is not None:
+            unchanged = self.unchanged_pools(prev, changed_osds)
         for poolid in self.poolids:
-            self.pg_up_by_poolid[poolid] = osdmap.map_pool_pgs_up(poolid)
-            for a, b in self.pg_up_by_poolid[poolid].items():
-                self.pg_up[a] = b
+            if prev is not None and poolid in unchanged:
+                self.pg_up[poolid] = prev.pg_up[poolid]
+                if prev.pg_stats is pg_stats and poolid in prev._sums:
+                    self._sums[poolid] = prev._sums[poolid]
+            else:
+                self.pg_up[poolid] = UpSets.pack(osdmap.map_pool_pgs_up(poolid))
+
+    @property
+    def crush_dump(self) -> Dict[str, Any]:
+        # only needed by crush-compat mode
+        if self._crush_dump is None:
+            self._crush_dump = self.crush.dump()
+        return self._crush_dump
+
+    def unchanged_pools(self, prev: 'MappingState',
+                        changed_osds: Optional[Set[int]] = None) -> Set[int]:
+        """
+        The pools of ``prev`` whose PGs map the same in this state: the pool
+        itself and its upmap entries are the same and none of the OSDs under
+        the CRUSH roots it takes from changed state or weight.
+        """
+        if changed_osds is None:
+            if self.osdmap.get_crush_version() != prev.osdmap.get_crush_version():
+                return set()
+            changed_osds = set()
+        else:
+            changed_osds = set(changed_osds)
+        unchanged = set(prev.pg_up)
+
+        # up/down, in/out, reweighted, primary affinity, created or removed
+        before = {o['osd']: o for o in prev.osdmap_dump.get('osds', [])}
+        for o in self.osdmap_dump.get('osds', []):
+            if before.pop(o['osd'], None) != o:
+                changed_osds.add(o['osd'])
+        changed_osds.update(before)
+
+        # pg_num, size, crush rule, ...
+        before = {p['pool']: p for p in prev.osdmap_dump.get('pools', [])}
+        for p in self.osdmap_dump.get('pools', []):
+            if before.get(p['pool']) != p:
+                unchanged.discard(p['pool'])
+
+        for key in ('pg_upmap', 'pg_upmap_items', 'pg_upmap_primaries'):
+            before = {e['pgid']: e for e in prev.osdmap_dump.get(key, [])}
+            for e in self.osdmap_dump.get(key, []):
+                if before.pop(e['pgid'], None) != e:
+                    unchanged.discard(int(e['pgid'].partition('.')[0]))
+            for pgid in before:
+                unchanged.discard(int(pgid.partition('.')[0]))
+
+        if changed_osds and unchanged:
+            for take in self.crush.find_takes():
+                if changed_osds.intersection(self.crush.get_take_weight_osd_map(take)):
+                    unchanged.difference_update(self.osdmap.get_pools_by_take(take))
+        return unchanged
+
+    def sum_by_osd(self, poolid: int) -> List[Dict[int, int]]:
+        """
+        The number of PGs, objects and bytes of a pool by OSD, see
+        UpSets.sum_by_osd().
+        """
+        if poolid not in self._sums:
+            up = self.pg_up[poolid]
+            self._sums[poolid] = up.sum_by_osd(*self.pg_stats.columns(poolid, up.pg_num))
+        return self._sums[poolid]
 
     def calc_misplaced_from(self, other_ms):
-        num = len(other_ms.pg_up)
+        num = 0
         misplaced = 0
-        for pgid, before in other_ms.pg_up.items():
-            if before != self.pg_up.get(pgid, []):
-                misplaced += 1
+        for poolid, before in other_ms.pg_up.items():
+            num += before.pg_num
+            after = self.pg_up.get(poolid, UpSets(0, 0, array('i')))
+            if after is before or after == before:
+                continue
+            if (after.pg_num, after.width) == (before.pg_num, before.width):
+                w = before.width
+                misplaced += sum(1 for i in range(0, len(before.osds), w)
+                                 if before.osds[i:i + w] != after.osds[i:i + w])
+                continue
+            for ps in range(before.pg_num):
+                if before.row(ps) != after.row(ps):
+                    misplaced += 1
         if num > 0:
             return float(misplaced) / float(num)
         return 0.0
@@ -60,11 +240,11 @@ class Mode(enum.Enum):
 
 
 class Plan(object):
-    def __init__(self, name, mode, osdmap, pools):
+    def __init__(self, name, mode, osdmap, pools, osdmap_dump=None):
         self.name = name
         self.mode = mode
         self.osdmap = osdmap
-        self.osdmap_dump = osdmap.dump()
+        self.osdmap_dump = osdmap_dump if osdmap_dump is not None else osdmap.dump()
         self.pools = pools
         self.osd_weights = {}
         self.compat_ws = {}
@@ -84,16 +264,22 @@ class MsPlan(Plan):
     """
 
     def __init__(self, name: str, mode: str, ms: MappingState, pools: List[str]) -> None:
-        super(MsPlan, self).__init__(name, mode, ms.osdmap, pools)
+        super(MsPlan, self).__init__(name, mode, ms.osdmap, pools, ms.osdmap_dump)
         self.initial = ms
 
-    def final_state(self) -> MappingState:
+    def final_state(self, prev: Optional[MappingState] = None,
+                    changed_osds: Optional[Set[int]] = None) -> MappingState:
+        """
+        The state after the plan is applied, see MappingState for ``prev``
+        and ``changed_osds``.
+        """
         self.inc.set_osd_reweights(self.osd_weights)
         self.inc.set_crush_compat_weight_set_weights(self.compat_ws)
         return MappingState(self.initial.osdmap.apply_incremental(self.inc),
-                            self.initial.raw_pg_stats,
-                            self.initial.raw_pool_stats,
-                            'plan %s final' % self.name)
+                            self.initial.pg_stats,
+                            'plan %s final' % self.name,
+                            prev=prev,
+                            changed_osds=changed_osds)
 
     def show(self) -> str:
         ls = []
@@ -321,6 +507,17 @@ class Module(MgrModule):
                desc='deviation below which no optimization is attempted',
                long_desc='If the number of PGs are within this count then no optimization is attempted',
                runtime=True),
+        Option(name='upmap_workers',
+               type='int',
+               default=1,
+               min=1,
+               desc='number of threads planning upmaps for independent groups of pools',
+               long_desc='Pools whose CRUSH rules share no OSDs are optimized as '
+                         'independent groups on copies of the OSDMap, up to this '
+                         'many at a time, each with its share of '
+                         'upmap_max_optimizations. With 1 all pools are '
+                         'optimized one after the other.',
+               runtime=True),
         Option(name='pool_ids',
                type='str',
                default='',
@@ -348,10 +545,16 @@ class Module(MgrModule):
     pg_upmap_items_removed: List[Dict[str, Any]] = []
     pg_upmap_primaries_added: List[Dict[str, Any]] = []
     pg_upmap_primaries_removed: List[Dict[str, Any]] = []
+    upmap_groups: List[Dict[str, Any]] = []
+    upmap_group_offset = 0
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super(Module, self).__init__(*args, **kwargs)
         self.event = Event()
+        self._pg_stats: Optional[Tuple[int, PgStats]] = None
+        # the serve thread and the commands both map states
+        self._last_ms_lock = Lock()
+        self._last_ms: Optional[MappingState] = None
 
     @CLIReadCommand('balancer status')
     def show_status(self) -> Tuple[int, str, str]:
@@ -390,7 +593,8 @@ class Module(MgrModule):
             'pg_upmap_items_added': self.pg_upmap_items_added,
             'pg_upmap_items_removed': self.pg_upmap_items_removed,
             'pg_upmap_primaries_added': self.pg_upmap_primaries_added,
-            'pg_upmap_primaries_removed': self.pg_upmap_primaries_removed
+            'pg_upmap_primaries_removed': self.pg_upmap_primaries_removed,
+            'upmap_groups': self.upmap_groups,
         }
         return (0, json.dumps(s, indent=4, sort_keys=True), '')
 
@@ -414,10 +618,7 @@ class Module(MgrModule):
                 warn = ('Unable to apply mode {} due to unknown min_compat_client {}.'.format(mode, min_compat_client))
                 return (-errno.EPERM, '', warn)
         elif mode == Mode.crush_compat:
-            ms = MappingState(self.get_osdmap(),
-                              self.get("pg_stats"),
-                              self.get("pool_stats"),
-                              'initialize compat weight-set')
+            ms = self.get_mapping_state(self.get_osdmap(), 'initialize compat weight-set')
             self.get_compat_weight_set_weights(ms)  # ignore error
         elif (mode == Mode.read) or (mode == Mode.upmap_read):
             try:
@@ -521,13 +722,43 @@ class Module(MgrModule):
         self.set_module_option('pool_ids', ','.join(final))
         return (0, '', '')
 
+    def get_pg_stats(self) -> PgStats:
+        # pg_stats and pool_stats come from the same PGMap
+        version = self.get_version("pg_stats")
+        cached = self._pg_stats
+        if version and cached and cached[0] == version:
+            return cached[1]
+        pg_stats = PgStats(self.get("pg_stats"), self.get("pool_stats"))
+        self._pg_stats = (version, pg_stats)
+        return pg_stats
+
+    def get_osdmap_dump(self, osdmap: OSDMap) -> Dict[str, Any]:
+        """
+        The dump of an OSDMap of the cluster: the one get('osd_map') keeps
+        for the current epoch if ``osdmap`` is of that epoch.
+        """
+        dump = self.get('osd_map', cached=True)
+        if dump.get('epoch') != osdmap.get_epoch():
+            dump = osdmap.dump()
+        return dump
+
+    def get_mapping_state(self, osdmap: OSDMap, desc: str) -> MappingState:
+        """
+        The MappingState of ``osdmap``, only the pools that changed since the
+        last one are mapped again.
+        """
+        with self._last_ms_lock:
+            prev = self._last_ms
+        ms = MappingState(osdmap, self.get_pg_stats(), desc, prev=prev,
+                          osdmap_dump=self.get_osdmap_dump(osdmap))
+        with self._last_ms_lock:
+            self._last_ms = ms
+        return ms
+
     def _state_from_option(self, option: Optional[str] = None) -> Tuple[MappingState, List[str]]:
         pools = []
         if option is None:
-            ms = MappingState(self.get_osdmap(),
-                              self.get("pg_stats"),
-                              self.get("pool_stats"),
-                              'current cluster')
+            ms = self.get_mapping_state(self.get_osdmap(), 'current cluster')
         elif option in self.plans:
             plan = self.plans.get(option)
             assert plan
@@ -539,10 +770,7 @@ class Module(MgrModule):
                 # Hence ms might not be accurate here since we are basically
                 # using an old snapshotted osdmap vs a fresh copy of pg_stats.
                 # It should not be a big deal though..
-                ms = MappingState(plan.osdmap,
-                                  self.get("pg_stats"),
-                                  self.get("pool_stats"),
-                                  f'plan "{plan.name}"')
+                ms = self.get_mapping_state(plan.osdmap, f'plan "{plan.name}"')
             else:
                 ms = cast(MsPlan, plan).final_state()
         else:
@@ -552,10 +780,7 @@ class Module(MgrModule):
             if option not in valid_pool_names:
                 raise ValueError(f'option "{option}" not a plan or a pool')
             pools.append(option)
-            ms = MappingState(osdmap,
-                              self.get("pg_stats"),
-                              self.get("pool_stats"),
-                              f'pool "{option}"')
+            ms = self.get_mapping_state(osdmap, f'pool "{option}"')
         return ms, pools
 
     @CLIReadCommand('balancer eval-verbose')
@@ -782,14 +1007,11 @@ class Module(MgrModule):
             # this way we could effectively eliminate the usage of a
             # complete pg_stats, which can become horribly inefficient
             # as pg_num grows..
-            plan = Plan(name, mode, osdmap, pools)
+            plan = Plan(name, mode, osdmap, pools, self.get_osdmap_dump(osdmap))
         else:
             plan = MsPlan(name,
                           mode,
-                          MappingState(osdmap,
-                                       self.get("pg_stats"),
-                                       self.get("pool_stats"),
-                                       'plan %s initial' % name),
+                          self.get_mapping_state(osdmap, 'plan %s initial' % name),
                           pools)
         return plan
 
@@ -868,40 +1090,27 @@ class Module(MgrModule):
         # pool and root actual
         for pool, pi in pool_info.items():
             poolid = pi['pool']
-            pm = ms.pg_up_by_poolid[poolid]
+            pgs_by_osd, objects_by_osd, bytes_by_osd = ms.sum_by_osd(poolid)
             pgs = 0
             objects = 0
             bytes = 0
-            pgs_by_osd = {}
-            objects_by_osd = {}
-            bytes_by_osd = {}
-            for pgid, up in pm.items():
-                for osd in [int(osd) for osd in up]:
-                    if osd == CRUSHMap.ITEM_NONE:
-                        continue
-                    if osd not in pgs_by_osd:
-                        pgs_by_osd[osd] = 0
-                        objects_by_osd[osd] = 0
-                        bytes_by_osd[osd] = 0
-                    pgs_by_osd[osd] += 1
-                    objects_by_osd[osd] += ms.pg_stat[pgid]['num_objects']
-                    bytes_by_osd[osd] += ms.pg_stat[pgid]['num_bytes']
-                    # pick a root to associate this pg instance with.
-                    # note that this is imprecise if the roots have
-                    # overlapping children.
-                    # FIXME: divide bytes by k for EC pools.
-                    for root in pe.pool_roots[pool]:
-                        if osd in pe.target_by_root[root]:
-                            actual_by_root[root]['pgs'][osd] += 1
-                            actual_by_root[root]['objects'][osd] += ms.pg_stat[pgid]['num_objects']
-                            actual_by_root[root]['bytes'][osd] += ms.pg_stat[pgid]['num_bytes']
-                            pgs += 1
-                            objects += ms.pg_stat[pgid]['num_objects']
-                            bytes += ms.pg_stat[pgid]['num_bytes']
-                            pe.total_by_root[root]['pgs'] += 1
-                            pe.total_by_root[root]['objects'] += ms.pg_stat[pgid]['num_objects']
-                            pe.total_by_root[root]['bytes'] += ms.pg_stat[pgid]['num_bytes']
-                            break
+            for osd, n in pgs_by_osd.items():
+                # pick a root to associate the pg instances on this osd
+                # with. note that this is imprecise if the roots have
+                # overlapping children.
+                # FIXME: divide bytes by k for EC pools.
+                for root in pe.pool_roots[pool]:
+                    if osd in pe.target_by_root[root]:
+                        actual_by_root[root]['pgs'][osd] += n
+                        actual_by_root[root]['objects'][osd] += objects_by_osd[osd]
+                        actual_by_root[root]['bytes'][osd] += bytes_by_osd[osd]
+                        pgs += n
+                        objects += objects_by_osd[osd]
+                        bytes += bytes_by_osd[osd]
+                        pe.total_by_root[root]['pgs'] += n
+                        pe.total_by_root[root]['objects'] += objects_by_osd[osd]
+                        pe.total_by_root[root]['bytes'] += bytes_by_osd[osd]
+                        break
             pe.count_by_pool[pool] = {
                 'pgs': {
                     k: v
@@ -1166,9 +1375,6 @@ class Module(MgrModule):
         self.log.debug('pools %s' % pools)
 
         adjusted_pools = []
-        inc = plan.inc
-        total_did = 0
-        left = max_optimizations
         pools_with_pg_merge = [p['pool_name'] for p in osdmap_dump.get('pools', [])
                                if p['pg_num'] > p['pg_num_target']]
         crush_rule_by_pool_name = dict((p['pool_name'], p['crush_rule'])
@@ -1183,12 +1389,41 @@ class Module(MgrModule):
             adjusted_pools.append(pool)
         # shuffle so all pools get equal (in)attention
         random.shuffle(adjusted_pools)
-        pool_dump = osdmap_dump.get('pools', [])
-        for pool in adjusted_pools:
-            for p in pool_dump:
-                if p['pool_name'] == pool:
-                    pool_id = p['pool']
-                    break
+        workers = cast(int, self.get_module_option('upmap_workers'))
+        if workers > 1:
+            total_did = self.upmap_groups_concurrently(plan, adjusted_pools, int(max_optimizations),
+                                                       max_deviation, workers)
+        else:
+            start = time.time()
+            total_did = self.upmap_pools(plan.osdmap, plan.inc, plan, adjusted_pools,
+                                         int(max_optimizations), max_deviation)
+            self.upmap_groups = [{
+                'roots': [],
+                'pools': adjusted_pools,
+                'changes': total_did,
+                'seconds': time.time() - start,
+            }]
+        if total_did > 0:
+            self.log.info('prepared %d/%d upmap changes' % (total_did, max_optimizations))
+        else:
+            self.log.debug('prepared %d/%d upmap changes' % (total_did, max_optimizations))
+            self.no_optimization_needed = True
+            return -errno.EALREADY, 'Unable to find further optimization, ' \
+                                    'or pool(s) pg_num is decreasing, ' \
+                                    'or distribution is already perfect'
+        return 0, ''
+
+    def upmap_pools(self, osdmap: OSDMap, inc: OSDMapIncremental, plan: Plan,
+                    pools: List[str], max_optimizations: int, max_deviation: int) -> int:
+        """
+        Add up to ``max_optimizations`` upmap changes for ``pools`` to ``inc``,
+        one pool after the other, and return their number.
+        """
+        pool_ids = {p['pool_name']: p['pool'] for p in plan.osdmap_dump.get('pools', [])}
+        total_did = 0
+        left = max_optimizations
+        for pool in pools:
+            pool_id = pool_ids[pool]
 
             # note that here we deliberately exclude any scrubbing pgs too
             # since scrubbing activities have significant impacts on performance
@@ -1202,20 +1437,117 @@ class Module(MgrModule):
                         num_pg_active_clean += s['count']
                         break
             available = min(left, num_pg_active_clean)
-            did = plan.osdmap.calc_pg_upmaps(inc, max_deviation, available, [pool])
+            did = osdmap.calc_pg_upmaps(inc, max_deviation, available, [pool])
             total_did += did
             left -= did
             if left <= 0:
                 break
-        if total_did > 0:
-            self.log.info('prepared %d/%d upmap changes' % (total_did, max_optimizations))
-        else:
-            self.log.debug('prepared %d/%d upmap changes' % (total_did, max_optimizations))
-            self.no_optimization_needed = True
-            return -errno.EALREADY, 'Unable to find further optimization, ' \
-                                    'or pool(s) pg_num is decreasing, ' \
-                                    'or distribution is already perfect'
-        return 0, ''
+        return total_did
+
+    def group_pools_by_osds(self, plan: Plan, pools: List[str]) -> List[Tuple[List[str], List[str]]]:
+        """
+        Split ``pools`` of ``plan`` into groups whose CRUSH rules share no OSDs, as the
+        names of the roots they take from and their pools, ordered by root
+        names and keeping the order of ``pools``.
+        """
+        crush = plan.osdmap.get_crush()
+        takes_by_rule = {
+            r['rule_id']: [s['item'] for s in r['steps'] if s.get('op') == 'take']
+            for r in crush.dump().get('rules', [])
+        }
+        rule_by_pool = {p['pool_name']: p['crush_rule'] for p in plan.osdmap_dump.get('pools', [])}
+        osds_by_take: Dict[int, Set[int]] = {}
+        # roots, OSDs and pools of every group
+        groups: List[Tuple[Set[int], Set[int], List[str]]] = []
+        for pool in pools:
+            takes = set(takes_by_rule.get(rule_by_pool[pool], []))
+            osds: Set[int] = set()
+            for take in takes:
+                if take not in osds_by_take:
+                    osds_by_take[take] = set(crush.get_take_weight_osd_map(take))
+                osds |= osds_by_take[take]
+            members = [pool]
+            for g in [g for g in groups if g[0] & takes or g[1] & osds]:
+                groups.remove(g)
+                takes |= g[0]
+                osds |= g[1]
+                members = g[2] + members
+            groups.append((takes, osds, members))
+        ret = []
+        for takes, _, members in groups:
+            names = sorted(crush.get_item_name(take) or str(take) for take in takes)
+            ret.append((names, sorted(members, key=pools.index)))
+        return sorted(ret)
+
+    def upmap_groups_concurrently(self, plan: Plan, pools: List[str], max_optimizations: int,
+                                  max_deviation: int, workers: int) -> int:
+        """
+        Plan the upmap changes of the groups of pools sharing no OSDs in up
+        to ``workers`` threads, each on its own copy of the OSDMap, and merge
+        them into the plan.
+
+        ``max_optimizations`` is split between the groups, starting one
+        group further on each call so that all groups get a share when there
+        are more groups than changes. Groups without a share are not run.
+        What a group did not use, because its pools are balanced, is split
+        between the groups that have not run yet or used all of their share,
+        in further rounds.
+        """
+        groups = self.group_pools_by_osds(plan, pools)
+        self.log.debug('upmap groups %s', groups)
+        if not groups:
+            self.upmap_groups = []
+            return 0
+
+        def run(osdmap: OSDMap, members: List[str], budget: int) -> Tuple['OSDMapIncremental', int, float]:
+            start = time.time()
+            inc = osdmap.new_incremental()
+            did = self.upmap_pools(osdmap, inc, plan, members, budget, max_deviation)
+            return inc, did, time.time() - start
+
+        first = self.upmap_group_offset % len(groups)
+        pending = list(range(first, len(groups))) + list(range(first))
+        osdmaps: Dict[int, OSDMap] = {}
+        changes = [0] * len(groups)
+        seconds = [0.0] * len(groups)
+        left = max_optimizations
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while left > 0 and pending:
+                batch = pending[:left]
+                budgets = [left // len(batch) + (1 if n < left % len(batch) else 0)
+                           for n in range(len(batch))]
+                futures = []
+                for i, budget in zip(batch, budgets):
+                    if i not in osdmaps:
+                        # calc_pg_upmaps runs without the GIL, on a copy per group
+                        osdmaps[i] = plan.osdmap.apply_incremental(plan.osdmap.new_incremental())
+                    futures.append(executor.submit(run, osdmaps[i], groups[i][1], budget))
+                exhausted = []
+                for i, budget, f in zip(batch, budgets, futures):
+                    inc, did, took = f.result()
+                    plan.inc.merge_upmaps(inc)
+                    changes[i] += did
+                    seconds[i] += took
+                    left -= did
+                    if did == budget:
+                        # there may be more to do: go on from its changes
+                        osdmaps[i] = osdmaps[i].apply_incremental(inc)
+                        exhausted.append(i)
+                pending = pending[len(batch):] + exhausted
+        # the next call starts with the first group that did not get a share
+        self.upmap_group_offset = first + min(max_optimizations, len(groups))
+
+        upmap_groups = []
+        for i, (roots, members) in enumerate(groups):
+            upmap_groups.append({
+                'roots': roots,
+                'pools': members,
+                'changes': changes[i],
+                'seconds': seconds[i],
+            })
+            self.log.debug('upmap group %s: %d changes in %.3fs', roots, changes[i], seconds[i])
+        self.upmap_groups = upmap_groups
+        return sum(changes)
 
     def do_crush_compat(self, plan: MsPlan) -> Tuple[int, str]:
         self.log.debug('do_crush_compat')
@@ -1286,6 +1618,10 @@ class Module(MgrModule):
         bad_steps = 0
         next_ws = copy.deepcopy(best_ws)
         next_ow = copy.deepcopy(best_ow)
+        # every step only maps the pools under the roots whose weights it
+        # changed again
+        prev_ms = ms
+        prev_ws = orig_ws
         while left > 0:
             # adjust
             self.log.debug('best_ws %s' % best_ws)
@@ -1356,7 +1692,10 @@ class Module(MgrModule):
 
             # recalc
             plan.compat_ws = copy.deepcopy(next_ws)
-            next_ms = plan.final_state()
+            changed_osds = set(osd for osd, w in next_ws.items() if prev_ws.get(osd) != w)
+            next_ms = plan.final_state(prev_ms, changed_osds)
+            prev_ms = next_ms
+            prev_ws = plan.compat_ws
             next_pe = self.calc_eval(next_ms, plan.pools)
             next_misplaced = next_ms.calc_misplaced_from(ms)
             self.log.debug('Step result score %f -> %f, misplacing %f',
@@ -0,0 +1,294 @@
+# python unit test
+import pytest
+
+from tests import mock
+from balancer.module import Module, MappingState, NO_OSD, PgStats, UpSets
+
+# CRUSHMap.ITEM_NONE, CRUSHMap itself is mocked
+NONE = 0x7fffffff
+
+# root -> OSDs under it
+TAKES = {-1: [0, 1, 2, 3], -2: [4, 5]}
+NAMES = {-1: 'default', -2: 'archive'}
+
+
+class CRUSH:
+    def __init__(self, takes):
+        self.takes = takes
+
+    def find_takes(self):
+        return list(self.takes)
+
+    def get_take_weight_osd_map(self, take):
+        return {osd: 1.0 for osd in self.takes[take]}
+
+    def get_item_name(self, item):
+        return NAMES[item]
+
+
+def replicated_up(ps):
+    # ps 7 is degraded and has one OSD less
+    return [(ps + i) % 4 for i in range(2 if ps == 7 else 3)]
+
+
+def ec_up(ps):
+    # holes in the up sets of an EC pool without enough OSDs
+    return [[4, 5, NONE], [5, NONE, 4], [NONE, 4, 5], [4, NONE, NONE]][ps % 4]
+
+
+class OSDMap:
+    """
+    Pool 1 "rbd" on root default with 8 PGs, pool 2 "ec" on root archive
+    with 4 PGs. ``moved`` overrides the up sets of some PGs, ``mapped``
+    records the pools mapped.
+    """
+
+    def __init__(self, moved=None, pg_num=None, epoch=1, down=(), upmaps=(), crush_version=1):
+        self.pg_num = {1: 8, 2: 4, **(pg_num or {})}
+        self.moved = moved or {}
+        self.epoch = epoch
+        self.down = set(down)
+        self.upmaps = list(upmaps)
+        self.crush_version = crush_version
+        self.dumps = 0
+        self.mapped = []
+
+    def get_epoch(self):
+        return self.epoch
+
+    def dump(self):
+        self.dumps += 1
+        return {
+            'epoch': self.epoch,
+            'pools': [
+                {'pool': 1, 'pool_name': 'rbd', 'crush_rule': 0, 'pg_num': self.pg_num[1]},
+                {'pool': 2, 'pool_name': 'ec', 'crush_rule': 1, 'pg_num': self.pg_num[2]},
+            ],
+            'osds': [{'osd': osd, 'weight': 1.0, 'up': 0 if osd in self.down else 1, 'in': 1}
+                     for osd in range(6)],
+            'pg_upmap_items': [{'pgid': pgid, 'mappings': [{'from': 0, 'to': 3}]}
+                               for pgid in self.upmaps],
+        }
+
+    def get_crush(self):
+        return CRUSH(TAKES)
+
+    def get_crush_version(self):
+        return self.crush_version
+
+    def get_pools_by_take(self, take):
+        return {-1: [1], -2: [2]}[take]
+
+    def map_pool_pgs_up(self, poolid):
+        self.mapped.append(poolid)
+        up = replicated_up if poolid == 1 else ec_up
+        pgs = {}
+        for ps in range(self.pg_num[poolid]):
+            pgid = '%d.%x' % (poolid, ps)
+            pgs[pgid] = self.moved.get(pgid, up(ps))
+        return pgs
+
+
+def pg_stats(pg_num=None):
+    pg_num = {1: 8, 2: 4, **(pg_num or {})}
+    return PgStats({
+        'pg_stats': [
+            {'pgid': '%d.%x' % (poolid, ps),
+             'stat_sum': {'num_objects': 10 * ps + poolid, 'num_bytes': 1000 * ps + poolid}}
+            for poolid, n in pg_num.items() for ps in range(n)
+        ],
+    }, {'pool_stats': [{'poolid': 1}, {'poolid': 2}]})
+
+
+def dict_sums(pgs_up, stats):
+    """
+    The PGs, objects and bytes by OSD of the up sets of a pool, counted
+    the way calc_eval() did on the pgid-keyed dicts.
+    """
+    pgs_by_osd, objects_by_osd, bytes_by_osd = {}, {}, {}
+    for pgid, up in pgs_up.items():
+        for osd in up:
+            if osd == NONE:
+                continue
+            pgs_by_osd[osd] = pgs_by_osd.get(osd, 0) + 1
+            objects_by_osd[osd] = objects_by_osd.get(osd, 0) + stats[pgid]['num_objects']
+            bytes_by_osd[osd] = bytes_by_osd.get(osd, 0) + stats[pgid]['num_bytes']
+    return [pgs_by_osd, objects_by_osd, bytes_by_osd]
+
+
+def dict_misplaced(before, after):
+    misplaced = sum(1 for pgid, up in before.items() if up != after.get(pgid, []))
+    return float(misplaced) / len(before)
+
+
+def all_pgs_up(osdmap):
+    pgs = {}
+    for poolid in (1, 2):
+        pgs.update(osdmap.map_pool_pgs_up(poolid))
+    return pgs
+
+
+def stat_sums():
+    return {pgid: {'num_objects': 10 * int(pgid[2:], 16) + int(pgid[0]),
+                   'num_bytes': 1000 * int(pgid[2:], 16) + int(pgid[0])}
+            for pgid in all_pgs_up(OSDMap())}
+
+
+@pytest.fixture(autouse=True)
+def crushmap():
+    with mock.patch('balancer.module.CRUSHMap', mock.Mock(ITEM_NONE=NONE)):
+        yield
+
+
+@pytest.fixture
+def module():
+    return Module('balancer', 0, 0)
+
+
+@pytest.mark.parametrize('poolid', [1, 2])
+def test_pack(poolid):
+    pgs_up = OSDMap().map_pool_pgs_up(poolid)
+    up = UpSets.pack(pgs_up)
+    assert up.pg_num == len(pgs_up)
+    assert up.width == 3
+    for pgid, osds in pgs_up.items():
+        # ITEM_NONE is NO_OSD, trailing ones are dropped
+        expected = [NO_OSD if osd == NONE else osd for osd in osds]
+        while expected and expected[-1] == NO_OSD:
+            expected.pop()
+        assert list(up.row(int(pgid[2:], 16))) == expected
+    assert list(up.row(up.pg_num)) == []
+
+
+def test_pack_empty():
+    up = UpSets.pack({})
+    assert (up.pg_num, up.width, list(up.osds)) == (0, 0, [])
+
+
+@pytest.mark.parametrize('poolid', [1, 2])
+def test_sum_by_osd(poolid):
+    osdmap = OSDMap()
+    ms = MappingState(osdmap, pg_stats())
+    assert ms.sum_by_osd(poolid) == dict_sums(osdmap.map_pool_pgs_up(poolid), stat_sums())
+
+
+def test_pg_stats_missing_pgs():
+    stats = pg_stats({1: 4})
+    objects, num_bytes = stats.columns(1, 8)
+    assert list(objects) == [1, 11, 21, 31, 0, 0, 0, 0]
+    assert list(num_bytes) == [1, 1001, 2001, 3001, 0, 0, 0, 0]
+
+
+def test_calc_eval(module):
+    osdmap = OSDMap()
+    pe = module.calc_eval(MappingState(osdmap, pg_stats()), [])
+    stats = stat_sums()
+    for pool, poolid in (('rbd', 1), ('ec', 2)):
+        pgs, objects, num_bytes = dict_sums(osdmap.map_pool_pgs_up(poolid), stats)
+        assert pe.count_by_pool[pool] == {'pgs': pgs, 'objects': objects, 'bytes': num_bytes}
+        assert pe.total_by_pool[pool] == {
+            'pgs': sum(pgs.values()),
+            'objects': sum(objects.values()),
+            'bytes': sum(num_bytes.values()),
+        }
+        assert pe.actual_by_pool[pool]['bytes'] == {
+            osd: float(v) / sum(num_bytes.values()) for osd, v in num_bytes.items()
+        }
+    # one pool per root
+    assert pe.count_by_root['default']['pgs'] == {
+        osd: float(n) for osd, n in pe.count_by_pool['rbd']['pgs'].items()
+    }
+    assert pe.total_by_root['archive'] == pe.total_by_pool['ec']
+    assert pe.score > 0
+
+
+@pytest.mark.parametrize('moved', [
+    {},
+    {'1.3': [3, 1, 0]},
+    {'1.0': [0, 1], '1.7': [3, 0, 2], '2.1': [5, 4, NONE], '2.3': [4, NONE, 5]},
+])
+def test_calc_misplaced_from(moved):
+    before = OSDMap()
+    after = OSDMap(moved)
+    stats = pg_stats()
+    ms_before = MappingState(before, stats)
+    ms_after = MappingState(after, stats)
+    assert ms_after.calc_misplaced_from(ms_before) == \
+        dict_misplaced(all_pgs_up(before), all_pgs_up(after))
+
+
+def test_calc_misplaced_from_pg_num_change():
+    before = OSDMap()
+    after = OSDMap(pg_num={1: 16})
+    ms_before = MappingState(before, pg_stats())
+    ms_after = MappingState(after, pg_stats({1: 16}))
+    assert ms_after.calc_misplaced_from(ms_before) == \
+        dict_misplaced(all_pgs_up(before), all_pgs_up(after))
+
+
+def test_osdmap_dump_is_reused(module):
+    current = OSDMap(epoch=5)
+    module._store = {
+        'mock_store/_ceph_get/osd_map': current.dump(),
+        'mock_store/_ceph_get_data_version/osd_map': 5,
+    }
+    module._pg_stats = (0, pg_stats())
+    module.get_pg_stats = lambda: module._pg_stats[1]
+    ms = module.get_mapping_state(current, 'current')
+    assert ms.osdmap_dump is module.get_mapping_state(current, 'again').osdmap_dump
+    assert current.dumps == 1
+
+    # not the current epoch
+    old = OSDMap(epoch=4)
+    ms = module.get_mapping_state(old, 'old')
+    assert ms.osdmap_dump['epoch'] == 4
+    assert old.dumps == 1
+
+
+@pytest.mark.parametrize('after,remapped', [
+    (OSDMap, []),
+    (lambda: OSDMap(pg_num={1: 16}), [1]),
+    (lambda: OSDMap(pg_num={2: 8}), [2]),
+    # osd.5 is under the archive root only
+    (lambda: OSDMap(down=[5]), [2]),
+    (lambda: OSDMap(down=[0]), [1]),
+    (lambda: OSDMap(upmaps=['1.3']), [1]),
+    (lambda: OSDMap(crush_version=2), [1, 2]),
+])
+def test_only_changed_pools_are_mapped(after, remapped):
+    stats = pg_stats({1: 16, 2: 8})
+    prev = MappingState(OSDMap(), stats)
+    osdmap = after()
+    ms = MappingState(osdmap, stats, prev=prev)
+    assert sorted(osdmap.mapped) == remapped
+    for poolid in (1, 2):
+        assert (ms.pg_up[poolid] is prev.pg_up[poolid]) == (poolid not in remapped)
+        assert ms.pg_up[poolid] == UpSets.pack(OSDMap(pg_num=osdmap.pg_num).map_pool_pgs_up(poolid))
+
+
+def test_upmap_removed():
+    stats = pg_stats()
+    prev = MappingState(OSDMap(upmaps=['2.1']), stats)
+    osdmap = OSDMap()
+    MappingState(osdmap, stats, prev=prev)
+    assert osdmap.mapped == [2]
+
+
+def test_changed_osds():
+    stats = pg_stats()
+    prev = MappingState(OSDMap(), stats)
+    # a crush-compat step reweighting osd.4, nothing else changed
+    osdmap = OSDMap(crush_version=2)
+    MappingState(osdmap, stats, prev=prev, changed_osds={4})
+    assert osdmap.mapped == [2]
+
+
+def test_mapping_state_reuses_the_last_one(module):
+    module.get_pg_stats = lambda: pg_stats()
+    module.get_osdmap_dump = lambda osdmap: osdmap.dump()
+    first = module.get_mapping_state(OSDMap(), 'first')
+    osdmap = OSDMap(down=[1])
+    second = module.get_mapping_state(osdmap, 'second')
+    assert osdmap.mapped == [1]
+    assert second.pg_up[2] is first.pg_up[2]
+    assert module._last_ms is second
@@ -0,0 +1,207 @@
+# python unit test
+import pytest
+
+from balancer.module import Module, Plan
+
+
+class CRUSH:
+    def __init__(self, rules, takes, names):
+        self.rules = rules
+        self.takes = takes
+        self.names = names
+
+    def dump(self):
+        return {'rules': self.rules}
+
+    def get_take_weight_osd_map(self, take):
+        return {osd: 1.0 for osd in self.takes[take]}
+
+    def get_item_name(self, item):
+        return self.names.get(item)
+
+
+class Incremental:
+    def __init__(self):
+        self.upmaps = {}
+
+    def merge_upmaps(self, other):
+        self.upmaps.update(other.upmaps)
+
+
+class OSDMap:
+    def __init__(self, crush, pools, needs=None):
+        self.crush = crush
+        self.pools = pools
+        self.dumps = 0
+        # pool name -> the budgets calc_pg_upmaps was called with
+        self.budgets = {}
+        # pool name -> the number of changes that balance it
+        self.needs = needs or {}
+        self.upmaps = {}
+
+    def get_crush(self):
+        return self.crush
+
+    def dump(self):
+        self.dumps += 1
+        return {'pools': self.pools}
+
+    def new_incremental(self):
+        return Incremental()
+
+    def apply_incremental(self, inc):
+        osdmap = OSDMap(self.crush, self.pools, self.needs)
+        osdmap.budgets = self.budgets
+        osdmap.upmaps = {**self.upmaps, **inc.upmaps}
+        return osdmap
+
+    def calc_pg_upmaps(self, inc, max_deviation, max_optimizations, pools):
+        assert max_optimizations > 0
+        self.budgets.setdefault(pools[0], []).append(max_optimizations)
+        pool_id = [p['pool'] for p in self.pools if p['pool_name'] == pools[0]][0]
+        done = sum(1 for v in self.upmaps.values() if v == pools[0])
+        did = min(max_optimizations, self.needs.get(pools[0], 2) - done)
+        for ps in range(done, done + did):
+            inc.upmaps['%d.%x' % (pool_id, ps)] = pools[0]
+        return did
+
+
+def rule(rule_id, *takes):
+    return {
+        'rule_id': rule_id,
+        'steps': [{'op': 'take', 'item': take} for take in takes] + [{'op': 'emit'}],
+    }
+
+
+def pool(pool_id, name, rule_id):
+    return {'pool': pool_id, 'pool_name': name, 'crush_rule': rule_id}
+
+
+# two roots, "default" with a "default~ssd" shadow tree of its ssd OSDs,
+# and "archive" with OSDs of its own
+TAKES = {
+    -1: [0, 1, 2, 3],
+    -2: [2, 3],
+    -3: [4, 5],
+}
+NAMES = {-1: 'default', -2: 'default~ssd', -3: 'archive'}
+
+
+@pytest.fixture
+def module():
+    return Module('balancer', 0, 0)
+
+
+def make_plan(rules, pools, takes=TAKES, names=NAMES, needs=None):
+    osdmap = OSDMap(CRUSH(rules, takes, names), pools, needs)
+    plan = Plan('test', 'upmap', osdmap, [p['pool_name'] for p in pools])
+    plan.pg_status = {
+        'pgs_by_pool_state': [
+            {
+                'pool_id': p['pool'],
+                'pg_state_counts': [{'state_name': 'active+clean', 'count': 64}],
+            }
+            for p in pools
+        ],
+    }
+    return plan
+
+
+def test_shadow_tree_shares_osds_with_its_root(module):
+    plan = make_plan([rule(0, -1), rule(1, -2), rule(2, -3)],
+                     [pool(1, 'rbd', 0), pool(2, 'fast', 1), pool(3, 'cold', 2)])
+    assert module.group_pools_by_osds(plan, ['rbd', 'fast', 'cold']) == [
+        (['archive'], ['cold']),
+        (['default', 'default~ssd'], ['rbd', 'fast']),
+    ]
+
+
+def test_rule_taking_several_roots_joins_their_groups(module):
+    plan = make_plan([rule(0, -2), rule(1, -3), rule(2, -2, -3)],
+                     [pool(1, 'fast', 0), pool(2, 'cold', 1), pool(3, 'mixed', 2)])
+    assert module.group_pools_by_osds(plan, ['fast', 'cold', 'mixed']) == [
+        (['archive', 'default~ssd'], ['fast', 'cold', 'mixed']),
+    ]
+
+
+def test_groups_keep_the_order_of_the_pools(module):
+    plan = make_plan([rule(0, -2), rule(1, -3)],
+                     [pool(1, 'a', 1), pool(2, 'b', 0), pool(3, 'c', 1), pool(4, 'd', 0)])
+    assert module.group_pools_by_osds(plan, ['d', 'c', 'b', 'a']) == [
+        (['archive'], ['c', 'a']),
+        (['default~ssd'], ['d', 'b']),
+    ]
+
+
+def test_grouping_uses_the_dump_of_the_plan(module):
+    plan = make_plan([rule(0, -1)], [pool(1, 'rbd', 0)])
+    dumps = plan.osdmap.dumps
+    module.group_pools_by_osds(plan, ['rbd'])
+    assert plan.osdmap.dumps == dumps
+
+
+def three_groups_plan(needs=None):
+    # the groups are ordered archive (cold), default~ssd (fast), slow
+    return make_plan([rule(0, -2), rule(1, -3), rule(2, -4)],
+                     [pool(1, 'fast', 0), pool(2, 'cold', 1), pool(3, 'slow', 2)],
+                     takes={**TAKES, -4: [6, 7]}, names={**NAMES, -4: 'slow'},
+                     needs=needs)
+
+
+@pytest.mark.parametrize('max_optimizations,budgets', [
+    (10, {'cold': [4], 'fast': [3], 'slow': [3]}),
+    (2, {'cold': [1], 'fast': [1]}),
+])
+def test_budget_is_split_between_groups(module, max_optimizations, budgets):
+    plan = three_groups_plan()
+    module.upmap_groups_concurrently(plan, ['fast', 'cold', 'slow'], max_optimizations, 5, 2)
+    # the first groups get the remainder, groups without a share do not run
+    assert plan.osdmap.budgets == budgets
+
+
+def test_more_groups_than_budget(module):
+    budgets = []
+    for _ in range(3):
+        plan = three_groups_plan(needs={'cold': 5, 'fast': 5, 'slow': 5})
+        assert module.upmap_groups_concurrently(plan, ['fast', 'cold', 'slow'], 2, 5, 2) == 2
+        budgets.append(plan.osdmap.budgets)
+    # every call starts with the first group left out by the previous one
+    assert budgets == [
+        {'cold': [1], 'fast': [1]},
+        {'slow': [1], 'cold': [1]},
+        {'fast': [1], 'slow': [1]},
+    ]
+
+
+def test_unused_budget_goes_to_the_other_groups(module):
+    # cold is balanced after 2 changes, fast after 8, slow after 1
+    plan = three_groups_plan(needs={'cold': 2, 'fast': 8, 'slow': 1})
+    did = module.upmap_groups_concurrently(plan, ['fast', 'cold', 'slow'], 10, 5, 2)
+    # 4, 3 and 3 first, then the 4 left over by cold and slow to fast,
+    # which goes on from its own changes
+    assert plan.osdmap.budgets == {'cold': [4], 'fast': [3, 4], 'slow': [3]}
+    assert did == 10
+    assert [u for u in plan.inc.upmaps if u.startswith('1.')] == ['1.%x' % ps for ps in range(7)]
+    assert [(g['roots'], g['changes']) for g in module.upmap_groups] == [
+        (['archive'], 2),
+        (['default~ssd'], 7),
+        (['slow'], 1),
+    ]
+
+
+def test_unused_budget_goes_to_groups_left_out(module):
+    plan = three_groups_plan(needs={'cold': 0, 'fast': 0, 'slow': 5})
+    did = module.upmap_groups_concurrently(plan, ['fast', 'cold', 'slow'], 2, 5, 2)
+    assert plan.osdmap.budgets == {'cold': [1], 'fast': [1], 'slow': [2]}
+    assert did == 2
+
+
+def test_group_changes_are_merged_into_the_plan(module):
+    plan = make_plan([rule(0, -2), rule(1, -3)], [pool(1, 'fast', 0), pool(2, 'cold', 1)])
+    did = module.upmap_groups_concurrently(plan, ['fast', 'cold'], 10, 5, 2)
+    assert did == 4
+    assert plan.inc.upmaps == {'1.0': 'fast', '1.1': 'fast', '2.0': 'cold', '2.1': 'cold'}
+    assert [(g['roots'], g['pools'], g['changes']) for g in module.upmap_groups] == [
+        (['archive'], ['cold'], 2),
+        (['default~ssd'], ['fast'], 2),
+    ]
@@ -0,0 +1,19 @@
+"""
+Offline benchmarks of mgr module hot paths.
+
+The benchmarks run outside of ceph-mgr, against the same ceph_module
+stand-in the unit tests use. Run them from src/pybind/mgr, e.g.:
+
+  PYTHONPATH=..:../../python-common python3 -m benchmarks.prometheus_exposition
+  PYTHONPATH=..:../../python-common python3 -m benchmarks.hot_paths --preset small
+"""
+
+import os
+
+os.environ.setdefault('UNITTEST', 'true')
+
+from tests import mock  # type: ignore  # noqa: E402,F401 - mocks ceph_module, rados, rbd and cephfs
+
+from .fake_cluster import install  # noqa: E402
+
+install()
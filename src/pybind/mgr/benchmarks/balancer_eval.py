@@ -0,0 +1,151 @@
+"""
+Compare the packed MappingState of the balancer with the dict based one it
+replaced: time and memory to build the state from pg_stats and to group the
+PG statistics by OSD, the core of calc_eval(). The results of both are
+checked to be the same. For the packed state, also the time of a step that
+moved no PG: a new state from the last one, evaluated and compared.
+
+Run from src/pybind/mgr:
+
+  PYTHONPATH=..:../../python-common python3 -m benchmarks.balancer_eval --osds 1000 --pgs 1048576
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+from balancer.module import MappingState, Module, PgStats
+from mgr_module import CRUSHMap
+
+from .fake_cluster import Cluster
+
+SumsByPool = Dict[int, Tuple[Dict[int, int], Dict[int, int], Dict[int, int]]]
+
+
+class DictMappingState:
+    """
+    The MappingState as it was before the PG statistics and up sets were
+    packed: a dict entry per PG.
+    """
+
+    def __init__(self, osdmap: Any, raw_pg_stats: Dict[str, Any],
+                 raw_pool_stats: Dict[str, Any]) -> None:
+        self.osdmap_dump = osdmap.dump()
+        self.crush_dump = osdmap.get_crush().dump()
+        self.pg_stat = {
+            i['pgid']: i['stat_sum'] for i in raw_pg_stats.get('pg_stats', [])
+        }
+        osd_poolids = [p['pool'] for p in self.osdmap_dump.get('pools', [])]
+        pg_poolids = [p['poolid'] for p in raw_pool_stats.get('pool_stats', [])]
+        self.poolids = set(osd_poolids) & set(pg_poolids)
+        self.pg_up: Dict[str, List[int]] = {}
+        self.pg_up_by_poolid: Dict[int, Dict[str, List[int]]] = {}
+        for poolid in self.poolids:
+            self.pg_up_by_poolid[poolid] = osdmap.map_pool_pgs_up(poolid)
+            for a, b in self.pg_up_by_poolid[poolid].items():
+                self.pg_up[a] = b
+
+    def sum_by_osd(self) -> SumsByPool:
+        ret = {}
+        for poolid, pm in self.pg_up_by_poolid.items():
+            pgs_by_osd: Dict[int, int] = {}
+            objects_by_osd: Dict[int, int] = {}
+            bytes_by_osd: Dict[int, int] = {}
+            for pgid, up in pm.items():
+                for osd in [int(osd) for osd in up]:
+                    if osd == CRUSHMap.ITEM_NONE:
+                        continue
+                    if osd not in pgs_by_osd:
+                        pgs_by_osd[osd] = 0
+                        objects_by_osd[osd] = 0
+                        bytes_by_osd[osd] = 0
+                    pgs_by_osd[osd] += 1
+                    objects_by_osd[osd] += self.pg_stat[pgid]['num_objects']
+                    bytes_by_osd[osd] += self.pg_stat[pgid]['num_bytes']
+            ret[poolid] = (pgs_by_osd, objects_by_osd, bytes_by_osd)
+        return ret
+
+
+def packed_sum_by_osd(ms: MappingState) -> SumsByPool:
+    ret = {}
+    for poolid, up in ms.pg_up.items():
+        pgs, objects, num_bytes = up.sum_by_osd(*ms.pg_stats.columns(poolid, up.pg_num))
+        ret[poolid] = (pgs, objects, num_bytes)
+    return ret
+
+
+def measure(func: Callable[[], Any]) -> Tuple[Any, float, int, int]:
+    """
+    Call ``func`` twice, return its result, duration and, measured in the
+    second call as tracing slows allocations down, peak and retained memory.
+    """
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    ret = func()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ret, elapsed, peak, retained
+
+
+def run(cluster: Cluster) -> Dict[str, Any]:
+    mod = cluster.attach(Module('balancer', 0, 0))
+    results: Dict[str, Any] = {'scale': cluster.scale()}
+
+    def build_dict() -> DictMappingState:
+        return DictMappingState(mod.get_osdmap(), mod.get('pg_stats'), mod.get('pool_stats'))
+
+    def build_packed() -> MappingState:
+        return MappingState(mod.get_osdmap(), PgStats(mod.get('pg_stats'), mod.get('pool_stats')))
+
+    # the pg_stats handed out by the synthetic cluster are shared, only what
+    # the state adds on top of them is counted
+    dict_ms, dict_build, dict_peak, dict_size = measure(build_dict)
+    packed_ms, packed_build, packed_peak, packed_size = measure(build_packed)
+    dict_sums, dict_sum_time, _, _ = measure(dict_ms.sum_by_osd)
+    packed_sums, packed_sum_time, _, _ = measure(lambda: packed_sum_by_osd(packed_ms))
+    assert dict_sums == packed_sums, 'packed and dict results differ'
+
+    start = time.perf_counter()
+    mod.calc_eval(packed_ms, [])
+    calc_eval = time.perf_counter() - start
+
+    # a new OSDMap that moved no PG: all up sets and sums are taken over
+    start = time.perf_counter()
+    next_ms = MappingState(mod.get_osdmap(), packed_ms.pg_stats, prev=packed_ms)
+    mod.calc_eval(next_ms, [])
+    next_ms.calc_misplaced_from(packed_ms)
+    incremental = time.perf_counter() - start
+
+    results['dict'] = {
+        'build_seconds': dict_build,
+        'build_peak_bytes': dict_peak,
+        'state_bytes': dict_size,
+        'sum_by_osd_seconds': dict_sum_time,
+    }
+    results['packed'] = {
+        'build_seconds': packed_build,
+        'build_peak_bytes': packed_peak,
+        'state_bytes': packed_size,
+        'sum_by_osd_seconds': packed_sum_time,
+        'calc_eval_seconds': calc_eval,
+        'unchanged_step_seconds': incremental,
+    }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--osds', type=int, default=1000)
+    parser.add_argument('--pgs', type=int, default=65536)
+    parser.add_argument('--pools', type=int, default=4)
+    args = parser.parse_args()
+    cluster = Cluster(osds=args.osds, pgs=args.pgs, pools=args.pools, osd_counters=0)
+    print(json.dumps(run(cluster), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,877 @@
+"""
+A synthetic cluster standing in for the C++ side of ceph-mgr.
+
+``Cluster`` generates the structures ceph-mgr hands to the python modules
+(OSDMap and CRUSH dumps, PGMap dumps, daemon metadata, perf counters, ...)
+for a cluster of a given size. PGs are mapped to OSDs deterministically, so
+two runs with the same parameters see the same cluster.
+
+The python modules only ever talk to ceph-mgr through the ``_ceph_*``
+methods of ``BaseMgrModule`` and the ``BasePyOSDMap`` / ``BasePyCRUSH``
+classes. ``install()`` replaces the latter on the mocked ``ceph_module`` so
+``mgr_module.OSDMap`` and ``mgr_module.CRUSHMap`` work against the synthetic
+cluster, ``Cluster.attach()`` does the same for a module instance.
+
+The data is generated once per PGMap version and handed out by reference
+(only the top level is copied), timings therefore exclude the cost of
+converting the C++ structures to python objects.
+"""
+
+import json
+import sys
+from array import array
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+# 4% of the PGs are not just active+clean
+PG_STATES = ('active+clean',) * 96 + (
+    'active+clean+scrubbing', 'active+clean+scrubbing+deep',
+    'active+recovering+degraded', 'active+remapped+backfilling')
+
+STAT_SUM = ('num_bytes', 'num_objects', 'num_object_copies', 'num_objects_degraded',
+            'num_objects_misplaced', 'num_objects_unfound', 'num_objects_recovered',
+            'num_bytes_recovered', 'num_keys_recovered', 'num_objects_repaired',
+            'num_read', 'num_read_kb', 'num_write', 'num_write_kb')
+
+# perf counter types, see PerfCounterType in mgr_module
+GAUGE = 2
+COUNTER = 2 | 8
+LONGRUNAVG = 1 | 4
+
+OSD_COUNTERS = [
+    ('osd.op', 'Client operations', COUNTER),
+    ('osd.op_r', 'Client read operations', COUNTER),
+    ('osd.op_w', 'Client write operations', COUNTER),
+    ('osd.op_in_bytes', 'Client operations total write size', COUNTER),
+    ('osd.op_out_bytes', 'Client operations total read size', COUNTER),
+    ('osd.op_latency', 'Latency of client operations', LONGRUNAVG),
+    ('osd.op_r_latency', 'Latency of read operation', LONGRUNAVG),
+    ('osd.op_w_latency', 'Latency of write operation', LONGRUNAVG),
+    ('osd.numpg', 'Placement groups', GAUGE),
+    ('osd.stat_bytes', 'OSD size', GAUGE),
+    ('osd.stat_bytes_used', 'Used space', GAUGE),
+    ('osd.recovery_ops', 'Started recovery operations', COUNTER),
+]
+
+MON_COUNTERS = [
+    ('mon.num_sessions', 'Open sessions', GAUGE),
+    ('mon.session_add', 'Created sessions', COUNTER),
+    ('mon.election_call', 'Elections started', COUNTER),
+    ('paxos.commit_latency', 'Commit latency', LONGRUNAVG),
+]
+
+CEPH_VERSION = 'ceph version 19.2.0 (0000000000000000000000000000000000000000) squid (stable)'
+
+TiB = 1 << 40
+
+
+def pg_hash(pool: int, ps: int) -> int:
+    return (pool * 2654435761 + ps * 40503) & 0xffffffff
+
+
+class Cluster:
+    """
+    A cluster of ``osds`` OSDs, ``osds_per_host`` to a host, below a single
+    CRUSH root. ``pgs`` PGs are spread over ``pools`` replicated pools of
+    size ``replicas``.
+    """
+
+    def __init__(self,
+                 osds: int = 100,
+                 pgs: int = 4096,
+                 pools: int = 4,
+                 osds_per_host: int = 10,
+                 replicas: int = 3,
+                 osd_counters: int = 40,
+                 mons: int = 3) -> None:
+        assert osds >= replicas
+        self.num_osds = osds
+        self.osds_per_host = osds_per_host
+        self.num_hosts = (osds + osds_per_host - 1) // osds_per_host
+        self.replicas = replicas
+        self.mons = mons
+        self.pg_num = {pool: max(1, pgs // pools) for pool in range(1, pools + 1)}
+        self.osd_counters = list(OSD_COUNTERS)
+        for i in range(len(OSD_COUNTERS), osd_counters):
+            self.osd_counters.append(('osd.counter_{}'.format(i), 'Synthetic counter', COUNTER))
+        self.osdmap_epoch = 100
+        self.pgmap_version = 1000
+        self.round = 0
+        self._pg_up: Dict[int, Dict[str, List[int]]] = {}
+        self.out: Set[int] = set()
+        self._data: Dict[str, Any] = {}
+        self.refresh_osdmap()
+        self.refresh_pgmap()
+
+    @property
+    def num_pgs(self) -> int:
+        return sum(self.pg_num.values())
+
+    def scale(self) -> Dict[str, int]:
+        return {
+            'osds': self.num_osds,
+            'hosts': self.num_hosts,
+            'pools': len(self.pg_num),
+            'pgs': self.num_pgs,
+            'replicas': self.replicas,
+            'osd_counters': len(self.osd_counters),
+        }
+
+    # -- topology
+
+    def host_osds(self, host: int) -> range:
+        return range(host * self.osds_per_host,
+                     min((host + 1) * self.osds_per_host, self.num_osds))
+
+    def map_pg(self, pool: int, ps: int) -> List[int]:
+        """
+        The up set of a PG: one OSD on each of ``replicas`` hosts, hosts
+        whose OSDs are all out are skipped.
+        """
+        h = pg_hash(pool, ps)
+        up: List[int] = []
+        if self.num_hosts >= self.replicas:
+            for r in range(self.num_hosts):
+                osds: Sequence[int] = self.host_osds((h + r) % self.num_hosts)
+                if self.out:
+                    osds = [osd for osd in osds if osd not in self.out]
+                if osds:
+                    up.append(osds[(h >> 8) % len(osds)])
+                if len(up) == self.replicas:
+                    break
+        else:
+            osds = [osd for osd in range(self.num_osds) if osd not in self.out]
+            for r in range(min(self.replicas, len(osds))):
+                up.append(osds[(h + r) % len(osds)])
+        return up
+
+    def pg_up(self, pool: int) -> Dict[str, List[int]]:
+        if pool not in self._pg_up:
+            self._pg_up[pool] = {'{}.{:x}'.format(pool, ps): self.map_pg(pool, ps)
+                                 for ps in range(self.pg_num[pool])}
+        return self._pg_up[pool]
+
+    def pg_state(self, pool: int, ps: int) -> str:
+        return PG_STATES[(pg_hash(pool, ps) + self.round) % len(PG_STATES)]
+
+    def mark_out(self, osds: Iterable[int]) -> None:
+        """Mark OSDs out, in a new OSDMap epoch."""
+        self.out.update(osds)
+        self._pg_up.clear()
+        self.osdmap_epoch += 1
+        self.refresh_osdmap()
+
+    # -- versions
+
+    def tick(self, osdmap: bool = False) -> None:
+        """
+        Advance the cluster: a new PGMap with grown statistics and, if
+        ``osdmap`` is set, a new OSDMap epoch.
+        """
+        self.round += 1
+        if osdmap:
+            self.osdmap_epoch += 1
+            self.refresh_osdmap()
+        self.pgmap_version += 1
+        self.refresh_pgmap()
+
+    def data_version(self, what: str) -> int:
+        # same as ActivePyModules::get_data_version()
+        if what in ('osd_map', 'osd_map_tree', 'osd_map_crush', 'osd_metadata'):
+            return self.osdmap_epoch
+        if what in ('fs_map', 'mon_map', 'mgr_map', 'service_map'):
+            return 1
+        if what in ('pg_summary', 'pg_status', 'pg_dump', 'pg_stats', 'pool_stats',
+                    'osd_stats', 'osd_ping_times'):
+            return self.pgmap_version
+        if what in ('df', 'osd_pool_stats'):
+            return (self.osdmap_epoch << 40) ^ self.pgmap_version
+        return 0
+
+    # -- OSDMap
+
+    def refresh_osdmap(self) -> None:
+        d = self._data
+        d['osd_map_crush'] = self.crush_dump()
+        d['osd_map'] = self.osd_map()
+        d['osd_map_tree'] = self.osd_map_tree()
+        d['osd_metadata'] = {str(osd): self.metadata('osd', str(osd))
+                             for osd in range(self.num_osds)}
+
+    def pool(self, pool: int) -> Dict[str, Any]:
+        pg_num = self.pg_num[pool]
+        return {
+            'pool': pool,
+            'pool_name': 'pool{}'.format(pool),
+            'type': 1,
+            'size': self.replicas,
+            'min_size': self.replicas - 1,
+            'crush_rule': 0,
+            'pg_num': pg_num,
+            'pg_placement_num': pg_num,
+            'pg_num_target': pg_num,
+            'pg_placement_num_target': pg_num,
+            'pg_num_pending': pg_num,
+            'pg_autoscale_mode': 'on',
+            'flags_names': 'hashpspool',
+            'erasure_code_profile': '',
+            'quota_max_bytes': 0,
+            'quota_max_objects': 0,
+            'target_max_bytes': 0,
+            'options': {},
+            # no rbd pools, the image listings would need rados
+            'application_metadata': {'cephfs' if pool <= 2 else 'rgw': {}},
+            'read_balance': {
+                'score_type': 'Fair distribution',
+                'score_acting': 1.5,
+                'score_stable': 1.5,
+                'optimal_score': 1,
+                'raw_score_acting': 1.5,
+                'raw_score_stable': 1.5,
+                'primary_affinity_weighted': 1,
+                'average_primary_affinity': 1,
+                'average_primary_affinity_weighted': 1,
+            },
+        }
+
+    def osd(self, osd: int) -> Dict[str, Any]:
+        addr = '10.0.{}.{}'.format(osd // 250, osd % 250)
+        return {
+            'osd': osd,
+            'uuid': '00000000-0000-0000-0000-{:012x}'.format(osd),
+            'up': 1,
+            'in': 0 if osd in self.out else 1,
+            'weight': 0.0 if osd in self.out else 1.0,
+            'primary_affinity': 1.0,
+            'last_clean_begin': 0,
+            'last_clean_end': 0,
+            'up_from': 10,
+            'up_thru': self.osdmap_epoch - 1,
+            'down_at': 0,
+            'lost_at': 0,
+            'public_addr': '{}:6800/{}'.format(addr, 1000 + osd),
+            'cluster_addr': '{}:6801/{}'.format(addr, 1000 + osd),
+            'heartbeat_back_addr': '{}:6802/{}'.format(addr, 1000 + osd),
+            'heartbeat_front_addr': '{}:6803/{}'.format(addr, 1000 + osd),
+            'state': ['exists', 'up'],
+        }
+
+    def osd_map(self) -> Dict[str, Any]:
+        return {
+            'epoch': self.osdmap_epoch,
+            'fsid': '00000000-0000-0000-0000-000000000000',
+            'flags': 'sortbitwise,recovery_deletes,purged_snapdirs,pglog_hardlimit',
+            'flags_num': 5799936,
+            'flags_set': ['pglog_hardlimit', 'purged_snapdirs', 'recovery_deletes',
+                          'sortbitwise'],
+            'crush_version': self.osdmap_epoch,
+            'full_ratio': 0.95,
+            'backfillfull_ratio': 0.9,
+            'nearfull_ratio': 0.85,
+            'require_min_compat_client': 'luminous',
+            'require_osd_release': 'squid',
+            'max_osd': self.num_osds,
+            'pools': [self.pool(pool) for pool in self.pg_num],
+            'osds': [self.osd(osd) for osd in range(self.num_osds)],
+            'osd_xinfo': [],
+            'pg_upmap': [],
+            'pg_upmap_items': [],
+            'pg_upmap_primaries': [],
+            'pg_temp': [],
+            'primary_temp': [],
+            'blocklist': {},
+            'erasure_code_profiles': {
+                'default': {'k': '2', 'm': '2', 'plugin': 'jerasure',
+                            'technique': 'reed_sol_van'},
+            },
+        }
+
+    def crush_dump(self) -> Dict[str, Any]:
+        weight = 0x10000
+        hosts = []
+        for host in range(self.num_hosts):
+            osds = self.host_osds(host)
+            hosts.append({
+                'id': -2 - host,
+                'name': 'host{}'.format(host),
+                'type_id': 1,
+                'type_name': 'host',
+                'weight': weight * len(osds),
+                'alg': 'straw2',
+                'hash': 'rjenkins1',
+                'items': [{'id': osd, 'weight': weight, 'pos': pos}
+                          for pos, osd in enumerate(osds)],
+            })
+        root = {
+            'id': -1,
+            'name': 'default',
+            'type_id': 11,
+            'type_name': 'root',
+            'weight': weight * self.num_osds,
+            'alg': 'straw2',
+            'hash': 'rjenkins1',
+            'items': [{'id': b['id'], 'weight': b['weight'], 'pos': pos}
+                      for pos, b in enumerate(hosts)],
+        }
+        return {
+            'devices': [{'id': osd, 'name': 'osd.{}'.format(osd), 'class': 'ssd'}
+                        for osd in range(self.num_osds)],
+            'types': [{'type_id': 0, 'name': 'osd'}, {'type_id': 1, 'name': 'host'},
+                      {'type_id': 11, 'name': 'root'}],
+            'buckets': [root] + hosts,
+            'rules': [{
+                'rule_id': 0,
+                'rule_name': 'replicated_rule',
+                'type': 1,
+                'steps': [
+                    {'op': 'take', 'item': -1, 'item_name': 'default'},
+                    {'op': 'chooseleaf_firstn', 'num': 0, 'type': 'host'},
+                    {'op': 'emit'},
+                ],
+            }],
+            'tunables': {'profile': 'jewel', 'chooseleaf_stable': 1},
+            'choose_args': {},
+        }
+
+    def osd_map_tree(self) -> Dict[str, Any]:
+        nodes: List[Dict[str, Any]] = [{
+            'id': -1, 'name': 'default', 'type': 'root', 'type_id': 11,
+            'children': [-2 - host for host in range(self.num_hosts)],
+        }]
+        for host in range(self.num_hosts):
+            osds = self.host_osds(host)
+            nodes.append({'id': -2 - host, 'name': 'host{}'.format(host), 'type': 'host',
+                          'type_id': 1, 'pool_weights': {}, 'children': list(osds)})
+            for osd in osds:
+                nodes.append({'id': osd, 'device_class': 'ssd', 'name': 'osd.{}'.format(osd),
+                              'type': 'osd', 'type_id': 0, 'crush_weight': 1.0, 'depth': 2,
+                              'pool_weights': {}, 'exists': 1, 'status': 'up',
+                              'reweight': 1.0, 'primary_affinity': 1.0})
+        return {'nodes': nodes, 'stray': []}
+
+    # -- PGMap
+
+    def refresh_pgmap(self) -> None:
+        pg_stats = []
+        pool_sums: Dict[int, Dict[str, int]] = {}
+        osd_pgs = [0] * self.num_osds
+        osd_bytes = [0] * self.num_osds
+        by_osd: Dict[int, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        by_pool: Dict[str, Dict[str, int]] = {}
+        total: Dict[str, int] = defaultdict(int)
+        states: Dict[str, int] = defaultdict(int)
+        for pool, pg_num in self.pg_num.items():
+            pool_sum = dict.fromkeys(STAT_SUM, 0)
+            pool_states: Dict[str, int] = defaultdict(int)
+            for (pgid, up), ps in zip(self.pg_up(pool).items(), range(pg_num)):
+                h = pg_hash(pool, ps)
+                objects = 1000 + h % 1000 + self.round
+                state = self.pg_state(pool, ps)
+                stat_sum = {
+                    'num_bytes': objects << 22,
+                    'num_objects': objects,
+                    'num_object_copies': objects * self.replicas,
+                    'num_objects_degraded': 0,
+                    'num_objects_misplaced': 0,
+                    'num_objects_unfound': 0,
+                    'num_objects_recovered': h % 7,
+                    'num_bytes_recovered': (h % 7) << 22,
+                    'num_keys_recovered': 0,
+                    'num_objects_repaired': 0,
+                    'num_read': objects * 11 + self.round,
+                    'num_read_kb': objects * 44,
+                    'num_write': objects * 7 + self.round,
+                    'num_write_kb': objects * 28,
+                }
+                if 'degraded' in state:
+                    stat_sum['num_objects_degraded'] = objects // 3
+                pg_stats.append({
+                    'pgid': pgid,
+                    'version': '{}\'{}'.format(self.osdmap_epoch, objects),
+                    'reported_seq': self.pgmap_version,
+                    'reported_epoch': self.osdmap_epoch,
+                    'state': state,
+                    'up': up,
+                    'acting': up,
+                    'up_primary': up[0],
+                    'acting_primary': up[0],
+                    'stat_sum': stat_sum,
+                })
+                for k, v in stat_sum.items():
+                    pool_sum[k] += v
+                for osd in up:
+                    osd_pgs[osd] += 1
+                    osd_bytes[osd] += stat_sum['num_bytes']
+                    by_osd[osd][state] += 1
+                pool_states[state] += 1
+                states[state] += 1
+            pool_sums[pool] = pool_sum
+            by_pool[str(pool)] = dict(pool_states)
+            for k, v in pool_sum.items():
+                total[k] += v
+
+        osd_kb = 4 * TiB // 1024
+        osd_stats = [{
+            'osd': osd,
+            'up_from': 10,
+            'seq': self.pgmap_version,
+            'num_pgs': osd_pgs[osd],
+            'num_osds': 1,
+            'kb': osd_kb,
+            'kb_used': osd_bytes[osd] // 1024,
+            'kb_avail': osd_kb - osd_bytes[osd] // 1024,
+            'hb_peers': [],
+            'perf_stat': {
+                'commit_latency_ms': osd % 5,
+                'apply_latency_ms': osd % 5,
+                'commit_latency_ns': (osd % 5) * 1000000,
+                'apply_latency_ns': (osd % 5) * 1000000,
+            },
+        } for osd in range(self.num_osds)]
+
+        pool_stats = [{
+            'poolid': pool,
+            'num_pg': self.pg_num[pool],
+            'stat_sum': pool_sums[pool],
+            'log_size': 0,
+            'ondisk_log_size': 0,
+            'up': self.pg_num[pool] * self.replicas,
+            'acting': self.pg_num[pool] * self.replicas,
+            'num_store_stats': self.num_osds,
+        } for pool in self.pg_num]
+
+        d = self._data
+        d['pg_stats'] = {'pg_stats': pg_stats}
+        d['pool_stats'] = {'pool_stats': pool_stats}
+        d['osd_stats'] = {'osd_stats': osd_stats}
+        d['pg_dump'] = {
+            'version': self.pgmap_version,
+            'last_osdmap_epoch': self.osdmap_epoch,
+            'pg_stats_sum': {'stat_sum': dict(total)},
+            'pg_stats': pg_stats,
+            'pool_stats': pool_stats,
+            'osd_stats': osd_stats,
+        }
+        d['pg_summary'] = {
+            'by_osd': {str(osd): dict(s) for osd, s in by_osd.items()},
+            'by_pool': by_pool,
+            'all': dict(states),
+            'pg_stats_sum': {'stat_sum': dict(total)},
+        }
+        d['df'] = self.df(pool_sums)
+        d['osd_pool_stats'] = {'pool_stats': [{
+            'pool_name': 'pool{}'.format(pool),
+            'pool_id': pool,
+            'recovery': {},
+            'recovery_rate': {
+                'recovering_objects_per_sec': pool % 3,
+                'recovering_bytes_per_sec': (pool % 3) << 22,
+                'recovering_keys_per_sec': 0,
+                'num_objects_recovered': pool % 3,
+                'num_bytes_recovered': (pool % 3) << 22,
+                'num_keys_recovered': 0,
+            },
+            'client_io_rate': {
+                'read_bytes_sec': 1 << 20,
+                'write_bytes_sec': 1 << 19,
+                'read_op_per_sec': 100,
+                'write_op_per_sec': 50,
+            },
+        } for pool in self.pg_num]}
+
+    def df(self, pool_sums: Dict[int, Dict[str, int]]) -> Dict[str, Any]:
+        total_bytes = self.num_osds * 4 * TiB
+        used_raw = sum(s['num_bytes'] for s in pool_sums.values()) * self.replicas
+        stats = {
+            'total_bytes': total_bytes,
+            'total_avail_bytes': total_bytes - used_raw,
+            'total_used_bytes': used_raw,
+            'total_used_raw_bytes': used_raw,
+            'total_used_raw_ratio': used_raw / total_bytes,
+            'num_osds': self.num_osds,
+            'num_per_pool_osds': self.num_osds,
+            'num_per_pool_omap_osds': self.num_osds,
+        }
+        max_avail = (total_bytes - used_raw) // self.replicas
+        pools = []
+        for pool, s in pool_sums.items():
+            stored = s['num_bytes']
+            pools.append({
+                'name': 'pool{}'.format(pool),
+                'id': pool,
+                'stats': {
+                    'stored': stored,
+                    'stored_data': stored,
+                    'stored_omap': 0,
+                    'objects': s['num_objects'],
+                    'kb_used': stored * self.replicas // 1024,
+                    'bytes_used': stored * self.replicas,
+                    'data_bytes_used': stored * self.replicas,
+                    'omap_bytes_used': 0,
+                    'percent_used': stored * self.replicas / total_bytes,
+                    'max_avail': max_avail,
+                    'avail_raw': max_avail * self.replicas,
+                    'stored_raw': stored * self.replicas,
+                    'quota_objects': 0,
+                    'quota_bytes': 0,
+                    'dirty': 0,
+                    'rd': s['num_read'],
+                    'rd_bytes': s['num_read_kb'] * 1024,
+                    'wr': s['num_write'],
+                    'wr_bytes': s['num_write_kb'] * 1024,
+                    'compress_bytes_used': 0,
+                    'compress_under_bytes': 0,
+                },
+            })
+        return {'stats': stats, 'stats_by_class': {'ssd': dict(stats)}, 'pools': pools}
+
+    # -- other maps
+
+    def mon_status(self) -> Dict[str, Any]:
+        mons = [{'rank': rank, 'name': chr(ord('a') + rank),
+                 'public_addr': '10.0.255.{}:6789/0'.format(rank),
+                 'addr': '10.0.255.{}:6789/0'.format(rank)}
+                for rank in range(self.mons)]
+        return {
+            'name': 'a',
+            'rank': 0,
+            'state': 'leader',
+            'quorum': list(range(self.mons)),
+            'monmap': {'epoch': 1, 'fsid': '00000000-0000-0000-0000-000000000000',
+                       'mons': mons},
+        }
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            'status': 'HEALTH_WARN',
+            'checks': {
+                'SLOW_OPS': {
+                    'severity': 'HEALTH_WARN',
+                    'summary': {
+                        'message': '42 slow ops, oldest one blocked for 12 sec, '
+                                   'daemons [osd.0,osd.3] have slow ops.',
+                        'count': 42,
+                    },
+                    'muted': False,
+                },
+            },
+            'mutes': [],
+        }
+
+    def fs_map(self) -> Dict[str, Any]:
+        return {
+            'epoch': 1,
+            'standbys': [{'gid': 4200, 'name': 'b', 'rank': -1, 'state': 'up:standby',
+                          'addr': '10.0.255.11:6800/2'}],
+            'filesystems': [{
+                'id': 1,
+                'mdsmap': {
+                    'fs_name': 'cephfs',
+                    'metadata_pool': 1,
+                    'data_pools': [2],
+                    'info': {'gid_4100': {'gid': 4100, 'name': 'a', 'rank': 0,
+                                          'state': 'up:active',
+                                          'addr': '10.0.255.10:6800/1'}},
+                },
+            }],
+        }
+
+    def mgr_map(self) -> Dict[str, Any]:
+        modules = ['balancer', 'dashboard', 'pg_autoscaler', 'progress', 'prometheus']
+        return {
+            'epoch': 1,
+            'active_gid': 4300,
+            'active_name': 'x',
+            'available': True,
+            'standbys': [{'gid': 4301, 'name': 'y', 'available_modules': []}],
+            'modules': ['dashboard', 'prometheus'],
+            'available_modules': [{'name': m, 'can_run': True, 'error_string': ''}
+                                  for m in modules],
+            'always_on_modules': {'squid': ['balancer', 'pg_autoscaler', 'progress']},
+            'services': {},
+        }
+
+    # -- daemons
+
+    def servers(self) -> List[Dict[str, Any]]:
+        servers = []
+        for host in range(self.num_hosts):
+            services = [{'type': 'osd', 'id': str(osd), 'name': '',
+                         'ceph_version': CEPH_VERSION}
+                        for osd in self.host_osds(host)]
+            if host < self.mons:
+                for t in ('mon', 'mgr'):
+                    services.append({'type': t, 'id': chr(ord('a') + host), 'name': '',
+                                     'ceph_version': CEPH_VERSION})
+            servers.append({'hostname': 'host{}'.format(host), 'ceph_version': CEPH_VERSION,
+                            'services': services})
+        return servers
+
+    def get_server(self, hostname: Optional[str]) -> Any:
+        servers = self.servers()
+        if hostname is None:
+            return servers
+        for server in servers:
+            if server['hostname'] == hostname:
+                return server
+        return {}
+
+    def metadata(self, svc_type: str, svc_id: str) -> Optional[Dict[str, str]]:
+        if svc_type == 'osd':
+            osd = int(svc_id)
+            if osd >= self.num_osds:
+                return None
+            return {
+                'hostname': 'host{}'.format(osd // self.osds_per_host),
+                'ceph_version': CEPH_VERSION,
+                'osd_objectstore': 'bluestore',
+                'front_iface': 'eth0',
+                'back_iface': 'eth1',
+                'bluestore_bdev_dev_node': '/dev/sd{}'.format(chr(ord('b') + osd % 20)),
+                'bluefs_db_dev_node': '',
+                'bluefs_wal_dev_node': '',
+                'devices': 'sd{}'.format(chr(ord('b') + osd % 20)),
+                'device_ids': 'sd{}=VENDOR_MODEL_{:08d}'.format(chr(ord('b') + osd % 20), osd),
+            }
+        return {'hostname': 'host0', 'ceph_version': CEPH_VERSION}
+
+    def perf_counters_bulk(self, svc_type: str, prio_limit: int,
+                           known_schema_version: int) -> Dict[str, Any]:
+        if svc_type == 'osd':
+            counters = self.osd_counters
+            daemons = [str(osd) for osd in range(self.num_osds)]
+        elif svc_type == 'mon':
+            counters = MON_COUNTERS
+            daemons = [chr(ord('a') + rank) for rank in range(self.mons)]
+        else:
+            counters = []
+            daemons = []
+        values = array('q')
+        counts = array('q')
+        for row in range(len(daemons)):
+            for col, (_, _, tp) in enumerate(counters):
+                v = (row * 7919 + col * 104729 + self.round * 31) & 0xffffffff
+                values.append(v)
+                counts.append(v >> 10 if tp & 4 else 0)
+        data: Dict[str, Any] = {
+            'schema_version': 1,
+            'daemons': daemons,
+            'values': values.tobytes(),
+            'counts': counts.tobytes(),
+            'present': b'\x01' * len(values),
+        }
+        if known_schema_version != 1:
+            data['schema'] = [(path, desc, '', tp, 5, 0) for path, desc, tp in counters]
+        return data
+
+    def daemon_health_metrics(self) -> Dict[str, List[Dict[str, Any]]]:
+        metrics = {
+            'osd.{}'.format(osd): [{'type': 'SLOW_OPS', 'value': 0},
+                                   {'type': 'PENDING_CREATING_PGS', 'value': 0}]
+            for osd in range(self.num_osds)
+        }
+        for rank in range(self.mons):
+            metrics['mon.{}'.format(chr(ord('a') + rank))] = [{'type': 'SLOW_OPS', 'value': 0}]
+        return metrics
+
+    # -- BaseMgrModule
+
+    def get(self, what: str) -> Any:
+        if what in self._data:
+            data = self._data[what]
+            return dict(data) if isinstance(data, dict) else data
+        if what in ('health', 'mon_status'):
+            data = self.health() if what == 'health' else self.mon_status()
+            return {'json': json.dumps(data)}
+        if what == 'fs_map':
+            return self.fs_map()
+        if what == 'mgr_map':
+            return self.mgr_map()
+        if what == 'service_map':
+            return {'epoch': 1, 'services': {}}
+        if what == 'osd_map_crush_map_text':
+            return ''
+        if what == 'io_rate':
+            return {'pg_stats_delta': {'stat_sum': {}}}
+        if what == 'osd_blocklist':
+            return {'entries': []}
+        if what == 'pg_progress' or what.startswith('pg_progress_since '):
+            return {
+                'version': self.pgmap_version,
+                'delta': False,
+                'pgs': {s['pgid']: {'num_bytes_recovered': s['stat_sum']['num_bytes_recovered'],
+                                    'num_bytes': s['stat_sum']['num_bytes'],
+                                    'reported_epoch': s['reported_epoch'],
+                                    'state': s['state']}
+                        for s in self._data['pg_stats']['pg_stats']},
+                'pg_ready': True,
+            }
+        raise KeyError(what)
+
+    def get_versioned(self, what: str, known_version: int) -> Tuple[int, Any]:
+        version = self.data_version(what)
+        if version and version == known_version:
+            return version, None
+        return version, self.get(what)
+
+    def send_command(self, res: Any, svc_type: str, svc_id: str, command: str, tag: str,
+                     inbuf: str, *, one_shot: bool = False) -> None:
+        cmd = json.loads(command)
+        if cmd['prefix'] == 'osd blocklist ls':
+            res.complete(0, '[]', 'listed 0 entries')
+        else:
+            res.complete(0, '', '')
+
+    def get_option(self, key: str) -> Any:
+        return {
+            'mon_target_pg_per_osd': 100,
+            'mon_max_pg_per_osd': 250,
+            'mon_pg_warn_max_object_skew': 10.0,
+        }.get(key)
+
+    def attach(self, module: Any, **options: Any) -> Any:
+        """
+        Point the ``_ceph_*`` methods of a module instance at this cluster.
+        Module options not given in ``options`` have their default value.
+        """
+        from mgr_module import OSDMap
+
+        defaults = {o['name']: o.get('default') for o in module.MODULE_OPTIONS}
+
+        def get_module_option(module_name: str, key: str,
+                              localized_prefix: Optional[str] = None) -> Any:
+            return options.get(key, defaults.get(key))
+
+        module._ceph_get_module_option = get_module_option
+        module._ceph_get = self.get
+        module._ceph_get_data_version = self.data_version
+        module._ceph_get_versioned = self.get_versioned
+        module._ceph_get_osdmap = lambda: OSDMap(self)  # type: ignore[call-arg]
+        module._ceph_get_option = self.get_option
+        module._ceph_send_command = self.send_command
+        module._ceph_get_server = self.get_server
+        module._ceph_get_metadata = self.metadata
+        module._ceph_get_unlabeled_perf_counters_bulk = self.perf_counters_bulk
+        module._ceph_get_daemon_health_metrics = self.daemon_health_metrics
+        module._ceph_have_mon_connection = lambda: True
+        module._ceph_get_release_name = lambda: 'squid'
+        module._ceph_update_progress_event = lambda *args: None
+        module._ceph_complete_progress_event = lambda *args: None
+        return module
+
+
+class FakeOSDMapBase:
+    """
+    Stands in for ``ceph_module.BasePyOSDMap``.
+    """
+
+    def __init__(self, cluster: Cluster) -> None:
+        self._cluster = cluster
+
+    def _get_epoch(self) -> int:
+        return self._cluster.osdmap_epoch
+
+    def _get_crush_version(self) -> int:
+        return self._cluster.osdmap_epoch
+
+    def _dump(self) -> Dict[str, Any]:
+        return self._cluster.get('osd_map')
+
+    def _get_crush(self) -> Any:
+        from mgr_module import CRUSHMap
+        return CRUSHMap(self._cluster)  # type: ignore[call-arg]
+
+    def _get_pools_by_take(self, take: int) -> Dict[str, List[int]]:
+        return {'pools': list(self._cluster.pg_num) if take == -1 else []}
+
+    def _map_pool_pgs_up(self, poolid: int) -> Dict[str, List[int]]:
+        return {pgid: list(up) for pgid, up in self._cluster.pg_up(poolid).items()}
+
+    def _pg_to_up_acting_osds(self, pool_id: int, ps: int) -> Dict[str, Any]:
+        up = self._cluster.map_pg(pool_id, ps)
+        return {'up': up, 'acting': up, 'up_primary': up[0], 'acting_primary': up[0]}
+
+    def _pool_raw_used_rate(self, pool_id: int) -> float:
+        return float(self._cluster.replicas)
+
+    def _new_incremental(self) -> Any:
+        from mgr_module import OSDMapIncremental
+        return OSDMapIncremental(self._cluster)  # type: ignore[call-arg]
+
+    def _apply_incremental(self, inc: Any) -> Any:
+        # the weights of the incremental do not move any PG here
+        from mgr_module import OSDMap
+        return OSDMap(self._cluster)  # type: ignore[call-arg]
+
+
+class FakeOSDMapIncrementalBase:
+    """
+    Stands in for ``ceph_module.BasePyOSDMapIncremental``.
+    """
+
+    def __init__(self, cluster: Cluster) -> None:
+        self._cluster = cluster
+        self._weights: Dict[int, float] = {}
+
+    def _get_epoch(self) -> int:
+        return self._cluster.osdmap_epoch + 1
+
+    def _dump(self) -> Dict[str, Any]:
+        return {'epoch': self._get_epoch(),
+                'new_weight': [{'osd': k, 'weight': v} for k, v in self._weights.items()]}
+
+    def _set_osd_reweights(self, weightmap: Dict[int, float]) -> None:
+        self._weights.update(weightmap)
+
+    def _set_crush_compat_weight_set_weights(self, weightmap: Dict[str, float]) -> None:
+        pass
+
+
+class FakeCRUSHBase:
+    """
+    Stands in for ``ceph_module.BasePyCRUSH``.
+    """
+
+    def __init__(self, cluster: Cluster) -> None:
+        self._cluster = cluster
+
+    def _dump(self) -> Dict[str, Any]:
+        return self._cluster.get('osd_map_crush')
+
+    def _get_item_weight(self, item: int) -> Optional[int]:
+        if 0 <= item < self._cluster.num_osds:
+            return 0x10000
+        return None
+
+    def _get_item_name(self, item: int) -> Optional[str]:
+        if item == -1:
+            return 'default'
+        if item < -1:
+            return 'host{}'.format(-2 - item)
+        if item < self._cluster.num_osds:
+            return 'osd.{}'.format(item)
+        return None
+
+    def _find_takes(self) -> Dict[str, List[int]]:
+        return {'takes': [-1]}
+
+    def _find_roots(self) -> Dict[str, List[int]]:
+        return {'roots': [-1]}
+
+    def _get_take_weight_osd_map(self, root: int) -> Dict[str, Dict[str, float]]:
+        if root != -1:
+            return {'weights': {}}
+        weight = 1.0 / self._cluster.num_osds
+        return {'weights': {str(osd): weight for osd in range(self._cluster.num_osds)}}
+
+
+def install() -> None:
+    """
+    Make the mocked ceph_module's OSDMap and CRUSH bindings use the fakes,
+    has to run before mgr_module is imported.
+    """
+    assert 'mgr_module' not in sys.modules, 'mgr_module was imported already'
+    ceph_module: Any = sys.modules['ceph_module']
+    ceph_module.BasePyOSDMap = FakeOSDMapBase
+    ceph_module.BasePyOSDMapIncremental = FakeOSDMapIncrementalBase
+    ceph_module.BasePyCRUSH = FakeCRUSHBase
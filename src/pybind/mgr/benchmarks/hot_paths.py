@@ -0,0 +1,321 @@
+"""
+Time the hot paths of the mgr modules against a synthetic cluster.
+
+Every benchmark runs ``--rounds`` times, each round on a new PGMap (see
+``Cluster.tick()``), only the benchmarked call is timed. The results are
+written as JSON; given a ``--baseline`` from an earlier run, benchmarks whose
+median got slower by more than ``--threshold`` are reported and the exit
+status is non-zero.
+
+Run from src/pybind/mgr:
+
+  PYTHONPATH=..:../../python-common python3 -m benchmarks.hot_paths --osds 1000 --pgs 65536
+"""
+
+import argparse
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, List, Optional
+
+from .fake_cluster import Cluster
+
+PRESETS = {
+    'small': {'osds': 100, 'pgs': 4096},
+    'medium': {'osds': 1000, 'pgs': 65536},
+    'large': {'osds': 10000, 'pgs': 1048576},
+}
+
+# A benchmark sets up its module and returns the function to time
+Benchmark = Callable[[Cluster], Callable[[], Any]]
+
+
+def prometheus_collect(cluster: Cluster) -> Callable[[], Any]:
+    from prometheus.module import Module
+
+    mod = cluster.attach(Module('prometheus', 0, 0))
+    mod.configure_collectors()
+    mod.configure_series_limits()
+    mod.configure_exposition_formats()
+    return mod.collect
+
+
+def balancer_mapping_state(cluster: Cluster) -> Callable[[], Any]:
+    from balancer.module import MappingState, Module
+
+    mod = cluster.attach(Module('balancer', 0, 0))
+
+    def run() -> Any:
+        return MappingState(mod.get_osdmap(), mod.get_pg_stats(), 'initialize compare')
+    return run
+
+
+def balancer_calc_eval(cluster: Cluster) -> Callable[[], Any]:
+    from balancer.module import MappingState, Module
+
+    mod = cluster.attach(Module('balancer', 0, 0))
+    ms = MappingState(mod.get_osdmap(), mod.get_pg_stats(), 'initialize compare')
+    return lambda: mod.calc_eval(ms, [])
+
+
+def pg_autoscaler_pool_status(cluster: Cluster) -> Callable[[], Any]:
+    from pg_autoscaler.module import PgAutoscaler
+
+    mod = cluster.attach(PgAutoscaler('pg_autoscaler', 0, 0))
+    mod.config_notify()
+
+    def run() -> Any:
+        osdmap = mod.get_osdmap()
+        return mod._get_pool_status(osdmap, osdmap.get_pools_by_name())
+    return run
+
+
+def pg_progress(cluster: Cluster, every: int = 1) -> Dict[str, Any]:
+    """
+    The pg_progress dump of every ``every``th PG.
+    """
+    data = cluster.get('pg_progress')
+    if every > 1:
+        data['pgs'] = {pgid: data['pgs'][pgid] for pgid in list(data['pgs'])[::every]}
+    return data
+
+
+def progress_event(cluster: Cluster) -> Callable[[], Any]:
+    """
+    A new recovery event of all PGs of the first OSD of every host.
+    """
+    from progress.module import PgId, PgRecoveryEvent
+
+    marked = set(cluster.host_osds(host)[0] for host in range(cluster.num_hosts))
+    which_pgs = [PgId(str(pool), ps)
+                 for pool, pg_num in cluster.pg_num.items()
+                 for ps in range(pg_num)
+                 if marked.intersection(cluster.map_pg(pool, ps))]
+    return lambda: PgRecoveryEvent('Rebalancing after osd marked out', [('osd', 0)],
+                                   list(which_pgs), [str(osd) for osd in marked],
+                                   cluster.osdmap_epoch, True)
+
+
+def progress_pg_update(cluster: Cluster) -> Callable[[], Any]:
+    from progress.module import Module
+
+    mod = cluster.attach(Module('progress', 0, 0))
+    new_event = progress_event(cluster)
+
+    def run() -> Any:
+        data = pg_progress(cluster)
+        ev = new_event()
+        start = time.perf_counter()
+        ev.pg_update(data, mod.log)
+        return time.perf_counter() - start
+    return run
+
+
+def progress_pg_delta_update(cluster: Cluster) -> Callable[[], Any]:
+    from progress.module import Module, index_pg_progress
+
+    mod = cluster.attach(Module('progress', 0, 0))
+    ev = progress_event(cluster)()
+    ev.pg_update(pg_progress(cluster), mod.log)
+
+    def run() -> Any:
+        # 1% of the PGs reported in since the last update
+        data = pg_progress(cluster, every=100)
+        start = time.perf_counter()
+        ev.pg_delta_update(index_pg_progress(data), mod.log)
+        return time.perf_counter() - start
+    return run
+
+
+def progress_osd_out_rack(cluster: Cluster) -> Callable[[], Any]:
+    from mgr_module import OSDMap
+    from progress.module import Module
+
+    # the same cluster with the OSDs of four hosts out
+    after = Cluster(osds=cluster.num_osds, pgs=cluster.num_pgs, pools=len(cluster.pg_num),
+                    osds_per_host=cluster.osds_per_host, replicas=cluster.replicas,
+                    osd_counters=0)
+    after.osdmap_epoch = cluster.osdmap_epoch
+    after.mark_out(osd for host in range(min(4, cluster.num_hosts - cluster.replicas))
+                   for osd in cluster.host_osds(host))
+    mod = cluster.attach(Module('progress', 0, 0))
+
+    def run() -> Any:
+        mod._events.clear()
+        start = time.perf_counter()
+        mod._osdmap_changed(OSDMap(cluster), OSDMap(after))  # type: ignore[call-arg]
+        return time.perf_counter() - start
+    return run
+
+
+def cephadm_daemon_lookups(cluster: Cluster) -> Callable[[], Any]:
+    """
+    HostCache lookups of every daemon by name, and of the daemons of every
+    service and service type, for the daemons of the cluster plus a crash and a
+    node-exporter daemon per host.
+    """
+    from unittest import mock
+
+    from cephadm.inventory import HostCache
+    from orchestrator import DaemonDescription, daemon_type_to_service
+
+    cache = HostCache(mock.Mock())
+    for server in cluster.servers():
+        host = server['hostname']
+        dds = [DaemonDescription(s['type'], s['id'], host) for s in server['services']]
+        dds += [DaemonDescription(t, host, host) for t in ('crash', 'node-exporter')]
+        cache.update_host_daemons(host, {dd.name(): dd for dd in dds})
+
+    def run() -> Any:
+        daemons = cache.get_daemons()
+        for dd in daemons:
+            cache.get_daemon(dd.name())
+        for service_name in set(dd.service_name() for dd in daemons):
+            cache.get_daemons_by_service(service_name)
+        for service_type in set(daemon_type_to_service(str(dd.daemon_type)) for dd in daemons):
+            cache.get_daemons_by_type(service_type)
+    return run
+
+
+def dashboard_health(minimal: bool) -> Benchmark:
+    def setup(cluster: Cluster) -> Callable[[], Any]:
+        import dashboard
+        from dashboard.controllers.health import HealthData
+        from dashboard.security import Scope
+
+        pool_stats: Dict[int, Dict[str, deque]] = \
+            defaultdict(lambda: defaultdict(lambda: deque(maxlen=10)))
+
+        def get_updated_pool_stats() -> Dict[int, Dict[str, deque]]:
+            now = time.time()
+            for p in cluster.get('df')['pools']:
+                for stat_name, stat_val in p['stats'].items():
+                    pool_stats[p['id']][stat_name].append((now, stat_val))
+            return pool_stats
+
+        mgr = dashboard.mgr
+        mgr.get.side_effect = cluster.get
+        mgr.get_updated_pool_stats.side_effect = get_updated_pool_stats
+        # hosts, RGW and iSCSI go through the orchestrator and the gateways
+        excluded = (Scope.HOSTS, Scope.RGW, Scope.ISCSI)
+        health = HealthData(lambda permission, scope: scope not in excluded, minimal=minimal)
+        return health.all_health
+    return setup
+
+
+BENCHMARKS: Dict[str, Benchmark] = {
+    'prometheus.collect': prometheus_collect,
+    'balancer.mapping_state': balancer_mapping_state,
+    'balancer.calc_eval': balancer_calc_eval,
+    'pg_autoscaler.get_pool_status': pg_autoscaler_pool_status,
+    'progress.pg_update': progress_pg_update,
+    'progress.pg_delta_update': progress_pg_delta_update,
+    'progress.osd_out_rack': progress_osd_out_rack,
+    'cephadm.daemon_lookups': cephadm_daemon_lookups,
+    'dashboard.health_minimal': dashboard_health(minimal=True),
+    'dashboard.health_full': dashboard_health(minimal=False),
+}
+
+
+def run(cluster: Cluster, names: List[str], rounds: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for name in names:
+        func = BENCHMARKS[name](cluster)
+        times = []
+        for _ in range(rounds):
+            cluster.tick()
+            start = time.perf_counter()
+            ret = func()
+            elapsed = time.perf_counter() - start
+            # a benchmark that has to prepare its input in the call returns
+            # the time of the part that counts
+            times.append(ret if name.startswith('progress.') else elapsed)
+        results[name] = {
+            'rounds': rounds,
+            'min_seconds': min(times),
+            'median_seconds': statistics.median(times),
+            'max_seconds': max(times),
+        }
+        logging.info('%s: median %.4fs', name, results[name]['median_seconds'])
+    return results
+
+
+def regressions(results: Dict[str, Any], baseline: Dict[str, Any],
+                threshold: float) -> Dict[str, float]:
+    """
+    The benchmarks whose median is more than ``threshold`` times the one
+    of the baseline, with the ratio.
+    """
+    ret = {}
+    for name, r in results['benchmarks'].items():
+        b = baseline.get('benchmarks', {}).get(name)
+        if not b or not b['median_seconds']:
+            continue
+        ratio = r['median_seconds'] / b['median_seconds']
+        if ratio > threshold:
+            ret[name] = ratio
+    return ret
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--preset', choices=sorted(PRESETS),
+                        help='cluster size, overrides --osds and --pgs')
+    parser.add_argument('--osds', type=int, default=100)
+    parser.add_argument('--pgs', type=int, default=4096)
+    parser.add_argument('--pools', type=int, default=4)
+    parser.add_argument('--osds-per-host', type=int, default=10)
+    parser.add_argument('--osd-counters', type=int, default=40,
+                        help='perf counters reported per OSD')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS),
+                        help='run this benchmark only, may be repeated')
+    parser.add_argument('--output', '-o', help='write the results to this file')
+    parser.add_argument('--baseline', help='results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='slowdown of the median that counts as a regression')
+    parser.add_argument('--verbose', '-v', action='store_true')
+    args = parser.parse_args(argv)
+
+    # the modules log at debug level in the unit test setup
+    logging.disable(logging.NOTSET if args.verbose else logging.WARNING)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    scale = dict(osds=args.osds, pgs=args.pgs)
+    if args.preset:
+        scale = PRESETS[args.preset]
+    cluster = Cluster(pools=args.pools, osds_per_host=args.osds_per_host,
+                      osd_counters=args.osd_counters, **scale)
+    results: Dict[str, Any] = {
+        'scale': cluster.scale(),
+        'python': platform.python_version(),
+        'timestamp': time.time(),
+        'benchmarks': run(cluster, args.only or list(BENCHMARKS), args.rounds),
+    }
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != results['scale']:
+            logging.warning('baseline was taken at a different scale: %s', baseline.get('scale'))
+        results['regressions'] = regressions(results, baseline, args.threshold)
+        for name, ratio in results['regressions'].items():
+            print('{}: {:.2f}x slower than the baseline'.format(name, ratio), file=sys.stderr)
+            status = 1
+
+    out = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(out + '\n')
+    else:
+        print(out)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Compare the exposition formats of the prometheus module on a synthetic
+cluster: time to render the metrics and payload size, uncompressed and
+compressed.
+
+Run from src/pybind/mgr:
+
+  PYTHONPATH=..:../../python-common python3 -m benchmarks.prometheus_exposition --osds 5000
+"""
+
+import argparse
+import gzip
+import json
+import random
+import time
+from typing import Any, Dict, List
+
+from prometheus.module import (
+    FORMATS, OSD_METADATA, OSD_STATS, OSD_STATUS, Metric, coalesce)
+
+
+def osd_metrics(osds: int, counters: int) -> List[Metric]:
+    """Per OSD metrics of a cluster with ``osds`` OSDs."""
+    metrics = [Metric('untyped', 'osd_metadata', 'OSD Metadata', OSD_METADATA)]
+    for stat in OSD_STATUS:
+        metrics.append(Metric('untyped', 'osd_{}'.format(stat), 'OSD status {}'.format(stat),
+                              ('ceph_daemon',)))
+    for stat in OSD_STATS:
+        metrics.append(Metric('gauge', 'osd_{}'.format(stat), 'OSD stat {}'.format(stat),
+                              ('ceph_daemon',)))
+    for i in range(counters):
+        metrics.append(Metric('counter', 'osd_counter_{}'.format(i), 'OSD perf counter',
+                              ('ceph_daemon',)))
+    return metrics
+
+
+def update(metrics: List[Metric], osds: int, changed: float) -> None:
+    """Set the values of all series, changing a ``changed`` share of them."""
+    for metric in metrics:
+        previous = metric.value
+        metric.clear()
+        for osd in range(osds):
+            daemon = 'osd.{}'.format(osd)
+            if metric.name == 'osd_metadata':
+                labels = ('eth0', daemon, '10.1.{}.{}:6800'.format(osd // 250, osd % 250),
+                          'ssd', 'eth0', 'host{}'.format(osd // 20), 'bluestore',
+                          '10.0.{}.{}:6800'.format(osd // 250, osd % 250), 'ceph version 19.2.0')
+                metric.set(1, labels)
+            elif (daemon,) not in previous or random.random() < changed:
+                metric.set(random.randint(0, 1 << 40), (daemon,))
+            else:
+                metric.set(previous[(daemon,)], (daemon,))
+
+
+def render(metrics: List[Metric], fmt_name: str) -> List[bytes]:
+    fmt = FORMATS[fmt_name]
+    return coalesce([m.bytes_expfmt(fmt) for m in metrics] + [fmt.footer])
+
+
+def run(osds: int, counters: int, changed: float, rounds: int) -> Dict[str, Any]:
+    random.seed(0)
+    results: Dict[str, Any] = {'osds': osds, 'counters_per_osd': counters, 'formats': {}}
+    for fmt_name in FORMATS:
+        metrics = osd_metrics(osds, counters)
+        update(metrics, osds, changed)
+        start = time.perf_counter()
+        chunks = render(metrics, fmt_name)
+        cold = time.perf_counter() - start
+
+        warm = []
+        for _ in range(rounds):
+            update(metrics, osds, changed)
+            start = time.perf_counter()
+            chunks = render(metrics, fmt_name)
+            warm.append(time.perf_counter() - start)
+
+        body = b''.join(chunks)
+        start = time.perf_counter()
+        compressed = gzip.compress(body, compresslevel=6)
+        results['formats'][fmt_name] = {
+            'series': sum(len(m.value) for m in metrics),
+            'render_cold_seconds': cold,
+            'render_warm_seconds': min(warm) if warm else cold,
+            'bytes': len(body),
+            'gzip_bytes': len(compressed),
+            'gzip_seconds': time.perf_counter() - start,
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--osds', type=int, default=5000)
+    parser.add_argument('--counters', type=int, default=40,
+                        help='perf counters exported per OSD')
+    parser.add_argument('--changed', type=float, default=0.1,
+                        help='share of series whose value changes between rounds')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.osds, args.counters, args.changed, args.rounds)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print('{} OSDs, {} counters per OSD'.format(args.osds, args.counters))
+    print('{:<12} {:>9} {:>10} {:>10} {:>12} {:>12}'.format(
+        'format', 'series', 'cold (s)', 'warm (s)', 'bytes', 'gzip bytes'))
+    for fmt_name, r in results['formats'].items():
+        print('{:<12} {:>9} {:>10.3f} {:>10.3f} {:>12} {:>12}'.format(
+            fmt_name, r['series'], r['render_cold_seconds'], r['render_warm_seconds'],
+            r['bytes'], r['gzip_bytes']))
+
+
+if __name__ == '__main__':
+    main()
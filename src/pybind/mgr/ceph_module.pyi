@@ -31,6 +31,7 @@ class BasePyOSDMapIncremental(object):
     def _dump(self):...
     def _set_osd_reweights(self, weightmap):...
     def _set_crush_compat_weight_set_weights(self, weightmap):...
+    def _merge_upmaps(self, other):...
 
 class BasePyCRUSH(object):
     def _dump(self):...
@@ -69,11 +70,14 @@ class BaseMgrModule(object):
     def _ceph_cluster_log(self, channel: str, priority: int, message: str) -> None: ...
     def _ceph_get_context(self) -> object: ...
     def _ceph_get(self, data_name: str) -> Any: ...
+    def _ceph_get_data_version(self, data_name: str) -> int: ...
+    def _ceph_get_versioned(self, data_name: str, known_version: int) -> Tuple[int, Any]: ...
     def _ceph_notify_all(self, what: str, tag: str) ->  None: ...
     def _ceph_get_server(self, hostname: Optional[str]) -> Union[ServerInfoT,
                                                                  List[ServerInfoT]]: ...
     def _ceph_get_unlabeled_perf_schema(self, svc_type: str, svc_name: str) -> Dict[str, Any]: ...
     def _ceph_get_perf_schema(self, svc_type: str, svc_name: str) -> Dict[str, Any]: ...
+    def _ceph_get_unlabeled_perf_counters_bulk(self, svc_type: str, prio_limit: int, known_schema_version: int) -> Dict[str, Any]: ...
     def _ceph_get_rocksdb_version(self) -> str: ...
     def _ceph_get_unlabeled_counter(self, svc_type: str, svc_name: str, path: str) -> Dict[str, List[Tuple[float, int]]]: ...
     def _ceph_get_latest_unlabeled_counter(self, svc_type, svc_name, path): ...
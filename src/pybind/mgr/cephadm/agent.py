@@ -27,7 +27,7 @@ from cephadm.services.cephadmservice import CephadmAgent
 from cephadm.tlsobject_types import TLSCredentials
 
 from urllib.error import HTTPError, URLError
-from typing import Any, Dict, List, Set, TYPE_CHECKING, Optional, MutableMapping, IO
+from typing import Any, Dict, List, Set, TYPE_CHECKING, Optional, MutableMapping, IO, Tuple
 
 if TYPE_CHECKING:
     from cephadm.module import CephadmOrchestrator
@@ -638,6 +638,7 @@ class NodeProxyEndpoint:
 
 class HostData(Server):
     exposed = True
+    metadata_types = ['ls', 'networks', 'facts', 'volume']
 
     def __init__(self, mgr: "CephadmOrchestrator", port: int, host: str):
         self.mgr = mgr
@@ -669,7 +670,8 @@ class HostData(Server):
             # if we got here, we've already verified the keyring of the agent. If
             # host agent is reporting on is marked offline, it shouldn't be any more
             self.mgr.offline_hosts_remove(data['host'])
-            results['result'] = self.handle_metadata(data)
+            size = int(cherrypy.request.headers.get('Content-Length', 0))
+            results.update(self.handle_metadata(data, size))
         return results
 
     def check_request_fields(self, data: Dict[str, Any]) -> None:
@@ -698,13 +700,39 @@ class HostData(Server):
         except Exception as e:
             raise Exception(
                 f'Counter value from agent on host {host} could not be converted to an integer: {e}')
-        metadata_types = ['ls', 'networks', 'facts', 'volume']
+        metadata_types = self.metadata_types
         metadata_types_str = '{' + ', '.join(metadata_types) + '}'
-        if not all(item in data.keys() for item in metadata_types):
+        # sections the agent reports unchanged are only sent as a digest
+        digests = data.get('digests') or {}
+        if not all(item in data.keys() or item in digests for item in metadata_types):
             self.mgr.log.warning(
                 f'Agent on host {host} reported incomplete metadata. Not all of {metadata_types_str} were present. Received fields {fields}')
 
-    def handle_metadata(self, data: Dict[str, Any]) -> str:
+    def check_report_delta(self, host: str, data: Dict[str, Any]) -> Tuple[List[str], bool]:
+        """
+        Agents leave out the metadata sections that did not change since
+        their last report the mgr acknowledged, and send only the digests
+        of those sections. Return the sections left out and whether a full
+        report has to be requested because we cannot tell what they contain:
+        a report was missed (sequence numbers diverge) or the digests we have
+        are not the ones the agent based its report on (e.g. after a mgr
+        failover).
+        """
+        digests = data.get('digests') or {}
+        unchanged = [section for section in digests if section not in data]
+        if not unchanged:
+            return [], False
+        known = self.mgr.agent_cache.agent_report_digests.get(host, {})
+        last_seq = self.mgr.agent_cache.agent_report_seq.get(host)
+        resync = (
+            last_seq is None
+            or int(data.get('seq', 0)) != last_seq + 1
+            or any(known.get(section) != digests[section] for section in unchanged)
+        )
+        return unchanged, resync
+
+    def handle_metadata(self, data: Dict[str, Any], size: int = 0) -> Dict[str, Any]:
+        start = time.monotonic()
         try:
             host = data['host']
             self.mgr.agent_cache.agent_ports[host] = int(data['port'])
@@ -713,7 +741,7 @@ class HostData(Server):
                 self.mgr.agent_helpers._request_agent_acks({host})
                 res = f'Got metadata from agent on host {host} with no known counter entry. Starting counter at 1 and requesting new metadata'
                 self.mgr.log.debug(res)
-                return res
+                return {'result': res}
 
             # update timestamp of most recent agent update
             self.mgr.agent_cache.agent_timestamp[host] = datetime_now()
@@ -733,6 +761,13 @@ class HostData(Server):
                 self.mgr.log.debug(
                     f'Received old metadata from agent on host {host}. Requested up-to-date metadata.')
 
+            unchanged, resync = self.check_report_delta(host, data)
+            if resync:
+                self.mgr.log.debug(
+                    f'Cannot apply metadata delta from agent on host {host}. Requesting a full report.')
+            elif unchanged:
+                self.mgr.cache.touch_host_metadata(host, unchanged)
+
             if 'ls' in data and data['ls']:
                 self.mgr._process_ls_output(host, data['ls'])
                 self.mgr.update_failed_daemon_health_check()
@@ -752,7 +787,8 @@ class HostData(Server):
                     f'Change detected in state of daemons from {host} agent metadata. Kicking serve loop')
                 self.mgr._kick_serve_loop()
 
-            if up_to_date and ('ls' in data and data['ls']):
+            ls_current = bool(data.get('ls')) or ('ls' in unchanged and not resync)
+            if up_to_date and ls_current:
                 was_out_of_date = not self.mgr.cache.all_host_metadata_up_to_date()
                 self.mgr.cache.metadata_up_to_date[host] = True
                 if was_out_of_date and self.mgr.cache.all_host_metadata_up_to_date():
@@ -763,12 +799,28 @@ class HostData(Server):
                     f'Received up-to-date metadata from agent on host {host}.')
 
             self.mgr.agent_cache.save_agent(host)
-            return 'Successfully processed metadata.'
+            result: Dict[str, Any] = {'result': 'Successfully processed metadata.'}
+            if 'seq' in data:
+                seq = int(data['seq'])
+                self.mgr.agent_cache.agent_report_seq[host] = seq
+                digests = data.get('digests') or {}
+                known = self.mgr.agent_cache.agent_report_digests.setdefault(host, {})
+                known.update({
+                    section: digest for section, digest in digests.items() if section in data
+                })
+                if resync:
+                    result['resync'] = True
+                else:
+                    result['seq'] = seq
+            self.mgr.agent_cache.record_report(
+                host, size, [section for section in self.metadata_types if section in data],
+                unchanged, resync, time.monotonic() - start)
+            return result
 
         except Exception as e:
             err_str = f'Failed to update metadata with metadata from agent on host {host}: {e}'
             self.mgr.log.warning(err_str)
-            return err_str
+            return {'result': err_str}
 
 
 class AgentMessageThread(threading.Thread):
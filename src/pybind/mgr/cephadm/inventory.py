@@ -1,14 +1,17 @@
 import datetime
 import enum
 from copy import copy
+import hashlib
 import ipaddress
 import itertools
 import json
 import logging
 import math
 import socket
+import threading
+import time
 from typing import TYPE_CHECKING, Dict, List, Iterator, Optional, Any, Tuple, Set, Mapping, cast, \
-    NamedTuple, Type, ValuesView, Union
+    Iterable, NamedTuple, Type, ValuesView, Union
 
 import orchestrator
 from ceph.deployment import inventory
@@ -40,6 +43,9 @@ SPEC_STORE_PREFIX = "spec."
 AGENT_CACHE_PREFIX = 'agent.'
 NODE_PROXY_CACHE_PREFIX = 'node_proxy'
 
+# key (service name, daemon type or daemon name) -> host -> daemon name -> daemon
+DaemonIndex = Dict[str, Dict[str, Dict[str, orchestrator.DaemonDescription]]]
+
 
 class HostCacheStatus(enum.Enum):
     stray = 'stray'
@@ -770,11 +776,26 @@ class HostCache():
     Used to run daemon actions after deploying a daemon. We need to
     store it persistently, in order to stay consistent across
     MGR failovers.
+
+    `daemons` is indexed by service name, daemon type and daemon name, so
+    it must only be changed through the methods below (or replaced as a
+    whole).
+
+    Entries are only written to the config-key store if they changed. Between
+    defer_saves() and flush(), save_host() calls of any thread only mark the
+    host, and flush() saves each marked host once. Marked hosts are saved
+    by the first save_host() call after SAVE_DEFER_SECONDS, and a host with
+    changed scheduled_daemon_actions or daemon_config_deps is saved right
+    away: these must survive a failover.
     """
 
+    SAVE_DEFER_SECONDS = 10.0
+
     def __init__(self, mgr):
         # type: (CephadmOrchestrator) -> None
         self.mgr: CephadmOrchestrator = mgr
+        # guards self.daemons and its indexes
+        self._daemons_lock = threading.RLock()
         self.daemons = {}   # type: Dict[str, Dict[str, orchestrator.DaemonDescription]]
         self._tmp_daemons = {}  # type: Dict[str, Dict[str, orchestrator.DaemonDescription]]
         self.last_daemon_update = {}   # type: Dict[str, datetime.datetime]
@@ -805,6 +826,96 @@ class HostCache():
 
         self.metadata_up_to_date = {}  # type: Dict[str, bool]
 
+        # config-key -> digest of the value last written to (or loaded from) it
+        self._stored_digests: Dict[str, str] = {}
+        # hosts whose save_host() is deferred to flush()
+        self._unsaved_hosts: Set[str] = set()
+        # time.monotonic() of the oldest deferred save_host()
+        self._deferred_since = 0.0
+        # hosts whose next save_host() is not deferred
+        self._save_now: Set[str] = set()
+        # hosts whose devices changed since save_host_devices()
+        self._unsaved_devices: Set[str] = set()
+        self._defer_saves = False
+        # guards the above, the counters below and the writes themselves
+        self._save_lock = threading.RLock()
+        self.store_writes = 0
+        self.store_bytes = 0
+        self.store_unchanged = 0
+
+    @property
+    def daemons(self) -> Dict[str, Dict[str, orchestrator.DaemonDescription]]:
+        return self._daemons
+
+    @daemons.setter
+    def daemons(self, daemons: Dict[str, Dict[str, orchestrator.DaemonDescription]]) -> None:
+        with self._daemons_lock:
+            self._daemons = daemons
+            self._daemons_by_service: DaemonIndex = {}
+            self._daemons_by_type: DaemonIndex = {}
+            self._daemons_by_name: DaemonIndex = {}
+            # host -> position of the host in self.daemons, to keep its order
+            self._host_pos: Dict[str, int] = {}
+            self._host_counter = itertools.count()
+            for host, dm in daemons.items():
+                self._host_pos[host] = next(self._host_counter)
+                for name, dd in dm.items():
+                    self._index_daemon(host, name, dd)
+
+    def _daemon_indexes(self, dd: orchestrator.DaemonDescription) -> Iterator[Tuple[DaemonIndex, str]]:
+        try:
+            service_name = dd.service_name()
+        except (KeyError, OrchestratorError):
+            # unknown daemon type, or no service id in the daemon id
+            pass
+        else:
+            yield self._daemons_by_service, service_name
+        yield self._daemons_by_type, cast(str, dd.daemon_type)
+        yield self._daemons_by_name, dd.name()
+
+    def _index_daemon(self, host: str, name: str, dd: orchestrator.DaemonDescription) -> None:
+        # called with self._daemons_lock held
+        for index, key in self._daemon_indexes(dd):
+            index.setdefault(key, {}).setdefault(host, {})[name] = dd
+
+    def _unindex_daemon(self, host: str, name: str, dd: orchestrator.DaemonDescription) -> None:
+        # called with self._daemons_lock held. Empty buckets are kept: there
+        # is at most one per service/type/name and host.
+        for index, key in self._daemon_indexes(dd):
+            index.get(key, {}).get(host, {}).pop(name, None)
+
+    def _set_host_daemons(self, host: str, dm: Dict[str, orchestrator.DaemonDescription]) -> None:
+        with self._daemons_lock:
+            for name, dd in self._daemons.get(host, {}).items():
+                self._unindex_daemon(host, name, dd)
+            if host not in self._daemons:
+                self._host_pos[host] = next(self._host_counter)
+            self._daemons[host] = dm
+            for name, dd in dm.items():
+                self._index_daemon(host, name, dd)
+
+    def _lookup_daemons(self, index: DaemonIndex, keys: List[str]) -> List[orchestrator.DaemonDescription]:
+        """
+        The daemons in ``index`` under any of ``keys``, in the order of
+        self.daemons.
+        """
+        with self._daemons_lock:
+            by_host: Dict[str, List[Dict[str, orchestrator.DaemonDescription]]] = {}
+            for key in keys:
+                for host, dm in index.get(key, {}).items():
+                    if dm:
+                        by_host.setdefault(host, []).append(dm)
+            r: List[orchestrator.DaemonDescription] = []
+            for host in sorted(by_host, key=lambda h: self._host_pos.get(h, 0)):
+                dms = by_host[host]
+                if len(dms) == 1:
+                    r.extend(dms[0].values())
+                else:
+                    names = set(itertools.chain.from_iterable(dms))
+                    r.extend(dd for name, dd in self._daemons.get(host, {}).items()
+                             if name in names)
+            return r
+
     def load(self):
         # type: () -> None
         for k, v in self.mgr.get_store_prefix(HOST_CACHE_PREFIX).items():
@@ -817,6 +928,10 @@ class HostCache():
                 self.mgr.set_store(k, None)
             try:
                 j = json.loads(v)
+                self._stored_digests[k] = self._digest(v)
+                if j.get('devices'):
+                    # move them to the <host>.devices.<n> entries
+                    self._unsaved_devices.add(host)
                 if 'last_device_update' in j:
                     self.last_device_update[host] = str_to_datetime(j['last_device_update'])
                 else:
@@ -827,14 +942,14 @@ class HostCache():
                 # and always trigger a new scrape on mgr restart.
                 self.daemon_refresh_queue.append(host)
                 self.network_refresh_queue.append(host)
-                self.daemons[host] = {}
                 self.osdspec_previews[host] = []
                 self.osdspec_last_applied[host] = {}
                 self.networks[host] = {}
                 self.daemon_config_deps[host] = {}
-                for name, d in j.get('daemons', {}).items():
-                    self.daemons[host][name] = \
-                        orchestrator.DaemonDescription.from_json(d)
+                self._set_host_daemons(host, {
+                    name: orchestrator.DaemonDescription.from_json(d)
+                    for name, d in j.get('daemons', {}).items()
+                })
                 self.devices[host] = []
                 # still want to check old device location for upgrade scenarios
                 for d in j.get('devices', []):
@@ -889,7 +1004,7 @@ class HostCache():
 
     def update_host_daemons(self, host, dm):
         # type: (str, Dict[str, orchestrator.DaemonDescription]) -> None
-        self.daemons[host] = dm
+        self._set_host_daemons(host, dm)
         self._tmp_daemons.pop(host, {})
         self.last_daemon_update[host] = datetime_now()
 
@@ -941,6 +1056,8 @@ class HostCache():
             self.last_device_change[host] = datetime_now()
         self.last_device_update[host] = datetime_now()
         self.devices[host] = dls
+        with self._save_lock:
+            self._unsaved_devices.add(host)
 
     def update_host_networks(
             self,
@@ -950,11 +1067,31 @@ class HostCache():
         self.networks[host] = nets
         self.last_network_update[host] = datetime_now()
 
+    def touch_host_metadata(self, host: str, sections: Iterable[str]) -> None:
+        """
+        Mark the given agent metadata sections ('ls', 'networks', 'facts'
+        and/or 'volume') of a host as refreshed, for when the agent reports
+        them unchanged.
+        """
+        now = datetime_now()
+        for section in sections:
+            if section == 'ls':
+                for dd in self.get_daemons_by_host(host):
+                    dd.last_refresh = now
+                self.last_daemon_update[host] = now
+            elif section == 'networks':
+                self.last_network_update[host] = now
+            elif section == 'facts':
+                self.last_facts_update[host] = now
+            elif section == 'volume':
+                self.last_device_update[host] = now
+
     def update_daemon_config_deps(self, host: str, name: str, deps: List[str], stamp: datetime.datetime) -> None:
         self.daemon_config_deps[host][name] = {
             'deps': deps,
             'last_config': stamp,
         }
+        self._save_now.add(host)
 
     def update_last_host_check(self, host):
         # type: (str) -> None
@@ -987,7 +1124,7 @@ class HostCache():
         """
         Install an empty entry for a host
         """
-        self.daemons[host] = {}
+        self._set_host_daemons(host, {})
         self.devices[host] = []
         self.networks[host] = {}
         self.osdspec_previews[host] = []
@@ -1035,7 +1172,59 @@ class HostCache():
     def distribute_new_registry_login_info(self) -> None:
         self.registry_login_queue = set(self.mgr.inventory.keys())
 
+    @staticmethod
+    def _digest(value: str) -> str:
+        return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+    def _set_store(self, key: str, value: str) -> None:
+        digest = self._digest(value)
+        with self._save_lock:
+            if self._stored_digests.get(key) == digest:
+                self.store_unchanged += 1
+                return
+            self.mgr.set_store(key, value)
+            self._stored_digests[key] = digest
+            self.store_writes += 1
+            self.store_bytes += len(value)
+
+    def defer_saves(self) -> None:
+        """
+        Collect the save_host() calls of all threads until flush().
+        """
+        with self._save_lock:
+            self._defer_saves = True
+
+    def flush(self) -> None:
+        """
+        Save the hosts of the deferred save_host() calls, and save right
+        away again until the next defer_saves().
+        """
+        with self._save_lock:
+            self._defer_saves = False
+            writes, written, unchanged = self.store_writes, self.store_bytes, self.store_unchanged
+            while self._unsaved_hosts:
+                self._save_host(self._unsaved_hosts.pop())
+            logger.debug('HostCache: wrote %d entries (%d bytes), %d unchanged entries skipped',
+                         self.store_writes - writes, self.store_bytes - written,
+                         self.store_unchanged - unchanged)
+
     def save_host(self, host: str) -> None:
+        with self._save_lock:
+            if self._defer_saves and host not in self._save_now:
+                if not self._unsaved_hosts:
+                    self._deferred_since = time.monotonic()
+                self._unsaved_hosts.add(host)
+                if time.monotonic() - self._deferred_since < self.SAVE_DEFER_SECONDS:
+                    return
+                # saved at the latest every SAVE_DEFER_SECONDS
+                while self._unsaved_hosts:
+                    self._save_host(self._unsaved_hosts.pop())
+                return
+            self._save_now.discard(host)
+            self._unsaved_hosts.discard(host)
+            self._save_host(host)
+
+    def _save_host(self, host: str) -> None:
         j: Dict[str, Any] = {
             'daemons': {},
             'devices': [],
@@ -1079,12 +1268,13 @@ class HostCache():
             j['scheduled_daemon_actions'] = self.scheduled_daemon_actions[host]
         if host in self.metadata_up_to_date:
             j['metadata_up_to_date'] = self.metadata_up_to_date[host]
-        if host in self.devices:
+        if host in self._unsaved_devices:
             self.save_host_devices(host)
 
-        self.mgr.set_store(HOST_CACHE_PREFIX + host, json.dumps(j))
+        self._set_store(HOST_CACHE_PREFIX + host, json.dumps(j))
 
     def save_host_devices(self, host: str) -> None:
+        self._unsaved_devices.discard(host)
         if host not in self.devices or not self.devices[host]:
             logger.debug(f'Host {host} has no devices to save')
             return
@@ -1110,12 +1300,12 @@ class HostCache():
                 dev_dict: Dict[str, Any] = {'devices': dev_list}
                 if dev_cache_counter == 0:
                     dev_dict.update({'entries': len(dev_lists)})
-                self.mgr.set_store(HOST_CACHE_PREFIX + host + '.devices.'
-                                   + str(dev_cache_counter), json.dumps(dev_dict))
+                self._set_store(HOST_CACHE_PREFIX + host + '.devices.'
+                                + str(dev_cache_counter), json.dumps(dev_dict))
                 dev_cache_counter += 1
         else:
-            self.mgr.set_store(HOST_CACHE_PREFIX + host + '.devices.'
-                               + str(dev_cache_counter), json.dumps({'devices': devs, 'entries': 1}))
+            self._set_store(HOST_CACHE_PREFIX + host + '.devices.'
+                            + str(dev_cache_counter), json.dumps({'devices': devs, 'entries': 1}))
 
     def load_host_devices(self, host: str) -> List[inventory.Device]:
         dev_cache_counter: int = 0
@@ -1146,8 +1336,11 @@ class HostCache():
 
     def rm_host(self, host):
         # type: (str) -> None
-        if host in self.daemons:
-            del self.daemons[host]
+        with self._daemons_lock:
+            if host in self.daemons:
+                self._set_host_daemons(host, {})
+                del self.daemons[host]
+                del self._host_pos[host]
         if host in self.devices:
             del self.devices[host]
         if host in self.facts:
@@ -1180,6 +1373,13 @@ class HostCache():
             del self.scheduled_daemon_actions[host]
         if host in self.last_client_files:
             del self.last_client_files[host]
+        with self._save_lock:
+            self._unsaved_hosts.discard(host)
+            self._save_now.discard(host)
+            self._unsaved_devices.discard(host)
+            for key in [k for k in self._stored_digests
+                        if k == HOST_CACHE_PREFIX + host or k.startswith(HOST_CACHE_PREFIX + host + '.devices.')]:
+                del self._stored_digests[key]
         self.mgr.set_store(HOST_CACHE_PREFIX + host, None)
 
     def get_hosts(self):
@@ -1311,7 +1511,10 @@ class HostCache():
 
     def get_daemon(self, daemon_name: str, host: Optional[str] = None) -> orchestrator.DaemonDescription:
         assert not daemon_name.startswith('ha-rgw.')
-        dds = self.get_daemons_by_host(host) if host else self._get_daemons()
+        if host:
+            dds = self.get_daemons_by_host(host)
+        else:
+            dds = self._lookup_daemons(self._daemons_by_name, [daemon_name])
         for dd in dds:
             if dd.name() == daemon_name:
                 return dd
@@ -1346,18 +1549,19 @@ class HostCache():
         assert not service_name.startswith('keepalived.')
         assert not service_name.startswith('haproxy.')
 
-        return list(dd for dd in self._get_daemons() if dd.service_name() == service_name)
+        return self._lookup_daemons(self._daemons_by_service, [service_name])
 
     def get_related_service_daemons(self, service_spec: ServiceSpec) -> Optional[List[orchestrator.DaemonDescription]]:
         if service_spec.service_type == 'ingress':
-            dds = list(dd for dd in self._get_daemons() if dd.service_name() == cast(IngressSpec, service_spec).backend_service)
+            backend_service = cast(IngressSpec, service_spec).backend_service
+            dds = self._lookup_daemons(self._daemons_by_service, [backend_service] if backend_service else [])
             dds += list(dd for dd in self._get_tmp_daemons() if dd.service_name() == cast(IngressSpec, service_spec).backend_service)
             logger.debug(f'Found related daemons {dds} for service {service_spec.service_name()}')
             return dds
         else:
             for ingress_spec in [cast(IngressSpec, s) for s in self.mgr.spec_store.active_specs.values() if s.service_type == 'ingress']:
                 if ingress_spec.backend_service == service_spec.service_name():
-                    dds = list(dd for dd in self._get_daemons() if dd.service_name() == ingress_spec.service_name())
+                    dds = self._lookup_daemons(self._daemons_by_service, [ingress_spec.service_name()])
                     dds += list(dd for dd in self._get_tmp_daemons() if dd.service_name() == ingress_spec.service_name())
                     logger.debug(f'Found related daemons {dds} for service {service_spec.service_name()}')
                     return dds
@@ -1365,8 +1569,9 @@ class HostCache():
 
     def get_daemons_by_type(self, service_type: str, host: str = '') -> List[orchestrator.DaemonDescription]:
         assert service_type not in ['keepalived', 'haproxy']
-        daemons = self.daemons[host].values() if host else self._get_daemons()
-        return [d for d in daemons if d.daemon_type in service_to_daemon_types(service_type)]
+        if not host:
+            return self._lookup_daemons(self._daemons_by_type, service_to_daemon_types(service_type))
+        return [d for d in self.daemons[host].values() if d.daemon_type in service_to_daemon_types(service_type)]
 
     def get_daemons_by_types(self, daemon_types: List[str]) -> List[str]:
         daemon_names = []
@@ -1549,14 +1754,20 @@ class HostCache():
     def add_daemon(self, host, dd):
         # type: (str, orchestrator.DaemonDescription) -> None
         assert host in self.daemons
-        self.daemons[host][dd.name()] = dd
+        with self._daemons_lock:
+            old = self.daemons[host].get(dd.name())
+            if old is not None:
+                self._unindex_daemon(host, dd.name(), old)
+            self.daemons[host][dd.name()] = dd
+            self._index_daemon(host, dd.name(), dd)
 
     def rm_daemon(self, host: str, name: str) -> None:
         assert not name.startswith('ha-rgw.')
 
-        if host in self.daemons:
-            if name in self.daemons[host]:
-                del self.daemons[host][name]
+        with self._daemons_lock:
+            if host in self.daemons:
+                if name in self.daemons[host]:
+                    self._unindex_daemon(host, name, self.daemons[host].pop(name))
 
     def daemon_cache_filled(self) -> bool:
         """
@@ -1589,6 +1800,7 @@ class HostCache():
         if host not in self.scheduled_daemon_actions:
             self.scheduled_daemon_actions[host] = {}
         self.scheduled_daemon_actions[host][daemon_name] = action
+        self._save_now.add(host)
 
     def rm_scheduled_daemon_action(self, host: str, daemon_name: str) -> bool:
         found = False
@@ -1596,6 +1808,7 @@ class HostCache():
             if daemon_name in self.scheduled_daemon_actions[host]:
                 del self.scheduled_daemon_actions[host][daemon_name]
                 found = True
+                self._save_now.add(host)
             if not self.scheduled_daemon_actions[host]:
                 del self.scheduled_daemon_actions[host]
         return found
@@ -1830,6 +2043,12 @@ class AgentCache():
         self.agent_keys = {}  # type: Dict[str, str]
         self.agent_ports = {}  # type: Dict[str, int]
         self.sending_agent_message = {}  # type: Dict[str, bool]
+        # Sequence number and section digests of the last metadata report of
+        # each agent. These are not saved: a newly active mgr asks every
+        # agent for a full report first.
+        self.agent_report_seq = {}  # type: Dict[str, int]
+        self.agent_report_digests = {}  # type: Dict[str, Dict[str, str]]
+        self.agent_report_stats = {}  # type: Dict[str, Dict[str, Any]]
 
     def load(self):
         # type: () -> None
@@ -1889,6 +2108,29 @@ class AgentCache():
                 self.agent_config_deps[host].get('last_config', None)
         return None, None
 
+    def record_report(self, host: str, size: int, sections: List[str], unchanged: List[str],
+                      resync: bool, duration: float) -> None:
+        stats = self.agent_report_stats.setdefault(host, {
+            'reports': 0,
+            'full_reports': 0,
+            'resyncs_requested': 0,
+            'bytes': 0,
+            'sections_received': 0,
+            'sections_unchanged': 0,
+            'processing_seconds': 0.0,
+        })
+        stats['reports'] += 1
+        if not unchanged:
+            stats['full_reports'] += 1
+        if resync:
+            stats['resyncs_requested'] += 1
+        stats['bytes'] += size
+        stats['sections_received'] += len(sections)
+        stats['sections_unchanged'] += len(unchanged)
+        stats['processing_seconds'] += duration
+        stats['last_processing_seconds'] = duration
+        stats['last_report'] = datetime_to_str(datetime_now())
+
     def messaging_agent(self, host: str) -> bool:
         if host not in self.sending_agent_message or not self.sending_agent_message[host]:
             return False
@@ -1673,6 +1673,17 @@ class CephadmOrchestrator(orchestrator.Orchestrator, MgrModule,
             systemd_unit_dict[host][d_type][d.name()] = systemd_unit
         return HandleCommandResult(stdout=json.dumps(systemd_unit_dict, indent=4))
 
+    @orchestrator._cli_read_command('cephadm agent-stats')
+    def _agent_stats(self, hostname: Optional[str] = None) -> HandleCommandResult:
+        """
+        Show the metadata reports received from the cephadm agents and the
+        time spent processing them since this mgr became active
+        """
+        stats = self.agent_cache.agent_report_stats
+        if hostname:
+            stats = {h: s for h, s in stats.items() if h == hostname}
+        return HandleCommandResult(stdout=json.dumps(stats, indent=4, sort_keys=True))
+
     @orchestrator._cli_read_command('orch client-keyring ls')
     def _client_keyring_ls(self, format: Format = Format.plain) -> HandleCommandResult:
         """
@@ -78,6 +78,8 @@ class CephadmServe:
         while self.mgr.run:
             self.log.debug("serve loop start")
 
+            # save each host of the HostCache once per pass
+            self.mgr.cache.defer_saves()
             try:
 
                 self.convert_tags_to_repo_digest()
@@ -135,6 +137,8 @@ class CephadmServe:
             except OrchestratorError as e:
                 if e.event_subject:
                     self.mgr.events.from_orch_error(e)
+            finally:
+                self.mgr.cache.flush()
 
             self.log.debug("serve loop sleep")
             self._serve_sleep()
@@ -270,29 +274,18 @@ class CephadmServe:
                 or self.mgr.cache.is_host_draining(host)
                 or host in agents_down
             ):
+                sections = []
                 if self.mgr.cache.host_needs_daemon_refresh(host):
-                    self.log.debug('refreshing %s daemons' % host)
-                    r = self._refresh_host_daemons(host)
-                    if r:
-                        failures.append(r)
-
+                    sections.append('ls')
                 if self.mgr.cache.host_needs_facts_refresh(host):
-                    self.log.debug(('Refreshing %s facts' % host))
-                    r = self._refresh_facts(host)
-                    if r:
-                        failures.append(r)
-
+                    sections.append('facts')
                 if self.mgr.cache.host_needs_network_refresh(host):
-                    self.log.debug(('Refreshing %s networks' % host))
-                    r = self._refresh_host_networks(host)
-                    if r:
-                        failures.append(r)
-
+                    sections.append('networks')
                 if self.mgr.cache.host_needs_device_refresh(host):
-                    self.log.debug('refreshing %s devices' % host)
-                    r = self._refresh_host_devices(host)
-                    if r:
-                        failures.append(r)
+                    sections.append('inventory')
+                if sections:
+                    self.log.debug('refreshing %s %s' % (host, ', '.join(sections)))
+                    failures.extend(self._refresh_host_metadata(host, sections))
                 self.mgr.cache.metadata_up_to_date[host] = True
             elif not self.mgr.cache.get_daemons_by_type('agent', host=host):
                 if self.mgr.cache.host_needs_daemon_refresh(host):
@@ -370,6 +363,43 @@ class CephadmServe:
             return 'host %s (%s) failed check: %s' % (host, addr, e)
         return None
 
+    def _refresh_host_metadata(self, host: str, sections: List[str]) -> List[str]:
+        """
+        Refresh the given sections ('ls', 'facts', 'networks' and/or
+        'inventory') of a host with a single `cephadm gather` call instead
+        of one remote cephadm call per section.
+
+        Returns the failures, one per failed section.
+        """
+        args = ['--' + section for section in sections]
+        if 'inventory' in sections:
+            args += ['--'] + self._inventory_args()
+        try:
+            with self.mgr.async_timeout_handler(host, 'cephadm gather'):
+                out = self.mgr.wait_async(self._run_cephadm_json(
+                    host, 'osd' if 'inventory' in sections else 'mon', 'gather', args,
+                    log_output=self.mgr.log_refresh_metadata))
+            if not isinstance(out, dict):
+                raise OrchestratorError(f'host {host} `cephadm gather` failed: unexpected output')
+        except OrchestratorError as e:
+            return [str(e)]
+
+        update: Dict[str, Callable[[str, Any], None]] = {
+            'ls': self.mgr._process_ls_output,
+            'facts': self.mgr.cache.update_host_facts,
+            'networks': self._update_host_networks,
+            'inventory': self._update_host_devices,
+        }
+        errors = out.get('errors') or {}
+        failures = []
+        for section in sections:
+            if section not in out:
+                failures.append(f'host {host} `cephadm gather --{section}` failed: '
+                                f'{errors.get(section, "no data returned")}')
+                continue
+            update[section](host, out[section])
+        return failures
+
     def _refresh_host_daemons(self, host: str) -> Optional[str]:
         try:
             with self.mgr.async_timeout_handler(host, 'cephadm ls'):
@@ -393,16 +423,18 @@ class CephadmServe:
 
         return None
 
-    def _refresh_host_devices(self, host: str) -> Optional[str]:
-        with_lsm = self.mgr.device_enhanced_scan
-        list_all = self.mgr.inventory_list_all
-        inventory_args = ['--', 'inventory',
+    def _inventory_args(self) -> List[str]:
+        inventory_args = ['inventory',
                           '--format=json-pretty',
                           '--filter-for-batch']
-        if with_lsm:
+        if self.mgr.device_enhanced_scan:
             inventory_args.insert(-1, "--with-lsm")
-        if list_all:
+        if self.mgr.inventory_list_all:
             inventory_args.insert(-1, "--list-all")
+        return inventory_args
+
+    def _refresh_host_devices(self, host: str) -> Optional[str]:
+        inventory_args = ['--'] + self._inventory_args()
 
         try:
             try:
@@ -422,13 +454,16 @@ class CephadmServe:
         except OrchestratorError as e:
             return str(e)
 
+        self._update_host_devices(host, devices)
+        return None
+
+    def _update_host_devices(self, host: str, devices: List[Dict[str, Any]]) -> None:
         self.log.debug('Refreshed host %s devices (%d)' % (
             host, len(devices)))
         ret = inventory.Devices.from_json(devices)
         self.mgr.cache.update_host_devices(host, ret.devices)
         self.update_osdspec_previews(host)
         self.mgr.cache.save_host(host)
-        return None
 
     def _refresh_host_networks(self, host: str) -> Optional[str]:
         try:
@@ -438,11 +473,14 @@ class CephadmServe:
         except OrchestratorError as e:
             return str(e)
 
+        self._update_host_networks(host, networks)
+        return None
+
+    def _update_host_networks(self, host: str, networks: Dict[str, Dict[str, List[str]]]) -> None:
         self.log.debug('Refreshed host %s networks (%s)' % (
             host, len(networks)))
         self.mgr.cache.update_host_networks(host, networks)
         self.mgr.cache.save_host(host)
-        return None
 
     def _refresh_host_osdspec_previews(self, host: str) -> Optional[str]:
         self.update_osdspec_previews(host)
@@ -1086,6 +1124,8 @@ class CephadmServe:
         self.log.debug('_check_daemons')
         daemons = self.mgr.cache.get_daemons()
         daemons_post: Dict[str, List[orchestrator.DaemonDescription]] = defaultdict(list)
+        # service name -> id of its active daemon
+        active_daemon_ids: Dict[str, Optional[str]] = {}
         for dd in daemons:
             # orphan?
             spec = self.mgr.spec_store.active_specs.get(dd.service_name(), None)
@@ -1103,6 +1143,7 @@ class CephadmServe:
                 # to a service spec)
                 self.log.info('Removing orphan daemon %s...' % dd.name())
                 self._remove_daemon(dd.name(), dd.hostname)
+                active_daemon_ids.pop(dd.service_name(), None)
 
             # ignore unmanaged services
             if spec and spec.unmanaged:
@@ -1124,8 +1165,11 @@ class CephadmServe:
             if dd.daemon_type in REQUIRES_POST_ACTIONS:
                 daemons_post[dd.daemon_type].append(dd)
 
-            if service_registry.get_service(daemon_type_to_service(dd.daemon_type)).get_active_daemon(
-               self.mgr.cache.get_daemons_by_service(dd.service_name())).daemon_id == dd.daemon_id:
+            if dd.service_name() not in active_daemon_ids:
+                active_daemon_ids[dd.service_name()] = service_registry.get_service(
+                    daemon_type_to_service(dd.daemon_type)).get_active_daemon(
+                        self.mgr.cache.get_daemons_by_service(dd.service_name())).daemon_id
+            if active_daemon_ids[dd.service_name()] == dd.daemon_id:
                 dd.is_active = True
             else:
                 dd.is_active = False
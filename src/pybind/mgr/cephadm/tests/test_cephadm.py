@@ -1,6 +1,7 @@
 import asyncio
 import json
 import logging
+import threading
 
 from contextlib import contextmanager
 
@@ -18,7 +19,7 @@ from cephadm.services.nvmeof import NvmeofService
 from cephadm.utils import SpecialHostLabels
 
 try:
-    from typing import List
+    from typing import Any, Dict, List
 except ImportError:
     pass
 
@@ -1676,6 +1677,85 @@ class TestCephadm(object):
             ]
             _set_store.assert_has_calls(expected_calls)
 
+    @mock.patch("cephadm.serve.CephadmServe._run_cephadm")
+    def test_save_host_deferred(self, _run_cephadm, cephadm_module: CephadmOrchestrator):
+        _run_cephadm.side_effect = async_side_effect(('{}', '', 0))
+        cache = cephadm_module.cache
+        with with_host(cephadm_module, 'test'):
+            cache.update_host_devices('test', [Device('/dev/sdb')])
+            with mock.patch.object(cephadm_module, 'set_store') as _set_store:
+                cache.defer_saves()
+                cache.update_host_daemons('test', {})
+                cache.save_host('test')
+                cache.save_host('test')
+                assert _set_store.call_count == 0
+
+                # once per host, with the changed devices
+                cache.flush()
+                assert [c.args[0] for c in _set_store.call_args_list] == \
+                    ['host.test.devices.0', 'host.test']
+
+                # nothing changed
+                cache.save_host('test')
+                cache.flush()
+                assert _set_store.call_count == 2
+
+                # flush() ends the deferral
+                cache.update_host_daemons('test', {})
+                cache.save_host('test')
+                assert _set_store.call_count == 3
+
+    @mock.patch("cephadm.serve.CephadmServe._run_cephadm")
+    def test_refresh_saves_deferred(self, _run_cephadm, cephadm_module: CephadmOrchestrator):
+        _run_cephadm.side_effect = async_side_effect(('[]', '', 0))
+        cache = cephadm_module.cache
+        with with_host(cephadm_module, 'test'):
+            cache.invalidate_host_daemons('test')
+            cache.last_host_check.pop('test', None)
+            with mock.patch.object(cephadm_module, 'set_store') as _set_store:
+                cache.defer_saves()
+                # save_host() runs on the threads of the worker pool
+                CephadmServe(cephadm_module)._refresh_hosts_and_daemons()
+                assert 'test' in cache._unsaved_hosts
+                assert not [c for c in _set_store.call_args_list if c.args[0] == 'host.test']
+
+                cache.flush()
+                assert [c.args[0] for c in _set_store.call_args_list
+                        if c.args[0] == 'host.test'] == ['host.test']
+
+    @mock.patch("cephadm.serve.CephadmServe._run_cephadm")
+    def test_deferred_saves_are_bounded(self, _run_cephadm, cephadm_module: CephadmOrchestrator):
+        _run_cephadm.side_effect = async_side_effect(('[]', '', 0))
+        cache = cephadm_module.cache
+        with with_host(cephadm_module, 'test'):
+            cache.update_host_daemons('test', {'mon.test': DaemonDescription('mon', 'test', 'test')})
+            with mock.patch.object(cephadm_module, 'set_store') as _set_store, \
+                    mock.patch('cephadm.inventory.time.monotonic') as _monotonic:
+                def saved() -> int:
+                    return len([c for c in _set_store.call_args_list if c.args[0] == 'host.test'])
+
+                _monotonic.return_value = 100.0
+                cache.defer_saves()
+                cache.last_host_check['test'] = datetime_now()
+                cache.save_host('test')
+                assert saved() == 0
+
+                # scheduled daemon actions are saved right away
+                cache.schedule_daemon_action('test', 'mon.test', 'restart')
+                cache.save_host('test')
+                assert saved() == 1
+                cache.last_host_check['test'] = datetime_now()
+                cache.save_host('test')
+                assert saved() == 1
+
+                # and everything else within SAVE_DEFER_SECONDS
+                _monotonic.return_value = 100.0 + cache.SAVE_DEFER_SECONDS
+                cache.save_host('test')
+                assert saved() == 2
+                assert not cache._unsaved_hosts
+                cache.flush()
+                assert saved() == 2
+
     @mock.patch("cephadm.module.CephadmOrchestrator.get_store")
     def test_load_devices(self, _get_store, cephadm_module: CephadmOrchestrator):
         def _fake_store(key):
@@ -1711,6 +1791,130 @@ class TestCephadm(object):
         assert cephadm_module.cache._get_host_cache_entry_status(
             'host.nothing.com') == HostCacheStatus.stray
 
+    def test_daemon_lookups(self, cephadm_module: CephadmOrchestrator):
+        cache = cephadm_module.cache
+
+        def dd(daemon_type: str, daemon_id: str, host: str, **kwargs) -> DaemonDescription:
+            return DaemonDescription(daemon_type, daemon_id, host, **kwargs)
+
+        cache.update_host_daemons('host1', {
+            'haproxy.ingress.host1.a': dd('haproxy', 'ingress.host1.a', 'host1'),
+            'mon.host1': dd('mon', 'host1', 'host1'),
+            'keepalived.ingress.host1.b': dd('keepalived', 'ingress.host1.b', 'host1'),
+        })
+        cache.update_host_daemons('host2', {
+            'mon.host2': dd('mon', 'host2', 'host2'),
+            'rgw.foo.host2.c': dd('rgw', 'foo.host2.c', 'host2', service_name='rgw.foo'),
+        })
+        cache.update_host_daemons('host3', {})
+
+        def names(dds: List[DaemonDescription]) -> List[str]:
+            return [d.name() for d in dds]
+
+        assert names(cache.get_daemons_by_service('mon')) == ['mon.host1', 'mon.host2']
+        assert names(cache.get_daemons_by_type('ingress')) == \
+            ['haproxy.ingress.host1.a', 'keepalived.ingress.host1.b']
+        assert cache.get_daemon('rgw.foo.host2.c').hostname == 'host2'
+
+        # daemons move: the indexes follow
+        cache.add_daemon('host3', dd('rgw', 'foo.host2.c', 'host3', service_name='rgw.foo'))
+        cache.rm_daemon('host2', 'rgw.foo.host2.c')
+        assert cache.get_daemon('rgw.foo.host2.c').hostname == 'host3'
+        assert names(cache.get_daemons_by_service('rgw.foo')) == ['rgw.foo.host2.c']
+
+        # a refresh of host1 replaces all of its daemons, the order of
+        # the hosts stays the same
+        cache.update_host_daemons('host1', {'mon.host1': dd('mon', 'host1', 'host1')})
+        assert names(cache.get_daemons_by_service('mon')) == ['mon.host1', 'mon.host2']
+        assert cache.get_daemons_by_service('ingress') == []
+        assert not cache.has_daemon('haproxy.ingress.host1.a')
+
+        cache.rm_host('host2')
+        assert names(cache.get_daemons_by_type('mon')) == ['mon.host1']
+        assert not cache.has_daemon('mon.host2')
+
+    def test_daemon_lookups_concurrent(self, cephadm_module: CephadmOrchestrator):
+        cache = cephadm_module.cache
+
+        def refresh(host: str, n: int) -> None:
+            cache.update_host_daemons(host, {
+                f'crash.{host}': DaemonDescription('crash', host, host),
+                f'osd.{n}': DaemonDescription('osd', str(n), host),
+            })
+
+        refresh('host1', 0)
+        refresh('host2', 0)
+        done = threading.Event()
+        seen: List[List[str]] = []
+
+        def writer(host: str) -> None:
+            for n in range(2000):
+                refresh(host, n)
+
+        def reader() -> None:
+            while not done.is_set():
+                names = [d.name() for d in cache.get_daemons_by_service('crash')]
+                if names != ['crash.host1', 'crash.host2']:
+                    seen.append(names)
+
+        writers = [threading.Thread(target=writer, args=(h,)) for h in ('host1', 'host2')]
+        r = threading.Thread(target=reader)
+        r.start()
+        for t in writers:
+            t.start()
+        for t in writers:
+            t.join()
+        done.set()
+        r.join()
+        # every refresh replaces the crash daemon of the host: a reader never
+        # sees a host without it
+        assert seen == []
+        assert [d.name() for d in cache.get_daemons_by_type('osd')] == ['osd.1999', 'osd.1999']
+
+    @mock.patch("cephadm.serve.CephadmServe._run_cephadm")
+    def test_agent_metadata_delta(self, _run_cephadm, cephadm_module: CephadmOrchestrator):
+        from cephadm.agent import HostData
+        _run_cephadm.side_effect = async_side_effect(('{}', '', 0))
+        endpoint = HostData.__new__(HostData)
+        endpoint.mgr = cephadm_module
+        networks = {'10.1.0.0/16': {'eth0': ['10.1.2.3']}}
+
+        def report(seq: int, **sections: Any) -> Dict[str, Any]:
+            return endpoint.handle_metadata({
+                'host': 'test', 'port': '7777', 'ack': '1', 'seq': seq,
+                'digests': {'ls': 'ls-%d' % seq, 'networks': 'net'},
+                **sections,
+            }, 100)
+
+        with with_host(cephadm_module, 'test'):
+            cephadm_module.agent_cache.agent_counter['test'] = 1
+
+            # full report
+            assert report(1, ls=[], networks=networks)['seq'] == 1
+            assert cephadm_module.cache.networks['test'] == networks
+
+            # networks left out as unchanged
+            cephadm_module.cache.last_network_update.pop('test', None)
+            assert report(2, ls=[])['seq'] == 2
+            assert cephadm_module.cache.networks['test'] == networks
+            assert 'test' in cephadm_module.cache.last_network_update
+
+            # a report got lost: ask for everything
+            res = report(4, ls=[])
+            assert res['resync']
+            assert 'seq' not in res
+
+            # a new mgr does not know the digests either
+            cephadm_module.agent_cache.agent_report_digests.clear()
+            assert report(5, ls=[])['resync']
+
+            stats = json.loads(cephadm_module._agent_stats('test').stdout)['test']
+            assert stats['reports'] == 4
+            assert stats['full_reports'] == 1
+            assert stats['resyncs_requested'] == 2
+            assert stats['sections_unchanged'] == 3
+            assert stats['bytes'] == 400
+
     @mock.patch("cephadm.serve.CephadmServe._run_cephadm", _run_cephadm('{}'))
     @mock.patch("cephadm.services.nfs.NFSService.run_grace_tool", mock.MagicMock())
     @mock.patch("cephadm.services.nfs.NFSService.purge", mock.MagicMock())
@@ -2339,6 +2543,33 @@ Traceback (most recent call last):
                           no_fsid=False, error_ok=False, log_output=False, use_current_daemon_image=False),
             ]
 
+    @mock.patch("cephadm.serve.CephadmServe._run_cephadm")
+    def test_refresh_host_metadata(self, _run_cephadm, cephadm_module: CephadmOrchestrator):
+        _run_cephadm.side_effect = async_side_effect(('{}', '', 0))
+
+        with with_host(cephadm_module, 'test'):
+            _run_cephadm.reset_mock()
+            _run_cephadm.side_effect = async_side_effect((json.dumps({
+                'ls': [],
+                'networks': {'10.1.0.0/16': {'eth0': ['10.1.2.3']}},
+                'inventory': [{'path': '/dev/sdb', 'available': True}],
+                'errors': {'facts': 'boom'},
+            }), '', 0))
+
+            failures = CephadmServe(cephadm_module)._refresh_host_metadata(
+                'test', ['ls', 'facts', 'networks', 'inventory'])
+            assert failures == ['host test `cephadm gather --facts` failed: boom']
+
+            assert _run_cephadm.mock_calls == [
+                mock.call('test', 'osd', 'gather',
+                          ['--ls', '--facts', '--networks', '--inventory',
+                           '--', 'inventory', '--format=json-pretty', '--filter-for-batch'],
+                          image='', no_fsid=False, error_ok=False, log_output=False,
+                          use_current_daemon_image=False),
+            ]
+            assert cephadm_module.cache.networks['test'] == {'10.1.0.0/16': {'eth0': ['10.1.2.3']}}
+            assert [d.path for d in cephadm_module.cache.devices['test']] == ['/dev/sdb']
+
     @mock.patch("cephadm.serve.CephadmServe._run_cephadm")
     def test_osd_activate_datadevice(self, _run_cephadm, cephadm_module: CephadmOrchestrator):
         _run_cephadm.side_effect = async_side_effect(('{}', '', 0))
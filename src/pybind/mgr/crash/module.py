@@ -1,3 +1,4 @@
+import bisect
 import hashlib
 from mgr_module import CLICommand, CLIReadCommand, CLIWriteCommand, MgrModule, Option
 import datetime
@@ -5,10 +6,11 @@ import errno
 import functools
 import inspect
 import json
-from collections import defaultdict
+from collections import Counter, defaultdict
 from prettytable import PrettyTable
 import re
 from threading import Event, Lock
+import typing
 from typing import cast, Any, Callable, DefaultDict, Dict, Iterable, List, Optional, Tuple, TypeVar, \
     Union, TYPE_CHECKING
 
@@ -27,7 +29,7 @@ def with_crashes(func: FuncT) -> FuncT:
     @functools.wraps(func)
     def wrapper(self: 'Module', *args: Any, **kwargs: Any) -> Tuple[int, str, str]:
         with self.crashes_lock:
-            if not self.crashes:
+            if self.crashes is None:
                 self._load_crashes()
             return func(self, *args, **kwargs)
     wrapper.__signature__ = inspect.signature(func)  # type: ignore[attr-defined]
@@ -36,6 +38,80 @@ def with_crashes(func: FuncT) -> FuncT:
 
 CrashT = Dict[str, Union[str, List[str]]]
 
+# the fields of a crash report the index keeps
+SUMMARY_FIELDS = ('crash_id', 'timestamp', 'entity_name', 'utsname_hostname',
+                  'mgr_module', 'process_name', 'stack_sig', 'archived')
+
+
+class CrashIndex:
+    """
+    The crash reports by time and by stack signature. Only SUMMARY_FIELDS
+    of every report are kept, the full reports stay in the store.
+    """
+
+    def __init__(self) -> None:
+        self.summaries: Dict[str, CrashT] = {}
+        # parallel lists, ordered by time
+        self.times: List[datetime.datetime] = []
+        self.ids: List[str] = []
+        self.by_sig: typing.Counter[str] = Counter()
+
+    def __len__(self) -> int:
+        return len(self.summaries)
+
+    def __contains__(self, crashid: str) -> bool:
+        return crashid in self.summaries
+
+    def get(self, crashid: str) -> Optional[CrashT]:
+        return self.summaries.get(crashid)
+
+    def values(self) -> Iterable[CrashT]:
+        return self.summaries.values()
+
+    def add(self, crashid: str, crash: CrashT, stamp: datetime.datetime) -> None:
+        assert crashid not in self.summaries
+        summary = {k: crash[k] for k in SUMMARY_FIELDS if k in crash}
+        self.summaries[crashid] = summary
+        i = bisect.bisect_right(self.times, stamp)
+        self.times.insert(i, stamp)
+        self.ids.insert(i, crashid)
+        if 'stack_sig' in summary:
+            self.by_sig[cast(str, summary['stack_sig'])] += 1
+
+    def update(self, crashid: str, crash: CrashT) -> None:
+        """
+        Take over the changes of a report, other than its time.
+        """
+        assert crashid in self.summaries
+        self.summaries[crashid] = {k: crash[k] for k in SUMMARY_FIELDS if k in crash}
+
+    def remove(self, crashid: str, stamp: datetime.datetime) -> None:
+        summary = self.summaries.pop(crashid)
+        i = bisect.bisect_left(self.times, stamp)
+        while self.ids[i] != crashid:
+            i += 1
+        del self.times[i]
+        del self.ids[i]
+        if 'stack_sig' in summary:
+            sig = cast(str, summary['stack_sig'])
+            self.by_sig[sig] -= 1
+            if not self.by_sig[sig]:
+                del self.by_sig[sig]
+
+    def newer_than(self, cutoff: datetime.datetime) -> List[Tuple[datetime.datetime, str]]:
+        """
+        The (time, crash id) of the crashes after ``cutoff``, oldest first.
+        """
+        i = bisect.bisect_right(self.times, cutoff)
+        return list(zip(self.times[i:], self.ids[i:]))
+
+    def not_newer_than(self, cutoff: datetime.datetime) -> List[Tuple[datetime.datetime, str]]:
+        """
+        The (time, crash id) of the crashes up to ``cutoff``, oldest first.
+        """
+        i = bisect.bisect_right(self.times, cutoff)
+        return list(zip(self.times[:i], self.ids[:i]))
+
 
 class Module(MgrModule):
     MODULE_OPTIONS = [
@@ -55,7 +131,7 @@ class Module(MgrModule):
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super(Module, self).__init__(*args, **kwargs)
-        self.crashes: Optional[Dict[str, CrashT]] = None
+        self.crashes: Optional[CrashIndex] = None
         self.crashes_lock = Lock()
         self.run = True
         self.event = Event()
@@ -86,20 +162,48 @@ class Module(MgrModule):
                            opt['name'], getattr(self, opt['name']))
 
     def _load_crashes(self) -> None:
+        # every report is decoded once, on first use after the mgr starts;
+        # only its summary is kept
         raw = self.get_store_prefix('crash/')
-        self.crashes = {k[6:]: json.loads(m) for (k, m) in raw.items()}
+        self.crashes = CrashIndex()
+        for k, m in raw.items():
+            crash = json.loads(m)
+            self.crashes.add(k[6:], crash, self.time_from_string(crash['timestamp']))
+
+    def _get_crash(self, crashid: str) -> Optional[CrashT]:
+        """
+        The full report of a crash, loaded from the store.
+        """
+        m = self.get_store('crash/%s' % crashid)
+        if m is None:
+            return None
+        return json.loads(m)
+
+    def _put_crash(self, crashid: str, crash: CrashT) -> None:
+        assert self.crashes is not None
+        self.set_store('crash/%s' % crashid, json.dumps(crash))
+        self.crashes.update(crashid, crash)
+
+    def _remove_crash(self, crashid: str) -> None:
+        assert self.crashes is not None
+        crash = self.crashes.get(crashid)
+        assert crash is not None
+        self.crashes.remove(crashid, self.time_from_string(cast(str, crash['timestamp'])))
+        key = 'crash/%s' % crashid
+        self.set_store(key, None)       # removes key
 
     def _refresh_health_checks(self) -> None:
-        if not self.crashes:
+        if self.crashes is None:
             self._load_crashes()
         assert self.crashes is not None
         cutoff = datetime.datetime.utcnow() - datetime.timedelta(
             seconds=self.warn_recent_interval)
-        recent = {
-            crashid: crash for crashid, crash in self.crashes.items()
-            if (self.time_from_string(cast(str, crash['timestamp'])) > cutoff
-                and 'archived' not in crash)
-        }
+        recent = {}
+        for _, crashid in self.crashes.newer_than(cutoff):
+            crash = self.crashes.get(crashid)
+            assert crash is not None
+            if 'archived' not in crash:
+                recent[crashid] = crash
 
         def prune_detail(ls: List[str]) -> int:
             num = len(ls)
@@ -173,14 +277,14 @@ class Module(MgrModule):
         Filter crash reports by timestamp.
 
         :param f: f(time) return true to keep crash report
-        :returns: crash reports for which f(time) returns true
+        :returns: the summaries of the crash reports for which f(time)
+            returns true
         """
-        def inner(pair: Tuple[str, CrashT]) -> bool:
-            _, crash = pair
-            time = self.time_from_string(cast(str, crash["timestamp"]))
-            return f(time)
         assert self.crashes is not None
-        return filter(inner, self.crashes.items())
+        crashes = self.crashes
+        return ((crashid, cast(CrashT, crashes.get(crashid)))
+                for stamp, crashid in zip(list(crashes.times), list(crashes.ids))
+                if f(stamp))
 
     # stack signature helpers
 
@@ -223,7 +327,7 @@ class Module(MgrModule):
         """
         crashid = id
         assert self.crashes is not None
-        crash = self.crashes.get(crashid)
+        crash = self._get_crash(crashid) if crashid in self.crashes else None
         if not crash:
             return errno.EINVAL, '', 'crash info: %s not found' % crashid
         val = json.dumps(crash, indent=4, sort_keys=True)
@@ -243,23 +347,28 @@ class Module(MgrModule):
             assert_msg = cast(Optional[str], metadata.get('assert_msg'))
             metadata['stack_sig'] = self.calc_sig(backtrace, assert_msg)
         crashid = cast(str, metadata['crash_id'])
-        assert self.crashes is not None
-        if crashid not in self.crashes:
-            self.crashes[crashid] = metadata
-            key = 'crash/%s' % crashid
-            self.set_store(key, json.dumps(metadata))
-            self._refresh_health_checks()
+        with self.crashes_lock:
+            if self.crashes is None:
+                self._load_crashes()
+            assert self.crashes is not None
+            if crashid not in self.crashes:
+                key = 'crash/%s' % crashid
+                self.set_store(key, json.dumps(metadata))
+                self.crashes.add(crashid, metadata,
+                                 self.time_from_string(cast(str, metadata['timestamp'])))
+                self._refresh_health_checks()
         return 0, '', ''
 
     def ls(self) -> Tuple[int, str, str]:
-        if not self.crashes:
-            self._load_crashes()
         return self.do_ls_all('')
 
     def _do_ls(self, t: Iterable[CrashT], format: Optional[str]) -> Tuple[int, str, str]:
         r = sorted(t, key=lambda i: i['crash_id'])
         if format in ('json', 'json-pretty'):
-            return 0, json.dumps(r, indent=4, sort_keys=True), ''
+            # the listing has the full reports
+            crashes = (self._get_crash(cast(str, c['crash_id'])) for c in r)
+            full = [c for c in crashes if c is not None]
+            return 0, json.dumps(full, indent=4, sort_keys=True), ''
         else:
             table = PrettyTable(['ID', 'ENTITY', 'NEW'],
                                 border=False)
@@ -289,7 +398,7 @@ class Module(MgrModule):
         Show new crash dumps
         """
         assert self.crashes is not None
-        t = [crash for crashid, crash in self.crashes.items()
+        t = [crash for crash in self.crashes.values()
              if 'archived' not in crash]
         return self._do_ls(t, format)
 
@@ -302,9 +411,7 @@ class Module(MgrModule):
         crashid = id
         assert self.crashes is not None
         if crashid in self.crashes:
-            del self.crashes[crashid]
-            key = 'crash/%s' % crashid
-            self.set_store(key, None)       # removes key
+            self._remove_crash(crashid)
             self._refresh_health_checks()
         return 0, '', ''
 
@@ -321,13 +428,9 @@ class Module(MgrModule):
         now = datetime.datetime.utcnow()
         cutoff = now - datetime.timedelta(seconds=seconds)
         removed_any = False
-        # make a copy of the list, since we'll modify self.crashes below
-        to_prune = list(self.timestamp_filter(lambda ts: ts <= cutoff))
         assert self.crashes is not None
-        for crashid, crash in to_prune:
-            del self.crashes[crashid]
-            key = 'crash/%s' % crashid
-            self.set_store(key, None)
+        for _, crashid in self.crashes.not_newer_than(cutoff):
+            self._remove_crash(crashid)
             removed_any = True
         if removed_any:
             self._refresh_health_checks()
@@ -340,14 +443,14 @@ class Module(MgrModule):
         """
         crashid = id
         assert self.crashes is not None
-        crash = self.crashes.get(crashid)
-        if not crash:
+        summary = self.crashes.get(crashid)
+        if not summary:
             return errno.EINVAL, '', 'crash info: %s not found' % crashid
-        if not crash.get('archived'):
+        if not summary.get('archived'):
+            crash = self._get_crash(crashid)
+            assert crash is not None
             crash['archived'] = str(datetime.datetime.utcnow())
-            self.crashes[crashid] = crash
-            key = 'crash/%s' % crashid
-            self.set_store(key, json.dumps(crash))
+            self._put_crash(crashid, crash)
             self._refresh_health_checks()
         return 0, '', ''
 
@@ -358,12 +461,14 @@ class Module(MgrModule):
         Acknowledge all new crashes and silence health warning(s)
         """
         assert self.crashes is not None
-        for crashid, crash in self.crashes.items():
-            if not crash.get('archived'):
-                crash['archived'] = str(datetime.datetime.utcnow())
-                self.crashes[crashid] = crash
-                key = 'crash/%s' % crashid
-                self.set_store(key, json.dumps(crash))
+        new = [crashid for crashid, summary in self.crashes.summaries.items()
+               if not summary.get('archived')]
+        for crashid in new:
+            crash = self._get_crash(crashid)
+            if crash is None:
+                continue
+            crash['archived'] = str(datetime.datetime.utcnow())
+            self._put_crash(crashid, crash)
         self._refresh_health_checks()
         return 0, '', ''
 
@@ -403,9 +508,8 @@ class Module(MgrModule):
             })
 
         assert self.crashes is not None
-        for crashid, crash in self.crashes.items():
+        for stamp, crashid in zip(self.crashes.times, self.crashes.ids):
             total += 1
-            stamp = self.time_from_string(cast(str, crash['timestamp']))
             for bindict in bins:
                 if stamp <= cast(datetime.datetime, bindict['agelimit']):
                     cast(List[str], bindict['idlist']).append(crashid)
@@ -416,6 +520,11 @@ class Module(MgrModule):
 
         for bindict in bins:
             retlines.append(binstr(bindict))
+
+        if self.crashes.by_sig:
+            retlines.append('%d stack signatures:' % len(self.crashes.by_sig))
+            for sig, count in self.crashes.by_sig.most_common():
+                retlines.append('%d %s' % (count, sig))
         return 0, '\n'.join(retlines), ''
 
     @CLIReadCommand('crash json_report')
@@ -427,7 +536,7 @@ class Module(MgrModule):
         # Return a machine readable summary of recent crashes.
         report: DefaultDict[str, int] = defaultdict(lambda: 0)
         assert self.crashes is not None
-        for crashid, crash in self.crashes.items():
+        for crash in self.crashes.values():
             pname = cast(str, crash.get("process_name", "unknown"))
             if not pname:
                 pname = "unknown"
@@ -0,0 +1,201 @@
+# python unit test
+import datetime
+import errno
+import json
+
+import pytest
+
+from tests import mock
+from crash.module import CrashIndex, Module, DATEFMT
+
+
+BACKTRACE_A = ['(foo()+0x10) [0x1]', '(bar()+0x20) [0x2]']
+BACKTRACE_B = ['(baz()+0x30) [0x3]']
+
+
+def stamp(t):
+    return t.strftime(DATEFMT) + 'Z'
+
+
+def report(crashid, t, backtrace=None, **kwargs):
+    crash = {
+        'crash_id': crashid,
+        'timestamp': stamp(t),
+        'entity_name': 'osd.0',
+        'utsname_hostname': 'host1',
+        'process_name': 'ceph-osd',
+        'os_version': 'big field the index does not keep',
+    }
+    if backtrace:
+        crash['backtrace'] = backtrace
+    crash.update(kwargs)
+    return crash
+
+
+@pytest.fixture
+def module():
+    m = Module('crash', 0, 0)
+    m.config_notify()
+    m.set_health_checks = mock.MagicMock()
+    return m
+
+
+def post(m, crash):
+    assert m.do_post(inbuf=json.dumps(crash)) == (0, '', '')
+
+
+def stored(m):
+    return sorted(k[len('crash/'):] for k in m.get_store_prefix('crash/'))
+
+
+def health_counts(m):
+    checks = m.set_health_checks.call_args[0][0]
+    return {name: check['count'] for name, check in checks.items()}
+
+
+NOW = datetime.datetime.utcnow()
+
+
+def test_post(module):
+    post(module, report('a', NOW - datetime.timedelta(hours=1), BACKTRACE_A))
+    post(module, report('b', NOW - datetime.timedelta(hours=2), mgr_module='balancer'))
+    assert stored(module) == ['a', 'b']
+    assert health_counts(module) == {'RECENT_CRASH': 1, 'RECENT_MGR_MODULE_CRASH': 1}
+    # the index keeps only the summary
+    assert 'os_version' not in module.crashes.get('a')
+    assert module.crashes.get('a')['stack_sig'] == module.calc_sig(BACKTRACE_A, None)
+
+    # posting the same crash again is a no-op
+    post(module, report('a', NOW, BACKTRACE_B))
+    info = json.loads(module.do_info(id='a')[1])
+    assert info['backtrace'] == BACKTRACE_A
+    assert info['os_version'] == 'big field the index does not keep'
+
+
+def test_post_malformed(module):
+    r, _, err = module.do_post(inbuf=json.dumps({'crash_id': 'a'}))
+    assert r == errno.EINVAL and 'timestamp' in err
+    assert stored(module) == []
+
+
+def test_archive(module):
+    post(module, report('a', NOW - datetime.timedelta(hours=1)))
+    post(module, report('b', NOW - datetime.timedelta(hours=2)))
+    assert health_counts(module) == {'RECENT_CRASH': 2}
+
+    assert module.do_archive(id='a')[0] == 0
+    assert health_counts(module) == {'RECENT_CRASH': 1}
+    assert 'archived' in json.loads(module.get_store('crash/a'))
+    assert 'archived' in module.crashes.get('a')
+    assert module.do_archive(id='nope')[0] == errno.EINVAL
+    assert [c['crash_id'] for c in json.loads(module.do_ls_new(format='json')[1])] == ['b']
+
+    assert module.do_archive_all()[0] == 0
+    assert health_counts(module) == {}
+    assert all('archived' in json.loads(module.get_store('crash/%s' % i)) for i in 'ab')
+    assert json.loads(module.do_ls_new(format='json')[1]) == []
+
+
+def test_rm(module):
+    post(module, report('a', NOW, BACKTRACE_A))
+    post(module, report('b', NOW, BACKTRACE_A))
+    assert module.do_rm(id='a') == (0, '', '')
+    assert module.do_rm(id='nope') == (0, '', '')
+    assert stored(module) == ['b']
+    assert 'a' not in module.crashes
+    assert module.crashes.ids == ['b']
+    assert module.crashes.by_sig == {module.calc_sig(BACKTRACE_A, None): 1}
+    assert health_counts(module) == {'RECENT_CRASH': 1}
+
+
+def test_prune(module):
+    post(module, report('old', NOW - datetime.timedelta(days=10)))
+    post(module, report('new', NOW - datetime.timedelta(days=1)))
+    assert module.do_prune(keep=5) == (0, '', '')
+    assert stored(module) == ['new']
+    assert list(module.crashes.summaries) == ['new']
+
+
+def test_prune_cutoff():
+    index = CrashIndex()
+    cutoff = datetime.datetime(2024, 5, 1, 12, 0, 0)
+    for crashid, t in (('before', cutoff - datetime.timedelta(microseconds=1)),
+                       ('at', cutoff),
+                       ('after', cutoff + datetime.timedelta(microseconds=1))):
+        index.add(crashid, report(crashid, t), t)
+    # a crash at the cutoff is pruned, and not recent
+    assert [i for _, i in index.not_newer_than(cutoff)] == ['before', 'at']
+    assert [i for _, i in index.newer_than(cutoff)] == ['after']
+
+
+def test_same_timestamp(module):
+    t = NOW - datetime.timedelta(days=2)
+    post(module, report('a', t, BACKTRACE_A))
+    post(module, report('b', t, BACKTRACE_A))
+    post(module, report('c', t, BACKTRACE_A))
+    assert module.crashes.ids == ['a', 'b', 'c']
+
+    # both are removed, whichever comes first in the index
+    assert module.do_rm(id='b') == (0, '', '')
+    assert module.crashes.ids == ['a', 'c']
+    assert module.do_rm(id='c') == (0, '', '')
+    assert module.crashes.ids == ['a']
+    assert module.crashes.times == [module.time_from_string(stamp(t))]
+
+    module.do_prune(keep=1)
+    assert stored(module) == []
+    assert len(module.crashes) == 0
+    assert not module.crashes.by_sig
+
+
+def test_stat(module):
+    post(module, report('a', NOW - datetime.timedelta(days=4), BACKTRACE_A))
+    post(module, report('b', NOW - datetime.timedelta(days=2), BACKTRACE_A))
+    post(module, report('c', NOW - datetime.timedelta(hours=1), BACKTRACE_B))
+    post(module, report('d', NOW - datetime.timedelta(hours=1)))
+    r, out, _ = module.do_stat()
+    assert r == 0
+    lines = out.split('\n')
+    assert lines[0] == '4 crashes recorded'
+    assert '2 older than 1 days old:' in lines
+    assert '1 older than 3 days old:' in lines
+    sig_a = module.calc_sig(BACKTRACE_A, None)
+    sig_b = module.calc_sig(BACKTRACE_B, None)
+    assert lines[-3:] == ['2 stack signatures:', '2 %s' % sig_a, '1 %s' % sig_b]
+
+    module.do_rm(id='c')
+    lines = module.do_stat()[1].split('\n')
+    assert lines[-2:] == ['1 stack signatures:', '2 %s' % sig_a]
+
+
+def test_ls_json_has_full_reports(module):
+    post(module, report('b', NOW, BACKTRACE_B))
+    post(module, report('a', NOW, BACKTRACE_A))
+    module.do_archive(id='b')
+    ls = json.loads(module.do_ls_all(format='json')[1])
+    assert [c['crash_id'] for c in ls] == ['a', 'b']
+    assert ls[0] == json.loads(module.get_store('crash/a'))
+    assert ls[0]['backtrace'] == BACKTRACE_A
+    assert ls[1]['os_version'] == 'big field the index does not keep'
+    assert 'archived' in ls[1]
+
+    table = module.do_ls_all()[1]
+    assert 'os_version' not in table
+    assert [line.split()[0] for line in table.split('\n')[1:]] == ['a', 'b']
+
+
+def test_load(module):
+    post(module, report('a', NOW - datetime.timedelta(hours=1), BACKTRACE_A))
+    post(module, report('b', NOW - datetime.timedelta(hours=2), BACKTRACE_A))
+    module.do_archive(id='b')
+
+    # a new mgr builds the same index from the store
+    m = Module('crash', 0, 0)
+    m.config_notify()
+    m.set_health_checks = mock.MagicMock()
+    m._store = dict(module._store)
+    m._refresh_health_checks()
+    assert m.crashes.summaries == module.crashes.summaries
+    assert m.crashes.ids == ['b', 'a']
+    assert m.crashes.by_sig == module.crashes.by_sig
+    assert health_counts(m) == {'RECENT_CRASH': 1}
@@ -2,18 +2,25 @@
 Device health monitoring
 """
 
+from collections import defaultdict, deque
 import errno
+import hashlib
 import json
 from mgr_module import MgrModule, CommandResult, MgrModuleRecoverDB, CLIRequiresDB, CLICommand, CLIReadCommand, Option, MgrDBNotReady
 import operator
 import rados
 import re
 from threading import Event
+import time
 from datetime import datetime, timedelta, timezone
-from typing import cast, Any, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING, Union
+from typing import cast, Any, Deque, Dict, Iterator, List, Optional, Sequence, Set, Tuple, TYPE_CHECKING, Union
+import zlib
 
 TIME_FORMAT = '%Y%m%d-%H%M%S'
 
+# scrape_all() stores the metrics of this many devices per transaction
+SCRAPE_BATCH_SIZE = 1000
+
 DEVICE_HEALTH = 'DEVICE_HEALTH'
 DEVICE_HEALTH_IN_USE = 'DEVICE_HEALTH_IN_USE'
 DEVICE_HEALTH_TOOMANY = 'DEVICE_HEALTH_TOOMANY'
@@ -47,6 +54,45 @@ def get_nvme_wear_level(data: Dict[Any, Any]) -> Optional[float]:
     return pct_used / 100.0
 
 
+def get_smart_attributes(data: Dict[Any, Any]) -> Dict[str, Union[int, float]]:
+    """
+    Extract the numeric attributes from smartctl -x --json output, named
+    the way the failure predictors expect them, e.g. smart_5_raw
+    """
+    attrs: Dict[str, Union[int, float]] = {}
+    for attr in data.get('ata_smart_attributes', {}).get('table', []):
+        raw = attr.get('raw', {})
+        if raw.get('string') is not None:
+            string = str(raw['string'])
+            value = raw.get('value', 0)
+            if string.isdigit():
+                value = int(string)
+            elif string.split(' ')[0].isdigit():
+                value = int(string.split(' ')[0])
+            if isinstance(value, (int, float)):
+                attrs['smart_%s_raw' % attr.get('id')] = value
+        if isinstance(attr.get('value'), (int, float)):
+            attrs['smart_%s_normalized' % attr.get('id')] = attr['value']
+    power_on_time = data.get('power_on_time', {}).get('hours')
+    if power_on_time is not None:
+        attrs['smart_9_raw'] = int(power_on_time)
+    user_capacity = data.get('user_capacity', {}).get('bytes')
+    if user_capacity is not None:
+        attrs['user_capacity'] = user_capacity
+    for name, value in data.get('nvme_smart_health_information_log', {}).items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            attrs['nvme_%s' % name] = value
+    temperature = data.get('temperature', {}).get('current')
+    if isinstance(temperature, (int, float)):
+        attrs['temperature'] = temperature
+    wear_level = get_ata_wear_level(data)
+    if wear_level is None:
+        wear_level = get_nvme_wear_level(data)
+    if wear_level is not None:
+        attrs['wear_level'] = wear_level
+    return attrs
+
+
 class Module(MgrModule):
 
     # latest (if db does not exist)
@@ -56,6 +102,7 @@ class Module(MgrModule):
             devid TEXT PRIMARY KEY
         ) WITHOUT ROWID;
         """,
+        # samples of v1 not converted yet, see convert_legacy_metrics()
         """
         CREATE TABLE DeviceHealthMetrics (
             time DATETIME DEFAULT (strftime('%s', 'now')),
@@ -63,7 +110,38 @@ class Module(MgrModule):
             raw_smart TEXT NOT NULL,
             PRIMARY KEY (time, devid)
         );
+        """,
+        # zlib compressed smartctl output, shared by identical samples
+        """
+        CREATE TABLE DeviceHealthBlob (
+            digest TEXT PRIMARY KEY,
+            raw_smart BLOB NOT NULL
+        ) WITHOUT ROWID;
+        """,
+        """
+        CREATE TABLE DeviceHealthSample (
+            id INTEGER PRIMARY KEY,
+            time DATETIME NOT NULL,
+            devid TEXT NOT NULL REFERENCES Device (devid),
+            digest TEXT NOT NULL REFERENCES DeviceHealthBlob (digest),
+            UNIQUE (devid, time)
+        );
+        """,
         """
+        CREATE TABLE DeviceHealthAttributeName (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+        """,
+        # the numeric attributes of the samples, see get_smart_attributes()
+        """
+        CREATE TABLE DeviceHealthAttribute (
+            sample INTEGER NOT NULL REFERENCES DeviceHealthSample (id),
+            name INTEGER NOT NULL REFERENCES DeviceHealthAttributeName (id),
+            value NUMERIC NOT NULL,
+            PRIMARY KEY (sample, name)
+        ) WITHOUT ROWID;
+        """,
     ]
 
     SCHEMA_VERSIONED = [
@@ -82,7 +160,39 @@ class Module(MgrModule):
                 PRIMARY KEY (time, devid)
             );
             """,
-        ]
+        ],
+        # v2
+        [
+            """
+            CREATE TABLE DeviceHealthBlob (
+                digest TEXT PRIMARY KEY,
+                raw_smart BLOB NOT NULL
+            ) WITHOUT ROWID;
+            """,
+            """
+            CREATE TABLE DeviceHealthSample (
+                id INTEGER PRIMARY KEY,
+                time DATETIME NOT NULL,
+                devid TEXT NOT NULL REFERENCES Device (devid),
+                digest TEXT NOT NULL REFERENCES DeviceHealthBlob (digest),
+                UNIQUE (devid, time)
+            );
+            """,
+            """
+            CREATE TABLE DeviceHealthAttributeName (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            );
+            """,
+            """
+            CREATE TABLE DeviceHealthAttribute (
+                sample INTEGER NOT NULL REFERENCES DeviceHealthSample (id),
+                name INTEGER NOT NULL REFERENCES DeviceHealthAttributeName (id),
+                value NUMERIC NOT NULL,
+                PRIMARY KEY (sample, name)
+            ) WITHOUT ROWID;
+            """,
+        ],
     ]
 
     MODULE_OPTIONS = [
@@ -100,6 +210,21 @@ class Module(MgrModule):
             desc='how frequently to scrape device health metrics',
             runtime=True,
         ),
+        Option(
+            name='scrape_concurrency',
+            default=32,
+            type='int',
+            min=1,
+            desc='how many daemons to scrape device health metrics from at once',
+            runtime=True,
+        ),
+        Option(
+            name='scrape_timeout',
+            default=120,
+            type='secs',
+            desc='how long to wait for a daemon to report device health metrics',
+            runtime=True,
+        ),
         Option(
             name='pool_name',
             default='device_health_metrics',
@@ -159,6 +284,8 @@ class Module(MgrModule):
         if TYPE_CHECKING:
             self.enable_monitoring = True
             self.scrape_frequency = 0.0
+            self.scrape_concurrency = 0
+            self.scrape_timeout = 0.0
             self.pool_name = ''
             self.device_health_metrics = ''
             self.retention_period = 0.0
@@ -285,15 +412,9 @@ class Module(MgrModule):
             self.log.debug(' %s = %s', opt['name'], getattr(self, opt['name']))
 
     def _legacy_put_device_metrics(self, t: str, devid: str, data: str) -> None:
-        SQL = """
-        INSERT OR IGNORE INTO DeviceHealthMetrics (time, devid, raw_smart)
-            VALUES (?, ?, ?);
-        """
-
         self._create_device(devid)
         epoch = self._t2epoch(t)
-        json.loads(data)  # valid?
-        self.db.execute(SQL, (epoch, devid, data))
+        self._put_sample(devid, epoch, json.loads(data), replace=False)
 
     devre = r"[a-zA-Z0-9-]+[_-][a-zA-Z0-9-]+[_-][a-zA-Z0-9-]+"
 
@@ -347,15 +468,45 @@ class Module(MgrModule):
         self.log.debug(f"finished reading legacy pool, complete = {done}")
         return done
 
+    def convert_legacy_metrics(self) -> bool:
+        """
+        Move a batch of the samples stored by v1 of the schema to the
+        compressed blobs and attributes of v2.
+
+        :return: whether there is nothing left to convert
+        """
+        SQL_SELECT = """
+        SELECT time, devid, raw_smart FROM DeviceHealthMetrics LIMIT ?;
+        """
+        SQL_DELETE = """
+        DELETE FROM DeviceHealthMetrics WHERE time = ? AND devid = ?;
+        """
+        BATCH = 1000
+
+        with self._db_lock, self.db:
+            self.db.execute('BEGIN;')
+            rows = self.db.execute(SQL_SELECT, (BATCH,)).fetchall()
+            for row in rows:
+                try:
+                    data = json.loads(row['raw_smart'])
+                except (ValueError, IndexError):
+                    self.log.debug(f"dropping unparsable {row['devid']}:{row['time']}")
+                else:
+                    self._put_sample(row['devid'], row['time'], data, replace=False)
+                self.db.execute(SQL_DELETE, (row['time'], row['devid']))
+        self.log.debug(f"converted {len(rows)} legacy metrics")
+        return len(rows) < BATCH
+
     @MgrModuleRecoverDB
     def _do_serve(self) -> None:
         last_scrape = None
         finished_loading_legacy = False
+        finished_converting_legacy = False
 
         while self.run:
             # sleep first, in case of exceptions causing retry:
             sleep_interval = self.sleep_interval or 60
-            if not finished_loading_legacy:
+            if not finished_loading_legacy or not finished_converting_legacy:
                 sleep_interval = 2
             self.log.debug('Sleeping for %d seconds', sleep_interval)
             self.event.wait(sleep_interval)
@@ -366,6 +517,8 @@ class Module(MgrModule):
 
                 if not finished_loading_legacy:
                     finished_loading_legacy = self.check_legacy_pool()
+                elif not finished_converting_legacy:
+                    finished_converting_legacy = self.convert_legacy_metrics()
 
                 if last_scrape is None:
                     ls = self.get_kv('last_scrape')
@@ -417,10 +570,12 @@ class Module(MgrModule):
             return -errno.EAGAIN, "", "mgr db not yet available"
         raw_smart_data = self.do_scrape_daemon(daemon_type, daemon_id)
         if raw_smart_data:
+            metrics = {}
             for device, raw_data in raw_smart_data.items():
                 data = self.extract_smart_features(raw_data)
                 if device and data:
-                    self.put_device_metrics(device, data)
+                    metrics[device] = data
+            self.put_many_device_metrics(metrics)
         return 0, "", ""
 
     def scrape_all(self) -> Tuple[int, str, str]:
@@ -428,27 +583,79 @@ class Module(MgrModule):
             return -errno.EAGAIN, "", "mgr db not yet available"
         osdmap = self.get("osd_map")
         assert osdmap is not None
-        did_device = {}
+        did_device = set()
         ids = []
         for osd in osdmap['osds']:
             ids.append(('osd', str(osd['osd'])))
         monmap = self.get("mon_map")
         for mon in monmap['mons']:
             ids.append(('mon', mon['name']))
-        for daemon_type, daemon_id in ids:
-            raw_smart_data = self.do_scrape_daemon(daemon_type, daemon_id)
-            if not raw_smart_data:
-                continue
-            for device, raw_data in raw_smart_data.items():
-                if device in did_device:
-                    self.log.debug('skipping duplicate %s' % device)
+        metrics: Dict[str, Any] = {}
+        targets, fallbacks = self.plan_scrape(ids)
+        while targets:
+            for raw_smart_data in self.do_scrape_daemons(targets):
+                if not raw_smart_data:
                     continue
-                did_device[device] = 1
-                data = self.extract_smart_features(raw_data)
-                if device and data:
-                    self.put_device_metrics(device, data)
+                for device, raw_data in raw_smart_data.items():
+                    if device in did_device:
+                        self.log.debug('skipping duplicate %s' % device)
+                        continue
+                    did_device.add(device)
+                    data = self.extract_smart_features(raw_data)
+                    if device and data:
+                        metrics[device] = data
+                if len(metrics) >= SCRAPE_BATCH_SIZE:
+                    self.put_many_device_metrics(metrics)
+                    metrics = {}
+            # retry the shared devices that did not come back from the
+            # daemon they were planned on with the next daemon having them
+            targets = []
+            for devid, daemons in fallbacks.items():
+                if devid not in did_device and daemons:
+                    daemon_type, daemon_id = daemons.pop(0)
+                    self.log.debug('retrying %s on %s.%s', devid, daemon_type, daemon_id)
+                    targets.append((daemon_type, daemon_id, devid))
+        self.put_many_device_metrics(metrics)
         return 0, "", ""
 
+    def plan_scrape(self, ids: List[Tuple[str, str]]
+                    ) -> Tuple[List[Tuple[str, str, str]], Dict[str, List[Tuple[str, str]]]]:
+        """
+        Decide what to scrape from the daemons so that a device shared by
+        several of them is scraped once: a daemon whose devices are all
+        scraped from daemons before it is skipped, one that has a single
+        device left is asked for that device only. Daemons with no known
+        devices are scraped completely.
+
+        :return: a list of (daemon type, daemon id, devid or '' for all),
+            and the other daemons having each device scraped from the
+            first one, to retry it with if that scrape fails
+        """
+        devids_by_daemon: Dict[str, List[str]] = defaultdict(list)
+        for dev in self.get('devices')['devices']:
+            for daemon in dev.get('daemons', []):
+                devids_by_daemon[daemon].append(dev['devid'])
+
+        planned: Set[str] = set()
+        ret = []
+        fallbacks: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+        for daemon_type, daemon_id in ids:
+            devids = devids_by_daemon.get('%s.%s' % (daemon_type, daemon_id), [])
+            todo = [devid for devid in devids if devid not in planned]
+            for devid in devids:
+                if devid in planned:
+                    fallbacks[devid].append((daemon_type, daemon_id))
+            if devids and not todo:
+                self.log.debug('skipping %s.%s, its devices are scraped already',
+                               daemon_type, daemon_id)
+                continue
+            planned.update(todo)
+            if len(todo) == 1 and len(devids) > 1:
+                ret.append((daemon_type, daemon_id, todo[0]))
+            else:
+                ret.append((daemon_type, daemon_id, ''))
+        return ret, fallbacks
+
     def scrape_device(self, devid: str) -> Tuple[int, str, str]:
         if not self.db_ready():
             return -errno.EAGAIN, "", "mgr db not yet available"
@@ -463,19 +670,18 @@ class Module(MgrModule):
         raw_smart_data = self.do_scrape_daemon(daemon_type, daemon_id,
                                                devid=devid)
         if raw_smart_data:
+            metrics = {}
             for device, raw_data in raw_smart_data.items():
                 data = self.extract_smart_features(raw_data)
                 if device and data:
-                    self.put_device_metrics(device, data)
+                    metrics[device] = data
+            self.put_many_device_metrics(metrics)
         return 0, "", ""
 
-    def do_scrape_daemon(self,
-                         daemon_type: str,
-                         daemon_id: str,
-                         devid: str = '') -> Optional[Dict[str, Any]]:
-        """
-        :return: a dict, or None if the scrape failed.
-        """
+    def _send_scrape(self,
+                     daemon_type: str,
+                     daemon_id: str,
+                     devid: str = '') -> CommandResult:
         self.log.debug('do_scrape_daemon %s.%s' % (daemon_type, daemon_id))
         result = CommandResult('')
         self.send_command(result, daemon_type, daemon_id, json.dumps({
@@ -483,7 +689,18 @@ class Module(MgrModule):
             'format': 'json',
             'devid': devid,
         }), '')
-        r, outb, outs = result.wait()
+        return result
+
+    def _wait_scrape(self,
+                     daemon_type: str,
+                     daemon_id: str,
+                     result: CommandResult,
+                     deadline: float) -> Optional[Dict[str, Any]]:
+        r, outb, outs = result.wait(max(0.0, deadline - time.monotonic()))
+        if r == -errno.ETIMEDOUT:
+            self.log.warning('Timed out scraping daemon {0}.{1}'.format(
+                daemon_type, daemon_id))
+            return None
 
         try:
             return json.loads(outb)
@@ -493,15 +710,111 @@ class Module(MgrModule):
                     daemon_type, daemon_id, outb))
             return None
 
+    def do_scrape_daemon(self,
+                         daemon_type: str,
+                         daemon_id: str,
+                         devid: str = '') -> Optional[Dict[str, Any]]:
+        """
+        :return: a dict, or None if the scrape failed.
+        """
+        result = self._send_scrape(daemon_type, daemon_id, devid)
+        return self._wait_scrape(daemon_type, daemon_id, result,
+                                 time.monotonic() + self.scrape_timeout)
+
+    def do_scrape_daemons(self,
+                          targets: List[Tuple[str, str, str]]) -> Iterator[Optional[Dict[str, Any]]]:
+        """
+        Scrape (daemon type, daemon id, devid) ``targets`` with up to
+        ``scrape_concurrency`` commands in flight.
+
+        :return: the result of each like do_scrape_daemon(), in order
+        """
+        in_flight: Deque[Tuple[str, str, CommandResult, float]] = deque()
+        for daemon_type, daemon_id, devid in targets:
+            if len(in_flight) >= max(1, self.scrape_concurrency):
+                yield self._wait_scrape(*in_flight.popleft())
+            result = self._send_scrape(daemon_type, daemon_id, devid)
+            in_flight.append((daemon_type, daemon_id, result,
+                              time.monotonic() + self.scrape_timeout))
+        while in_flight:
+            yield self._wait_scrape(*in_flight.popleft())
+
     def _prune_device_metrics(self) -> None:
-        SQL = """
-        DELETE FROM DeviceHealthMetrics
-            WHERE time < (strftime('%s', 'now') - ?);
+        SQL = [
+            """
+            DELETE FROM DeviceHealthMetrics
+                WHERE time < (strftime('%s', 'now') - ?);
+            """,
+            """
+            DELETE FROM DeviceHealthAttribute
+                WHERE sample IN (SELECT id FROM DeviceHealthSample
+                                     WHERE time < (strftime('%s', 'now') - ?));
+            """,
+            """
+            DELETE FROM DeviceHealthSample
+                WHERE time < (strftime('%s', 'now') - ?);
+            """,
+        ]
+        SQL_BLOBS = """
+        DELETE FROM DeviceHealthBlob
+            WHERE digest NOT IN (SELECT digest FROM DeviceHealthSample);
         """
 
-        cursor = self.db.execute(SQL, (self.retention_period,))
-        if cursor.rowcount >= 1:
-            self.log.info(f"pruned {cursor.rowcount} metrics")
+        pruned = 0
+        for sql in SQL:
+            cursor = self.db.execute(sql, (self.retention_period,))
+            pruned += max(0, cursor.rowcount)
+        if pruned:
+            self.log.info(f"pruned {pruned} metrics")
+            self.db.execute(SQL_BLOBS)
+
+    def _put_sample(self, devid: str, t: int, data: Any, replace: bool = True) -> None:
+        """
+        Store a sample of the device, its raw smartctl output and its
+        attributes. The caller holds the DB lock and creates the device.
+        """
+        SQL_BLOB = """
+        INSERT OR IGNORE INTO DeviceHealthBlob (digest, raw_smart) VALUES (?, ?);
+        """
+        SQL_FIND = """
+        SELECT id FROM DeviceHealthSample WHERE devid = ? AND time = ?;
+        """
+        SQL_SAMPLE = """
+        INSERT INTO DeviceHealthSample (time, devid, digest) VALUES (?, ?, ?);
+        """
+        SQL_UPDATE = """
+        UPDATE DeviceHealthSample SET digest = ? WHERE id = ?;
+        """
+        SQL_CLEAR = """
+        DELETE FROM DeviceHealthAttribute WHERE sample = ?;
+        """
+        SQL_NAME = """
+        INSERT OR IGNORE INTO DeviceHealthAttributeName (name) VALUES (?);
+        """
+        SQL_NAMES = """
+        SELECT id, name FROM DeviceHealthAttributeName;
+        """
+        SQL_ATTR = """
+        INSERT INTO DeviceHealthAttribute (sample, name, value) VALUES (?, ?, ?);
+        """
+
+        raw = json.dumps(data, sort_keys=True).encode('utf-8')
+        digest = hashlib.sha256(raw).hexdigest()
+        row = self.db.execute(SQL_FIND, (devid, t)).fetchone()
+        if row is not None and not replace:
+            return
+        self.db.execute(SQL_BLOB, (digest, zlib.compress(raw)))
+        if row is None:
+            sample = self.db.execute(SQL_SAMPLE, (t, devid, digest)).lastrowid
+        else:
+            sample = row['id']
+            self.db.execute(SQL_UPDATE, (digest, sample))
+            self.db.execute(SQL_CLEAR, (sample,))
+        attrs = get_smart_attributes(data)
+        self.db.executemany(SQL_NAME, ((name,) for name in attrs))
+        ids = {row['name']: row['id'] for row in self.db.execute(SQL_NAMES)}
+        self.db.executemany(SQL_ATTR, ((sample, ids[name], value)
+                                       for name, value in attrs.items()))
 
     def _create_device(self, devid: str) -> None:
         SQL = """
@@ -515,17 +828,26 @@ class Module(MgrModule):
             self.log.debug(f"device {devid} already exists")
 
     def put_device_metrics(self, devid: str, data: Any) -> None:
-        SQL = """
-        INSERT OR REPLACE INTO DeviceHealthMetrics (devid, raw_smart, time)
-            VALUES (?, ?, strftime('%s', 'now'));
-        """
+        self.put_many_device_metrics({devid: data})
 
+    def put_many_device_metrics(self, metrics: Dict[str, Any]) -> None:
+        """
+        Store the metrics of the devices in a single transaction.
+        """
+        if not metrics:
+            return
+        now = int(time.time())
         with self._db_lock, self.db:
             self.db.execute('BEGIN;')
-            self._create_device(devid)
-            self.db.execute(SQL, (devid, json.dumps(data)))
+            for devid, data in metrics.items():
+                self._create_device(devid)
+                self._put_sample(devid, now, data)
             self._prune_device_metrics()
 
+        for devid, data in metrics.items():
+            self._update_wear_level(devid, data)
+
+    def _update_wear_level(self, devid: str, data: Any) -> None:
         # extract wear level?
         wear_level = get_ata_wear_level(data)
         if wear_level is None:
@@ -554,16 +876,24 @@ class Module(MgrModule):
         res = {}
 
         SQL_EXACT = """
+        SELECT s.time, b.raw_smart
+            FROM DeviceHealthSample s JOIN DeviceHealthBlob b ON b.digest = s.digest
+            WHERE s.devid = ? AND s.time = ?;
+        """
+        SQL_MIN = """
+        SELECT s.time, b.raw_smart
+            FROM DeviceHealthSample s JOIN DeviceHealthBlob b ON b.digest = s.digest
+            WHERE s.devid = ? AND ? <= s.time;
+        """
+        SQL_LEGACY_EXACT = """
         SELECT time, raw_smart
             FROM DeviceHealthMetrics
-            WHERE devid = ? AND time = ?
-            ORDER BY time DESC;
+            WHERE devid = ? AND time = ?;
         """
-        SQL_MIN = """
+        SQL_LEGACY_MIN = """
         SELECT time, raw_smart
             FROM DeviceHealthMetrics
-            WHERE devid = ? AND ? <= time
-            ORDER BY time DESC;
+            WHERE devid = ? AND ? <= time;
         """
 
         isample = None
@@ -575,22 +905,75 @@ class Module(MgrModule):
 
         self.log.debug(f"_get_device_metrics: {devid} {sample} {min_sample}")
 
+        rows: Dict[int, bytes] = {}
         with self._db_lock, self.db:
             self.db.execute('BEGIN;')
             if isample:
+                legacy = self.db.execute(SQL_LEGACY_EXACT, (devid, isample))
                 cursor = self.db.execute(SQL_EXACT, (devid, isample))
             else:
+                legacy = self.db.execute(SQL_LEGACY_MIN, (devid, imin_sample))
                 cursor = self.db.execute(SQL_MIN, (devid, imin_sample))
+            for row in legacy:
+                rows[row['time']] = row['raw_smart'].encode('utf-8')
             for row in cursor:
-                t = row['time']
-                dt = datetime.utcfromtimestamp(t).strftime(TIME_FORMAT)
-                try:
-                    res[dt] = json.loads(row['raw_smart'])
-                except (ValueError, IndexError):
-                    self.log.debug(f"unable to parse value for {devid}:{t}")
-                    pass
+                rows[row['time']] = zlib.decompress(row['raw_smart'])
+        for t in sorted(rows, reverse=True):
+            dt = datetime.utcfromtimestamp(t).strftime(TIME_FORMAT)
+            try:
+                res[dt] = json.loads(rows[t])
+            except (ValueError, IndexError):
+                self.log.debug(f"unable to parse value for {devid}:{t}")
+                pass
         return res
 
+    def get_device_attributes(self, devid: str,
+                              min_sample: Optional[str] = None,
+                              max_samples: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        The numeric attributes of the device's samples (see
+        get_smart_attributes()), without loading the raw smartctl output.
+
+        :return: sample time -> attribute name -> value, the newest first
+        """
+        SQL = """
+        SELECT s.time, n.name, a.value
+            FROM DeviceHealthSample s
+                JOIN DeviceHealthAttribute a ON a.sample = s.id
+                JOIN DeviceHealthAttributeName n ON n.id = a.name
+            WHERE s.id IN (
+                SELECT id FROM DeviceHealthSample
+                    WHERE devid = ? AND ? <= time
+                    ORDER BY time DESC LIMIT ?);
+        """
+        SQL_LEGACY = """
+        SELECT time, raw_smart
+            FROM DeviceHealthMetrics
+            WHERE devid = ? AND ? <= time
+            ORDER BY time DESC LIMIT ?;
+        """
+
+        imin_sample = self._t2epoch(min_sample)
+        limit = -1 if max_samples is None else max_samples
+        attrs: Dict[int, Dict[str, Any]] = {}
+        try:
+            with self._db_lock, self.db:
+                self.db.execute('BEGIN;')
+                for row in self.db.execute(SQL, (devid, imin_sample, limit)):
+                    attrs.setdefault(row['time'], {})[row['name']] = row['value']
+                # not converted yet
+                for row in self.db.execute(SQL_LEGACY, (devid, imin_sample, limit)):
+                    if row['time'] not in attrs:
+                        try:
+                            attrs[row['time']] = get_smart_attributes(json.loads(row['raw_smart']))
+                        except (ValueError, IndexError):
+                            pass
+        except MgrDBNotReady:
+            return dict()
+        times = sorted(attrs, reverse=True)[:max_samples]
+        return dict((datetime.utcfromtimestamp(t).strftime(TIME_FORMAT), attrs[t])
+                    for t in times)
+
     def show_device_metrics(self, devid: str, sample: Optional[str]) -> Tuple[int, str, str]:
         # verify device exists
         r = self.get("device " + devid)
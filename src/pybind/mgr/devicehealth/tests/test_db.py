@@ -0,0 +1,246 @@
+# python unit test
+import json
+import sqlite3
+import time
+
+import pytest
+
+from tests import mock
+from devicehealth.module import Module, get_smart_attributes, TIME_FORMAT
+
+
+def ata(power_on_hours, reallocated=0):
+    return {
+        'model_name': 'ST4000NM0035',
+        'vendor': 'ATA',
+        'user_capacity': {'bytes': 4000787030016},
+        'power_on_time': {'hours': power_on_hours},
+        'temperature': {'current': 31},
+        'ata_smart_attributes': {
+            'table': [
+                {'id': 1, 'value': 83, 'raw': {'value': 213581536, 'string': '213581536'}},
+                {'id': 5, 'value': 100, 'raw': {'value': reallocated,
+                                                'string': str(reallocated)}},
+                {'id': 9, 'value': 90, 'raw': {'value': power_on_hours,
+                                               'string': '%d (23 35 0)' % power_on_hours}},
+                {'id': 190, 'value': 69, 'raw': {'value': 421003295,
+                                                 'string': '31 (Min/Max 25/36)'}},
+                {'id': 240, 'value': 100, 'raw': {'value': 1, 'string': 'n/a'}},
+            ],
+        },
+    }
+
+
+def nvme(percentage_used):
+    return {
+        'model_name': 'INTEL SSDPE2KX040T8',
+        'nvme_smart_health_information_log': {
+            'critical_warning': 0,
+            'percentage_used': percentage_used,
+            'power_on_hours': 1234,
+        },
+    }
+
+
+def legacy_attributes(s_val):
+    """
+    How diskprediction_local used to parse the samples it fetched from
+    show_device_metrics.
+    """
+    dev_smart = {}
+    ata_smart = s_val.get('ata_smart_attributes', {})
+    for attr in ata_smart.get('table', []):
+        if attr.get('raw', {}).get('string') is not None:
+            if str(attr.get('raw', {}).get('string', '0')).isdigit():
+                dev_smart['smart_%s_raw' % attr.get('id')] = \
+                    int(attr.get('raw', {}).get('string', '0'))
+            else:
+                if str(attr.get('raw', {}).get('string', '0')).split(' ')[0].isdigit():
+                    dev_smart['smart_%s_raw' % attr.get('id')] = \
+                        int(attr.get('raw', {}).get('string', '0').split(' ')[0])
+                else:
+                    dev_smart['smart_%s_raw' % attr.get('id')] = \
+                        attr.get('raw', {}).get('value', 0)
+        if attr.get('value') is not None:
+            dev_smart['smart_%s_normalized' % attr.get('id')] = attr.get('value')
+    power_on_time = s_val.get('power_on_time', {}).get('hours')
+    if power_on_time is not None:
+        dev_smart['smart_9_raw'] = int(power_on_time)
+    user_capacity = s_val.get('user_capacity', {}).get('bytes')
+    if user_capacity is not None:
+        dev_smart['user_capacity'] = user_capacity
+    return dev_smart
+
+
+def connect():
+    return sqlite3.connect(':memory:', check_same_thread=False, isolation_level=None)
+
+
+@pytest.fixture
+def module():
+    m = Module('devicehealth', 0, 0)
+    m.retention_period = 86400 * 180
+    m.get = mock.MagicMock(return_value={})
+    m.set_device_wear_level = mock.MagicMock()
+    m._db = connect()
+    m.configure_db(m._db)
+    yield m
+    m._db.close()
+
+
+@pytest.fixture
+def legacy_module():
+    """
+    A module whose DB was created by v1 of the schema.
+    """
+    m = Module('devicehealth', 0, 0)
+    m.retention_period = 86400 * 180
+    db = connect()
+    db.row_factory = sqlite3.Row
+    m.create_skeleton_schema(db)
+    for sql in Module.SCHEMA_VERSIONED[0]:
+        db.execute(sql)
+    m.update_schema_version(db, 1)
+    m._db = db
+    yield m
+    db.close()
+
+
+def query(m, sql, *args):
+    with m._db_lock:
+        return [tuple(row) for row in m.db.execute(sql, args)]
+
+
+def put(m, devid, t, data):
+    with m._db_lock, m.db:
+        m.db.execute('BEGIN;')
+        m._create_device(devid)
+        m._put_sample(devid, t, data)
+
+
+def stamp(t):
+    return time.strftime(TIME_FORMAT, time.gmtime(t))
+
+
+def test_new_db_has_the_latest_version(module):
+    assert query(module, "SELECT value FROM MgrModuleKV WHERE key = '__version'") == \
+        [(len(Module.SCHEMA_VERSIONED),)]
+
+
+def test_convert_legacy_metrics(legacy_module):
+    m = legacy_module
+    now = int(time.time())
+    samples = {now - 86400: ata(100), now: ata(124, reallocated=8)}
+    with m._db_lock, m.db:
+        m.db.execute("INSERT INTO Device VALUES ('disk0');")
+        for t, data in samples.items():
+            m.db.execute('INSERT INTO DeviceHealthMetrics (time, devid, raw_smart) '
+                         'VALUES (?, ?, ?);', (t, 'disk0', json.dumps(data)))
+        m.db.execute('INSERT INTO DeviceHealthMetrics (time, devid, raw_smart) '
+                     'VALUES (?, ?, ?);', (now - 3600, 'disk0', '{not json'))
+
+    m.configure_db(m._db)
+    assert query(m, "SELECT value FROM MgrModuleKV WHERE key = '__version'") == \
+        [(len(Module.SCHEMA_VERSIONED),)]
+
+    # readable before and after the conversion
+    expected = {stamp(t): get_smart_attributes(data) for t, data in samples.items()}
+    assert m.get_device_attributes('disk0') == expected
+    assert m.convert_legacy_metrics()
+    assert query(m, 'SELECT * FROM DeviceHealthMetrics') == []
+    assert m.get_device_attributes('disk0') == expected
+    assert m._get_device_metrics('disk0') == {stamp(t): data for t, data in samples.items()}
+    assert len(query(m, 'SELECT * FROM DeviceHealthSample')) == 2
+
+
+def test_convert_legacy_metrics_keeps_newer_samples(legacy_module):
+    m = legacy_module
+    now = int(time.time())
+    with m._db_lock, m.db:
+        m.db.execute("INSERT INTO Device VALUES ('disk0');")
+        m.db.execute('INSERT INTO DeviceHealthMetrics (time, devid, raw_smart) '
+                     'VALUES (?, ?, ?);', (now, 'disk0', json.dumps(ata(100))))
+    m.configure_db(m._db)
+    put(m, 'disk0', now, ata(200))
+    assert m.convert_legacy_metrics()
+    assert m.get_device_attributes('disk0')[stamp(now)]['smart_9_raw'] == 200
+
+
+def test_identical_samples_share_a_blob(module):
+    now = int(time.time())
+    put(module, 'disk0', now - 60, ata(100))
+    put(module, 'disk0', now, ata(100))
+    put(module, 'disk1', now, ata(100))
+    put(module, 'disk1', now - 60, ata(101))
+    assert len(query(module, 'SELECT * FROM DeviceHealthSample')) == 4
+    assert len(query(module, 'SELECT * FROM DeviceHealthBlob')) == 2
+
+
+def test_attribute_names_are_stored_once(module):
+    now = int(time.time())
+    put(module, 'disk0', now - 60, ata(100))
+    put(module, 'disk0', now, ata(101))
+    names = query(module, 'SELECT name FROM DeviceHealthAttributeName')
+    assert sorted(name for name, in names) == sorted(get_smart_attributes(ata(100)))
+    assert len(query(module, 'SELECT * FROM DeviceHealthAttribute')) == 2 * len(names)
+
+
+def test_replacing_a_sample(module):
+    now = int(time.time())
+    put(module, 'disk0', now, ata(100))
+    put(module, 'disk0', now, nvme(3))
+    assert module.get_device_attributes('disk0') == {stamp(now): get_smart_attributes(nvme(3))}
+    assert module._get_device_metrics('disk0') == {stamp(now): nvme(3)}
+
+
+def test_prune(module):
+    now = int(time.time())
+    old = now - module.retention_period - 60
+    put(module, 'disk0', old, ata(90))
+    put(module, 'disk0', old + 1, ata(100))
+    with mock.patch('devicehealth.module.time.time', return_value=now):
+        module.put_many_device_metrics({'disk0': ata(100), 'disk1': nvme(3)})
+    assert sorted(query(module, 'SELECT devid, time FROM DeviceHealthSample')) == \
+        [('disk0', now), ('disk1', now)]
+    # the blob of ata(90) is not used any more, the one of ata(100) still is
+    assert len(query(module, 'SELECT * FROM DeviceHealthBlob')) == 2
+    assert len(query(module, 'SELECT * FROM DeviceHealthAttribute')) == \
+        len(get_smart_attributes(ata(100))) + len(get_smart_attributes(nvme(3)))
+    module.set_device_wear_level.assert_called_with('disk1', 0.03)
+
+
+def test_get_device_attributes(module):
+    now = int(time.time())
+    for i in range(5):
+        put(module, 'disk0', now - 3600 * i, ata(100 - i))
+    put(module, 'disk1', now, nvme(3))
+    attrs = module.get_device_attributes('disk0', max_samples=3)
+    assert list(attrs) == [stamp(now - 3600 * i) for i in range(3)]
+    assert [a['smart_9_raw'] for a in attrs.values()] == [100, 99, 98]
+    attrs = module.get_device_attributes('disk0', min_sample=stamp(now - 3600))
+    assert list(attrs) == [stamp(now), stamp(now - 3600)]
+    assert module.get_device_attributes('disk1') == {stamp(now): get_smart_attributes(nvme(3))}
+    assert module.get_device_attributes('disk2') == {}
+
+
+@pytest.mark.parametrize('data', [ata(100), ata(4321, reallocated=16), nvme(3), {}])
+def test_smart_attributes_match_diskprediction(data):
+    attrs = get_smart_attributes(data)
+    legacy = legacy_attributes(data)
+    assert {name: attrs[name] for name in legacy} == legacy
+
+
+def test_smart_attributes():
+    attrs = get_smart_attributes(ata(100))
+    assert attrs['smart_9_raw'] == 100
+    assert attrs['smart_190_raw'] == 31
+    assert attrs['smart_240_raw'] == 1
+    assert attrs['temperature'] == 31
+    assert 'wear_level' not in attrs
+    attrs = get_smart_attributes(nvme(3))
+    assert attrs == {
+        'nvme_critical_warning': 0,
+        'nvme_percentage_used': 3,
+        'nvme_power_on_hours': 1234,
+        'wear_level': 0.03,
+    }
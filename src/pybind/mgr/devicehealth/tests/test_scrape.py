@@ -0,0 +1,125 @@
+# python unit test
+import json
+
+import pytest
+
+from tests import mock
+from devicehealth.module import Module
+
+
+DEVICES = [
+    # shared by osd.0 and osd.1
+    {'devid': 'nvme', 'daemons': ['osd.0', 'osd.1']},
+    {'devid': 'hdd0', 'daemons': ['osd.0']},
+    {'devid': 'hdd1', 'daemons': ['osd.1']},
+    # shared by osd.2 and mon.a
+    {'devid': 'ssd', 'daemons': ['osd.2', 'mon.a']},
+]
+
+
+class Cluster:
+    """
+    Answer the smart commands of the daemons, from the devices they have,
+    unless they are down.
+    """
+    def __init__(self, devices, down=()):
+        self.devices = devices
+        self.down = set(down)
+        self.sent = []
+
+    def get(self, what):
+        if what == 'devices':
+            return {'devices': self.devices}
+        if what == 'osd_map':
+            return {'osds': [{'osd': i} for i in range(3)]}
+        if what == 'mon_map':
+            return {'mons': [{'name': 'a'}]}
+        raise KeyError(what)
+
+    def send_command(self, result, daemon_type, daemon_id, command, tag):
+        daemon = '%s.%s' % (daemon_type, daemon_id)
+        devid = json.loads(command)['devid']
+        self.sent.append((daemon, devid))
+        if daemon in self.down:
+            return
+        out = {d['devid']: {'device': d['devid'], 'from': daemon}
+               for d in self.devices
+               if daemon in d['daemons'] and devid in ('', d['devid'])}
+        result.complete(0, json.dumps(out), '')
+
+
+@pytest.fixture
+def module():
+    m = Module('devicehealth', 0, 0)
+    m.scrape_timeout = 0.01
+    m.scrape_concurrency = 2
+    return m
+
+
+def attach(m, cluster):
+    m.get = cluster.get
+    m.send_command = cluster.send_command
+    m.db_ready = mock.MagicMock(return_value=True)
+    m.put_many_device_metrics = mock.MagicMock()
+
+
+def stored(m):
+    ret = {}
+    for call in m.put_many_device_metrics.call_args_list:
+        ret.update(call[0][0])
+    return ret
+
+
+def test_plan_scrape(module):
+    attach(module, Cluster(DEVICES))
+    targets, fallbacks = module.plan_scrape(
+        [('osd', '0'), ('osd', '1'), ('osd', '2'), ('osd', '3'), ('mon', 'a')])
+    # osd.1 is asked for its own device only, mon.a is skipped, osd.3 has
+    # no known devices and is scraped completely
+    assert targets == [('osd', '0', ''), ('osd', '1', 'hdd1'), ('osd', '2', ''), ('osd', '3', '')]
+    assert fallbacks == {'nvme': [('osd', '1')], 'ssd': [('mon', 'a')]}
+
+
+def test_do_scrape_daemons_keeps_the_order(module):
+    cluster = Cluster(DEVICES, down=['osd.1'])
+    attach(module, cluster)
+    results = list(module.do_scrape_daemons(
+        [('osd', '0', 'hdd0'), ('osd', '1', ''), ('osd', '2', '')]))
+    assert results == [
+        {'hdd0': {'device': 'hdd0', 'from': 'osd.0'}},
+        None,
+        {'ssd': {'device': 'ssd', 'from': 'osd.2'}},
+    ]
+    assert cluster.sent == [('osd.0', 'hdd0'), ('osd.1', ''), ('osd.2', '')]
+
+
+def test_do_scrape_daemons_limits_commands_in_flight(module):
+    cluster = Cluster(DEVICES)
+    attach(module, cluster)
+    module.scrape_concurrency = 1
+    results = module.do_scrape_daemons([('osd', '0', ''), ('osd', '1', '')])
+    next(results)
+    assert len(cluster.sent) == 1
+    next(results)
+    assert len(cluster.sent) == 2
+
+
+def test_scrape_all(module):
+    cluster = Cluster(DEVICES)
+    attach(module, cluster)
+    assert module.scrape_all() == (0, '', '')
+    assert sorted(cluster.sent) == [('osd.0', ''), ('osd.1', 'hdd1'), ('osd.2', '')]
+    assert sorted(stored(module)) == ['hdd0', 'hdd1', 'nvme', 'ssd']
+
+
+def test_scrape_all_retries_shared_devices(module):
+    cluster = Cluster(DEVICES, down=['osd.0', 'osd.2'])
+    attach(module, cluster)
+    assert module.scrape_all() == (0, '', '')
+    metrics = stored(module)
+    # hdd0 has no other daemon to scrape it from
+    assert sorted(metrics) == ['hdd1', 'nvme', 'ssd']
+    assert metrics['nvme']['from'] == 'osd.1'
+    assert metrics['ssd']['from'] == 'mon.a'
+    assert ('osd.1', 'nvme') in cluster.sent
+    assert ('mon.a', 'ssd') in cluster.sent
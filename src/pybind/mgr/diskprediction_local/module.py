@@ -124,15 +124,17 @@ class Module(MgrModule):
     def _predict_life_expectancy(self, devid: str) -> str:
         predicted_result = ''
         health_data: Dict[str, Dict[str, Any]] = {}
+        device_info: Dict[str, Any] = {}
         predict_datas: List[DevSmartT] = []
         try:
-            r, outb, outs = self.remote(
-                'devicehealth', 'show_device_metrics', devid=devid, sample='')
-            if r != 0:
-                self.log.error('failed to get device %s health', devid)
-                health_data = {}
-            else:
-                health_data = json.loads(outb)
+            # the numeric SMART attributes of the 12 latest samples, the
+            # raw smartctl output of the latest one for the device model
+            health_data = self.remote(
+                'devicehealth', 'get_device_attributes', devid, max_samples=12)
+            if health_data:
+                latest = self.remote(
+                    'devicehealth', 'get_recent_device_metrics', devid, max(health_data))
+                device_info = latest.get(max(health_data), {})
         except Exception as e:
             self.log.error('failed to get device %s health data due to %s', devid, str(e))
 
@@ -152,47 +154,15 @@ class Module(MgrModule):
             o_keys = sorted(health_data.keys(), reverse=True)
             for o_key in o_keys:
                 # get values for current day (?)
-                dev_smart = {}
-                s_val = health_data[o_key]
-
-                # add all smart attributes
-                ata_smart = s_val.get('ata_smart_attributes', {})
-                for attr in ata_smart.get('table', []):
-                    # get raw smart values
-                    if attr.get('raw', {}).get('string') is not None:
-                        if str(attr.get('raw', {}).get('string', '0')).isdigit():
-                            dev_smart['smart_%s_raw' % attr.get('id')] = \
-                                int(attr.get('raw', {}).get('string', '0'))
-                        else:
-                            if str(attr.get('raw', {}).get('string', '0')).split(' ')[0].isdigit():
-                                dev_smart['smart_%s_raw' % attr.get('id')] = \
-                                    int(attr.get('raw', {}).get('string',
-                                                                '0').split(' ')[0])
-                            else:
-                                dev_smart['smart_%s_raw' % attr.get('id')] = \
-                                    attr.get('raw', {}).get('value', 0)
-                    # get normalized smart values
-                    if attr.get('value') is not None:
-                        dev_smart['smart_%s_normalized' % attr.get('id')] = \
-                            attr.get('value')
-                # add power on hours manually if not available in smart attributes
-                power_on_time = s_val.get('power_on_time', {}).get('hours')
-                if power_on_time is not None:
-                    dev_smart['smart_9_raw'] = int(power_on_time)
-                # add device capacity
-                user_capacity = s_val.get('user_capacity', {}).get('bytes')
-                if user_capacity is not None:
-                    dev_smart['user_capacity'] = user_capacity
-                else:
+                dev_smart: DevSmartT = dict(
+                    (name, value) for name, value in health_data[o_key].items()
+                    if name.startswith('smart_') or name == 'user_capacity')
+                if 'user_capacity' not in dev_smart:
                     self.log.debug('user_capacity not found in smart attributes list')
-                # add device model
-                model_name = s_val.get('model_name')
-                if model_name is not None:
-                    dev_smart['model_name'] = model_name
-                # add vendor
-                vendor = s_val.get('vendor')
-                if vendor is not None:
-                    dev_smart['vendor'] = vendor
+                # add device model and vendor
+                for key in ('model_name', 'vendor'):
+                    if device_info.get(key) is not None:
+                        dev_smart[key] = device_info[key]
                 # if smart data was found, then add that to list
                 if dev_smart:
                     predict_datas.append(dev_smart)
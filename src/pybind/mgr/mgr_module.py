@@ -26,6 +26,7 @@ if TYPE_CHECKING:
 
 import cephfs
 import inspect
+from array import array
 import logging
 import errno
 import functools
@@ -163,8 +164,13 @@ class CommandResult(object):
         self.outs = outs
         self.ev.set()
 
-    def wait(self) -> Tuple[int, str, str]:
-        self.ev.wait()
+    def wait(self, timeout: Optional[float] = None) -> Tuple[int, str, str]:
+        """
+        Block until the command completed, or fail with ``-ETIMEDOUT`` once
+        ``timeout`` seconds passed.
+        """
+        if not self.ev.wait(timeout):
+            return -errno.ETIMEDOUT, '', 'timed out after {}s'.format(timeout)
         return self.r, self.outb, self.outs
 
 
@@ -184,6 +190,42 @@ class HandleCommandResult(NamedTuple):
     stderr: str = ""            # Typically used for error messages.
 
 
+class PerfCounterSnapshot(NamedTuple):
+    """
+    The latest values of the unlabeled perf counters of all daemons of one
+    type, as returned by `MgrModule.get_unlabeled_perf_counters_snapshot()`.
+
+    Values are stored row-major: the value of counter ``paths[c]`` of daemon
+    ``daemons[r]`` is ``values[r * len(paths) + c]``. For long running
+    averages ``values`` holds the sum and ``counts`` the count, ``counts`` is
+    0 for all other counters. ``present`` has a non-zero byte for every cell
+    whose counter the daemon actually has; the paths are the union over all
+    daemons of the type, the value and count of the other cells are 0. Paths
+    and schema are shared between snapshots with the same ``schema_version``.
+    """
+    svc_type: str
+    schema_version: int
+    daemons: List[str]                          # daemon ids, e.g. "0" for osd.0
+    paths: List[str]                            # counter paths
+    schema: List[Dict[str, Union[str, int]]]    # schema info, one per path
+    values: 'array[int]'
+    counts: 'array[int]'
+    present: bytes
+
+    def counters(self, row: int) -> Iterator[Tuple[str, Dict[str, Union[str, int]], int, int]]:
+        """
+        Yield (path, schema, value, count) for every counter the daemon has.
+        """
+        start = row * len(self.paths)
+        end = start + len(self.paths)
+        return ((path, schema, value, count)
+                for path, schema, value, count, present in zip(
+                    self.paths, self.schema,
+                    self.values[start:end], self.counts[start:end],
+                    self.present[start:end])
+                if present)
+
+
 class MonCommandFailed(RuntimeError):
     pass
 
@@ -245,7 +287,7 @@ class OSDMap(ceph_module.BasePyOSDMap):
                           inc: 'OSDMapIncremental') -> int:
         return self._balance_primaries(pool_id, inc)
 
-    def map_pool_pgs_up(self, poolid: int) -> List[int]:
+    def map_pool_pgs_up(self, poolid: int) -> Dict[str, List[int]]:
         return self._map_pool_pgs_up(poolid)
 
     def pg_to_up_acting_osds(self, pool_id: int, ps: int) -> Dict[str, Any]:
@@ -288,6 +330,13 @@ class OSDMapIncremental(ceph_module.BasePyOSDMapIncremental):
         """
         return self._set_crush_compat_weight_set_weights(weightmap)
 
+    def merge_upmaps(self, other: 'OSDMapIncremental') -> None:
+        """
+        Add the pg-upmap, pg-upmap-items and pg-upmap-primary changes of
+        ``other``, replacing those of the same PGs.
+        """
+        return self._merge_upmaps(other)
+
 
 class CRUSHMap(ceph_module.BasePyCRUSH):
     ITEM_NONE = 0x7fffffff
@@ -1107,7 +1156,12 @@ class MgrModule(ceph_module.BaseMgrModule, MgrModuleLoggingMixin):
 
         self._version = self._ceph_get_version()
 
-        self._perf_schema_cache = None
+        # (svc_type, prio_limit) -> (schema_version, paths, schema)
+        self._perf_schema_cache: Dict[Tuple[str, int], Tuple[int, List[str], List[Dict[str, Union[str, int]]]]] = {}
+
+        # data_name -> (version, decoded object) for get(..., cached=True)
+        self._get_cache: Dict[str, Tuple[int, Any]] = {}
+        self._get_cache_lock = threading.Lock()
 
         # Keep a librados instance for those that need it.
         self._rados: Optional[rados.Rados] = None
@@ -1284,7 +1338,8 @@ class MgrModule(ceph_module.BaseMgrModule, MgrModuleLoggingMixin):
             assert self.SCHEMA is not None
             for sql in self.SCHEMA:
                 db.execute(sql)
-            self.update_schema_version(db, 1)
+            # SCHEMA is the latest version
+            self.update_schema_version(db, len(self.SCHEMA_VERSIONED or [None]))
         else:
             assert self.SCHEMA_VERSIONED is not None
             latest = len(self.SCHEMA_VERSIONED)
@@ -1485,7 +1540,7 @@ class MgrModule(ceph_module.BaseMgrModule, MgrModuleLoggingMixin):
             self._rados = None
 
     @API.expose
-    def get(self, data_name: str) -> Any:
+    def get(self, data_name: str, cached: bool = False) -> Any:
         """
         Called by the plugin to fetch named cluster-wide objects from ceph-mgr.
 
@@ -1495,18 +1550,51 @@ class MgrModule(ceph_module.BaseMgrModule, MgrModuleLoggingMixin):
                 health, mon_status, devices, device <devid>, pg_stats,
                 pool_stats, pg_ready, osd_ping_times, mgr_map, mgr_ips,
                 modified_config_options, service_map, mds_metadata,
-                have_local_config_map, osd_pool_stats, pg_status.
+                have_local_config_map, osd_pool_stats, pg_status,
+                pg_progress, pg_progress_since <version>.
+
+        :param bool cached: Keep the decoded object and return it again for
+                as long as its version (see :meth:`get_version`) does not
+                change. The returned object is shared between callers and
+                must not be modified.
 
         Note:
             All these structures have their own JSON representations: experiment
             or look at the C++ ``dump()`` methods to learn about them.
         """
-        obj = self._ceph_get(data_name)
+        if not cached:
+            obj = self._ceph_get(data_name)
+            if isinstance(obj, bytes):
+                obj = json.loads(obj)
+            return obj
+
+        with self._get_cache_lock:
+            entry = self._get_cache.get(data_name)
+        known_version = entry[0] if entry else 0
+        version, obj = self._ceph_get_versioned(data_name, known_version)
+        if entry and version and version == known_version:
+            return entry[1]
         if isinstance(obj, bytes):
             obj = json.loads(obj)
-
+        with self._get_cache_lock:
+            if version:
+                self._get_cache[data_name] = (version, obj)
+            else:
+                self._get_cache.pop(data_name, None)
         return obj
 
+    @API.expose
+    def get_version(self, data_name: str) -> int:
+        """
+        Return the version of a named cluster-wide object, i.e. the epoch of
+        the map it is derived from or the version of the PGMap. The version
+        changes whenever ``get(data_name)`` might return something new.
+
+        :param str data_name: see :meth:`get`
+        :return: the version, or 0 if ``data_name`` is not versioned
+        """
+        return self._ceph_get_data_version(data_name)
+
     def _stattype_to_str(self, stattype: int) -> str:
 
         typeonly = stattype & self.PERFCOUNTER_TYPE_MASK
@@ -2277,6 +2365,69 @@ class MgrModule(ceph_module.BaseMgrModule, MgrModuleLoggingMixin):
         else:
             return 0, 0
 
+    def get_unlabeled_perf_counters_snapshot(
+        self,
+        prio_limit: int = PRIO_USEFUL,
+        services: Sequence[str] = (
+            "mds",
+            "mon",
+            "osd",
+            "rbd-mirror",
+            "cephfs-mirror",
+            "rgw",
+            "tcmu-runner",
+        ),
+    ) -> Dict[str, PerfCounterSnapshot]:
+        """
+        Return the latest values of the unlabeled perf counters of all daemons
+        of the given types, filtered by priority equal to or greater than
+        `prio_limit`, with one call into ceph-mgr per daemon type.
+
+        The schema of a daemon type is only transferred again when its
+        schema version changed since the previous call.
+
+        :return: a dict mapping daemon types to a `PerfCounterSnapshot`
+        """
+        result = {}
+        for svc_type in services:
+            cache_key = (svc_type, prio_limit)
+            cached = self._perf_schema_cache.get(cache_key)
+            data = self._ceph_get_unlabeled_perf_counters_bulk(
+                svc_type, prio_limit, cached[0] if cached else 0)
+            if 'schema' in data:
+                paths = []
+                schema: List[Dict[str, Union[str, int]]] = []
+                for path, description, nick, tp, priority, units in data['schema']:
+                    paths.append(sys.intern(path))
+                    counter_schema: Dict[str, Union[str, int]] = {
+                        'description': description,
+                        'type': tp,
+                        'priority': priority,
+                        'units': units,
+                    }
+                    if nick:
+                        counter_schema['nick'] = nick
+                    schema.append(counter_schema)
+                cached = (data['schema_version'], paths, schema)
+                self._perf_schema_cache[cache_key] = cached
+            assert cached is not None
+            if not data['daemons']:
+                continue
+            values = array('q')
+            values.frombytes(data['values'])
+            counts = array('q')
+            counts.frombytes(data['counts'])
+            result[svc_type] = PerfCounterSnapshot(
+                svc_type=svc_type,
+                schema_version=cached[0],
+                daemons=data['daemons'],
+                paths=cached[1],
+                schema=cached[2],
+                values=values,
+                counts=counts,
+                present=data['present'])
+        return result
+
     @API.expose
     @profile_method()
     def get_unlabeled_perf_counters(
@@ -2306,53 +2457,16 @@ class MgrModule(ceph_module.BaseMgrModule, MgrModuleLoggingMixin):
 
         result = defaultdict(dict)  # type: Dict[str, dict]
 
-        for server in self.list_servers():
-            for service in cast(List[ServiceInfoT], server['services']):
-                if service['type'] not in services:
-                    continue
-
-                schemas = self.get_unlabeled_perf_schema(service['type'], service['id'])
-                if not schemas:
-                    self.log.warning("No perf counter schema for {0}.{1}".format(
-                        service['type'], service['id']
-                    ))
-                    continue
-
-                # Value is returned in a potentially-multi-service format,
-                # get just the service we're asking about
-                svc_full_name = "{0}.{1}".format(
-                    service['type'], service['id'])
-                schema = schemas[svc_full_name]
-
-                # Populate latest values
-                for counter_path, counter_schema in schema.items():
-                    # self.log.debug("{0}: {1}".format(
-                    #     counter_path, json.dumps(counter_schema)
-                    # ))
-                    priority = counter_schema['priority']
-                    assert isinstance(priority, int)
-                    if priority < prio_limit:
-                        continue
-
-                    tp = counter_schema['type']
-                    assert isinstance(tp, int)
+        snapshots = self.get_unlabeled_perf_counters_snapshot(prio_limit, services)
+        for svc_type, snapshot in snapshots.items():
+            for row, svc_id in enumerate(snapshot.daemons):
+                svc_full_name = "{0}.{1}".format(svc_type, svc_id)
+                for counter_path, counter_schema, value, count in snapshot.counters(row):
                     counter_info = dict(counter_schema)
+                    counter_info['value'] = value
                     # Also populate count for the long running avgs
-                    if tp & self.PERFCOUNTER_LONGRUNAVG:
-                        v, c = self.get_unlabeled_counter_latest_avg(
-                            service['type'],
-                            service['id'],
-                            counter_path
-                        )
-                        counter_info['value'], counter_info['count'] = v, c
-                        result[svc_full_name][counter_path] = counter_info
-                    else:
-                        counter_info['value'] = self.get_unlabeled_counter_latest(
-                            service['type'],
-                            service['id'],
-                            counter_path
-                        )
-
+                    if cast(int, counter_schema['type']) & self.PERFCOUNTER_LONGRUNAVG:
+                        counter_info['count'] = count
                     result[svc_full_name][counter_path] = counter_info
 
         self.log.debug("returning {0} counter".format(len(result)))
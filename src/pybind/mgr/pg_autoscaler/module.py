@@ -2,6 +2,7 @@
 Automatically scale pg_num based on how much data is stored in each pool.
 """
 
+import copy
 import json
 import mgr_util
 import threading
@@ -112,6 +113,65 @@ class CrushSubtreeResourceStatus:
         self.total_target_bytes = 0  # including replication / EC overhead
 
 
+class PoolStatusCache:
+    """
+    The CRUSH subtrees of an OSDMap epoch and the status of the pools under
+    them as last calculated by _get_pool_status().
+    """
+
+    def __init__(self,
+                 key: Tuple[Any, ...],
+                 root_map: Dict[int, CrushSubtreeResourceStatus],
+                 overlapped_roots: Set[int],
+                 pool_roots: Dict[int, int],
+                 osd_stats_version: int) -> None:
+        self.key = key
+        # the subtrees before their PGs were handed out to the pools
+        self.root_map = root_map
+        self.overlapped_roots = overlapped_roots
+        self.pool_roots = pool_roots
+        self.osd_stats_version = osd_stats_version
+        # root id -> the subtree after the targets of its pools were calculated
+        self.evaluated: Dict[int, CrushSubtreeResourceStatus] = {}
+        # pool id -> bytes used by the pool when its target was calculated
+        self.bytes_used: Dict[int, Optional[int]] = {}
+        # pool id -> (pass, status)
+        self.status: Dict[int, Tuple[int, Dict[str, Any]]] = {}
+
+    def subtrees(self) -> List[CrushSubtreeResourceStatus]:
+        return list({id(s): s for s in self.root_map.values()}.values())
+
+    def invalidate(self, s: CrushSubtreeResourceStatus) -> None:
+        for root_id in s.root_ids:
+            self.evaluated.pop(root_id, None)
+
+    def stale_subtrees(self,
+                       pool_stats: Dict[int, Dict[str, int]],
+                       usage_delta: float) -> List[CrushSubtreeResourceStatus]:
+        """
+        The subtrees whose pool targets have to be calculated (again): those
+        never calculated and those with a pool whose usage moved by more than
+        ``usage_delta`` of the capacity since.
+        """
+        stale = {id(s): s for s in self.root_map.values()
+                 if any(root_id not in self.evaluated for root_id in s.root_ids)}
+        for pool_id, root_id in self.pool_roots.items():
+            s = self.root_map[root_id]
+            if id(s) in stale:
+                continue
+            used = pool_stats.get(pool_id, {}).get('bytes_used')
+            if pool_id not in self.bytes_used:
+                stale[id(s)] = s
+                continue
+            last = self.bytes_used[pool_id]
+            if used is None or last is None:
+                if used != last:
+                    stale[id(s)] = s
+            elif abs(used - last) > usage_delta * (s.capacity or 0):
+                stale[id(s)] = s
+        return list(stale.values())
+
+
 class PgAutoscaler(MgrModule):
     """
     PG autoscaler.
@@ -135,6 +195,18 @@ class PgAutoscaler(MgrModule):
                        '`PG_NUM` before being accepted. Cannot be less than 1.0'),
             default=3.0,
             min=1.0),
+
+        Option(
+            name='usage_delta',
+            type='float',
+            desc='change of pool usage that triggers recalculating the PG targets',
+            long_desc=('The PG targets of the pools under a CRUSH root are recalculated '
+                       'when the OSDMap or the capacity of the root changes, or when '
+                       'the space used by one of its pools moved by more than this '
+                       'fraction of the capacity since the last calculation. With 0 '
+                       'they are recalculated every time.'),
+            default=0.001,
+            min=0.0),
     ]
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
@@ -145,10 +217,14 @@ class PgAutoscaler(MgrModule):
         # So much of what we do peeks at the osdmap that it's easiest
         # to just keep a copy of the pythonized version.
         self._osd_map = None
+        self._status_cache: Optional[PoolStatusCache] = None
+        # the serve thread and the autoscale-status command share the cache
+        self._status_lock = threading.Lock()
         if TYPE_CHECKING:
             self.sleep_interval = 60
             self.mon_target_pg_per_osd = 0
             self.threshold = 3.0
+            self.usage_delta = 0.001
 
     def config_notify(self) -> None:
         for opt in self.NATIVE_OPTIONS:
@@ -355,18 +431,30 @@ class PgAutoscaler(MgrModule):
                                        crush: CRUSHMap,
                                        result: Dict[int, CrushSubtreeResourceStatus],
                                        overlapped_roots: Set[int],
-                                       roots: List[CrushSubtreeResourceStatus]) -> \
+                                       roots: List[CrushSubtreeResourceStatus],
+                                       pool_roots: Optional[Dict[int, int]] = None) -> \
         Tuple[List[CrushSubtreeResourceStatus],
               Set[int]]:
 
+        # Many pools share a rule and many rules a root: look each up once
+        rule_roots: Dict[int, int] = {}
+        root_osds: Dict[int, Set[int]] = {}
+
         # We identify subtrees and overlapping roots from osdmap
         for pool_name, pool in pools.items():
-            crush_rule = crush.get_rule_by_id(pool['crush_rule'])
-            assert crush_rule is not None
-            cr_name = crush_rule['rule_name']
-            root_id = crush.get_rule_root(cr_name)
-            assert root_id is not None
-            osds = set(crush.get_osds_under(root_id))
+            root_id = rule_roots.get(pool['crush_rule'])
+            if root_id is None:
+                crush_rule = crush.get_rule_by_id(pool['crush_rule'])
+                assert crush_rule is not None
+                cr_name = crush_rule['rule_name']
+                root_id = crush.get_rule_root(cr_name)
+                assert root_id is not None
+                rule_roots[pool['crush_rule']] = root_id
+            if pool_roots is not None:
+                pool_roots[pool['pool']] = root_id
+            osds = root_osds.get(root_id)
+            if osds is None:
+                osds = root_osds[root_id] = set(crush.get_osds_under(root_id))
 
             # Are there overlapping roots?
             s = None
@@ -403,8 +491,9 @@ class PgAutoscaler(MgrModule):
     def get_subtree_resource_status(self,
                                     osdmap: OSDMap,
                                     pools: Dict[str, Dict[str, Any]],
-                                    crush: CRUSHMap) -> Tuple[Dict[int, CrushSubtreeResourceStatus],
-                                                              Set[int]]:
+                                    crush: CRUSHMap,
+                                    pool_roots: Optional[Dict[int, int]] = None) -> \
+            Tuple[Dict[int, CrushSubtreeResourceStatus], Set[int]]:
         """
         For each CRUSH subtree of interest (i.e. the roots under which
         we have pools), calculate the current resource usages and targets,
@@ -416,26 +505,16 @@ class PgAutoscaler(MgrModule):
         overlapped_roots: Set[int] = set()
         # identify subtrees and overlapping roots
         roots, overlapped_roots = self.identify_subtrees_and_overlaps(
-            osdmap, pools, crush, result, overlapped_roots, roots
+            osdmap, pools, crush, result, overlapped_roots, roots, pool_roots
         )
         # finish subtrees
-        all_stats = self.get('osd_stats')
+        self.set_subtree_capacity(roots)
         for s in roots:
             assert s.osds is not None
             s.osd_count = len(s.osds)
             s.pg_target = s.osd_count * self.mon_target_pg_per_osd
             s.pg_left = s.pg_target
             s.pool_count = len(s.pool_ids)
-            capacity = 0
-            for osd_stats in all_stats['osd_stats']:
-                if osd_stats['osd'] in s.osds:
-                    # Intentionally do not apply the OSD's reweight to
-                    # this, because we want to calculate PG counts based
-                    # on the physical storage available, not how it is
-                    # reweighted right now.
-                    capacity += osd_stats['kb'] * 1024
-
-            s.capacity = capacity
             self.log.debug('root_ids %s pools %s with %d osds, pg_target %d',
                            s.root_ids,
                            s.pool_ids,
@@ -444,6 +523,19 @@ class PgAutoscaler(MgrModule):
 
         return result, overlapped_roots
 
+    def set_subtree_capacity(self, roots: List[CrushSubtreeResourceStatus]) -> None:
+        """
+        Set the capacity of each subtree to the total size of its OSDs.
+        """
+        all_stats = self.get('osd_stats')
+        osd_kb = dict((o['osd'], o['kb']) for o in all_stats['osd_stats'])
+        for s in roots:
+            # Intentionally do not apply the OSD's reweight to
+            # this, because we want to calculate PG counts based
+            # on the physical storage available, not how it is
+            # reweighted right now.
+            s.capacity = sum(osd_kb.get(osd, 0) for osd in s.osds) * 1024
+
     def _calc_final_pg_target(
             self,
             p: Dict[str, Any],
@@ -542,7 +634,7 @@ class PgAutoscaler(MgrModule):
             self,
             osdmap: OSDMap,
             pools: Dict[str, Dict[str, Any]],
-            crush_map: CRUSHMap,
+            pool_roots: Dict[int, int],
             root_map: Dict[int, CrushSubtreeResourceStatus],
             pool_stats: Dict[int, Dict[str, int]],
             ret: List[Dict[str, Any]],
@@ -567,11 +659,7 @@ class PgAutoscaler(MgrModule):
 
             # FIXME: we assume there is only one take per pool, but that
             # may not be true.
-            crush_rule = crush_map.get_rule_by_id(p['crush_rule'])
-            assert crush_rule is not None
-            cr_name = crush_rule['rule_name']
-            root_id = crush_map.get_rule_root(cr_name)
-            assert root_id is not None
+            root_id = pool_roots[pool_id]
             if root_id in overlapped_roots:
                 # skip pools
                 # with overlapping roots
@@ -581,7 +669,7 @@ class PgAutoscaler(MgrModule):
             capacity = root_map[root_id].capacity
             assert capacity is not None
             if capacity == 0:
-                self.log.debug("skipping empty subtree {0}".format(cr_name))
+                self.log.debug("skipping empty subtree {0}".format(root_id))
                 continue
 
             raw_used_rate = osdmap.pool_raw_used_rate(pool_id)
@@ -683,28 +771,39 @@ class PgAutoscaler(MgrModule):
         threshold = self.threshold
         assert threshold >= 1.0
 
-        crush_map = osdmap.get_crush()
-        root_map, overlapped_roots = self.get_subtree_resource_status(osdmap, pools, crush_map)
         df = self.get('df')
         pool_stats = dict([(p['id'], p['stats']) for p in df['pools']])
 
         ret: List[Dict[str, Any]] = []
-
-        # Iterate over all pools to determine how they should be sized.
-        # First call of _get_pool_pg_targets() is to find/adjust pools that uses more capacaity than
-        # the even_ratio of other pools and we adjust those first.
-        # Second call make use of the even_pools we keep track of in the first call.
-        # All we need to do is iterate over those and give them 1/pool_count of the
-        # total pgs.
-
-        ret, bulk_pools, _  = self._get_pool_pg_targets(osdmap, pools, crush_map, root_map,
-                                                  pool_stats, ret, threshold, 'first', overlapped_roots)
-
-        ret, _, even_pools = self._get_pool_pg_targets(osdmap, bulk_pools, crush_map, root_map,
-                                                  pool_stats, ret, threshold, 'second', overlapped_roots)
-
-        ret, _, _ = self._get_pool_pg_targets(osdmap, even_pools, crush_map, root_map,
-                                         pool_stats, ret, threshold, 'third', overlapped_roots)
+        with self._status_lock:
+            cache = self._get_status_cache(osdmap, pools)
+            stale = cache.stale_subtrees(pool_stats, self.usage_delta)
+            if stale:
+                self._calc_pool_targets(osdmap, pools, cache, stale, pool_stats, threshold)
+
+            passes: Dict[int, int] = {}
+            for pool_name, p in pools.items():
+                entry = cache.status.get(p['pool'])
+                if entry is None or p['pool'] not in pool_stats:
+                    continue
+                # the targets stand as long as the usage stays within
+                # usage_delta, the usage reported is the current one
+                # nonetheless
+                passes[p['pool']], status = entry
+                actual_raw_used = pool_stats[p['pool']]['bytes_used']
+                raw_used = max(actual_raw_used, status['target_bytes'] * status['raw_used_rate'])
+                capacity = status['subtree_capacity']
+                ret.append(dict(
+                    status,
+                    logical_used=float(actual_raw_used) / status['raw_used_rate'],
+                    actual_raw_used=actual_raw_used,
+                    raw_used=raw_used,
+                    actual_capacity_ratio=float(actual_raw_used) / capacity,
+                    capacity_ratio=max(float(raw_used) / capacity,
+                                       status['effective_target_ratio'])))
+            root_map = dict(cache.evaluated)
+        # in the order of the passes that calculated them
+        ret.sort(key=lambda status: passes[status['pool_id']])
 
         # If noautoscale flag is set, we set pg_autoscale_mode to off
         if self.has_noautoscale_flag():
@@ -713,6 +812,77 @@ class PgAutoscaler(MgrModule):
 
         return (ret, root_map)
 
+    def _get_status_cache(self,
+                          osdmap: OSDMap,
+                          pools: Dict[str, Dict[str, Any]]) -> PoolStatusCache:
+        """
+        The subtrees of the OSDMap, identified again for a new epoch only.
+        Their capacity is updated with every osd_stats version. Called with
+        self._status_lock held.
+        """
+        key = (osdmap.get_epoch(), self.mon_target_pg_per_osd, self.threshold)
+        cache = self._status_cache
+        osd_stats_version = self.get_version('osd_stats')
+        if cache is None or cache.key != key:
+            pool_roots: Dict[int, int] = {}
+            root_map, overlapped_roots = self.get_subtree_resource_status(
+                osdmap, pools, osdmap.get_crush(), pool_roots)
+            cache = PoolStatusCache(key, root_map, overlapped_roots, pool_roots,
+                                    osd_stats_version)
+            self._status_cache = cache
+        elif not osd_stats_version or osd_stats_version != cache.osd_stats_version:
+            subtrees = cache.subtrees()
+            capacity = [s.capacity for s in subtrees]
+            self.set_subtree_capacity(subtrees)
+            for s, c in zip(subtrees, capacity):
+                if s.capacity != c:
+                    cache.invalidate(s)
+            cache.osd_stats_version = osd_stats_version
+        return cache
+
+    def _calc_pool_targets(self,
+                           osdmap: OSDMap,
+                           pools: Dict[str, Dict[str, Any]],
+                           cache: PoolStatusCache,
+                           stale: List[CrushSubtreeResourceStatus],
+                           pool_stats: Dict[int, Dict[str, int]],
+                           threshold: float) -> None:
+        """
+        Calculate the targets of the pools under the ``stale`` subtrees, the
+        others keep the ones they have.
+        """
+        # the passes hand out the PGs of the subtrees, start from scratch
+        root_map: Dict[int, CrushSubtreeResourceStatus] = {}
+        for s in stale:
+            evaluated = copy.copy(s)
+            for root_id in s.root_ids:
+                root_map[root_id] = evaluated
+        stale_pools = dict((pool_name, p) for pool_name, p in pools.items()
+                           if cache.pool_roots.get(p['pool']) in root_map)
+        for p in stale_pools.values():
+            cache.status.pop(p['pool'], None)
+            cache.bytes_used[p['pool']] = pool_stats.get(p['pool'], {}).get('bytes_used')
+
+        # Iterate over all pools to determine how they should be sized.
+        # First call of _get_pool_pg_targets() is to find/adjust pools that uses more capacaity than
+        # the even_ratio of other pools and we adjust those first.
+        # Second call make use of the even_pools we keep track of in the first call.
+        # All we need to do is iterate over those and give them 1/pool_count of the
+        # total pgs.
+        ret: List[Dict[str, Any]] = []
+        done = 0
+        passes: Tuple['PassT', ...] = ('first', 'second', 'third')
+        for i, func_pass in enumerate(passes):
+            ret, bulk_pools, even_pools = self._get_pool_pg_targets(
+                osdmap, stale_pools, cache.pool_roots, root_map, pool_stats, ret,
+                threshold, func_pass, cache.overlapped_roots)
+            for status in ret[done:]:
+                cache.status[status['pool_id']] = (i, status)
+            done = len(ret)
+            stale_pools = bulk_pools if func_pass == 'first' else even_pools
+
+        cache.evaluated.update(root_map)
+
     def _get_pool_by_id(self,
                      pools: Dict[str, Dict[str, Any]],
                      pool_id: int) -> Optional[Dict[str, Any]]:
@@ -0,0 +1,93 @@
+# python unit test
+from pg_autoscaler import module
+
+
+class TestPoolStatusCache(object):
+
+    def setup_method(self):
+        root_map = {}
+        for root_id, pool_ids in ((-1, [1, 2]), (-2, [3])):
+            s = module.CrushSubtreeResourceStatus()
+            s.root_ids = [root_id]
+            s.pool_ids = pool_ids
+            s.capacity = 1000
+            root_map[root_id] = s
+        self.cache = module.PoolStatusCache((1,), root_map, set(), {1: -1, 2: -1, 3: -2}, 1)
+        self.stats = {1: {'bytes_used': 100}, 2: {'bytes_used': 200}, 3: {'bytes_used': 300}}
+
+    def evaluate(self):
+        # what _calc_pool_targets() leaves behind
+        for pool_id, root_id in self.cache.pool_roots.items():
+            self.cache.bytes_used[pool_id] = self.stats[pool_id]['bytes_used']
+            self.cache.evaluated[root_id] = self.cache.root_map[root_id]
+
+    def stale_roots(self, usage_delta):
+        return sorted(root_id
+                      for s in self.cache.stale_subtrees(self.stats, usage_delta)
+                      for root_id in s.root_ids)
+
+    def test_never_evaluated(self):
+        assert self.stale_roots(0.01) == [-2, -1]
+
+    def test_usage_delta(self):
+        self.evaluate()
+        assert self.stale_roots(0.01) == []
+        # within 1% of the capacity
+        self.stats[2]['bytes_used'] += 10
+        assert self.stale_roots(0.01) == []
+        assert self.stale_roots(0.0) == [-1]
+        # moves add up until they count
+        self.stats[2]['bytes_used'] += 1
+        assert self.stale_roots(0.01) == [-1]
+
+    def test_pool_gone(self):
+        self.evaluate()
+        del self.stats[3]
+        assert self.stale_roots(0.01) == [-2]
+
+    def test_invalidate(self):
+        self.evaluate()
+        self.cache.invalidate(self.cache.root_map[-1])
+        assert self.stale_roots(0.01) == [-1]
+
+
+class TestPoolStatus(object):
+
+    setup_cache = TestPoolStatusCache.setup_method
+    evaluate = TestPoolStatusCache.evaluate
+
+    def setup_method(self):
+        self.setup_cache()
+        self.autoscaler = module.PgAutoscaler('module_name', 0, 0)
+        self.autoscaler.threshold = 3.0
+        self.autoscaler.usage_delta = 0.01
+        self.autoscaler._get_status_cache = lambda osdmap, pools: self.cache
+        self.autoscaler.get = lambda what: {
+            'pools': [{'id': pool_id, 'stats': stats} for pool_id, stats in self.stats.items()],
+        }
+        self.autoscaler.has_noautoscale_flag = lambda: False
+        self.evaluate()
+        for i, pool_id in enumerate((3, 1, 2)):
+            self.cache.status[pool_id] = (i, {
+                'pool_id': pool_id,
+                'target_bytes': 0,
+                'raw_used_rate': 2.0,
+                'subtree_capacity': 1000,
+                'effective_target_ratio': 0.15,
+                'pg_num_final': 32,
+            })
+
+    def test_usage_is_current(self):
+        self.stats[1]['bytes_used'] = 105
+        self.stats[2]['bytes_used'] = 208
+        pools = {'a': {'pool': 1}, 'b': {'pool': 2}, 'c': {'pool': 3}}
+        ret, _ = self.autoscaler._get_pool_status(None, pools)
+        # within usage_delta: the targets stand, in the order of the passes
+        assert [(s['pool_id'], s['pg_num_final']) for s in ret] == [(3, 32), (1, 32), (2, 32)]
+        by_id = {s['pool_id']: s for s in ret}
+        assert by_id[1]['actual_raw_used'] == 105
+        assert by_id[1]['raw_used'] == 105
+        assert by_id[1]['logical_used'] == 52.5
+        assert by_id[1]['capacity_ratio'] == 0.15
+        assert by_id[2]['actual_capacity_ratio'] == 0.208
+        assert by_id[2]['capacity_ratio'] == 0.208
@@ -1,9 +1,10 @@
 try:
-    from typing import List, Dict, Union, Any, Optional
+    from typing import List, Dict, Union, Any, Optional, Tuple
     from typing import TYPE_CHECKING
 except ImportError:
     TYPE_CHECKING = False
 
+from collections import defaultdict
 from mgr_module import MgrModule, OSDMap, Option
 from mgr_util import to_pretty_timedelta
 from datetime import timedelta
@@ -280,6 +281,39 @@ class RemoteEvent(Event):
         return self._failure_message if self._failed else None
 
 
+def pg_index(pool_id, ps):
+    # type: (Union[int, str], int) -> int
+    """
+    A PG as one int: the pool id in the upper, the placement seed in the
+    lower 32 bits.
+    """
+    return (int(pool_id) << 32) | ps
+
+
+def pg_index_from_str(pgid):
+    # type: (str) -> int
+    pool_id, _, ps = pgid.partition('.')
+    return pg_index(pool_id, int(ps, 16))
+
+
+def pg_index_to_str(pg):
+    # type: (int) -> str
+    return "{0}.{1:x}".format(pg >> 32, pg & 0xffffffff)
+
+
+def index_pg_progress(pg_progress):
+    # type: (Dict[str, Any]) -> Dict[int, Optional[Dict[str, Any]]]
+    """
+    The PGs of a ``pg_progress`` or ``pg_progress_since`` dump by
+    pg_index(), the removed ones with None.
+    """
+    ret = {pg_index_from_str(pgid): info
+           for pgid, info in pg_progress["pgs"].items()}  # type: Dict[int, Optional[Dict[str, Any]]]
+    for pgid in pg_progress.get("removed", []):
+        ret[pg_index_from_str(pgid)] = None
+    return ret
+
+
 class PgRecoveryEvent(Event):
     """
     An event whose completion is determined by the recovery of a set of
@@ -291,10 +325,14 @@ class PgRecoveryEvent(Event):
     def __init__(self, message, refs, which_pgs, which_osds, start_epoch, add_to_ceph_s):
         # type: (str, List[Any], List[PgId], List[str], int, bool) -> None
         super().__init__(str(uuid.uuid4()), message, refs, add_to_ceph_s)
-        self._pgs = which_pgs
+        # the PGs still recovering, by pg_index()
+        self._pgs = {pg.index for pg in which_pgs}
         self._which_osds = which_osds
         self._original_pg_count = len(self._pgs)
-        self._original_bytes_recovered = None  # type: Optional[Dict[PgId, float]]
+        self._original_bytes_recovered = None  # type: Optional[Dict[int, float]]
+        # how far along the recovering PGs are, and the sum of that
+        self._ratios = {}  # type: Dict[int, float]
+        self._ratio_sum = 0.0
         self._progress = 0.0
 
         self._start_epoch = start_epoch
@@ -305,27 +343,36 @@ class PgRecoveryEvent(Event):
         return self. _which_osds
 
     def pg_update(self, pg_progress: Dict, log: Any) -> None:
-        # FIXME: O(pg_num) in python
-        # Sanity check to see if there are any missing PGs and to assign
-        # empty array and dictionary if there hasn't been any recovery
-        pg_to_state: Dict[str, Any] = pg_progress["pgs"]
-        pg_ready: bool = pg_progress["pg_ready"]
+        """
+        Update from a ``pg_progress`` dump of all PGs.
+        """
+        pg_to_state = pg_progress["pgs"]
+        pgs = {}  # type: Dict[int, Optional[Dict[str, Any]]]
+        for pg in self._pgs:
+            info = pg_to_state.get(pg_index_to_str(pg))
+            if info is not None:
+                pgs[pg] = info
+        self.pg_delta_update(pgs, log, delta=False)
 
+    def pg_delta_update(self, pgs: Dict[int, Optional[Dict[str, Any]]], log: Any,
+                        delta: bool = True) -> None:
+        """
+        Update from the PGs by pg_index(), as returned by index_pg_progress().
+        With ``delta`` these are only the PGs that changed since the last
+        update, only those of them this event tracks are looked at.
+        Otherwise they are all PGs and the tracked ones missing are gone.
+        """
         if self._original_bytes_recovered is None:
             self._original_bytes_recovered = {}
-            missing_pgs = []
             for pg in self._pgs:
-                pg_str = str(pg)
-                if pg_str in pg_to_state:
-                    self._original_bytes_recovered[pg] = \
-                        pg_to_state[pg_str]['num_bytes_recovered']
-                else:
-                    missing_pgs.append(pg)
-            if pg_ready:
-                for pg in missing_pgs:
-                    self._pgs.remove(pg)
+                info = pgs.get(pg)
+                if info is not None:
+                    self._original_bytes_recovered[pg] = info['num_bytes_recovered']
 
-        complete_accumulate = 0.0
+        if delta:
+            changed = self._pgs & pgs.keys()
+        else:
+            changed = set(self._pgs)
 
         # Calculating progress as the number of PGs recovered divided by the
         # original where partially completed PGs count for something
@@ -335,17 +382,16 @@ class PgRecoveryEvent(Event):
         # few-bytes PGs that still need the housekeeping of their recovery
         # to be done. This is subjective...
 
-        complete = set()
-        for pg in self._pgs:
-            pg_str = str(pg)
-            try:
-                info = pg_to_state[pg_str]
-            except KeyError:
+        for pg in changed:
+            ratio = 0.0
+            info = pgs.get(pg)
+            if info is None:
                 # The PG is gone!  Probably a pool was deleted. Drop it.
-                complete.add(pg)
+                self._complete_pg(pg)
                 continue
             # Only checks the state of each PGs when it's epoch >= the OSDMap's epoch
             if info['reported_epoch'] < self._start_epoch:
+                self._set_ratio(pg, ratio)
                 continue
 
             state = info['state']
@@ -353,36 +399,35 @@ class PgRecoveryEvent(Event):
             states = state.split("+")
 
             if "active" in states and "clean" in states:
-                complete.add(pg)
+                self._complete_pg(pg)
+                continue
+            if info['num_bytes'] == 0:
+                # Empty PGs are considered 0% done until they are
+                # in the correct state.
+                pass
             else:
-                if info['num_bytes'] == 0:
-                    # Empty PGs are considered 0% done until they are
-                    # in the correct state.
-                    pass
+                recovered = info['num_bytes_recovered']
+                total_bytes = info['num_bytes']
+                if total_bytes > 0:
+                    # a PG first heard of after the first update starts now
+                    original = self._original_bytes_recovered.setdefault(pg, recovered)
+                    ratio = float(recovered - original) / total_bytes
+                    # Since the recovered bytes (over time) could perhaps
+                    # exceed the contents of the PG (moment in time), we
+                    # must clamp this
+                    ratio = min(ratio, 1.0)
+                    ratio = max(ratio, 0.0)
+
                 else:
-                    recovered = info['num_bytes_recovered']
-                    total_bytes = info['num_bytes']
-                    if total_bytes > 0:
-                        ratio = float(recovered -
-                                      self._original_bytes_recovered[pg]) / \
-                            total_bytes
-                        # Since the recovered bytes (over time) could perhaps
-                        # exceed the contents of the PG (moment in time), we
-                        # must clamp this
-                        ratio = min(ratio, 1.0)
-                        ratio = max(ratio, 0.0)
-
-                    else:
-                        # Dataless PGs (e.g. containing only OMAPs) count
-                        # as half done.
-                        ratio = 0.5
-                    complete_accumulate += ratio
-
-        self._pgs = list(set(self._pgs) ^ complete)
+                    # Dataless PGs (e.g. containing only OMAPs) count
+                    # as half done.
+                    ratio = 0.5
+            self._set_ratio(pg, ratio)
+
         completed_pgs = self._original_pg_count - len(self._pgs)
         completed_pgs = max(completed_pgs, 0)
         try:
-            prog = (completed_pgs + complete_accumulate)\
+            prog = (completed_pgs + self._ratio_sum)\
                 / self._original_pg_count
         except ZeroDivisionError:
             prog = 0.0
@@ -392,12 +437,64 @@ class PgRecoveryEvent(Event):
         self._refresh()
         log.info("Updated progress to %s", self.summary())
 
+    def _set_ratio(self, pg, ratio):
+        # type: (int, float) -> None
+        self._ratio_sum += ratio - self._ratios.get(pg, 0.0)
+        self._ratios[pg] = ratio
+
+    def _complete_pg(self, pg):
+        # type: (int) -> None
+        self._pgs.discard(pg)
+        self._ratio_sum -= self._ratios.pop(pg, 0.0)
+
     @property
     def progress(self):
         # type: () -> float
         return self._progress
 
 
+class PgMappings(object):
+    """
+    The up sets of the PGs of an OSDMap by pg_index(), each pool mapped at
+    once, and the PGs in the up set of every OSD.
+    """
+
+    def __init__(self, osdmap, pg_nums):
+        # type: (OSDMap, Dict[int, int]) -> None
+        self.up = {}  # type: Dict[int, List[int]]
+        self.by_osd = defaultdict(set)
+        for pool_id, pg_num in pg_nums.items():
+            for pgid, up in osdmap.map_pool_pgs_up(pool_id).items():
+                pg = pg_index_from_str(pgid)
+                if pg & 0xffffffff >= pg_num:
+                    continue
+                self.up[pg] = up
+                for osd in up:
+                    self.by_osd[osd].add(pg)
+
+    @classmethod
+    def of(cls, old_map, old_dump, new_map, new_dump):
+        # type: (OSDMap, Dict, OSDMap, Dict) -> Tuple[PgMappings, PgMappings]
+        """
+        The mappings of the PGs of the old OSDMap in the old and the new one.
+        """
+        old_pg_nums = {p['pool']: p['pg_num'] for p in old_dump['pools']}
+        new_pools = set(p['pool'] for p in new_dump['pools'])
+        return (cls(old_map, old_pg_nums),
+                cls(new_map, {pool_id: pg_num for pool_id, pg_num in old_pg_nums.items()
+                              if pool_id in new_pools}))
+
+    def moved_with(self, new, osd_id):
+        # type: (PgMappings, int) -> List[int]
+        """
+        The PGs of this mapping with ``osd_id`` in their up set, here or in
+        ``new``, whose up set is not the same in both.
+        """
+        pgs = self.by_osd.get(osd_id, set()) | new.by_osd.get(osd_id, set())
+        return sorted(pg for pg in pgs
+                      if pg in self.up and self.up[pg] != new.up.get(pg, []))
+
+
 class PgId(object):
     def __init__(self, pool_id, ps):
         # type: (str, int) -> None
@@ -413,6 +510,11 @@ class PgId(object):
     def __str__(self):
         return "{0}.{1:x}".format(self.pool_id, self.ps)
 
+    @property
+    def index(self):
+        # type: () -> int
+        return pg_index(self.pool_id, self.ps)
+
 
 class Module(MgrModule):
     COMMANDS = [
@@ -478,6 +580,9 @@ class Module(MgrModule):
 
         self._dirty = False
 
+        # the PGMap version of the last pg_progress the events were fed
+        self._pg_progress_version = 0
+
         global _module
         _module = self
 
@@ -496,37 +601,23 @@ class Module(MgrModule):
             self.log.debug(' %s = %s', opt['name'], getattr(self, opt['name']))
 
     def _osd_in_out(self, old_map: OSDMap, old_dump: Dict,
-                    new_map: OSDMap, osd_id: str, marked: str) -> None:
+                    new_map: OSDMap, osd_id: str, marked: str,
+                    mappings: Optional[Tuple[PgMappings, PgMappings]] = None,
+                    pg_progress: Optional[Dict] = None) -> None:
         # A function that will create or complete an event when an
         # OSD is marked in or out according to the affected PGs
-        affected_pgs = []
-        for pool in old_dump['pools']:
-            pool_id = pool['pool']  # type: str
-            for ps in range(0, pool['pg_num']):
-
-                # Was this pg affected by the OSD coming in/out?
-                # Compare old and new OSDs using
-                # data from the old/new acting and up sets.
-                old_up_acting = old_map.pg_to_up_acting_osds(pool['pool'], ps)
-                old_acting_osds = old_up_acting['acting']
-                old_up_set_osds = old_up_acting['up']
-                new_up_acting = new_map.pg_to_up_acting_osds(pool['pool'], ps)
-                new_acting_osds = new_up_acting['acting']
-                new_up_set_osds = new_up_acting['up']
-
-                # Check if this PG involves the OSD that was marked in/out
-                osd_affected = osd_id in old_up_set_osds or osd_id in new_up_set_osds
-                if not osd_affected:
-                    continue
-                
-                up_set_changed = old_up_set_osds != new_up_set_osds
+        if mappings is None:
+            mappings = PgMappings.of(old_map, old_dump, new_map, new_map.dump())
+        old_pgs, new_pgs = mappings
 
-                if osd_affected and up_set_changed:
-                    self.log.debug("PG %s.%x: acting %s->%s up %s->%s (relocated=%s)",
-                            pool_id, ps, old_acting_osds, new_acting_osds, old_up_set_osds,
-                            new_up_set_osds, up_set_changed)
-                    # This PG is now in motion, track its progress
-                    affected_pgs.append(PgId(pool_id, ps))
+        # Was this pg affected by the OSD coming in/out? Compare the old
+        # and new up sets of the PGs the OSD is in, before or after.
+        affected_pgs = []
+        for pg in old_pgs.moved_with(new_pgs, int(osd_id)):
+            self.log.debug("PG %s: up %s->%s", pg_index_to_str(pg),
+                           old_pgs.up[pg], new_pgs.up.get(pg, []))
+            # This PG is now in motion, track its progress
+            affected_pgs.append(PgId(str(pg >> 32), pg & 0xffffffff))
 
         # In the case of the osd coming back in, we might need to cancel
         # previous recovery event for that osd
@@ -560,7 +651,9 @@ class Module(MgrModule):
                     start_epoch=self.get_osdmap().get_epoch(),
                     add_to_ceph_s=False
                     )
-            r_ev.pg_update(self.get("pg_progress"), self.log)
+            if pg_progress is None:
+                pg_progress = self.get("pg_progress")
+            r_ev.pg_update(pg_progress, self.log)
             self._events[r_ev.id] = r_ev
 
     def _osdmap_changed(self, old_osdmap, new_osdmap):
@@ -570,6 +663,7 @@ class Module(MgrModule):
 
         old_osds = dict([(o['osd'], o) for o in old_dump['osds']])
 
+        marked = []
         for osd in new_dump['osds']:
             osd_id = osd['osd']
             new_weight = osd['in']
@@ -579,13 +673,22 @@ class Module(MgrModule):
 
                 if new_weight == 0.0 and old_weight > new_weight:
                     self.log.warning("osd.{0} marked out".format(osd_id))
-                    self._osd_in_out(old_osdmap, old_dump, new_osdmap, osd_id, "out")
+                    marked.append((osd_id, "out"))
                 elif new_weight >= 1.0 and old_weight == 0.0:
                     # Only consider weight>=1.0 as "in" to avoid spawning
                     # individual recovery events on every adjustment
                     # in a gradual weight-in
                     self.log.warning("osd.{0} marked in".format(osd_id))
-                    self._osd_in_out(old_osdmap, old_dump, new_osdmap, osd_id, "in")
+                    marked.append((osd_id, "in"))
+        if not marked:
+            return
+
+        # map all PGs once for all the OSDs that were marked, e.g. a rack
+        mappings = PgMappings.of(old_osdmap, old_dump, new_osdmap, new_dump)
+        pg_progress = self.get("pg_progress")
+        for osd_id, how in marked:
+            self._osd_in_out(old_osdmap, old_dump, new_osdmap, osd_id, how,
+                             mappings, pg_progress)
 
     def _pg_state_changed(self):
 
@@ -629,14 +732,18 @@ class Module(MgrModule):
             return
 
         global_event = False
-        data = self.get("pg_progress")
+        # only the PGs that changed since the last time, unless that was
+        # too long ago
+        data = self.get("pg_progress_since {}".format(self._pg_progress_version))
+        self._pg_progress_version = data["version"]
+        pgs = index_pg_progress(data)
         for ev_id in list(self._events):
             try:
                 ev = self._events[ev_id]
                 # Check for types of events
                 # we have to update
                 if isinstance(ev, PgRecoveryEvent):
-                    ev.pg_update(data, self.log)
+                    ev.pg_delta_update(pgs, self.log, delta=data["delta"])
                     self.maybe_complete(ev)
                 elif isinstance(ev, GlobalRecoveryEvent):
                     global_event = True
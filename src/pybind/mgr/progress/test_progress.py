@@ -47,6 +47,35 @@ class TestPgRecoveryEvent(object):
         self.test_event.pg_update(pg_progress, mock.Mock())
         assert self.test_event._progress == 1.0
 
+    def test_pg_delta_update(self):
+        # Only the PGs in the delta change, removed PGs count as done
+        def info(state, recovered):
+            return {
+                "state": state,
+                "num_bytes": 10,
+                "num_bytes_recovered": recovered,
+                "reported_epoch": 30,
+            }
+        pgs = {module.pg_index(1, i): info("active+remapped+backfilling", 0) for i in range(3)}
+        self.test_event.pg_delta_update(pgs, mock.Mock(), delta=False)
+        assert self.test_event._progress == 0.0
+
+        pg_progress = {
+            "pgs": {
+                "1.0": info("active+clean", 10),
+                "1.1": info("active+remapped+backfilling", 5),
+                "2.0": info("active+clean", 10),
+            },
+            "removed": ["1.2"],
+        }
+        self.test_event.pg_delta_update(module.index_pg_progress(pg_progress), mock.Mock())
+        assert self.test_event._pgs == {module.pg_index(1, 1)}
+        assert self.test_event._progress == pytest.approx(2.5 / 3)
+
+        # 1.1 did not change
+        self.test_event.pg_delta_update({}, mock.Mock())
+        assert self.test_event._progress == pytest.approx(2.5 / 3)
+
 
 class OSDMap: 
     
@@ -86,6 +115,10 @@ class OSDMap:
     def pg_to_up_acting_osds(self, pool_id, ps):
         return self._pg_to_up_acting_osds(pool_id, ps)
 
+    def map_pool_pgs_up(self, pool_id):
+        return {pg["pg_id"]: pg["up"] for pg in self._pg_stats["pg_stats"]
+                if pg["pg_id"].split(".")[0] == str(pool_id)}
+
 
 class TestModule(object):
     # Testing Module Class
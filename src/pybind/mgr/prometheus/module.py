@@ -1,12 +1,19 @@
 import cherrypy
+import concurrent.futures
 import yaml
+from abc import ABC, abstractmethod
 from collections import defaultdict
+import hashlib
+import heapq
 import json
 import math
+import os
 import re
+import struct
 import threading
 import time
 import enum
+import zlib
 from collections import namedtuple
 from collections import OrderedDict
 from tempfile import NamedTemporaryFile
@@ -14,9 +21,15 @@ from tempfile import NamedTemporaryFile
 from mgr_module import CLIReadCommand, MgrModule, MgrStandbyModule, PG_STATES, Option, ServiceInfoT, HandleCommandResult, CLIWriteCommand
 from mgr_util import get_default_addr, profile_method, build_url, test_port_allocation, PortAlreadyInUse
 from orchestrator import OrchestratorClientMixin, raise_if_exception, OrchestratorError
+import rados
 from rbd import RBD
 
-from typing import DefaultDict, Optional, Dict, Any, Set, cast, Tuple, Union, List, Callable, IO, TypeVar, Generic
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from typing import DefaultDict, Optional, Dict, Any, Set, cast, Tuple, Union, List, Callable, IO, TypeVar, Generic, Iterable, Iterator
 LabelValues = Tuple[str, ...]
 Number = Union[int, float]
 MetricValue = Dict[LabelValues, Number]
@@ -27,6 +40,10 @@ MetricValue = Dict[LabelValues, Number]
 
 DEFAULT_PORT = 9283
 
+# Size the rendered metrics are coalesced to before they are written to the
+# client, so that a scrape does not result in one write per metric family.
+EXPOSITION_CHUNK_SIZE = 64 * 1024
+
 # to access things in class Module from subclass Root.  Because
 # it's a dict, the writer doesn't need to declare 'global' for access
 
@@ -210,7 +227,8 @@ class HealthHistory:
 
     def __init__(self, mgr: MgrModule):
         self.mgr = mgr
-        self.lock = threading.Lock()
+        # check() saves the history while holding the lock
+        self.lock = threading.RLock()
         self.max_entries = cast(int, self.mgr.get_localized_module_option('healthcheck_history_max_entries', 1000))
         self.healthcheck: LRUCacheDict[str, HealthCheckEvent] = LRUCacheDict(maxsize=self.max_entries)
         self._load()
@@ -357,73 +375,306 @@ class HealthHistory:
         return yaml.safe_dump(self.as_dict(), explicit_start=True, default_flow_style=False)
 
 
+# Must be kept in sync with promethize() in src/exporter/util.cc
+def promethize(path: str) -> str:
+    ''' replace illegal metric name characters '''
+    result = re.sub(r'[./\s]|::', '_', path).replace('+', '_plus')
+
+    # Hyphens usually turn into underscores, unless they are
+    # trailing
+    if result.endswith("-"):
+        result = result[0:-1] + "_minus"
+    else:
+        result = result.replace("-", "_")
+
+    return "ceph_{0}".format(result)
+
+
+def floatstr(value: float) -> str:
+    ''' represent as Go-compatible float '''
+    if value == float('inf'):
+        return '+Inf'
+    if value == float('-inf'):
+        return '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    return repr(float(value))
+
+
+def varint(value: int) -> bytes:
+    ''' encode as protobuf base 128 varint '''
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def pb_bytes(field: int, value: bytes) -> bytes:
+    ''' encode a length-delimited protobuf field '''
+    return varint(field << 3 | 2) + varint(len(value)) + value
+
+
+class ExpositionFormat(ABC):
+    """
+    A format metrics can be exposed in. Metric.bytes_expfmt renders a
+    metric family as the ``header`` of the family followed by one ``line``
+    per series, each combining the value with a per series ``prefix``
+    that is rendered once and cached.
+    """
+
+    name = ''
+    media_type = ''
+    content_type = ''
+    # appended to the exposition once all metric families are rendered
+    footer = b''
+
+    def accepts(self, element: Any) -> bool:
+        """Whether an element of the Accept header of a request matches."""
+        return element.value == self.media_type
+
+    @abstractmethod
+    def header(self, metric: 'Metric') -> bytes:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def prefix(self, metric: 'Metric', labelvalues: LabelValues) -> Any:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def line(self, metric: 'Metric', prefix: Any, value: Number) -> bytes:
+        raise NotImplementedError()
+
+    def family(self, header: bytes, lines: bytes) -> bytes:
+        return header + lines
+
+
+class TextFormat(ExpositionFormat):
+    """The classic Prometheus text exposition format, version 0.0.4."""
+
+    name = 'text'
+    media_type = 'text/plain'
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+    footer = b'\n'
+
+    def accepts(self, element: Any) -> bool:
+        return element.value in ('text/plain', 'text/*', '*/*')
+
+    def header(self, metric: 'Metric') -> bytes:
+        return '''
+# HELP {name} {desc}
+# TYPE {name} {mtype}'''.format(
+            name=metric.promname,
+            desc=metric.desc,
+            mtype=metric.mtype,
+        ).encode('utf-8')
+
+    def prefix(self, metric: 'Metric', labelvalues: LabelValues) -> str:
+        return metric._line_prefix(metric.promname, labelvalues)
+
+    def line(self, metric: 'Metric', prefix: str, value: Number) -> bytes:
+        return (prefix + floatstr(value)).encode('utf-8')
+
+
+class OpenMetricsFormat(TextFormat):
+    """
+    The OpenMetrics text format, version 1.0.0. Unlike in the classic text
+    format, the samples of counters carry a ``_total`` suffix.
+    """
+
+    name = 'openmetrics'
+    media_type = 'application/openmetrics-text'
+    content_type = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+    footer = b'# EOF\n'
+
+    def accepts(self, element: Any) -> bool:
+        return element.value == self.media_type
+
+    @staticmethod
+    def _family_name(metric: 'Metric') -> str:
+        name = metric.promname
+        if metric.mtype == 'counter' and name.endswith('_total'):
+            return name[:-len('_total')]
+        return name
+
+    def header(self, metric: 'Metric') -> bytes:
+        desc = metric.desc.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+        return '''# HELP {name} {desc}
+# TYPE {name} {mtype}'''.format(
+            name=self._family_name(metric),
+            desc=desc,
+            mtype=metric.mtype if metric.mtype in ('counter', 'gauge') else 'unknown',
+        ).encode('utf-8')
+
+    def prefix(self, metric: 'Metric', labelvalues: LabelValues) -> str:
+        name = self._family_name(metric)
+        if metric.mtype == 'counter':
+            name += '_total'
+        return metric._line_prefix(name, labelvalues)
+
+    def family(self, header: bytes, lines: bytes) -> bytes:
+        return header + lines + b'\n'
+
+
+class ProtobufFormat(ExpositionFormat):
+    """
+    The delimited protobuf format, i.e. a sequence of length prefixed
+    io.prometheus.client.MetricFamily messages (see metrics.proto of the
+    Prometheus client model), encoded without a protobuf library.
+    """
+
+    name = 'protobuf'
+    media_type = 'application/vnd.google.protobuf'
+    content_type = ('application/vnd.google.protobuf; '
+                    'proto=io.prometheus.client.MetricFamily; encoding=delimited')
+
+    # MetricType enum and the field of the Metric message holding the value
+    TYPES = {'counter': (0, 3), 'gauge': (1, 2)}
+    UNTYPED = (3, 5)
+
+    def accepts(self, element: Any) -> bool:
+        return element.value == self.media_type and \
+            element.params.get('proto') == 'io.prometheus.client.MetricFamily' and \
+            element.params.get('encoding') == 'delimited'
+
+    def header(self, metric: 'Metric') -> bytes:
+        mtype, _ = self.TYPES.get(metric.mtype, self.UNTYPED)
+        return (pb_bytes(1, metric.promname.encode('utf-8'))
+                + pb_bytes(2, metric.desc.encode('utf-8'))
+                + varint(3 << 3) + varint(mtype))
+
+    def prefix(self, metric: 'Metric', labelvalues: LabelValues) -> bytes:
+        labels = b''
+        for name, value in zip(metric.labelnames or (), labelvalues):
+            labels += pb_bytes(1, pb_bytes(1, name.encode('utf-8'))
+                               + pb_bytes(2, str(value).encode('utf-8')))
+        return labels
+
+    def line(self, metric: 'Metric', prefix: bytes, value: Number) -> bytes:
+        _, field = self.TYPES.get(metric.mtype, self.UNTYPED)
+        # Gauge, Counter and Untyped all hold the value as double field 1
+        sample = prefix + pb_bytes(field, b'\x09' + struct.pack('<d', value))
+        return pb_bytes(4, sample)
+
+    def family(self, header: bytes, lines: bytes) -> bytes:
+        return varint(len(header) + len(lines)) + header + lines
+
+
+TEXT_FORMAT = TextFormat()
+FORMATS: Dict[str, ExpositionFormat] = {
+    f.name: f for f in (TEXT_FORMAT, OpenMetricsFormat(), ProtobufFormat())
+}
+
+
+# label value of the series that series exceeding the budget of their
+# metric family are folded into
+OTHER_LABEL_VALUE = '__other__'
+
+
 class Metric(object):
+    # Series cardinality budget: the maximum number of series of a metric
+    # family, by name, and the one of families without an entry. 0 means
+    # no limit. Configured by the module, see Module.configure_series_limits.
+    series_limits: Dict[str, int] = {}
+    default_series_limit = 0
+
     def __init__(self, mtype: str, name: str, desc: str, labels: Optional[LabelValues] = None) -> None:
         self.mtype = mtype
         self.name = name
         self.desc = desc
         self.labelnames = labels  # tuple if present
         self.value: Dict[LabelValues, Number] = {}
+        self.limit = self.series_limit(name)
+        self.dropped = 0  # series over the limit since clear()
+        # Rendered exposition fragments per format, kept across collection
+        # cycles so that only series whose value changed have to be
+        # formatted again. Each series maps to (value, rendered line, line
+        # prefix).
+        self._promname = ''
+        self._headers: Dict[str, bytes] = {}
+        self._lines: Dict[str, Dict[LabelValues, Tuple[Number, bytes, Any]]] = {}
+        self.rendered = 0  # series re-rendered by the last expfmt call
+
+    @property
+    def promname(self) -> str:
+        if not self._promname:
+            self._promname = promethize(self.name)
+        return self._promname
+
+    @classmethod
+    def series_limit(cls, name: str) -> int:
+        return cls.series_limits.get(name, cls.default_series_limit)
 
     def clear(self) -> None:
         self.value = {}
+        self.dropped = 0
+
+    def _over_limit(self, labelvalues: LabelValues) -> bool:
+        return bool(self.limit) and labelvalues not in self.value \
+            and len(self.value) >= self.limit
+
+    def _other(self) -> LabelValues:
+        self.dropped += 1
+        return tuple(OTHER_LABEL_VALUE for _ in self.labelnames or ('',))
 
     def set(self, value: Number, labelvalues: Optional[LabelValues] = None) -> None:
         # labelvalues must be a tuple
         labelvalues = labelvalues or ('',)
+        if self._over_limit(labelvalues):
+            # the family is over budget: counters (and the sums of
+            # summaries, which are counters as well) are aggregated instead
+            # of adding a series, the sum of gauges means nothing and they
+            # are dropped
+            if self.mtype == 'counter':
+                other = self._other()
+                self.value[other] = self.value.get(other, 0) + value
+            else:
+                self.dropped += 1
+            return
         self.value[labelvalues] = value
 
-    def str_expfmt(self) -> str:
+    def _line_prefix(self, name: str, labelvalues: LabelValues) -> str:
+        if self.labelnames:
+            labels_list = zip(self.labelnames, labelvalues)
+            labels = ','.join('%s="%s"' % (k, v) for k, v in labels_list)
+        else:
+            labels = ''
+        if labels:
+            return '\n{name}{{{labels}}} '.format(name=name, labels=labels)
+        return '\n{name} '.format(name=name)
 
-        # Must be kept in sync with promethize() in src/exporter/util.cc
-        def promethize(path: str) -> str:
-            ''' replace illegal metric name characters '''
-            result = re.sub(r'[./\s]|::', '_', path).replace('+', '_plus')
+    def bytes_expfmt(self, fmt: ExpositionFormat = TEXT_FORMAT) -> bytes:
+        """
+        Render the metric in the given exposition format, by default the
+        text format.
 
-            # Hyphens usually turn into underscores, unless they are
-            # trailing
-            if result.endswith("-"):
-                result = result[0:-1] + "_minus"
-            else:
-                result = result.replace("-", "_")
-
-            return "ceph_{0}".format(result)
-
-        def floatstr(value: float) -> str:
-            ''' represent as Go-compatible float '''
-            if value == float('inf'):
-                return '+Inf'
-            if value == float('-inf'):
-                return '-Inf'
-            if math.isnan(value):
-                return 'NaN'
-            return repr(float(value))
-
-        name = promethize(self.name)
-        expfmt = '''
-# HELP {name} {desc}
-# TYPE {name} {mtype}'''.format(
-            name=name,
-            desc=self.desc,
-            mtype=self.mtype,
-        )
+        The header and the label part of every series are rendered once and
+        cached; a series line is only formatted again when its value differs
+        from the one it was last rendered with. Series that are no longer
+        present are dropped from the cache.
+        """
+        header = self._headers.get(fmt.name)
+        if header is None:
+            header = self._headers[fmt.name] = fmt.header(self)
 
+        rendered = 0
+        cached = self._lines.get(fmt.name, {})
+        lines: Dict[LabelValues, Tuple[Number, bytes, Any]] = {}
         for labelvalues, value in self.value.items():
-            if self.labelnames:
-                labels_list = zip(self.labelnames, labelvalues)
-                labels = ','.join('%s="%s"' % (k, v) for k, v in labels_list)
-            else:
-                labels = ''
-            if labels:
-                fmtstr = '\n{name}{{{labels}}} {value}'
-            else:
-                fmtstr = '\n{name} {value}'
-            expfmt += fmtstr.format(
-                name=name,
-                labels=labels,
-                value=floatstr(value),
-            )
-        return expfmt
+            entry = cached.get(labelvalues)
+            if entry is None or entry[0] != value:
+                prefix = entry[2] if entry is not None else fmt.prefix(self, labelvalues)
+                entry = (value, fmt.line(self, prefix, value), prefix)
+                rendered += 1
+            lines[labelvalues] = entry
+        self._lines[fmt.name] = lines
+        self.rendered = rendered
+
+        return fmt.family(header, b''.join(entry[1] for entry in lines.values()))
+
+    def str_expfmt(self) -> str:
+        return self.bytes_expfmt().decode('utf-8')
 
     def group_by(
         self,
@@ -527,7 +778,8 @@ class MetricCounter(Metric):
         self.value = defaultdict(lambda: 0)
 
     def clear(self) -> None:
-        pass  # Skip calls to clear as we want to keep the counters here.
+        # Skip calls to clear as we want to keep the counters here.
+        self.dropped = 0
 
     def set(self,
             value: Number,
@@ -540,9 +792,164 @@ class MetricCounter(Metric):
             labelvalues: Optional[LabelValues] = None) -> None:
         # labelvalues must be a tuple
         labelvalues = labelvalues or ('',)
+        if self._over_limit(labelvalues):
+            labelvalues = self._other()
         self.value[labelvalues] += value
 
 
+class Collector(object):
+    """
+    A metric getter of the Module together with its scheduling information.
+
+    ``metrics`` names the keys of ``Module.metrics`` the collector populates;
+    their values are only cleared when the collector runs again, so that a
+    collector with a refresh interval longer than the scrape interval keeps
+    exporting its last values in between. Getters that create metrics at
+    runtime register them in ``Module.metric_owners`` themselves.
+    ``after`` lists collectors that have to finish before this one is
+    started when both are due in the same cycle.
+    """
+
+    def __init__(self,
+                 func: Callable[[], None],
+                 metrics: Tuple[str, ...] = (),
+                 after: Tuple[str, ...] = (),
+                 enabled: Optional[Callable[[], bool]] = None) -> None:
+        self.func = func
+        self.name = func.__name__
+        self.metrics = metrics
+        self.after = after
+        self.enabled = enabled
+        self.interval = 0.0
+        self.last_run = 0.0
+        self.duration = 0.0
+        self.overruns = 0
+
+    def is_enabled(self) -> bool:
+        return self.enabled is None or self.enabled()
+
+    def is_due(self, now: float) -> bool:
+        if not self.is_enabled():
+            return False
+        return now >= self.last_run + self.interval
+
+
+def coalesce(parts: Iterable[bytes], size: int = EXPOSITION_CHUNK_SIZE) -> List[bytes]:
+    """
+    Merge consecutive small byte strings into chunks of at least ``size``
+    bytes. Parts that are large enough on their own are kept as they are,
+    so nothing but the small parts is copied.
+    """
+    chunks: List[bytes] = []
+    pending: List[bytes] = []
+    pending_size = 0
+    for part in parts:
+        if not part:
+            continue
+        if len(part) >= size and not pending:
+            chunks.append(part)
+            continue
+        pending.append(part)
+        pending_size += len(part)
+        if pending_size >= size:
+            chunks.append(b''.join(pending))
+            pending = []
+            pending_size = 0
+    if pending:
+        chunks.append(b''.join(pending))
+    return chunks
+
+
+class Exposition(object):
+    """
+    The result of one collection cycle, as served by the /metrics endpoint.
+
+    The exposition is kept as the list of immutable chunks it was rendered
+    into and streamed to clients chunk by chunk, it is never joined into a
+    single string.
+
+    The ETag is derived from the body, so unchanged output keeps its tag
+    across cycles. Compressed representations are computed on first request
+    and kept for the lifetime of the exposition, i.e. one collection cycle.
+    """
+
+    def __init__(self,
+                 chunks: List[bytes],
+                 timestamp: Optional[float] = None,
+                 fmt: ExpositionFormat = TEXT_FORMAT) -> None:
+        self.chunks = chunks
+        self.format = fmt
+        self.size = sum(len(chunk) for chunk in chunks)
+        self.timestamp = time.time() if timestamp is None else timestamp
+        digest = hashlib.sha256()
+        for chunk in chunks:
+            digest.update(chunk)
+        self.etag = '"{}"'.format(digest.hexdigest()[:32])
+        self.last_modified = cherrypy.lib.httputil.HTTPDate(self.timestamp)
+        self._encoded: Dict[str, List[bytes]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def body(self) -> bytes:
+        return b''.join(self.chunks)
+
+    @staticmethod
+    def encodings() -> List[str]:
+        """Supported content encodings, in order of preference."""
+        if zstandard is not None:
+            return ['zstd', 'gzip']
+        return ['gzip']
+
+    def encoded(self, encoding: str) -> List[bytes]:
+        if encoding == 'identity':
+            return self.chunks
+        # concurrent scrapes of the same cycle wait for a single compression
+        with self._lock:
+            if encoding not in self._encoded:
+                if encoding == 'gzip':
+                    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                elif encoding == 'zstd' and zstandard is not None:
+                    compressor = zstandard.ZstdCompressor().compressobj()
+                else:
+                    raise ValueError('unsupported content encoding: {}'.format(encoding))
+                parts = [compressor.compress(chunk) for chunk in self.chunks]
+                parts.append(compressor.flush())
+                self._encoded[encoding] = coalesce(parts)
+            return self._encoded[encoding]
+
+    @staticmethod
+    def negotiate_format(accept: List[Any], available: Iterable[str]) -> str:
+        """
+        Pick the format of the response among the ``available`` ones, given
+        the parsed elements of the Accept header of the request (highest
+        quality first). Falls back to the text format.
+        """
+        for element in accept:
+            if element.qvalue <= 0:
+                continue
+            for name in available:
+                if FORMATS[name].accepts(element):
+                    return name
+        return TEXT_FORMAT.name
+
+    def negotiate(self, accept_encoding: List[Any]) -> str:
+        """
+        Pick the content encoding for a request, given the parsed elements of
+        its Accept-Encoding header (highest quality first).
+        """
+        supported = self.encodings()
+        for element in accept_encoding:
+            if element.qvalue <= 0:
+                continue
+            if element.value in supported:
+                return element.value
+            if element.value == '*':
+                return supported[0]
+            if element.value == 'identity':
+                break
+        return 'identity'
+
+
 class MetricCollectionThread(threading.Thread):
     def __init__(self, module: 'Module') -> None:
         self.mod = module
@@ -582,8 +989,12 @@ class MetricCollectionThread(threading.Thread):
                     )
                     sleep_time = 0
 
+                exposition = {name: Exposition(chunks, start_time, FORMATS[name])
+                              for name, chunks in data.items()}
                 with self.mod.collect_lock:
-                    self.mod.collect_cache = data
+                    # the previous exposition is released here, only the
+                    # responses still streaming it keep a reference
+                    self.mod.collect_cache = exposition
                     self.mod.collect_time = duration
 
                 self.event.wait(sleep_time)
@@ -633,6 +1044,24 @@ class Module(MgrModule, OrchestratorClientMixin):
             type='int',
             default=300
         ),
+        Option(
+            name='rbd_stats_top_n',
+            type='int',
+            default=0,
+            min=0,
+            desc='only export the stats of the N images with the most IO '
+                 'operations in the last collection, 0 for all images',
+            runtime=True
+        ),
+        Option(
+            name='rbd_stats_idle_timeout',
+            type='secs',
+            default=0,
+            min=0,
+            desc='do not export the stats of images without IO operations '
+                 'for longer than this, 0 to export idle images too',
+            runtime=True
+        ),
         Option(
             name='standby_behaviour',
             type='str',
@@ -656,6 +1085,57 @@ class Module(MgrModule, OrchestratorClientMixin):
             long_desc='Gathering perf-counters from a single Prometheus exporter can degrade ceph-mgr performance, especially in large clusters. Instead, Ceph-exporter daemons are now used by default for perf-counter gathering. This should only be disabled when no ceph-exporters are deployed.',
             runtime=True
         ),
+        Option(
+            name='collector_threads',
+            type='int',
+            default=4,
+            min=1,
+            desc='Number of threads used to run metric collectors concurrently',
+        ),
+        Option(
+            name='collector_intervals',
+            type='str',
+            default='',
+            desc='Refresh intervals of individual metric collectors',
+            long_desc='Comma or space separated list of <collector>=<seconds> entries, '
+                      'e.g. "get_rbd_stats=60 get_perf_counters=30". Collectors without '
+                      'an entry are run on every scrape interval. The values of a '
+                      'collector that is not due are exported unchanged.',
+            runtime=True
+        ),
+        Option(
+            name='exposition_formats',
+            type='str',
+            default='text',
+            desc='Formats the metrics are offered in',
+            long_desc='Comma or space separated list of exposition formats the '
+                      'metrics are rendered in on every collection and served in, '
+                      'depending on the Accept header of the request: text, '
+                      'openmetrics and protobuf. The text format is always available.',
+            runtime=True
+        ),
+        Option(
+            name='series_limit',
+            type='int',
+            default=0,
+            min=0,
+            desc='Maximum number of series of a metric family, 0 for no limit',
+            long_desc='Counter series exceeding the limit are aggregated into a single '
+                      'series with all labels set to "__other__", gauge series exceeding '
+                      'it are dropped. The number of series aggregated or dropped per '
+                      'family is exported as ceph_prometheus_series_dropped.',
+            runtime=True
+        ),
+        Option(
+            name='series_limits',
+            type='str',
+            default='',
+            desc='Maximum number of series of individual metric families',
+            long_desc='Comma or space separated list of <family>=<limit> entries '
+                      'overriding series_limit, e.g. "rbd_write_ops=1000 osd_up=0". '
+                      'Families are named without the "ceph_" prefix.',
+            runtime=True
+        ),
         Option(
             name='healthcheck_history_max_entries',
             type='int',
@@ -673,17 +1153,28 @@ class Module(MgrModule, OrchestratorClientMixin):
         self.key_file: IO[bytes]
         self.cert_file: IO[bytes]
         self.metrics = self._setup_static_metrics()
+        self.collectors = self._setup_collectors()
+        self.metric_owners = {key: c.name for c in self.collectors for key in c.metrics}
+        self.collector_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
         self.shutdown_event = threading.Event()
         self.config_change_event = threading.Event()
         self.collect_lock = threading.Lock()
         self.collect_time = 0.0
+        self.exposition_size = 0
+        self.bytes_served = 0
         self.scrape_interval: float = 15.0
         self.cache = True
         self.stale_cache_strategy: str = self.STALE_CACHE_FAIL
-        self.collect_cache: Optional[str] = None
+        self.collect_cache: Optional[Dict[str, Exposition]] = None
+        self.exposition_formats: List[ExpositionFormat] = [TEXT_FORMAT]
+        # (pool_id, namespace) -> (directory object version, listing) of
+        # the rbd images, (pool_id, None) for the namespaces of a pool
+        self.rbd_listings: Dict[Tuple[int, Optional[str]], Tuple[Optional[int], List[Any]]] = {}
         self.rbd_stats = {
             'pools': {},
             'pools_refresh_time': 0,
+            # pool_id -> {'query': ..., 'query_id': ...}
+            'queries': {},
             'counters_info': {
                 'write_ops': {'type': self.PERFCOUNTER_COUNTER,
                               'desc': 'RBD image writes count'},
@@ -817,6 +1308,14 @@ class Module(MgrModule, OrchestratorClientMixin):
             RBD_MIRROR_METADATA
         )
 
+        metrics['rbd_stats_images'] = Metric(
+            'gauge',
+            'rbd_stats_images',
+            'Number of RBD images tracked for per-image IO statistics and of '
+            'those exported',
+            ('state',)
+        )
+
         metrics['rbd_image_metadata'] = Metric(
             'untyped',
             'rbd_image_metadata',
@@ -941,6 +1440,48 @@ class Module(MgrModule, OrchestratorClientMixin):
                 'Number of {} objects'.format(state),
             )
 
+        metrics['prometheus_collector_last_duration_seconds'] = Metric(
+            'gauge',
+            'prometheus_collector_last_duration_seconds',
+            'Duration of the last run of a metric collector',
+            ('collector',)
+        )
+        metrics['prometheus_collector_overruns'] = MetricCounter(
+            'prometheus_collector_overruns',
+            'Number of times a metric collector took longer than its refresh interval',
+            ('collector',)
+        )
+
+        metrics['prometheus_series_dropped'] = Metric(
+            'gauge',
+            'prometheus_series_dropped',
+            'Number of series aggregated into the "__other__" series of a metric '
+            'family or dropped in the last collection because the family exceeded '
+            'its series limit',
+            ('family',)
+        )
+
+        metrics['prometheus_exposition_rendered_series'] = Metric(
+            'gauge',
+            'prometheus_exposition_rendered_series',
+            'Number of series whose exposition text was re-rendered in the last collection',
+        )
+        metrics['prometheus_exposition_size_bytes'] = Metric(
+            'gauge',
+            'prometheus_exposition_size_bytes',
+            'Uncompressed size of the exposition produced by the previous collection',
+        )
+        metrics['prometheus_exposition_bytes_served'] = Metric(
+            'counter',
+            'prometheus_exposition_bytes_served',
+            'Number of bytes of the exposition written to clients, after compression',
+        )
+        metrics['prometheus_mgr_rss_bytes'] = Metric(
+            'gauge',
+            'prometheus_mgr_rss_bytes',
+            'Resident set size of the ceph-mgr process after the previous collection',
+        )
+
         for check in HEALTH_CHECKS:
             path = 'healthcheck_{}'.format(check.name.lower())
             metrics[path] = Metric(
@@ -951,6 +1492,129 @@ class Module(MgrModule, OrchestratorClientMixin):
 
         return metrics
 
+    def _setup_collectors(self) -> List[Collector]:
+        return [
+            Collector(self.get_health,
+                      ('health_status', 'health_detail')
+                      + tuple('healthcheck_{}'.format(c.name.lower()) for c in HEALTH_CHECKS)),
+            Collector(self.get_df,
+                      tuple('cluster_{}'.format(s) for s in DF_CLUSTER)
+                      + tuple('cluster_by_class_{}'.format(s) for s in DF_CLUSTER)
+                      + tuple('pool_{}'.format(s) for s in DF_POOL)),
+            Collector(self.get_osd_blocklisted_entries,
+                      tuple('cluster_{}'.format(s) for s in OSD_BLOCKLIST)),
+            Collector(self.get_pool_stats,
+                      tuple('pool_{}'.format(s) for s in OSD_POOL_STATS)),
+            Collector(self.get_fs, ('fs_metadata', 'mds_metadata')),
+            Collector(self.get_osd_stats,
+                      tuple('osd_{}'.format(s) for s in OSD_STATS)),
+            Collector(self.get_quorum_status, ('mon_metadata', 'mon_quorum_status')),
+            Collector(self.get_mgr_status,
+                      ('mgr_metadata', 'mgr_status', 'mgr_module_status', 'mgr_module_can_run')),
+            Collector(self.get_metadata_and_osd_status,
+                      ('osd_nearfull_ratio', 'osd_full_ratio', 'osd_metadata',
+                       'disk_occupation', 'disk_occupation_human', 'pool_metadata',
+                       'rgw_metadata', 'rbd_mirror_metadata', 'rbd_image_metadata')
+                      + tuple('osd_flag_{}'.format(f) for f in OSD_FLAGS)
+                      + tuple('osd_{}'.format(s) for s in OSD_STATUS)),
+            Collector(self.get_pg_status,
+                      ('pg_total',) + tuple('pg_{}'.format(s) for s in PG_STATES)),
+            Collector(self.get_pool_repaired_objects, ('pool_objects_repaired',)),
+            Collector(self.get_num_objects,
+                      tuple('num_objects_{}'.format(s) for s in NUM_OBJECTS)),
+            Collector(self.get_all_daemon_health_metrics, ('daemon_health_metrics',)),
+            Collector(self.get_smb_metadata, ('smb_metadata',)),
+            Collector(self.set_cephadm_daemon_status_metrics, ('cephadm_daemon_status',)),
+            Collector(self.get_perf_counters,
+                      enabled=lambda: not self.get_module_option('exclude_perf_counters')),
+            Collector(self.get_rbd_stats, ('rbd_stats_images',)),
+        ]
+
+    def configure_exposition_formats(self) -> None:
+        formats: List[ExpositionFormat] = [TEXT_FORMAT]
+        formats_string = cast(str, self.get_localized_module_option('exposition_formats', ''))
+        for x in re.split(r'[\s,]+', formats_string):
+            if not x:
+                continue
+            if x not in FORMATS:
+                self.log.error('unknown exposition format: %s' % x)
+            elif FORMATS[x] not in formats:
+                formats.append(FORMATS[x])
+        self.exposition_formats = formats
+
+    def configure_series_limits(self) -> None:
+        limits: Dict[str, int] = {}
+        limits_string = cast(str, self.get_localized_module_option('series_limits', ''))
+        for x in re.split(r'[\s,]+', limits_string):
+            if not x:
+                continue
+            try:
+                name, limit = x.split('=', 1)
+                limits[name] = max(int(limit), 0)
+            except ValueError:
+                self.log.error('invalid series_limits entry: %s' % x)
+        Metric.series_limits = limits
+        Metric.default_series_limit = cast(int, self.get_localized_module_option('series_limit', 0))
+        for metric in self.metrics.values():
+            metric.limit = Metric.series_limit(metric.name)
+
+    def configure_collectors(self) -> None:
+        intervals: Dict[str, float] = {}
+        intervals_string = cast(str, self.get_localized_module_option('collector_intervals', ''))
+        for x in re.split(r'[\s,]+', intervals_string):
+            if not x:
+                continue
+            try:
+                name, interval = x.split('=', 1)
+                intervals[name] = float(interval)
+            except ValueError:
+                self.log.error('invalid collector_intervals entry: %s' % x)
+        for collector in self.collectors:
+            collector.interval = intervals.pop(collector.name, 0.0)
+        for name in intervals:
+            self.log.error('unknown collector in collector_intervals: %s' % name)
+
+    def _run_collector(self, collector: Collector) -> None:
+        start_time = time.time()
+        try:
+            collector.func()
+        except Exception:
+            self.log.exception('collector %s failed:' % collector.name)
+        else:
+            collector.last_run = start_time
+        collector.duration = time.time() - start_time
+        if collector.duration > max(collector.interval, self.scrape_interval):
+            collector.overruns += 1
+            cast(MetricCounter, self.metrics['prometheus_collector_overruns']).add(
+                1, (collector.name,))
+
+    def run_collectors(self, collectors: List[Collector]) -> None:
+        """
+        Run the given collectors on the collector thread pool. A collector is
+        submitted as soon as all collectors it has to run after are done.
+        """
+        if self.collector_pool is None:
+            self.collector_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=cast(int, self.get_localized_module_option('collector_threads', 4)),
+                thread_name_prefix='prometheus-collector')
+        names = set(c.name for c in collectors)
+        pending = list(collectors)
+        running: Dict[concurrent.futures.Future, Collector] = {}
+        done: Set[str] = set()
+        while pending or running:
+            for collector in list(pending):
+                if all(dep in done or dep not in names for dep in collector.after):
+                    pending.remove(collector)
+                    running[self.collector_pool.submit(self._run_collector, collector)] = collector
+            if not running:
+                self.log.error('collectors with unsatisfiable dependencies: %s' %
+                               [c.name for c in pending])
+                break
+            finished, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                done.add(running.pop(future).name)
+
     def orch_is_available(self) -> bool:
         try:
             return self.available()[0]
@@ -1038,7 +1702,7 @@ class Module(MgrModule, OrchestratorClientMixin):
     def get_pool_stats(self) -> None:
         # retrieve pool stats to provide per pool recovery metrics
         # (osd_pool_stats moved to mgr in Mimic)
-        pstats = self.get('osd_pool_stats')
+        pstats = self.get('osd_pool_stats', cached=True)
         for pool in pstats['pool_stats']:
             for stat in OSD_POOL_STATS:
                 self.metrics['pool_{}'.format(stat)].set(
@@ -1073,7 +1737,7 @@ class Module(MgrModule, OrchestratorClientMixin):
     @profile_method()
     def get_df(self) -> None:
         # maybe get the to-be-exported metrics from a config?
-        df = self.get('df')
+        df = self.get('df', cached=True)
         for stat in DF_CLUSTER:
             self.metrics['cluster_{}'.format(stat)].set(df['stats'][stat])
             for device_class in df['stats_by_class']:
@@ -1100,7 +1764,7 @@ class Module(MgrModule, OrchestratorClientMixin):
 
     @profile_method()
     def get_fs(self) -> None:
-        fs_map = self.get('fs_map')
+        fs_map = self.get('fs_map', cached=True)
         servers = self.get_service_list()
         self.log.debug('standbys: {}'.format(fs_map['standbys']))
         # export standby mds metadata, default standby fs_id is '-1'
@@ -1155,7 +1819,7 @@ class Module(MgrModule, OrchestratorClientMixin):
 
     @profile_method()
     def get_mgr_status(self) -> None:
-        mgr_map = self.get('mgr_map')
+        mgr_map = self.get('mgr_map', cached=True)
         servers = self.get_service_list()
 
         active = mgr_map['active_name']
@@ -1199,7 +1863,7 @@ class Module(MgrModule, OrchestratorClientMixin):
     @profile_method()
     def get_pg_status(self) -> None:
 
-        pg_summary = self.get('pg_summary')
+        pg_summary = self.get('pg_summary', cached=True)
 
         for pool in pg_summary['by_pool']:
             num_by_state: DefaultDict[str, int] = defaultdict(int)
@@ -1219,7 +1883,7 @@ class Module(MgrModule, OrchestratorClientMixin):
 
     @profile_method()
     def get_osd_stats(self) -> None:
-        osd_stats = self.get('osd_stats')
+        osd_stats = self.get('osd_stats', cached=True)
         for osd in osd_stats['osd_stats']:
             id_ = osd['osd']
             for stat in OSD_STATS:
@@ -1240,7 +1904,7 @@ class Module(MgrModule, OrchestratorClientMixin):
 
     @profile_method()
     def get_metadata_and_osd_status(self) -> None:
-        osd_map = self.get('osd_map')
+        osd_map = self.get('osd_map', cached=True)
 
         cluster_nearfull_ratio = osd_map.get('nearfull_ratio', None)
         cluster_full_ratio = osd_map.get('full_ratio', None)
@@ -1255,7 +1919,7 @@ class Module(MgrModule, OrchestratorClientMixin):
                 int(flag in osd_flags)
             )
 
-        osd_devices = self.get('osd_map_crush')['devices']
+        osd_devices = self.get('osd_map_crush', cached=True)['devices']
         servers = self.get_service_list()
         for osd in osd_map['osds']:
             # id can be used to link osd metrics and metadata
@@ -1447,14 +2111,12 @@ class Module(MgrModule, OrchestratorClientMixin):
                     1, rbd_mirror_metadata
                 )
         try:
-            rbd = RBD()
             for pool in osd_map['pools']:
                 pool_id = pool['pool']
                 pool_name = pool['pool_name']
                 if 'rbd' in pool.get('application_metadata', {}):
                     with self.rados.open_ioctx(pool_name) as ioctx:
-                        for image_meta in rbd.list2(ioctx):
-                            image_name = image_meta['name']
+                        for _, image_name in self.list_rbd_images(ioctx, pool_id):
                             self.metrics['rbd_image_metadata'].set(
                                 1, (str(pool_id), image_name)
                             )
@@ -1463,7 +2125,7 @@ class Module(MgrModule, OrchestratorClientMixin):
 
     @profile_method()
     def get_num_objects(self) -> None:
-        pg_sum = self.get('pg_summary')['pg_stats_sum']['stat_sum']
+        pg_sum = self.get('pg_summary', cached=True)['pg_stats_sum']['stat_sum']
         for obj in NUM_OBJECTS:
             stat = 'num_objects_{}'.format(obj)
             self.metrics[stat].set(pg_sum[stat])
@@ -1489,7 +2151,7 @@ class Module(MgrModule, OrchestratorClientMixin):
         # '*' can be used to indicate all pools or namespaces
         pools_string = cast(str, self.get_localized_module_option('rbd_stats_pools'))
         pool_keys = set()
-        osd_map = self.get('osd_map')
+        osd_map = self.get('osd_map', cached=True)
         rbd_pools = [pool['pool_name'] for pool in osd_map['pools']
                      if 'rbd' in pool.get('application_metadata', {})]
         for x in re.split(r'[\s,]+', pools_string):
@@ -1543,41 +2205,30 @@ class Module(MgrModule, OrchestratorClientMixin):
                 self.refresh_rbd_stats_pools(pools)
                 pools_refreshed = True
 
-        pool_ids = list(self.rbd_stats['pools'])
-        pool_ids.sort()
-        pool_id_regex = '^(' + '|'.join([str(x) for x in pool_ids]) + ')$'
-
-        nspace_names = []
-        for pool_id, pool in self.rbd_stats['pools'].items():
-            if pool['ns_names']:
-                nspace_names.extend(pool['ns_names'])
-            else:
-                nspace_names = []
-                break
-        if nspace_names:
-            namespace_regex = '^(' + \
-                              "|".join([re.escape(x)
-                                        for x in set(nspace_names)]) + ')$'
-        else:
-            namespace_regex = '^(.*)$'
-
-        if ('query' in self.rbd_stats
-            and (pool_id_regex != self.rbd_stats['query']['key_descriptor'][0]['regex']
-                 or namespace_regex != self.rbd_stats['query']['key_descriptor'][1]['regex'])):
-            self.remove_osd_perf_query(self.rbd_stats['query_id'])
-            del self.rbd_stats['query_id']
-            del self.rbd_stats['query']
+        # One query per pool, so that the query of a pool is only replaced
+        # when its own namespaces change and the counters of one busy pool
+        # are fetched and processed independently of the others.
+        queries = self.rbd_stats['queries']
+        for pool_id in list(queries):
+            pool = self.rbd_stats['pools'].get(pool_id)
+            if pool is None or \
+               self.rbd_namespace_regex(pool) != queries[pool_id]['query']['key_descriptor'][1]['regex']:
+                self.remove_osd_perf_query(queries[pool_id]['query_id'])
+                del queries[pool_id]
 
         if not self.rbd_stats['pools']:
             return
 
         counters_info = self.rbd_stats['counters_info']
+        ops_counters = [i for i, key in enumerate(counters_info) if key.endswith('_ops')]
 
-        if 'query_id' not in self.rbd_stats:
+        for pool_id, pool in self.rbd_stats['pools'].items():
+            if pool_id in queries:
+                continue
             query = {
                 'key_descriptor': [
-                    {'type': 'pool_id', 'regex': pool_id_regex},
-                    {'type': 'namespace', 'regex': namespace_regex},
+                    {'type': 'pool_id', 'regex': '^({})$'.format(pool_id)},
+                    {'type': 'namespace', 'regex': self.rbd_namespace_regex(pool)},
                     {'type': 'object_name',
                      'regex': r'^(?:rbd|journal)_data\.(?:([0-9]+)\.)?([^.]+)\.'},
                 ],
@@ -1586,135 +2237,226 @@ class Module(MgrModule, OrchestratorClientMixin):
             query_id = self.add_osd_perf_query(query)
             if query_id is None:
                 self.log.error('failed to add query %s' % query)
-                return
-            self.rbd_stats['query'] = query
-            self.rbd_stats['query_id'] = query_id
-
-        res = self.get_osd_perf_counters(self.rbd_stats['query_id'])
-        assert res
-        for c in res['counters']:
-            # if the pool id is not found in the object name use id of the
-            # pool where the object is located
-            if c['k'][2][0]:
-                pool_id = int(c['k'][2][0])
-            else:
-                pool_id = int(c['k'][0][0])
-            if pool_id not in self.rbd_stats['pools'] and not pools_refreshed:
-                self.refresh_rbd_stats_pools(pools)
-                pools_refreshed = True
-            if pool_id not in self.rbd_stats['pools']:
                 continue
-            pool = self.rbd_stats['pools'][pool_id]
-            nspace_name = c['k'][1][0]
-            if nspace_name not in pool['images']:
+            queries[pool_id] = {'query': query, 'query_id': query_id}
+
+        now = time.time()
+        for shard in queries.values():
+            res = self.get_osd_perf_counters(shard['query_id'])
+            if not res:
                 continue
-            image_id = c['k'][2][1]
-            if image_id not in pool['images'][nspace_name] and \
-               not pools_refreshed:
-                self.refresh_rbd_stats_pools(pools)
+            for c in res['counters']:
+                # if the pool id is not found in the object name use id of the
+                # pool where the object is located
+                if c['k'][2][0]:
+                    pool_id = int(c['k'][2][0])
+                else:
+                    pool_id = int(c['k'][0][0])
+                if pool_id not in self.rbd_stats['pools'] and not pools_refreshed:
+                    self.refresh_rbd_stats_pools(pools)
+                    pools_refreshed = True
+                if pool_id not in self.rbd_stats['pools']:
+                    continue
                 pool = self.rbd_stats['pools'][pool_id]
-                pools_refreshed = True
-            if image_id not in pool['images'][nspace_name]:
-                continue
-            counters = pool['images'][nspace_name][image_id]['c']
-            for i in range(len(c['c'])):
-                counters[i][0] += c['c'][i][0]
-                counters[i][1] += c['c'][i][1]
+                nspace_name = c['k'][1][0]
+                if nspace_name not in pool['images']:
+                    continue
+                image_id = c['k'][2][1]
+                if image_id not in pool['images'][nspace_name] and \
+                   not pools_refreshed:
+                    self.refresh_rbd_stats_pools(pools)
+                    pool = self.rbd_stats['pools'][pool_id]
+                    pools_refreshed = True
+                if image_id not in pool['images'][nspace_name]:
+                    continue
+                image = pool['images'][nspace_name][image_id]
+                counters = image['c']
+                for i in range(len(c['c'])):
+                    counters[i][0] += c['c'][i][0]
+                    counters[i][1] += c['c'][i][1]
+                ops = sum(c['c'][i][0] for i in ops_counters)
+                if ops:
+                    image['ops'] += ops
+                    image['active'] = now
+
+        images = self.rbd_stats_exported_images(now)
 
         label_names = ("pool", "namespace", "image")
-        for pool_id, pool in self.rbd_stats['pools'].items():
-            pool_name = pool['name']
-            for nspace_name, images in pool['images'].items():
-                for image_id in images:
-                    image_name = images[image_id]['n']
-                    counters = images[image_id]['c']
-                    i = 0
-                    for key in counters_info:
-                        counter_info = counters_info[key]
-                        stattype = self._stattype_to_str(counter_info['type'])
-                        labels = (pool_name, nspace_name, image_name)
-                        if counter_info['type'] == self.PERFCOUNTER_COUNTER:
-                            path = 'rbd_' + key
-                            if path not in self.metrics:
-                                self.metrics[path] = Metric(
-                                    stattype,
-                                    path,
-                                    counter_info['desc'],
-                                    label_names,
-                                )
-                            self.metrics[path].set(counters[i][0], labels)
-                        elif counter_info['type'] == self.PERFCOUNTER_LONGRUNAVG:
-                            path = 'rbd_' + key + '_sum'
-                            if path not in self.metrics:
-                                self.metrics[path] = Metric(
-                                    stattype,
-                                    path,
-                                    counter_info['desc'] + ' Total',
-                                    label_names,
-                                )
-                            self.metrics[path].set(counters[i][0], labels)
-                            path = 'rbd_' + key + '_count'
-                            if path not in self.metrics:
-                                self.metrics[path] = Metric(
-                                    'counter',
-                                    path,
-                                    counter_info['desc'] + ' Count',
-                                    label_names,
-                                )
-                            self.metrics[path].set(counters[i][1], labels)
-                        i += 1
+        for pool_name, nspace_name, image in images:
+            image_name = image['n']
+            counters = image['c']
+            i = 0
+            for key in counters_info:
+                counter_info = counters_info[key]
+                stattype = self._stattype_to_str(counter_info['type'])
+                labels = (pool_name, nspace_name, image_name)
+                if counter_info['type'] == self.PERFCOUNTER_COUNTER:
+                    path = 'rbd_' + key
+                    if path not in self.metrics:
+                        self.metrics[path] = Metric(
+                            stattype,
+                            path,
+                            counter_info['desc'],
+                            label_names,
+                        )
+                        self.metric_owners[path] = 'get_rbd_stats'
+                    self.metrics[path].set(counters[i][0], labels)
+                elif counter_info['type'] == self.PERFCOUNTER_LONGRUNAVG:
+                    path = 'rbd_' + key + '_sum'
+                    if path not in self.metrics:
+                        self.metrics[path] = Metric(
+                            stattype,
+                            path,
+                            counter_info['desc'] + ' Total',
+                            label_names,
+                        )
+                        self.metric_owners[path] = 'get_rbd_stats'
+                    self.metrics[path].set(counters[i][0], labels)
+                    path = 'rbd_' + key + '_count'
+                    if path not in self.metrics:
+                        self.metrics[path] = Metric(
+                            'counter',
+                            path,
+                            counter_info['desc'] + ' Count',
+                            label_names,
+                        )
+                        self.metric_owners[path] = 'get_rbd_stats'
+                    self.metrics[path].set(counters[i][1], labels)
+                i += 1
+
+    @staticmethod
+    def rbd_namespace_regex(pool: Dict[str, Any]) -> str:
+        if pool['ns_names']:
+            return '^(' + '|'.join([re.escape(x) for x in sorted(pool['ns_names'])]) + ')$'
+        return '^(.*)$'
+
+    def rbd_stats_exported_images(self, now: float) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """
+        Return (pool name, namespace, image) of the images whose stats are
+        exported in this collection, as limited by the rbd_stats_idle_timeout
+        and rbd_stats_top_n options, and reset the per-collection operation
+        counts of all images.
+        """
+        idle_timeout = cast(int, self.get_localized_module_option('rbd_stats_idle_timeout', 0))
+        top_n = cast(int, self.get_localized_module_option('rbd_stats_top_n', 0))
+
+        tracked = 0
+        images = []
+        for pool in self.rbd_stats['pools'].values():
+            for nspace_name, nspace_images in pool['images'].items():
+                tracked += len(nspace_images)
+                for image in nspace_images.values():
+                    if not idle_timeout or now - image['active'] <= idle_timeout:
+                        images.append((pool['name'], nspace_name, image))
+        if top_n and len(images) > top_n:
+            images = heapq.nlargest(top_n, images,
+                                    key=lambda x: (x[2]['ops'], x[2]['active']))
+        for pool in self.rbd_stats['pools'].values():
+            for nspace_images in pool['images'].values():
+                for image in nspace_images.values():
+                    image['ops'] = 0
+
+        self.metrics['rbd_stats_images'].set(tracked, ('tracked',))
+        self.metrics['rbd_stats_images'].set(len(images), ('exported',))
+        return images
+
+    @staticmethod
+    def rbd_object_version(ioctx: rados.Ioctx, oid: str) -> Optional[int]:
+        """
+        Return the version of an object, which is bumped by every write,
+        including omap updates, or None if it does not exist.
+        """
+        try:
+            ioctx.stat(oid)
+        except rados.ObjectNotFound:
+            return None
+        return ioctx.get_last_version()
+
+    def list_rbd_namespaces(self, ioctx: rados.Ioctx, pool_id: int) -> List[str]:
+        """
+        List the namespaces of a pool, reusing the previous listing if the
+        namespace directory object did not change since.
+        """
+        version = self.rbd_object_version(ioctx, 'rbd_namespace')
+        cached = self.rbd_listings.get((pool_id, None))
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        nspace_names = [] if version is None else RBD().namespace_list(ioctx)
+        self.rbd_listings[(pool_id, None)] = (version, nspace_names)
+        return nspace_names
+
+    def list_rbd_images(self, ioctx: rados.Ioctx, pool_id: int) -> List[Tuple[str, str]]:
+        """
+        List the (id, name) of the images in the namespace of ``ioctx``,
+        reusing the previous listing if the image directory object did not
+        change since. Unchanged listings are returned as the same object.
+        """
+        key = (pool_id, ioctx.get_namespace())
+        version = self.rbd_object_version(ioctx, 'rbd_directory')
+        cached = self.rbd_listings.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        images = [] if version is None else \
+            [(image_meta['id'], image_meta['name']) for image_meta in RBD().list2(ioctx)]
+        self.rbd_listings[key] = (version, images)
+        return images
 
     def refresh_rbd_stats_pools(self, pools: Dict[str, Set[str]]) -> None:
         self.log.debug('refreshing rbd pools %s' % (pools))
 
-        rbd = RBD()
         counters_info = self.rbd_stats['counters_info']
         for pool_name, cfg_ns_names in pools.items():
             try:
                 pool_id = self.rados.pool_lookup(pool_name)
                 with self.rados.open_ioctx(pool_name) as ioctx:
                     if pool_id not in self.rbd_stats['pools']:
-                        self.rbd_stats['pools'][pool_id] = {'images': {}}
+                        self.rbd_stats['pools'][pool_id] = {'images': {}, 'listings': {}}
                     pool = self.rbd_stats['pools'][pool_id]
                     pool['name'] = pool_name
                     pool['ns_names'] = cfg_ns_names
+                    existing_nspace_names = self.list_rbd_namespaces(ioctx, pool_id)
                     if cfg_ns_names:
                         nspace_names = list(cfg_ns_names)
                     else:
-                        nspace_names = [''] + rbd.namespace_list(ioctx)
-                    for nspace_name in pool['images']:
+                        nspace_names = [''] + existing_nspace_names
+                    for nspace_name in list(pool['images']):
                         if nspace_name not in nspace_names:
                             del pool['images'][nspace_name]
+                            pool['listings'].pop(nspace_name, None)
                     for nspace_name in nspace_names:
-                        if nspace_name and\
-                           not rbd.namespace_exists(ioctx, nspace_name):
+                        if nspace_name and nspace_name not in existing_nspace_names:
                             self.log.debug('unknown namespace %s for pool %s' %
                                            (nspace_name, pool_name))
                             continue
                         ioctx.set_namespace(nspace_name)
-                        if nspace_name not in pool['images']:
-                            pool['images'][nspace_name] = {}
-                        namespace = pool['images'][nspace_name]
+                        listing = self.list_rbd_images(ioctx, pool_id)
+                        if listing is pool['listings'].get(nspace_name):
+                            # the namespace did not change since the last refresh
+                            continue
+                        namespace = pool['images'].get(nspace_name, {})
                         images = {}
-                        for image_meta in RBD().list2(ioctx):
-                            image = {'n': image_meta['name']}
-                            image_id = image_meta['id']
+                        for image_id, image_name in listing:
                             if image_id in namespace:
-                                image['c'] = namespace[image_id]['c']
+                                image = namespace[image_id]
+                                image['n'] = image_name
                             else:
-                                image['c'] = [[0, 0] for x in counters_info]
+                                image = {'n': image_name,
+                                         'c': [[0, 0] for x in counters_info],
+                                         'ops': 0,
+                                         'active': 0.0}
                             images[image_id] = image
                         pool['images'][nspace_name] = images
+                        pool['listings'][nspace_name] = listing
             except Exception as e:
                 self.log.error('failed listing pool %s: %s' % (pool_name, e))
         self.rbd_stats['pools_refresh_time'] = time.time()
 
     def shutdown_rbd_stats(self) -> None:
-        if 'query_id' in self.rbd_stats:
-            self.remove_osd_perf_query(self.rbd_stats['query_id'])
-            del self.rbd_stats['query_id']
-            del self.rbd_stats['query']
+        for shard in self.rbd_stats['queries'].values():
+            self.remove_osd_perf_query(shard['query_id'])
+        self.rbd_stats['queries'].clear()
         self.rbd_stats['pools'].clear()
+        self.rbd_listings.clear()
 
     def add_fixed_name_metrics(self) -> None:
         """
@@ -1726,7 +2468,8 @@ class Module(MgrModule, OrchestratorClientMixin):
         See: https://tracker.ceph.com/issues/45311
         """
         new_metrics = {}
-        for metric_path, metrics in self.metrics.items():
+        # metrics may be added concurrently by other collectors
+        for metric_path, metrics in list(self.metrics.items()):
             # Address RGW sync perf. counters.
             match = re.search(r'^data-sync-from-(.*)\.', metric_path)
             if match:
@@ -1741,9 +2484,11 @@ class Module(MgrModule, OrchestratorClientMixin):
                 for label_values, value in metrics.value.items():
                     new_metrics[new_path].set(value, label_values + (match.group(1),))
 
+        for new_path in new_metrics:
+            self.metric_owners[new_path] = 'get_perf_counters'
         self.metrics.update(new_metrics)
 
-    def get_collect_time_metrics(self) -> None:
+    def get_collect_time_metrics(self, collectors: List[Collector]) -> None:
         sum_metric = self.metrics.get('prometheus_collect_duration_seconds_sum')
         count_metric = self.metrics.get('prometheus_collect_duration_seconds_count')
         if sum_metric is None:
@@ -1759,19 +2504,18 @@ class Module(MgrModule, OrchestratorClientMixin):
                 ('method',))
             self.metrics['prometheus_collect_duration_seconds_count'] = count_metric
 
-        # Collect all timing data and make it available as metric, excluding the
-        # `collect` method because it has not finished at this point and hence
-        # there's no `_execution_duration` attribute to be found. The
-        # `_execution_duration` attribute is added by the `profile_method`
-        # decorator.
-        for method_name, method in Module.__dict__.items():
-            duration = getattr(method, '_execution_duration', None)
-            if duration is not None:
-                cast(MetricCounter, sum_metric).add(duration, (method_name,))
-                cast(MetricCounter, count_metric).add(1, (method_name,))
+        # Make the timing data of the collectors that ran in this cycle
+        # available as metric. `collect` itself has not finished at this
+        # point and is therefore not included.
+        for collector in collectors:
+            cast(MetricCounter, sum_metric).add(collector.duration, (collector.name,))
+            cast(MetricCounter, count_metric).add(1, (collector.name,))
+        for collector in self.collectors:
+            self.metrics['prometheus_collector_last_duration_seconds'].set(
+                collector.duration, (collector.name,))
 
     def get_pool_repaired_objects(self) -> None:
-        dump = self.get('pg_dump')
+        dump = self.get('pg_dump', cached=True)
         for stats in dump['pool_stats']:
             path = 'pool_objects_repaired'
             self.metrics[path].set(stats['stat_sum']['num_objects_repaired'],
@@ -1789,56 +2533,68 @@ class Module(MgrModule, OrchestratorClientMixin):
         """
         Get the perf counters for all daemons
         """
-        for daemon, counters in self.get_unlabeled_perf_counters().items():
-            for path, counter_info in counters.items():
-                # Skip histograms, they are represented by long running avgs
-                stattype = self._stattype_to_str(counter_info['type'])
+        for svc_type, snapshot in self.get_unlabeled_perf_counters_snapshot().items():
+            # Skip histograms, they are represented by long running avgs
+            columns: Dict[str, Tuple[str, int]] = {}
+            for path, counter_schema in zip(snapshot.paths, snapshot.schema):
+                counter_type = cast(int, counter_schema['type'])
+                stattype = self._stattype_to_str(counter_type)
                 if not stattype or stattype == 'histogram':
                     self.log.debug('ignoring %s, type %s' % (path, stattype))
-                    continue
-
-                path, label_names, labels = self._perfpath_to_path_labels(
-                    daemon, path)
-
-                # Get the value of the counter
-                value = self._perfvalue_to_value(
-                    counter_info['type'], counter_info['value'])
+                columns[path] = (stattype, counter_type)
+
+            for row, svc_id in enumerate(snapshot.daemons):
+                daemon = '{}.{}'.format(svc_type, svc_id)
+                # only the counters this daemon has
+                for path, counter_schema, value, count in snapshot.counters(row):
+                    stattype, counter_type = columns[path]
+                    if not stattype or stattype == 'histogram':
+                        continue
 
-                # Represent the long running avgs as sum/count pairs
-                if counter_info['type'] & self.PERFCOUNTER_LONGRUNAVG:
-                    _path = path + '_sum'
-                    if _path not in self.metrics:
-                        self.metrics[_path] = Metric(
-                            stattype,
-                            _path,
-                            counter_info['description'] + ' Total',
-                            label_names,
-                        )
-                    self.metrics[_path].set(value, labels)
-                    _path = path + '_count'
-                    if _path not in self.metrics:
-                        self.metrics[_path] = Metric(
-                            'counter',
-                            _path,
-                            counter_info['description'] + ' Count',
-                            label_names,
-                        )
-                    self.metrics[_path].set(counter_info['count'], labels,)
-                else:
-                    if path not in self.metrics:
-                        self.metrics[path] = Metric(
-                            stattype,
-                            path,
-                            counter_info['description'],
-                            label_names,
-                        )
-                    self.metrics[path].set(value, labels)
+                    path, label_names, labels = self._perfpath_to_path_labels(
+                        daemon, path)
+
+                    # Get the value of the counter
+                    value = self._perfvalue_to_value(counter_type, value)
+
+                    # Represent the long running avgs as sum/count pairs
+                    if counter_type & self.PERFCOUNTER_LONGRUNAVG:
+                        _path = path + '_sum'
+                        if _path not in self.metrics:
+                            self.metrics[_path] = Metric(
+                                stattype,
+                                _path,
+                                cast(str, counter_schema['description']) + ' Total',
+                                label_names,
+                            )
+                            self.metric_owners[_path] = 'get_perf_counters'
+                        self.metrics[_path].set(value, labels)
+                        _path = path + '_count'
+                        if _path not in self.metrics:
+                            self.metrics[_path] = Metric(
+                                'counter',
+                                _path,
+                                cast(str, counter_schema['description']) + ' Count',
+                                label_names,
+                            )
+                            self.metric_owners[_path] = 'get_perf_counters'
+                        self.metrics[_path].set(count, labels,)
+                    else:
+                        if path not in self.metrics:
+                            self.metrics[path] = Metric(
+                                stattype,
+                                path,
+                                cast(str, counter_schema['description']),
+                                label_names,
+                            )
+                            self.metric_owners[path] = 'get_perf_counters'
+                        self.metrics[path].set(value, labels)
         self.add_fixed_name_metrics()
 
     @profile_method()
     def get_smb_metadata(self) -> None:
         try:
-            mgr_map = self.get('mgr_map')
+            mgr_map = self.get('mgr_map', cached=True)
             enabled_modules = mgr_map['modules']
             if 'smb' not in enabled_modules:
                 self.log.debug("SMB module is not enabled, skipping SMB metadata collection")
@@ -1897,40 +2653,92 @@ class Module(MgrModule, OrchestratorClientMixin):
         except Exception as e:
             self.log.error(f"Failed to get SMB metadata: {str(e)}")
 
+    def get_series_dropped_metrics(self) -> None:
+        dropped_metric = self.metrics['prometheus_series_dropped']
+        for name, metric in self.metrics.items():
+            if metric.dropped:
+                dropped_metric.set(metric.dropped, (name,))
+
+    def get_exposition_metrics(self) -> None:
+        self.metrics['prometheus_exposition_size_bytes'].set(self.exposition_size)
+        self.metrics['prometheus_exposition_bytes_served'].set(self.bytes_served)
+        rss = self.get_rss()
+        if rss is not None:
+            self.metrics['prometheus_mgr_rss_bytes'].set(rss)
+
+    @staticmethod
+    def get_rss() -> Optional[int]:
+        # the current resident set size; the peak reported by getrusage()
+        # would never go down after a large collection
+        try:
+            with open('/proc/self/statm') as f:
+                pages = int(f.read().split()[1])
+        except (OSError, IndexError, ValueError):
+            return None
+        return pages * os.sysconf('SC_PAGE_SIZE')
+
+    def count_bytes_served(self, chunks: List[bytes]) -> Iterator[bytes]:
+        """Stream ``chunks`` to a client, accounting for what was written."""
+        served = 0
+        try:
+            for chunk in chunks:
+                yield chunk
+                served += len(chunk)
+        finally:
+            with self.collect_lock:
+                self.bytes_served += served
+
     @profile_method(True)
-    def collect(self) -> str:
-        # Clear the metrics before scraping
-        for k in self.metrics.keys():
-            self.metrics[k].clear()
-
-        self.get_health()
-        self.get_df()
-        self.get_osd_blocklisted_entries()
-        self.get_pool_stats()
-        self.get_fs()
-        self.get_osd_stats()
-        self.get_quorum_status()
-        self.get_mgr_status()
-        self.get_metadata_and_osd_status()
-        self.get_pg_status()
-        self.get_pool_repaired_objects()
-        self.get_num_objects()
-        self.get_all_daemon_health_metrics()
-        self.get_smb_metadata()
-        self.set_cephadm_daemon_status_metrics()
-
-        if not self.get_module_option('exclude_perf_counters'):
-            self.get_perf_counters()
-        self.get_rbd_stats()
-
-        self.get_collect_time_metrics()
-
-        # Return formatted metrics and clear no longer used data
-        _metrics = [m.str_expfmt() for m in self.metrics.values()]
-        for k in self.metrics.keys():
-            self.metrics[k].clear()
-
-        return ''.join(_metrics) + '\n'
+    def collect(self) -> Dict[str, List[bytes]]:
+        now = time.time()
+        collectors = [c for c in self.collectors if c.is_due(now)]
+
+        # Clear the metrics before scraping, keeping the values of
+        # collectors that are not due in this cycle. Metrics of disabled
+        # collectors are cleared, or dropped if they were created at runtime.
+        due = set(c.name for c in collectors)
+        disabled = {c.name: c for c in self.collectors if not c.is_enabled()}
+        for k in list(self.metrics.keys()):
+            owner = self.metric_owners.get(k)
+            if owner in disabled:
+                if k in disabled[owner].metrics:
+                    self.metrics[k].clear()
+                else:
+                    del self.metrics[k]
+                    del self.metric_owners[k]
+            elif owner is None or owner in due:
+                self.metrics[k].clear()
+
+        self.run_collectors(collectors)
+        self.get_collect_time_metrics(collectors)
+        self.get_series_dropped_metrics()
+        self.get_exposition_metrics()
+
+        # Return formatted metrics as a list of chunks per format. Series are
+        # rendered from the per-metric caches, the number of series that had
+        # to be rendered again is reported last.
+        rendered_metric = self.metrics['prometheus_exposition_rendered_series']
+        _metrics: Dict[str, List[bytes]] = {fmt.name: [] for fmt in self.exposition_formats}
+        rendered = 0
+        for m in self.metrics.values():
+            if m is rendered_metric:
+                continue
+            # every format keeps its own cache, count a series once even if
+            # it had to be rendered again for each of them
+            changed = 0
+            for fmt in self.exposition_formats:
+                _metrics[fmt.name].append(m.bytes_expfmt(fmt))
+                changed = max(changed, m.rendered)
+            rendered += changed
+        rendered_metric.set(rendered)
+
+        data: Dict[str, List[bytes]] = {}
+        for fmt in self.exposition_formats:
+            _metrics[fmt.name].append(rendered_metric.bytes_expfmt(fmt))
+            _metrics[fmt.name].append(fmt.footer)
+            data[fmt.name] = coalesce(_metrics.pop(fmt.name))
+        self.exposition_size = sum(len(chunk) for chunk in data[TEXT_FORMAT.name])
+        return data
 
     @CLIReadCommand('prometheus file_sd_config')
     def get_file_sd_config(self) -> Tuple[int, str, str]:
@@ -2068,23 +2876,51 @@ class Module(MgrModule, OrchestratorClientMixin):
 </html>'''
 
             @cherrypy.expose
-            def metrics(self) -> Optional[str]:
+            @cherrypy.config(**{'tools.gzip.on': False, 'response.stream': True})
+            def metrics(self) -> Optional[Iterator[bytes]]:
                 # Lock the function execution
                 assert isinstance(_global_instance, Module)
                 with _global_instance.collect_lock:
-                    return self._metrics(_global_instance)
+                    expositions = self._metrics(_global_instance)
+                if expositions is None:
+                    return None
+                return self._respond(expositions)
+
+            @staticmethod
+            def _respond(expositions: Dict[str, Exposition]) -> Iterator[bytes]:
+                response = cherrypy.response
+                exposition = expositions[Exposition.negotiate_format(
+                    cherrypy.request.headers.elements('Accept'), expositions)]
+                response.headers['Content-Type'] = exposition.format.content_type
+                response.headers['ETag'] = exposition.etag
+                response.headers['Last-Modified'] = exposition.last_modified
+                response.headers['Vary'] = 'Accept, Accept-Encoding'
+                # raises a 304 (Not Modified) redirect for matching
+                # conditional requests
+                cherrypy.lib.cptools.validate_etags()
+                cherrypy.lib.cptools.validate_since()
+
+                encoding = exposition.negotiate(
+                    cherrypy.request.headers.elements('Accept-Encoding'))
+                if encoding != 'identity':
+                    response.headers['Content-Encoding'] = encoding
+                # streamed without a Content-Length, i.e. using chunked
+                # transfer encoding
+                assert isinstance(_global_instance, Module)
+                return _global_instance.count_bytes_served(exposition.encoded(encoding))
 
             @staticmethod
-            def _metrics(instance: 'Module') -> Optional[str]:
+            def _metrics(instance: 'Module') -> Optional[Dict[str, Exposition]]:
                 if not instance.cache:
                     instance.log.debug('Cache disabled, collecting and returning without cache')
-                    return instance.collect()
+                    return {name: Exposition(chunks, fmt=FORMATS[name])
+                            for name, chunks in instance.collect().items()}
 
                 # Return cached data if available
                 if not instance.collect_cache:
                     raise cherrypy.HTTPError(503, 'No cached data available yet')
 
-                def respond() -> Optional[str]:
+                def respond() -> Optional[Dict[str, Exposition]]:
                     assert isinstance(instance, Module)
                     return instance.collect_cache
 
@@ -2118,6 +2954,9 @@ class Module(MgrModule, OrchestratorClientMixin):
 
         # Make the cache timeout for collecting configurable
         self.scrape_interval = cast(float, self.get_localized_module_option('scrape_interval'))
+        self.configure_collectors()
+        self.configure_series_limits()
+        self.configure_exposition_formats()
 
         self.stale_cache_strategy = cast(
             str, self.get_localized_module_option('stale_cache_strategy'))
@@ -2179,6 +3018,9 @@ class Module(MgrModule, OrchestratorClientMixin):
                 server_addr = cast(str, self.get_localized_module_option('server_addr', get_default_addr()))
                 server_port = cast(int, self.get_localized_module_option('server_port', DEFAULT_PORT))
                 self.configure(server_addr, server_port)
+                self.configure_collectors()
+                self.configure_series_limits()
+                self.configure_exposition_formats()
 
                 # Wait for port to be available before starting
                 if not _wait_for_port_available(self.log, server_addr, server_port):
@@ -2200,6 +3042,9 @@ class Module(MgrModule, OrchestratorClientMixin):
         self.shutdown_rbd_stats()
         # wait for the metrics collection thread to stop
         self.metrics_thread.join()
+        if self.collector_pool is not None:
+            self.collector_pool.shutdown()
+            self.collector_pool = None
 
     def shutdown(self) -> None:
         self.log.info('Stopping engine...')
@@ -1,7 +1,16 @@
+from array import array
+import gzip
+import os
+import struct
+import threading
 from typing import Dict
 from unittest import TestCase
 
-from prometheus.module import Metric, LabelValues, Number
+from cherrypy.lib.httputil import header_elements
+
+from tests import mock  # noqa: F401 - mocks ceph_module
+import rados
+from prometheus.module import Collector, Exposition, ExpositionFormat, FORMATS, Metric, MetricCounter, LabelValues, Module, Number, coalesce, varint
 
 
 class MetricGroupTest(TestCase):
@@ -91,3 +100,489 @@ ceph_disk_occupation_display{ceph_daemon="osd.5+osd.6",device="/dev/dm-1",instan
         with self.assertRaises(AssertionError) as cm:
             m.group_by(["foo"], {"bar": "not callable str"})
         self.assertEqual(str(cm.exception), "joins must be callable")
+
+
+class MetricRenderCacheTest(TestCase):
+    def test_only_changed_series_are_rendered(self):
+        m = Metric("gauge", "osd_up", "OSD status up", ("ceph_daemon",))
+        m.set(1, ("osd.0",))
+        m.set(1, ("osd.1",))
+        first = m.str_expfmt()
+        self.assertEqual(m.rendered, 2)
+        self.assertEqual(
+            first,
+            '\n# HELP ceph_osd_up OSD status up'
+            '\n# TYPE ceph_osd_up gauge'
+            '\nceph_osd_up{ceph_daemon="osd.0"} 1.0'
+            '\nceph_osd_up{ceph_daemon="osd.1"} 1.0')
+
+        m.clear()
+        m.set(1, ("osd.0",))
+        m.set(1, ("osd.1",))
+        self.assertEqual(m.str_expfmt(), first)
+        self.assertEqual(m.rendered, 0)
+
+        m.clear()
+        m.set(1, ("osd.0",))
+        m.set(0, ("osd.1",))
+        self.assertEqual(
+            m.str_expfmt(),
+            '\n# HELP ceph_osd_up OSD status up'
+            '\n# TYPE ceph_osd_up gauge'
+            '\nceph_osd_up{ceph_daemon="osd.0"} 1.0'
+            '\nceph_osd_up{ceph_daemon="osd.1"} 0.0')
+        self.assertEqual(m.rendered, 1)
+
+    def test_removed_series_are_dropped(self):
+        m = Metric("gauge", "osd_up", "OSD status up", ("ceph_daemon",))
+        m.set(1, ("osd.0",))
+        m.set(1, ("osd.1",))
+        m.str_expfmt()
+        m.clear()
+        m.set(1, ("osd.1",))
+        self.assertEqual(
+            m.str_expfmt(),
+            '\n# HELP ceph_osd_up OSD status up'
+            '\n# TYPE ceph_osd_up gauge'
+            '\nceph_osd_up{ceph_daemon="osd.1"} 1.0')
+        self.assertEqual(m.rendered, 0)
+        self.assertEqual(list(m._lines['text']), [("osd.1",)])
+
+
+class CollectorTest(TestCase):
+    def setUp(self):
+        self.mod = Module('prometheus', 0, 0)
+        self.calls = []
+
+    def _collector(self, name, metrics=(), after=(), interval=0.0):
+        def func():
+            self.calls.append(name)
+            for key in metrics:
+                self.mod.metrics[key].set(self.calls.count(name))
+        func.__name__ = name
+        c = Collector(func, metrics, after)
+        c.interval = interval
+        return c
+
+    def test_run_collectors_honours_dependencies(self):
+        first = self._collector('first')
+        second = self._collector('second', after=('first',))
+        third = self._collector('third', after=('second',))
+        self.mod.run_collectors([third, second, first])
+        self.assertEqual(self.calls, ['first', 'second', 'third'])
+
+    def test_run_collectors_ignores_dependencies_not_due(self):
+        second = self._collector('second', after=('first',))
+        self.mod.run_collectors([second])
+        self.assertEqual(self.calls, ['second'])
+
+    def test_failing_collector_does_not_stop_others(self):
+        def broken():
+            raise RuntimeError('boom')
+        failing = Collector(broken)
+        ok = self._collector('ok')
+        self.mod.run_collectors([failing, ok])
+        self.assertEqual(self.calls, ['ok'])
+        self.assertEqual(failing.last_run, 0.0)
+        self.assertTrue(failing.is_due(1.0))
+
+    def test_collector_not_due_keeps_its_values(self):
+        fast = self._collector('fast', ('health_status',))
+        slow = self._collector('slow', ('num_objects_degraded',), interval=3600)
+        self.mod.collectors = [fast, slow]
+        self.mod.metric_owners = {'health_status': 'fast', 'num_objects_degraded': 'slow'}
+
+        body = b''.join(self.mod.collect()['text']).decode()
+        self.assertEqual(sorted(self.calls), ['fast', 'slow'])
+        self.assertIn('\nceph_num_objects_degraded 1.0', body)
+
+        body = b''.join(self.mod.collect()['text']).decode()
+        self.assertEqual(sorted(self.calls), ['fast', 'fast', 'slow'])
+        self.assertIn('\nceph_health_status 2.0', body)
+        self.assertIn('\nceph_num_objects_degraded 1.0', body)
+        self.assertIn('ceph_prometheus_collector_last_duration_seconds{collector="slow"}', body)
+
+    def test_disabled_collector_metrics_are_removed(self):
+        def get_perf_counters():
+            self.mod.metrics['health_status'].set(1)
+            if 'osd_op_r' not in self.mod.metrics:
+                self.mod.metrics['osd_op_r'] = Metric('counter', 'osd_op_r', '', ('ceph_daemon',))
+                self.mod.metric_owners['osd_op_r'] = 'get_perf_counters'
+            self.mod.metrics['osd_op_r'].set(5, ('osd.0',))
+        perf = Collector(get_perf_counters, ('health_status',),
+                         enabled=lambda: not self.mod.get_module_option('exclude_perf_counters'))
+        self.mod.collectors = [perf]
+        self.mod.metric_owners = {'health_status': 'get_perf_counters'}
+
+        self.mod.set_module_option('exclude_perf_counters', False)
+        body = b''.join(self.mod.collect()['text']).decode()
+        self.assertIn('\nceph_osd_op_r{ceph_daemon="osd.0"} 5.0', body)
+        self.assertIn('\nceph_health_status 1.0', body)
+
+        self.mod.set_module_option('exclude_perf_counters', True)
+        body = b''.join(self.mod.collect()['text']).decode()
+        self.assertNotIn('ceph_osd_op_r', body)
+        self.assertNotIn('osd_op_r', self.mod.metric_owners)
+        self.assertNotIn('\nceph_health_status 1.0', body)
+
+        self.mod.set_module_option('exclude_perf_counters', False)
+        body = b''.join(self.mod.collect()['text']).decode()
+        self.assertIn('\nceph_osd_op_r{ceph_daemon="osd.0"} 5.0', body)
+
+    def test_rendered_series_counted_once(self):
+        self.mod.collectors = [self._collector('fast', ('health_status',))]
+        self.mod.metric_owners = {'health_status': 'fast'}
+        self.mod.exposition_formats = [FORMATS['text'], FORMATS['openmetrics'], FORMATS['protobuf']]
+
+        self.mod.collect()
+        rendered_metric = self.mod.metrics['prometheus_exposition_rendered_series']
+        series = sum(len(m.value) for m in self.mod.metrics.values() if m is not rendered_metric)
+        # everything is rendered in all three formats the first time
+        self.assertEqual(rendered_metric.value[('',)], series)
+
+
+class PerfCountersTest(TestCase):
+    def test_only_present_counters_are_exported(self):
+        schema = [
+            ('osd.op_r', 'Client read operations', '', 10, 8, 1),
+            ('osd.op_r_latency', 'Latency of read operation', '', 5, 8, 1),
+        ]
+
+        def bulk(svc_type, prio_limit, known_schema_version):
+            if svc_type != 'osd':
+                return {'schema_version': 1, 'daemons': [], 'schema': [],
+                        'values': b'', 'counts': b'', 'present': b''}
+            # osd.0 has no latency counter, osd.1 has no read counter
+            return {
+                'schema_version': 1,
+                'daemons': ['0', '1'],
+                'schema': schema,
+                'values': array('q', [10, 0, 0, 400]).tobytes(),
+                'counts': array('q', [0, 0, 0, 4]).tobytes(),
+                'present': bytes([1, 0, 0, 1]),
+            }
+
+        mod = Module('prometheus', 0, 0)
+        mod._ceph_get_unlabeled_perf_counters_bulk = bulk
+        mod.get_perf_counters()
+        self.assertEqual(mod.metrics['osd.op_r'].value, {('osd.0',): 10})
+        self.assertEqual(mod.metrics['osd.op_r_latency_count'].value, {('osd.1',): 4})
+        self.assertEqual(list(mod.metrics['osd.op_r_latency_sum'].value), [('osd.1',)])
+
+
+class ExpositionTest(TestCase):
+    def setUp(self):
+        self.exposition = Exposition([b'\n# HELP ceph_health_status', b'\nceph_health_status 0.0\n'], 0)
+
+    def negotiate(self, accept_encoding):
+        return self.exposition.negotiate(header_elements('Accept-Encoding', accept_encoding))
+
+    def test_etag_depends_on_body(self):
+        self.assertEqual(self.exposition.etag, Exposition([self.exposition.body]).etag)
+        self.assertNotEqual(self.exposition.etag, Exposition([b'other']).etag)
+        self.assertEqual(self.exposition.last_modified, 'Thu, 01 Jan 1970 00:00:00 GMT')
+
+    def test_negotiate(self):
+        self.assertEqual(self.negotiate(''), 'identity')
+        self.assertEqual(self.negotiate('gzip'), 'gzip')
+        self.assertEqual(self.negotiate('br, gzip;q=0.5'), 'gzip')
+        self.assertEqual(self.negotiate('gzip;q=0'), 'identity')
+        self.assertEqual(self.negotiate('identity, gzip;q=0.5'), 'identity')
+        self.assertEqual(self.negotiate('*'), Exposition.encodings()[0])
+
+    def test_encoded_once(self):
+        body = self.exposition.encoded('gzip')
+        self.assertEqual(gzip.decompress(b''.join(body)), self.exposition.body)
+        self.assertIs(self.exposition.encoded('gzip'), body)
+        self.assertIs(self.exposition.encoded('identity'), self.exposition.chunks)
+        with self.assertRaises(ValueError):
+            self.exposition.encoded('br')
+
+
+class CoalesceTest(TestCase):
+    def test_small_parts_are_merged(self):
+        self.assertEqual(coalesce([b'ab', b'', b'cd', b'e'], size=4), [b'abcd', b'e'])
+
+    def test_large_parts_are_not_copied(self):
+        large = b'x' * 8
+        chunks = coalesce([large, b'a', b'b'], size=4)
+        self.assertIs(chunks[0], large)
+        self.assertEqual(chunks[1:], [b'ab'])
+
+    def test_bytes_served(self):
+        mod = Module.__new__(Module)
+        mod.collect_lock = threading.Lock()
+        mod.bytes_served = 0
+        stream = mod.count_bytes_served([b'abc', b'de'])
+        next(stream)
+        stream.close()
+        self.assertEqual(mod.bytes_served, 0)
+        self.assertEqual(b''.join(mod.count_bytes_served([b'abc', b'de'])), b'abcde')
+        self.assertEqual(mod.bytes_served, 5)
+
+    def test_rss_is_current(self):
+        statm = '100 25 3 1 0 10 0\n'
+        with mock.patch('builtins.open', mock.mock_open(read_data=statm)):
+            self.assertEqual(Module.get_rss(), 25 * os.sysconf('SC_PAGE_SIZE'))
+        with mock.patch('builtins.open', side_effect=OSError):
+            self.assertIsNone(Module.get_rss())
+
+
+class FakeIoctx(object):
+    def __init__(self, versions):
+        # (namespace, oid) -> version, missing objects are not found
+        self.versions = versions
+        self.namespace = ''
+        self.last_version = 0
+
+    def stat(self, oid):
+        key = (self.namespace, oid)
+        if key not in self.versions:
+            raise rados.ObjectNotFound(oid)
+        self.last_version = self.versions[key]
+        return 0, None
+
+    def get_last_version(self):
+        return self.last_version
+
+    def get_namespace(self):
+        return self.namespace
+
+    def set_namespace(self, nspace):
+        self.namespace = nspace
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class RbdStatsTest(TestCase):
+    def setUp(self):
+        self.mod = Module('prometheus', 0, 0)
+        self.options = {'rbd_stats_pools': 'rbd', 'rbd_stats_pools_refresh_interval': 300,
+                        'rbd_stats_top_n': 0, 'rbd_stats_idle_timeout': 0}
+        self.mod.get_localized_module_option = \
+            lambda key, default=None: self.options.get(key, default)
+        self.ioctx = FakeIoctx({('', 'rbd_directory'): 1})
+        self.images = [{'id': 'i1', 'name': 'img1'}, {'id': 'i2', 'name': 'img2'}]
+        patcher = mock.patch('prometheus.module.RBD')
+        self.rbd = patcher.start()
+        self.rbd.return_value.list2.side_effect = lambda ioctx: list(self.images)
+        self.rbd.return_value.namespace_list.return_value = []
+        self.addCleanup(patcher.stop)
+        self.mod._rados = mock.MagicMock()
+        self.mod._rados.pool_lookup.return_value = 1
+        self.mod._rados.open_ioctx.side_effect = lambda name: FakeIoctx(self.ioctx.versions)
+
+    def test_unchanged_directory_is_not_relisted(self):
+        first = self.mod.list_rbd_images(self.ioctx, 1)
+        self.assertEqual(first, [('i1', 'img1'), ('i2', 'img2')])
+        self.assertIs(self.mod.list_rbd_images(self.ioctx, 1), first)
+        self.assertEqual(self.rbd.return_value.list2.call_count, 1)
+
+        self.images.pop()
+        self.ioctx.versions[('', 'rbd_directory')] = 2
+        self.assertEqual(self.mod.list_rbd_images(self.ioctx, 1), [('i1', 'img1')])
+        self.assertEqual(self.rbd.return_value.list2.call_count, 2)
+
+    def test_missing_directory_has_no_images(self):
+        self.ioctx.versions.clear()
+        self.assertEqual(self.mod.list_rbd_images(self.ioctx, 1), [])
+        self.rbd.return_value.list2.assert_not_called()
+
+    def test_refresh_keeps_counters(self):
+        self.mod.refresh_rbd_stats_pools({'rbd': set()})
+        images = self.mod.rbd_stats['pools'][1]['images']['']
+        images['i1']['c'][0][0] = 5
+
+        self.images.append({'id': 'i3', 'name': 'img3'})
+        self.ioctx.versions[('', 'rbd_directory')] = 2
+        self.mod.refresh_rbd_stats_pools({'rbd': set()})
+        images = self.mod.rbd_stats['pools'][1]['images']['']
+        self.assertEqual(sorted(images), ['i1', 'i2', 'i3'])
+        self.assertEqual(images['i1']['c'][0][0], 5)
+
+    def test_one_query_per_pool(self):
+        self.mod.get = lambda name, cached=False: {'pools': [
+            {'pool': 1, 'pool_name': 'rbd', 'application_metadata': {'rbd': {}}},
+            {'pool': 2, 'pool_name': 'rbd2', 'application_metadata': {'rbd': {}}},
+        ]}
+        self.options['rbd_stats_pools'] = 'rbd rbd2/ns'
+        self.mod._rados.pool_lookup.side_effect = lambda name: {'rbd': 1, 'rbd2': 2}[name]
+        self.ioctx.versions[('', 'rbd_namespace')] = 1
+        self.ioctx.versions[('ns', 'rbd_directory')] = 1
+        self.rbd.return_value.namespace_list.return_value = ['ns']
+        query_ids = {'^(1)$': 10, '^(2)$': 20}
+        self.mod.add_osd_perf_query = mock.MagicMock(
+            side_effect=lambda query: query_ids[query['key_descriptor'][0]['regex']])
+        self.mod.get_osd_perf_counters = mock.MagicMock(side_effect=lambda query_id: {
+            10: {'counters': [{'k': [['1'], [''], ['', 'i1']],
+                               'c': [[3, 0], [1, 0], [0, 0], [0, 0], [0, 0], [0, 0]]}]},
+            20: None,
+        }.get(query_id))
+
+        self.mod.get_rbd_stats()
+
+        queries = self.mod.rbd_stats['queries']
+        self.assertEqual(sorted(queries), [1, 2])
+        self.assertEqual(queries[1]['query']['key_descriptor'][0]['regex'], '^(1)$')
+        self.assertEqual(queries[2]['query']['key_descriptor'][1]['regex'], '^(ns)$')
+        self.assertEqual(self.mod.metrics['rbd_write_ops'].value[('rbd', '', 'img1')], 3)
+        self.assertEqual(self.mod.metrics['rbd_stats_images'].value[('tracked',)], 6)
+
+        # only the query of the pool whose namespaces changed is replaced
+        self.mod.remove_osd_perf_query = mock.MagicMock()
+        query_ids['^(2)$'] = 30
+        self.options['rbd_stats_pools'] = 'rbd rbd2'
+        self.mod.get_rbd_stats()
+        self.mod.remove_osd_perf_query.assert_called_once_with(20)
+        self.assertEqual(queries[1]['query_id'], 10)
+        self.assertEqual(queries[2]['query_id'], 30)
+
+    def _image(self, name, ops, active):
+        return {'n': name, 'c': [], 'ops': ops, 'active': active}
+
+    def test_exported_images(self):
+        images = {'a': self._image('a', 5, 100.0), 'b': self._image('b', 0, 10.0),
+                  'c': self._image('c', 1, 100.0)}
+        self.mod.rbd_stats['pools'] = {1: {'name': 'rbd', 'images': {'': images}}}
+
+        exported = self.mod.rbd_stats_exported_images(100.0)
+        self.assertEqual(len(exported), 3)
+        self.assertEqual(images['a']['ops'], 0)
+
+        self.options['rbd_stats_idle_timeout'] = 60
+        for image, ops in (('a', 5), ('c', 1)):
+            images[image]['ops'] = ops
+        exported = self.mod.rbd_stats_exported_images(100.0)
+        self.assertEqual(sorted(image['n'] for _, _, image in exported), ['a', 'c'])
+
+        self.options['rbd_stats_top_n'] = 1
+        images['a']['ops'] = 5
+        exported = self.mod.rbd_stats_exported_images(100.0)
+        self.assertEqual([image['n'] for _, _, image in exported], ['a'])
+        self.assertEqual(self.mod.metrics['rbd_stats_images'].value[('tracked',)], 3)
+        self.assertEqual(self.mod.metrics['rbd_stats_images'].value[('exported',)], 1)
+
+
+class SeriesLimitTest(TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, Metric, 'series_limits', Metric.series_limits)
+        self.addCleanup(setattr, Metric, 'default_series_limit', Metric.default_series_limit)
+
+    def test_excess_gauges_are_dropped(self):
+        Metric.series_limits = {'osd_up': 2}
+        m = Metric("gauge", "osd_up", "OSD status up", ("ceph_daemon", "hostname"))
+        for i in range(5):
+            m.set(1, ("osd.{}".format(i), "node"))
+        m.set(0, ("osd.0", "node"))
+        self.assertEqual(m.value, {("osd.0", "node"): 0,
+                                   ("osd.1", "node"): 1})
+        self.assertEqual(m.dropped, 3)
+        m.clear()
+        self.assertEqual(m.dropped, 0)
+
+    def test_excess_counters_are_folded(self):
+        Metric.series_limits = {'rbd_write_ops': 2}
+        m = Metric("counter", "rbd_write_ops", "RBD image writes count", ("pool", "image"))
+        for i in range(5):
+            m.set(i, ("rbd", "img{}".format(i)))
+        m.set(7, ("rbd", "img0"))
+        self.assertEqual(m.value, {("rbd", "img0"): 7,
+                                   ("rbd", "img1"): 1,
+                                   ("__other__", "__other__"): 9})
+        self.assertEqual(m.dropped, 3)
+
+    def test_counter_is_folded(self):
+        Metric.default_series_limit = 1
+        m = MetricCounter("collect_duration", "duration", ("method",))
+        m.add(1, ("a",))
+        m.add(2, ("b",))
+        m.add(3, ("c",))
+        m.add(1, ("a",))
+        self.assertEqual(dict(m.value), {("a",): 2, ("__other__",): 5})
+
+    def test_configure(self):
+        mod = Module('prometheus', 0, 0)
+        options = {'series_limit': 10, 'series_limits': 'osd_up=2, bogus pool_metadata=0'}
+        mod.get_localized_module_option = lambda key, default=None: options.get(key, default)
+        mod.configure_series_limits()
+        self.assertEqual(mod.metrics['osd_up'].limit, 2)
+        self.assertEqual(mod.metrics['pool_metadata'].limit, 0)
+        self.assertEqual(mod.metrics['osd_metadata'].limit, 10)
+        self.assertEqual(Metric("gauge", "rbd_write_ops", "").limit, 10)
+
+        for i in range(4):
+            mod.metrics['osd_up'].set(1, ("osd.{}".format(i),))
+        mod.get_series_dropped_metrics()
+        self.assertEqual(mod.metrics['prometheus_series_dropped'].value, {('osd_up',): 2})
+
+
+class HealthHistoryTest(TestCase):
+    def test_new_check_is_saved(self):
+        mod = Module('prometheus', 0, 0)
+        checker = threading.Thread(
+            target=mod.health_history.check,
+            args=({'checks': {'SLOW_OPS': {'severity': 'HEALTH_WARN'}}},),
+            daemon=True)
+        checker.start()
+        checker.join(timeout=10)
+        self.assertFalse(checker.is_alive(), 'HealthHistory.check() deadlocked')
+        self.assertIn('SLOW_OPS', mod.get_store(mod.health_history.kv_name))
+
+
+class ExpositionFormatTest(TestCase):
+    def setUp(self):
+        self.counter = Metric("counter", "osd_op_r", "Client read operations", ("ceph_daemon",))
+        self.counter.set(5, ("osd.0",))
+        self.gauge = Metric("gauge", "health_status", "Cluster health status")
+        self.gauge.set(1)
+
+    def test_openmetrics(self):
+        fmt = FORMATS['openmetrics']
+        body = self.counter.bytes_expfmt(fmt) + self.gauge.bytes_expfmt(fmt) + fmt.footer
+        self.assertEqual(
+            body.decode(),
+            '# HELP ceph_osd_op_r Client read operations\n'
+            '# TYPE ceph_osd_op_r counter\n'
+            'ceph_osd_op_r_total{ceph_daemon="osd.0"} 5.0\n'
+            '# HELP ceph_health_status Cluster health status\n'
+            '# TYPE ceph_health_status gauge\n'
+            'ceph_health_status 1.0\n'
+            '# EOF\n')
+        # the text format is rendered and cached independently
+        self.assertIn(b'\nceph_osd_op_r{ceph_daemon="osd.0"} 5.0', self.counter.bytes_expfmt())
+
+    def test_protobuf(self):
+        body = self.counter.bytes_expfmt(FORMATS['protobuf'])
+        label = b'\x0a\x0bceph_daemon\x12\x05osd.0'
+        sample = b'\x0a' + bytes([len(label)]) + label + b'\x1a\x09\x09' + struct.pack('<d', 5.0)
+        family = (b'\x0a\x0dceph_osd_op_r\x12\x16Client read operations\x18\x00'
+                  + b'\x22' + bytes([len(sample)]) + sample)
+        self.assertEqual(body, bytes([len(family)]) + family)
+
+    def test_formats_implement_the_abstract_methods(self):
+        with self.assertRaises(TypeError):
+            ExpositionFormat()
+        for fmt in FORMATS.values():
+            self.assertIsInstance(fmt, ExpositionFormat)
+
+    def test_varint(self):
+        self.assertEqual(varint(1), b'\x01')
+        self.assertEqual(varint(300), b'\xac\x02')
+
+    def test_negotiate_format(self):
+        def negotiate(accept, available=('text', 'openmetrics', 'protobuf')):
+            return Exposition.negotiate_format(header_elements('Accept', accept), available)
+
+        self.assertEqual(negotiate(''), 'text')
+        self.assertEqual(negotiate('application/openmetrics-text; version=1.0.0,'
+                                   'text/plain;version=0.0.4;q=0.5,*/*;q=0.1'), 'openmetrics')
+        self.assertEqual(negotiate('application/vnd.google.protobuf;'
+                                   'proto=io.prometheus.client.MetricFamily;encoding=delimited;q=0.7,'
+                                   'text/plain;version=0.0.4;q=0.3'), 'protobuf')
+        self.assertEqual(negotiate('application/vnd.google.protobuf;q=0.7,'
+                                   'text/plain;version=0.0.4;q=0.3'), 'text')
+        self.assertEqual(negotiate('application/openmetrics-text', ('text',)), 'text')
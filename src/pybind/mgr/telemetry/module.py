@@ -4,12 +4,14 @@ Telemetry module for ceph-mgr
 Collect statistics from Ceph cluster and send this back to the Ceph project
 when user has opted-in
 """
+import copy
 import logging
 import numbers
 import enum
 import errno
 import hashlib
 import json
+import operator
 import rbd
 import requests
 import uuid
@@ -17,10 +19,10 @@ import time
 from datetime import datetime, timedelta
 from prettytable import PrettyTable
 from threading import Event, Lock
-from collections import defaultdict
-from typing import cast, Any, DefaultDict, Dict, List, Optional, Tuple, TypeVar, TYPE_CHECKING, Union
+from collections import defaultdict, deque
+from typing import cast, Any, Callable, DefaultDict, Deque, Dict, Iterator, List, Optional, Tuple, TypeVar, TYPE_CHECKING, Union
 
-from mgr_module import CLICommand, CLIReadCommand, MgrModule, Option, OptionValue, ServiceInfoT
+from mgr_module import CLICommand, CLIReadCommand, CommandResult, MgrModule, Option, OptionValue, ServiceInfoT
 
 
 ALL_CHANNELS = ['basic', 'ident', 'crash', 'device', 'perf']
@@ -30,6 +32,8 @@ LICENSE_NAME = 'Community Data License Agreement - Sharing - Version 1.0'
 LICENSE_URL = 'https://cdla.io/sharing-1-0/'
 NO_SALT_CNT = 0
 
+T = TypeVar('T')
+
 # Latest revision of the telemetry report.  Bump this each time we make
 # *any* change.
 REVISION = 3
@@ -252,6 +256,24 @@ class Module(MgrModule):
                type='bool',
                default=False,
                desc='Share various performance metrics of a cluster'),
+        Option(name='gather_concurrency',
+               type='int',
+               default=16,
+               min=1,
+               desc='Number of daemons queried at once while compiling a report'),
+        Option(name='gather_timeout',
+               type='int',
+               default=60,
+               min=1,
+               desc='Seconds to wait for a daemon to answer while compiling a report'),
+        Option(name='report_cache_ttl',
+               type='int',
+               default=60,
+               min=0,
+               desc='Seconds the data gathered for a channel is reused by later reports',
+               long_desc=('Lets `telemetry show`, `preview` and `send` run within this '
+                          'many seconds of each other share one collection; 0 disables '
+                          'the cache')),
     ]
 
     @property
@@ -270,6 +292,8 @@ class Module(MgrModule):
         self.report_id: Optional[str] = None
         self.salt: Optional[str] = None
         self.get_report_lock = Lock()
+        # (channel, opted-in collections of the channel) -> (gathered at, data)
+        self.channel_cache: Dict[Tuple[str, Tuple[str, ...]], Tuple[float, Any]] = {}
         self.config_update_module_option()
         # for mypy which does not run the code
         if TYPE_CHECKING:
@@ -286,6 +310,9 @@ class Module(MgrModule):
             self.channel_crash = True
             self.channel_device = True
             self.channel_perf = False
+            self.gather_concurrency = 0
+            self.gather_timeout = 0
+            self.report_cache_ttl = 0
             self.db_collection = ['basic_base', 'device_base']
             self.last_opted_in_ceph_version = 17
             self.last_opted_out_ceph_version = 0
@@ -498,36 +525,71 @@ class Module(MgrModule):
 
         return  etype + '.' + m.hexdigest()
 
-    def get_heap_stats(self) -> Dict[str, dict]:
-        result: Dict[str, dict] = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
-        anonymized_daemons = {}
-        osd_map = self.get('osd_map')
+    def tell_daemons(self,
+                     targets: List[Tuple[str, str, Dict[str, Any]]]) -> Iterator[Tuple[int, str, str]]:
+        """
+        Send the command to each (daemon type, daemon id, command) of
+        ``targets`` with up to ``gather_concurrency`` commands in flight.
 
-        # Combine available daemons
+        :return: the result of each like tell_command(), in order
+        """
+        in_flight: Deque[Tuple[str, str, CommandResult, float]] = deque()
+        for daemon_type, daemon_id, cmd_dict in targets:
+            if len(in_flight) >= max(1, self.gather_concurrency):
+                yield self._wait_daemon(*in_flight.popleft())
+            result = CommandResult('')
+            self.send_command(result, daemon_type, daemon_id, json.dumps(cmd_dict), '')
+            in_flight.append((daemon_type, daemon_id, result,
+                              time.monotonic() + self.gather_timeout))
+        while in_flight:
+            yield self._wait_daemon(*in_flight.popleft())
+
+    def _wait_daemon(self,
+                     daemon_type: str,
+                     daemon_id: str,
+                     result: CommandResult,
+                     deadline: float) -> Tuple[int, str, str]:
+        r, outb, outs = result.wait(max(0.0, deadline - time.monotonic()))
+        if r == -errno.ETIMEDOUT:
+            self.log.warning('Timed out waiting for {}.{}'.format(daemon_type, daemon_id))
+        return r, outb, outs
+
+    def get_memory_daemons(self) -> List[Tuple[str, str]]:
         daemons = []
+        osd_map = self.get('osd_map')
         for osd in osd_map['osds']:
-            daemons.append('osd'+'.'+str(osd['osd']))
-        # perf_memory_metrics collection (1/2)
+            daemons.append(('osd', str(osd['osd'])))
+        # perf_memory_metrics collection
         if self.is_enabled_collection(Collection.perf_memory_metrics):
             mon_map = self.get('mon_map')
             mds_metadata = self.get('mds_metadata')
             for mon in mon_map['mons']:
-                daemons.append('mon'+'.'+mon['name'])
+                daemons.append(('mon', mon['name']))
             for mds in mds_metadata:
-                daemons.append('mds'+'.'+mds)
+                daemons.append(('mds', mds))
+        return daemons
+
+    def get_heap_stats(self) -> Dict[str, dict]:
+        result: Dict[str, dict] = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+        anonymized_daemons = {}
 
         # Grab output from the "daemon.x heap stats" command
-        for daemon in daemons:
-            daemon_type, daemon_id = daemon.split('.', 1)
-            heap_stats = self.parse_heap_stats(daemon_type, daemon_id)
+        daemons = self.get_memory_daemons()
+        cmd_dict = {
+            'prefix': 'heap',
+            'heapcmd': 'stats'
+        }
+        replies = self.tell_daemons([(daemon_type, daemon_id, cmd_dict)
+                                     for daemon_type, daemon_id in daemons])
+        for (daemon_type, daemon_id), (r, outb, outs) in zip(daemons, replies):
+            heap_stats = self._parse_heap_stats(daemon_type, daemon_id, cmd_dict, r, outb, outs)
             if heap_stats:
+                daemon = daemon_type + '.' + daemon_id
                 if (daemon_type != 'osd'):
                     # Anonymize mon and mds
                     anonymized_daemons[daemon] = self.anonymize_entity_name(daemon)
                     daemon = anonymized_daemons[daemon]
                 result[daemon_type][daemon] = heap_stats
-            else:
-                continue
 
         if anonymized_daemons:
             # for debugging purposes only, this data is never reported
@@ -535,13 +597,21 @@ class Module(MgrModule):
         return result
 
     def parse_heap_stats(self, daemon_type: str, daemon_id: Any) -> Dict[str, int]:
-        parsed_output = {}
-
         cmd_dict = {
             'prefix': 'heap',
             'heapcmd': 'stats'
         }
         r, outb, outs = self.tell_command(daemon_type, str(daemon_id), cmd_dict)
+        return self._parse_heap_stats(daemon_type, daemon_id, cmd_dict, r, outb, outs)
+
+    def _parse_heap_stats(self,
+                          daemon_type: str,
+                          daemon_id: Any,
+                          cmd_dict: Dict[str, str],
+                          r: int,
+                          outb: str,
+                          outs: str) -> Dict[str, int]:
+        parsed_output = {}
 
         if r != 0:
             self.log.error("Invalid command dictionary: {}".format(cmd_dict))
@@ -576,29 +646,17 @@ class Module(MgrModule):
     def get_mempool(self, mode: str = 'separated') -> Dict[str, dict]:
         result: Dict[str, dict] = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
         anonymized_daemons = {}
-        osd_map = self.get('osd_map')
-
-        # Combine available daemons
-        daemons = []
-        for osd in osd_map['osds']:
-            daemons.append('osd'+'.'+str(osd['osd']))
-        # perf_memory_metrics collection (2/2)
-        if self.is_enabled_collection(Collection.perf_memory_metrics):
-            mon_map = self.get('mon_map')
-            mds_metadata = self.get('mds_metadata')
-            for mon in mon_map['mons']:
-                daemons.append('mon'+'.'+mon['name'])
-            for mds in mds_metadata:
-                daemons.append('mds'+'.'+mds)
 
         # Grab output from the "dump_mempools" command
-        for daemon in daemons:
-            daemon_type, daemon_id = daemon.split('.', 1)
-            cmd_dict = {
-                'prefix': 'dump_mempools',
-                'format': 'json'
-            }
-            r, outb, outs = self.tell_command(daemon_type, daemon_id, cmd_dict)
+        daemons = self.get_memory_daemons()
+        cmd_dict = {
+            'prefix': 'dump_mempools',
+            'format': 'json'
+        }
+        replies = self.tell_daemons([(daemon_type, daemon_id, cmd_dict)
+                                     for daemon_type, daemon_id in daemons])
+        for (daemon_type, daemon_id), (r, outb, outs) in zip(daemons, replies):
+            daemon = daemon_type + '.' + daemon_id
             if r != 0:
                 self.log.error("Invalid command dictionary: {}".format(cmd_dict))
                 continue
@@ -628,116 +686,96 @@ class Module(MgrModule):
 
         return result
 
+    @staticmethod
+    def get_histogram_axis(axis: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'buckets': axis['buckets'],
+            'min': axis['min'],
+            'name': axis['name'],
+            'quant_size': axis['quant_size'],
+            'scale_type': axis['scale_type'],
+            # Collecting ranges; placing them in lists to
+            # improve readability later on.
+            'ranges': [[_range.get('min'), _range.get('max')] for _range in axis['ranges']],
+        }
+
     def get_osd_histograms(self, mode: str = 'separated') -> List[Dict[str, dict]]:
-        # Initialize result dict
-        result: Dict[str, dict] = defaultdict(lambda: defaultdict(
-                                              lambda: defaultdict(
-                                              lambda: defaultdict(
-                                              lambda: defaultdict(
-                                              lambda: defaultdict(int))))))
-
-        # Get list of osd ids from the metadata
-        osd_metadata = self.get('osd_metadata')
-
-        # Grab output from the "osd.x perf histogram dump" command
-        for osd_id in osd_metadata:
-            cmd_dict = {
-                'prefix': 'perf histogram dump',
-                'id': str(osd_id),
-                'format': 'json'
-            }
-            r, outb, outs = self.osd_command(cmd_dict)
+        if mode not in ('separated', 'aggregated'):
+            self.log.error('Incorrect mode specified in get_osd_histograms: {}'.format(mode))
+            return list()
+
+        # The key of a histogram config is the string form of its axes list
+        # (str(axes)), so that histograms with different axis configs will
+        # not be combined. These key names are dropped when only the values
+        # are returned.
+        result: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # 'aggregated' mode sums the values of a histogram as one flat list,
+        # along with the length of each of its rows: (config, histogram) ->
+        # (row lengths, sums)
+        sums: Dict[Tuple[str, str], Tuple[List[int], List[int]]] = {}
+
+        # Grab output from the "osd.x perf histogram dump" command of every
+        # osd in the metadata
+        osd_ids = list(self.get('osd_metadata'))
+        targets = [('osd', str(osd_id), {
+            'prefix': 'perf histogram dump',
+            'id': str(osd_id),
+            'format': 'json'
+        }) for osd_id in osd_ids]
+        for osd_id, (_, _, cmd_dict), (r, outb, outs) in zip(osd_ids, targets,
+                                                             self.tell_daemons(targets)):
             # Check for invalid calls
             if r != 0:
                 self.log.error("Invalid command dictionary: {}".format(cmd_dict))
                 continue
-            else:
-                try:
-                    # This is where the histograms will land if there are any.
-                    dump = json.loads(outb)
+            try:
+                # This is where the histograms will land if there are any.
+                dump = json.loads(outb)
 
-                    for histogram in dump['osd']:
-                        # Log axis information. There are two axes, each represented
-                        # as a dictionary. Both dictionaries are contained inside a
-                        # list called 'axes'.
-                        axes = []
-                        for axis in dump['osd'][histogram]['axes']:
-
-                            # This is the dict that contains information for an individual
-                            # axis. It will be appended to the 'axes' list at the end.
-                            axis_dict: Dict[str, Any] = defaultdict()
-
-                            # Collecting information for buckets, min, name, etc.
-                            axis_dict['buckets'] = axis['buckets']
-                            axis_dict['min'] = axis['min']
-                            axis_dict['name'] = axis['name']
-                            axis_dict['quant_size'] = axis['quant_size']
-                            axis_dict['scale_type'] = axis['scale_type']
-
-                            # Collecting ranges; placing them in lists to
-                            # improve readability later on.
-                            ranges = []
-                            for _range in axis['ranges']:
-                                _max, _min = None, None
-                                if 'max' in _range:
-                                    _max = _range['max']
-                                if 'min' in _range:
-                                    _min = _range['min']
-                                ranges.append([_min, _max])
-                            axis_dict['ranges'] = ranges
-
-                            # Now that 'axis_dict' contains all the appropriate
-                            # information for the current axis, append it to the 'axes' list.
-                            # There will end up being two axes in the 'axes' list, since the
-                            # histograms are 2D.
-                            axes.append(axis_dict)
-
-                        # Add the 'axes' list, containing both axes, to result.
-                        # At this point, you will see that the name of the key is the string
-                        # form of our axes list (str(axes)). This is there so that histograms
-                        # with different axis configs will not be combined.
-                        # These key names are later dropped when only the values are returned.
-                        result[str(axes)][histogram]['axes'] = axes
+                for histogram, data in dump['osd'].items():
+                    # There are two axes, since the histograms are 2D.
+                    axes = [self.get_histogram_axis(axis) for axis in data['axes']]
+                    config = str(axes)
+                    entry = result.setdefault(config, {}).setdefault(histogram, {'axes': axes})
 
+                    if mode == 'separated':
                         # Collect current values and make sure they are in
                         # integer form.
-                        values = []
-                        for value_list in dump['osd'][histogram]['values']:
-                            values.append([int(v) for v in value_list])
-
-                        if mode == 'separated':
-                            if 'osds' not in result[str(axes)][histogram]:
-                                result[str(axes)][histogram]['osds'] = []
-                            result[str(axes)][histogram]['osds'].append({'osd_id': int(osd_id), 'values': values})
+                        values = [[int(v) for v in value_list] for value_list in data['values']]
+                        entry.setdefault('osds', []).append({'osd_id': int(osd_id), 'values': values})
+                        continue
+
+                    rows = [len(value_list) for value_list in data['values']]
+                    flat = [int(v) for value_list in data['values'] for v in value_list]
+                    if (config, histogram) not in sums:
+                        sums[(config, histogram)] = (rows, flat)
+                        entry['num_combined_osds'] = 1
+                        continue
+                    sum_rows, sum_values = sums[(config, histogram)]
+                    if rows != sum_rows:
+                        self.log.error('Histogram {} of osd.{} has {} values, expected {}'.format(
+                            histogram, osd_id, rows, sum_rows))
+                        continue
+                    sum_values[:] = map(operator.add, sum_values, flat)
+                    entry['num_combined_osds'] += 1
+
+            # Sometimes, json errors occur if you give it an empty string.
+            # I am also putting in a catch for a KeyError since it could
+            # happen where the code is assuming that a key exists in the
+            # schema when it doesn't. In either case, we'll handle that
+            # by continuing and collecting what we can from other osds.
+            except (json.decoder.JSONDecodeError, KeyError) as e:
+                self.log.exception("Error caught on osd.{}: {}".format(osd_id, e))
+                continue
 
-                        elif mode == 'aggregated':
-                            # Aggregate values. If 'values' have already been initialized,
-                            # we can safely add.
-                            if 'values' in result[str(axes)][histogram]:
-                                for i in range (0, len(values)):
-                                    for j in range (0, len(values[i])):
-                                        values[i][j] += result[str(axes)][histogram]['values'][i][j]
-
-                            # Add the values to result.
-                            result[str(axes)][histogram]['values'] = values
-
-                            # Update num_combined_osds
-                            if 'num_combined_osds' not in result[str(axes)][histogram]:
-                                result[str(axes)][histogram]['num_combined_osds'] = 1
-                            else:
-                                result[str(axes)][histogram]['num_combined_osds'] += 1
-                        else:
-                            self.log.error('Incorrect mode specified in get_osd_histograms: {}'.format(mode))
-                            return list()
-
-                # Sometimes, json errors occur if you give it an empty string.
-                # I am also putting in a catch for a KeyError since it could
-                # happen where the code is assuming that a key exists in the
-                # schema when it doesn't. In either case, we'll handle that
-                # by continuing and collecting what we can from other osds.
-                except (json.decoder.JSONDecodeError, KeyError) as e:
-                    self.log.exception("Error caught on osd.{}: {}".format(osd_id, e))
-                    continue
+        # Split the sums back into rows
+        for (config, histogram), (rows, flat) in sums.items():
+            values = []
+            start = 0
+            for length in rows:
+                values.append(flat[start:start + length])
+                start += length
+            result[config][histogram]['values'] = values
 
         return list(result.values())
 
@@ -1028,349 +1066,385 @@ class Module(MgrModule):
             for option in ['description', 'contact', 'organization']:
                 report[option] = getattr(self, option)
 
-        if 'basic' in channels:
-            mon_map = self.get('mon_map')
-            osd_map = self.get('osd_map')
-            service_map = self.get('service_map')
-            fs_map = self.get('fs_map')
-            df = self.get('df')
-            df_pools = {pool['id']: pool for pool in df['pools']}
-
-            report['created'] = mon_map['created']
-
-            # mons
-            v1_mons = 0
-            v2_mons = 0
-            ipv4_mons = 0
-            ipv6_mons = 0
-            for mon in mon_map['mons']:
-                for a in mon['public_addrs']['addrvec']:
-                    if a['type'] == 'v2':
-                        v2_mons += 1
-                    elif a['type'] == 'v1':
-                        v1_mons += 1
-                    if a['addr'].startswith('['):
-                        ipv6_mons += 1
-                    else:
-                        ipv4_mons += 1
-            report['mon'] = {
-                'count': len(mon_map['mons']),
-                'features': mon_map['features'],
-                'min_mon_release': mon_map['min_mon_release'],
-                'v1_addr_mons': v1_mons,
-                'v2_addr_mons': v2_mons,
-                'ipv4_addr_mons': ipv4_mons,
-                'ipv6_addr_mons': ipv6_mons,
-            }
+        for channel, gather in [('basic', self.gather_basic),
+                                ('crash', self.gather_crash),
+                                ('perf', self.gather_perf)]:
+            if channel in channels:
+                report.update(self.get_channel_cached(channel, gather))
 
-            report['config'] = self.gather_configs()
-
-            # pools
-
-            rbd_num_pools = 0
-            rbd_num_images_by_pool = []
-            rbd_mirroring_by_pool = []
-            num_pg = 0
-            report['pools'] = list()
-            for pool in osd_map['pools']:
-                num_pg += pool['pg_num']
-                ec_profile = {}
-                if pool['erasure_code_profile']:
-                    orig = osd_map['erasure_code_profiles'].get(
-                        pool['erasure_code_profile'], {})
-                    ec_profile = {
-                        k: orig[k] for k in orig.keys()
-                        if k in ['k', 'm', 'plugin', 'technique',
-                                 'crush-failure-domain', 'l']
-                    }
-                pool_data = {
-                        'pool': pool['pool'],
-                        'pg_num': pool['pg_num'],
-                        'pgp_num': pool['pg_placement_num'],
-                        'size': pool['size'],
-                        'min_size': pool['min_size'],
-                        'pg_autoscale_mode': pool['pg_autoscale_mode'],
-                        'target_max_bytes': pool['target_max_bytes'],
-                        'target_max_objects': pool['target_max_objects'],
-                        'type': ['', 'replicated', '', 'erasure'][pool['type']],
-                        'erasure_code_profile': ec_profile,
-                        'cache_mode': pool['cache_mode'],
-                    }
-
-                # basic_pool_usage collection
-                if self.is_enabled_collection(Collection.basic_pool_usage):
-                    pool_data['application'] = []
-                    for application in pool['application_metadata']:
-                        # Only include default applications
-                        if application in ['cephfs', 'mgr', 'rbd', 'rgw']:
-                            pool_data['application'].append(application)
-                    pool_stats = df_pools[pool['pool']]['stats']
-                    pool_data['stats'] = { # filter out kb_used
-                                            'avail_raw': pool_stats['avail_raw'],
-                                            'bytes_used': pool_stats['bytes_used'],
-                                            'compress_bytes_used': pool_stats['compress_bytes_used'],
-                                            'compress_under_bytes': pool_stats['compress_under_bytes'],
-                                            'data_bytes_used': pool_stats['data_bytes_used'],
-                                            'dirty': pool_stats['dirty'],
-                                            'max_avail': pool_stats['max_avail'],
-                                            'objects': pool_stats['objects'],
-                                            'omap_bytes_used': pool_stats['omap_bytes_used'],
-                                            'percent_used': pool_stats['percent_used'],
-                                            'quota_bytes': pool_stats['quota_bytes'],
-                                            'quota_objects': pool_stats['quota_objects'],
-                                            'rd': pool_stats['rd'],
-                                            'rd_bytes': pool_stats['rd_bytes'],
-                                            'stored': pool_stats['stored'],
-                                            'stored_data': pool_stats['stored_data'],
-                                            'stored_omap': pool_stats['stored_omap'],
-                                            'stored_raw': pool_stats['stored_raw'],
-                                            'wr': pool_stats['wr'],
-                                            'wr_bytes': pool_stats['wr_bytes']
-                        }
-                    pool_data['options'] = {}
-                    # basic_pool_options_bluestore collection
-                    if self.is_enabled_collection(Collection.basic_pool_options_bluestore):
-                        bluestore_options = ['compression_algorithm',
-                                             'compression_mode',
-                                             'compression_required_ratio',
-                                             'compression_min_blob_size',
-                                             'compression_max_blob_size']
-                        for option in bluestore_options:
-                            if option in pool['options']:
-                                pool_data['options'][option] = pool['options'][option]
-
-                # basic_pool_flags collection
-                if self.is_enabled_collection(Collection.basic_pool_flags):
-                    if 'flags_names' in pool and pool['flags_names'] is not None:
-                        # flags are defined in pg_pool_t (src/osd/osd_types.h)
-                        flags_to_report = [
-                            'hashpspool',
-                            'full',
-                            'ec_overwrites',
-                            'incomplete_clones',
-                            'nodelete',
-                            'nopgchange',
-                            'nosizechange',
-                            'write_fadvise_dontneed',
-                            'noscrub',
-                            'nodeep-scrub',
-                            'full_quota',
-                            'nearfull',
-                            'backfillfull',
-                            'selfmanaged_snaps',
-                            'pool_snaps',
-                            'creating',
-                            'eio',
-                            'bulk',
-                            'crimson',
-                            'ec_optimizations',
-                            ]
-
-                        pool_data['flags_names'] = [flag for flag in pool['flags_names'].split(',') if flag in flags_to_report]
-
-                cast(List[Dict[str, Any]], report['pools']).append(pool_data)
-
-                if 'rbd' in pool['application_metadata']:
-                    rbd_num_pools += 1
-                    ioctx = self.rados.open_ioctx(pool['pool_name'])
-                    rbd_num_images_by_pool.append(
-                        sum(1 for _ in rbd.RBD().list2(ioctx)))
-                    rbd_mirroring_by_pool.append(
-                        rbd.RBD().mirror_mode_get(ioctx) != rbd.RBD_MIRROR_MODE_DISABLED)
-            report['rbd'] = {
-                'num_pools': rbd_num_pools,
-                'num_images_by_pool': rbd_num_images_by_pool,
-                'mirroring_by_pool': rbd_mirroring_by_pool}
-
-            # osds
-            cluster_network = False
-            for osd in osd_map['osds']:
-                if osd['up'] and not cluster_network:
-                    front_ip = osd['public_addrs']['addrvec'][0]['addr'].split(':')[0]
-                    back_ip = osd['cluster_addrs']['addrvec'][0]['addr'].split(':')[0]
-                    if front_ip != back_ip:
-                        cluster_network = True
-            report['osd'] = {
-                'count': len(osd_map['osds']),
-                'require_osd_release': osd_map['require_osd_release'],
-                'require_min_compat_client': osd_map['require_min_compat_client'],
-                'cluster_network': cluster_network,
-            }
+        # NOTE: We do not include the 'device' channel in this report; it is
+        # sent to a different endpoint.
 
-            # crush
-            report['crush'] = self.gather_crush_info()
+        return report
 
-            # cephfs
-            report['fs'] = {
-                'count': len(fs_map['filesystems']),
-                'feature_flags': fs_map['feature_flags'],
-                'num_standby_mds': len(fs_map['standbys']),
-                'filesystems': [],
-            }
-            num_mds = len(fs_map['standbys'])
-            for fsm in fs_map['filesystems']:
-                fs = fsm['mdsmap']
-                num_sessions = 0
-                cached_ino = 0
-                cached_dn = 0
-                cached_cap = 0
-                subtrees = 0
-                rfiles = 0
-                rbytes = 0
-                rsnaps = 0
-                for gid, mds in fs['info'].items():
-                    num_sessions += self.get_unlabeled_counter_latest('mds', mds['name'],
-                                                    'mds_sessions.session_count')
-                    cached_ino += self.get_unlabeled_counter_latest('mds', mds['name'],
-                                                  'mds_mem.ino')
-                    cached_dn += self.get_unlabeled_counter_latest('mds', mds['name'],
-                                                 'mds_mem.dn')
-                    cached_cap += self.get_unlabeled_counter_latest('mds', mds['name'],
-                                                  'mds_mem.cap')
-                    subtrees += self.get_unlabeled_counter_latest('mds', mds['name'],
-                                                'mds.subtrees')
-                    if mds['rank'] == 0:
-                        rfiles = self.get_unlabeled_counter_latest('mds', mds['name'],
-                                                 'mds.root_rfiles')
-                        rbytes = self.get_unlabeled_counter_latest('mds', mds['name'],
-                                                 'mds.root_rbytes')
-                        rsnaps = self.get_unlabeled_counter_latest('mds', mds['name'],
-                                                 'mds.root_rsnaps')
-                report['fs']['filesystems'].append({  # type: ignore
-                    'max_mds': fs['max_mds'],
-                    'ever_allowed_features': fs['ever_allowed_features'],
-                    'explicitly_allowed_features': fs['explicitly_allowed_features'],
-                    'num_in': len(fs['in']),
-                    'num_up': len(fs['up']),
-                    'num_standby_replay': len(
-                        [mds for gid, mds in fs['info'].items()
-                         if mds['state'] == 'up:standby-replay']),
-                    'num_mds': len(fs['info']),
-                    'num_sessions': num_sessions,
-                    'cached_inos': cached_ino,
-                    'cached_dns': cached_dn,
-                    'cached_caps': cached_cap,
-                    'cached_subtrees': subtrees,
-                    'balancer_enabled': len(fs['balancer']) > 0,
-                    'num_data_pools': len(fs['data_pools']),
-                    'standby_count_wanted': fs['standby_count_wanted'],
-                    'approx_ctime': fs['created'][0:7],
-                    'files': rfiles,
-                    'bytes': rbytes,
-                    'snaps': rsnaps,
-                })
-                num_mds += len(fs['info'])
-            report['fs']['total_num_mds'] = num_mds  # type: ignore
-
-            # daemons
-            report['metadata'] = dict(osd=self.gather_osd_metadata(osd_map),
-                                      mon=self.gather_mon_metadata(mon_map))
-
-            if self.is_enabled_collection(Collection.basic_mds_metadata):
-                report['metadata']['mds'] = self.gather_mds_metadata()  # type: ignore
-
-            # host counts
-            servers = self.list_servers()
-            self.log.debug('servers %s' % servers)
-            hosts = {
-                'num': len([h for h in servers if h['hostname']]),
-            }
-            for t in ['mon', 'mds', 'osd', 'mgr']:
-                nr_services = sum(1 for host in servers if
-                                  any(service for service in cast(List[ServiceInfoT],
-                                                                  host['services'])
-                                      if service['type'] == t))
-                hosts['num_with_' + t] = nr_services
-            report['hosts'] = hosts
-
-            report['usage'] = {
-                'pools': len(df['pools']),
-                'pg_num': num_pg,
-                'total_used_bytes': df['stats']['total_used_bytes'],
-                'total_bytes': df['stats']['total_bytes'],
-                'total_avail_bytes': df['stats']['total_avail_bytes']
-            }
-            # basic_usage_by_class collection
-            if self.is_enabled_collection(Collection.basic_usage_by_class):
-                report['usage']['stats_by_class'] = {} # type: ignore
-                for device_class in df['stats_by_class']:
-                    if device_class in ['hdd', 'ssd', 'nvme']:
-                        report['usage']['stats_by_class'][device_class] = df['stats_by_class'][device_class] # type: ignore
-
-            services: DefaultDict[str, int] = defaultdict(int)
-            for key, value in service_map['services'].items():
-                services[key] += 1
-                if key == 'rgw':
-                    rgw = {}
-                    zones = set()
-                    zonegroups = set()
-                    frontends = set()
-                    count = 0
-                    d = value.get('daemons', dict())
-                    for k, v in d.items():
-                        if k == 'summary' and v:
-                            rgw[k] = v
-                        elif isinstance(v, dict) and 'metadata' in v:
-                            count += 1
-                            zones.add(v['metadata']['zone_id'])
-                            zonegroups.add(v['metadata']['zonegroup_id'])
-                            frontends.add(v['metadata']['frontend_type#0'])
-
-                            # we could actually iterate over all the keys of
-                            # the dict and check for how many frontends there
-                            # are, but it is unlikely that one would be running
-                            # more than 2 supported ones
-                            f2 = v['metadata'].get('frontend_type#1', None)
-                            if f2:
-                                frontends.add(f2)
-
-                    rgw['count'] = count
-                    rgw['zones'] = len(zones)
-                    rgw['zonegroups'] = len(zonegroups)
-                    rgw['frontends'] = list(frontends)  # sets aren't json-serializable
-                    report['rgw'] = rgw
-            report['services'] = services
+    def gather_basic(self) -> Dict[str, Any]:
+        report: Dict[str, Any] = {}
+        mon_map = self.get('mon_map')
+        osd_map = self.get('osd_map')
+        service_map = self.get('service_map')
+        fs_map = self.get('fs_map')
+        df = self.get('df')
+        df_pools = {pool['id']: pool for pool in df['pools']}
+
+        report['created'] = mon_map['created']
+
+        # mons
+        v1_mons = 0
+        v2_mons = 0
+        ipv4_mons = 0
+        ipv6_mons = 0
+        for mon in mon_map['mons']:
+            for a in mon['public_addrs']['addrvec']:
+                if a['type'] == 'v2':
+                    v2_mons += 1
+                elif a['type'] == 'v1':
+                    v1_mons += 1
+                if a['addr'].startswith('['):
+                    ipv6_mons += 1
+                else:
+                    ipv4_mons += 1
+        report['mon'] = {
+            'count': len(mon_map['mons']),
+            'features': mon_map['features'],
+            'min_mon_release': mon_map['min_mon_release'],
+            'v1_addr_mons': v1_mons,
+            'v2_addr_mons': v2_mons,
+            'ipv4_addr_mons': ipv4_mons,
+            'ipv6_addr_mons': ipv6_mons,
+        }
 
-            try:
-                report['balancer'] = self.remote('balancer', 'gather_telemetry')
-            except ImportError:
-                report['balancer'] = {
-                    'active': False
+        report['config'] = self.gather_configs()
+
+        # pools
+
+        rbd_num_pools = 0
+        rbd_num_images_by_pool = []
+        rbd_mirroring_by_pool = []
+        num_pg = 0
+        report['pools'] = list()
+        for pool in osd_map['pools']:
+            num_pg += pool['pg_num']
+            ec_profile = {}
+            if pool['erasure_code_profile']:
+                orig = osd_map['erasure_code_profiles'].get(
+                    pool['erasure_code_profile'], {})
+                ec_profile = {
+                    k: orig[k] for k in orig.keys()
+                    if k in ['k', 'm', 'plugin', 'technique',
+                             'crush-failure-domain', 'l']
                 }
-
-            # Rook
-            self.get_rook_data(report)
-
-            # Stretch Mode
-            if self.is_enabled_collection(Collection.basic_stretch_cluster):
-                stretch_mode = osd_map.get("stretch_mode", {})
-                report['stretch_cluster'] = {
-                    'stretch_mode_enabled': stretch_mode.get("stretch_mode_enabled", {}),
-                    'stretch_bucket_count': stretch_mode.get("stretch_bucket_count", {}),
-                    'degraded_stretch_mode': stretch_mode.get("degraded_stretch_mode", {}),
-                    'recovering_stretch_mode': stretch_mode.get("recovering_stretch_mode", {}),
-                    'stretch_mode_bucket': stretch_mode.get("stretch_mode_bucket", {}),
+            pool_data = {
+                    'pool': pool['pool'],
+                    'pg_num': pool['pg_num'],
+                    'pgp_num': pool['pg_placement_num'],
+                    'size': pool['size'],
+                    'min_size': pool['min_size'],
+                    'pg_autoscale_mode': pool['pg_autoscale_mode'],
+                    'target_max_bytes': pool['target_max_bytes'],
+                    'target_max_objects': pool['target_max_objects'],
+                    'type': ['', 'replicated', '', 'erasure'][pool['type']],
+                    'erasure_code_profile': ec_profile,
+                    'cache_mode': pool['cache_mode'],
                 }
 
-        if 'crash' in channels:
-            report['crashes'] = self.gather_crashinfo()
+            # basic_pool_usage collection
+            if self.is_enabled_collection(Collection.basic_pool_usage):
+                pool_data['application'] = []
+                for application in pool['application_metadata']:
+                    # Only include default applications
+                    if application in ['cephfs', 'mgr', 'rbd', 'rgw']:
+                        pool_data['application'].append(application)
+                pool_stats = df_pools[pool['pool']]['stats']
+                pool_data['stats'] = { # filter out kb_used
+                                        'avail_raw': pool_stats['avail_raw'],
+                                        'bytes_used': pool_stats['bytes_used'],
+                                        'compress_bytes_used': pool_stats['compress_bytes_used'],
+                                        'compress_under_bytes': pool_stats['compress_under_bytes'],
+                                        'data_bytes_used': pool_stats['data_bytes_used'],
+                                        'dirty': pool_stats['dirty'],
+                                        'max_avail': pool_stats['max_avail'],
+                                        'objects': pool_stats['objects'],
+                                        'omap_bytes_used': pool_stats['omap_bytes_used'],
+                                        'percent_used': pool_stats['percent_used'],
+                                        'quota_bytes': pool_stats['quota_bytes'],
+                                        'quota_objects': pool_stats['quota_objects'],
+                                        'rd': pool_stats['rd'],
+                                        'rd_bytes': pool_stats['rd_bytes'],
+                                        'stored': pool_stats['stored'],
+                                        'stored_data': pool_stats['stored_data'],
+                                        'stored_omap': pool_stats['stored_omap'],
+                                        'stored_raw': pool_stats['stored_raw'],
+                                        'wr': pool_stats['wr'],
+                                        'wr_bytes': pool_stats['wr_bytes']
+                    }
+                pool_data['options'] = {}
+                # basic_pool_options_bluestore collection
+                if self.is_enabled_collection(Collection.basic_pool_options_bluestore):
+                    bluestore_options = ['compression_algorithm',
+                                         'compression_mode',
+                                         'compression_required_ratio',
+                                         'compression_min_blob_size',
+                                         'compression_max_blob_size']
+                    for option in bluestore_options:
+                        if option in pool['options']:
+                            pool_data['options'][option] = pool['options'][option]
+
+            # basic_pool_flags collection
+            if self.is_enabled_collection(Collection.basic_pool_flags):
+                if 'flags_names' in pool and pool['flags_names'] is not None:
+                    # flags are defined in pg_pool_t (src/osd/osd_types.h)
+                    flags_to_report = [
+                        'hashpspool',
+                        'full',
+                        'ec_overwrites',
+                        'incomplete_clones',
+                        'nodelete',
+                        'nopgchange',
+                        'nosizechange',
+                        'write_fadvise_dontneed',
+                        'noscrub',
+                        'nodeep-scrub',
+                        'full_quota',
+                        'nearfull',
+                        'backfillfull',
+                        'selfmanaged_snaps',
+                        'pool_snaps',
+                        'creating',
+                        'eio',
+                        'bulk',
+                        'crimson',
+                        'ec_optimizations',
+                        ]
+
+                    pool_data['flags_names'] = [flag for flag in pool['flags_names'].split(',') if flag in flags_to_report]
+
+            cast(List[Dict[str, Any]], report['pools']).append(pool_data)
+
+            if 'rbd' in pool['application_metadata']:
+                rbd_num_pools += 1
+                ioctx = self.rados.open_ioctx(pool['pool_name'])
+                rbd_num_images_by_pool.append(
+                    sum(1 for _ in rbd.RBD().list2(ioctx)))
+                rbd_mirroring_by_pool.append(
+                    rbd.RBD().mirror_mode_get(ioctx) != rbd.RBD_MIRROR_MODE_DISABLED)
+        report['rbd'] = {
+            'num_pools': rbd_num_pools,
+            'num_images_by_pool': rbd_num_images_by_pool,
+            'mirroring_by_pool': rbd_mirroring_by_pool}
+
+        # osds
+        cluster_network = False
+        for osd in osd_map['osds']:
+            if osd['up'] and not cluster_network:
+                front_ip = osd['public_addrs']['addrvec'][0]['addr'].split(':')[0]
+                back_ip = osd['cluster_addrs']['addrvec'][0]['addr'].split(':')[0]
+                if front_ip != back_ip:
+                    cluster_network = True
+        report['osd'] = {
+            'count': len(osd_map['osds']),
+            'require_osd_release': osd_map['require_osd_release'],
+            'require_min_compat_client': osd_map['require_min_compat_client'],
+            'cluster_network': cluster_network,
+        }
 
-        if 'perf' in channels:
-            if self.is_enabled_collection(Collection.perf_perf):
-                report['perf_counters'] = self.gather_perf_counters('separated')
-                report['stats_per_pool'] = self.get_stats_per_pool()
-                report['stats_per_pg'] = self.get_stats_per_pg()
-                report['io_rate'] = self.get_io_rate()
-                report['osd_perf_histograms'] = self.get_osd_histograms('separated')
-                report['mempool'] = self.get_mempool('separated')
-                report['heap_stats'] = self.get_heap_stats()
-                report['rocksdb_stats'] = self.get_rocksdb_stats()
+        # crush
+        report['crush'] = self.gather_crush_info()
 
-        # NOTE: We do not include the 'device' channel in this report; it is
-        # sent to a different endpoint.
+        # cephfs
+        report['fs'] = {
+            'count': len(fs_map['filesystems']),
+            'feature_flags': fs_map['feature_flags'],
+            'num_standby_mds': len(fs_map['standbys']),
+            'filesystems': [],
+        }
+        num_mds = len(fs_map['standbys'])
+        for fsm in fs_map['filesystems']:
+            fs = fsm['mdsmap']
+            num_sessions = 0
+            cached_ino = 0
+            cached_dn = 0
+            cached_cap = 0
+            subtrees = 0
+            rfiles = 0
+            rbytes = 0
+            rsnaps = 0
+            for gid, mds in fs['info'].items():
+                num_sessions += self.get_unlabeled_counter_latest('mds', mds['name'],
+                                                'mds_sessions.session_count')
+                cached_ino += self.get_unlabeled_counter_latest('mds', mds['name'],
+                                              'mds_mem.ino')
+                cached_dn += self.get_unlabeled_counter_latest('mds', mds['name'],
+                                             'mds_mem.dn')
+                cached_cap += self.get_unlabeled_counter_latest('mds', mds['name'],
+                                              'mds_mem.cap')
+                subtrees += self.get_unlabeled_counter_latest('mds', mds['name'],
+                                            'mds.subtrees')
+                if mds['rank'] == 0:
+                    rfiles = self.get_unlabeled_counter_latest('mds', mds['name'],
+                                             'mds.root_rfiles')
+                    rbytes = self.get_unlabeled_counter_latest('mds', mds['name'],
+                                             'mds.root_rbytes')
+                    rsnaps = self.get_unlabeled_counter_latest('mds', mds['name'],
+                                             'mds.root_rsnaps')
+            report['fs']['filesystems'].append({  # type: ignore
+                'max_mds': fs['max_mds'],
+                'ever_allowed_features': fs['ever_allowed_features'],
+                'explicitly_allowed_features': fs['explicitly_allowed_features'],
+                'num_in': len(fs['in']),
+                'num_up': len(fs['up']),
+                'num_standby_replay': len(
+                    [mds for gid, mds in fs['info'].items()
+                     if mds['state'] == 'up:standby-replay']),
+                'num_mds': len(fs['info']),
+                'num_sessions': num_sessions,
+                'cached_inos': cached_ino,
+                'cached_dns': cached_dn,
+                'cached_caps': cached_cap,
+                'cached_subtrees': subtrees,
+                'balancer_enabled': len(fs['balancer']) > 0,
+                'num_data_pools': len(fs['data_pools']),
+                'standby_count_wanted': fs['standby_count_wanted'],
+                'approx_ctime': fs['created'][0:7],
+                'files': rfiles,
+                'bytes': rbytes,
+                'snaps': rsnaps,
+            })
+            num_mds += len(fs['info'])
+        report['fs']['total_num_mds'] = num_mds  # type: ignore
+
+        # daemons
+        report['metadata'] = dict(osd=self.gather_osd_metadata(osd_map),
+                                  mon=self.gather_mon_metadata(mon_map))
+
+        if self.is_enabled_collection(Collection.basic_mds_metadata):
+            report['metadata']['mds'] = self.gather_mds_metadata()  # type: ignore
+
+        # host counts
+        servers = self.list_servers()
+        self.log.debug('servers %s' % servers)
+        hosts = {
+            'num': len([h for h in servers if h['hostname']]),
+        }
+        for t in ['mon', 'mds', 'osd', 'mgr']:
+            nr_services = sum(1 for host in servers if
+                              any(service for service in cast(List[ServiceInfoT],
+                                                              host['services'])
+                                  if service['type'] == t))
+            hosts['num_with_' + t] = nr_services
+        report['hosts'] = hosts
+
+        report['usage'] = {
+            'pools': len(df['pools']),
+            'pg_num': num_pg,
+            'total_used_bytes': df['stats']['total_used_bytes'],
+            'total_bytes': df['stats']['total_bytes'],
+            'total_avail_bytes': df['stats']['total_avail_bytes']
+        }
+        # basic_usage_by_class collection
+        if self.is_enabled_collection(Collection.basic_usage_by_class):
+            report['usage']['stats_by_class'] = {} # type: ignore
+            for device_class in df['stats_by_class']:
+                if device_class in ['hdd', 'ssd', 'nvme']:
+                    report['usage']['stats_by_class'][device_class] = df['stats_by_class'][device_class] # type: ignore
+
+        services: DefaultDict[str, int] = defaultdict(int)
+        for key, value in service_map['services'].items():
+            services[key] += 1
+            if key == 'rgw':
+                rgw = {}
+                zones = set()
+                zonegroups = set()
+                frontends = set()
+                count = 0
+                d = value.get('daemons', dict())
+                for k, v in d.items():
+                    if k == 'summary' and v:
+                        rgw[k] = v
+                    elif isinstance(v, dict) and 'metadata' in v:
+                        count += 1
+                        zones.add(v['metadata']['zone_id'])
+                        zonegroups.add(v['metadata']['zonegroup_id'])
+                        frontends.add(v['metadata']['frontend_type#0'])
+
+                        # we could actually iterate over all the keys of
+                        # the dict and check for how many frontends there
+                        # are, but it is unlikely that one would be running
+                        # more than 2 supported ones
+                        f2 = v['metadata'].get('frontend_type#1', None)
+                        if f2:
+                            frontends.add(f2)
+
+                rgw['count'] = count
+                rgw['zones'] = len(zones)
+                rgw['zonegroups'] = len(zonegroups)
+                rgw['frontends'] = list(frontends)  # sets aren't json-serializable
+                report['rgw'] = rgw
+        report['services'] = services
 
+        try:
+            report['balancer'] = self.remote('balancer', 'gather_telemetry')
+        except ImportError:
+            report['balancer'] = {
+                'active': False
+            }
+
+        # Rook
+        self.get_rook_data(report)
+
+        # Stretch Mode
+        if self.is_enabled_collection(Collection.basic_stretch_cluster):
+            stretch_mode = osd_map.get("stretch_mode", {})
+            report['stretch_cluster'] = {
+                'stretch_mode_enabled': stretch_mode.get("stretch_mode_enabled", {}),
+                'stretch_bucket_count': stretch_mode.get("stretch_bucket_count", {}),
+                'degraded_stretch_mode': stretch_mode.get("degraded_stretch_mode", {}),
+                'recovering_stretch_mode': stretch_mode.get("recovering_stretch_mode", {}),
+                'stretch_mode_bucket': stretch_mode.get("stretch_mode_bucket", {}),
+            }
+
+        return report
+
+    def gather_crash(self) -> Dict[str, Any]:
+        return {'crashes': self.gather_crashinfo()}
+
+    def gather_perf(self) -> Dict[str, Any]:
+        report: Dict[str, Any] = {}
+        if self.is_enabled_collection(Collection.perf_perf):
+            report['perf_counters'] = self.gather_perf_counters('separated')
+            report['stats_per_pool'] = self.get_stats_per_pool()
+            report['stats_per_pg'] = self.get_stats_per_pg()
+            report['io_rate'] = self.get_io_rate()
+            report['osd_perf_histograms'] = self.get_osd_histograms('separated')
+            report['mempool'] = self.get_mempool('separated')
+            report['heap_stats'] = self.get_heap_stats()
+            report['rocksdb_stats'] = self.get_rocksdb_stats()
         return report
 
+    def get_channel_cached(self, channel: str, gather: Callable[[], T]) -> T:
+        """
+        The data ``gather`` returns for ``channel``, reused for
+        ``report_cache_ttl`` seconds as long as the collections opted-in
+        to for the channel stay the same.
+
+        :return: a copy the caller may modify
+        """
+        collections = tuple(c['name'].name for c in MODULE_COLLECTION
+                            if c['channel'] == channel and self.is_enabled_collection(c['name']))
+        key = (channel, collections)
+        now = time.monotonic()
+        cached = self.channel_cache.get(key)
+        if cached and now - cached[0] < self.report_cache_ttl:
+            self.log.debug('Reusing the %s channel gathered %.0fs ago', channel, now - cached[0])
+            data = cached[1]
+        else:
+            data = gather()
+            for k in [k for k, v in self.channel_cache.items()
+                      if now - v[0] >= self.report_cache_ttl]:
+                del self.channel_cache[k]
+            if self.report_cache_ttl:
+                self.channel_cache[key] = (now, data)
+        return copy.deepcopy(data)
+
     def get_rook_data(self, report: Dict[str, object]) -> None:
         r, outb, outs = self.mon_command({
             'prefix': 'config-key dump',
@@ -1586,7 +1660,7 @@ class Module(MgrModule):
                     self.log.info('Sent report to {0}'.format(self.url))
             elif e == self.EndPoint.device:
                 if 'device' in self.get_active_channels():
-                    devices = self.gather_device_report()
+                    devices = self.get_channel_cached('device', self.gather_device_report)
                     if devices:
                         num_devs = 0
                         num_hosts = 0
@@ -2068,10 +2142,11 @@ Please consider enabling the telemetry module with 'ceph telemetry on'.'''
         if report_type == 'default':
             return self.compile_report(channels=channels)
         elif report_type == 'device':
-            return self.gather_device_report()
+            return self.get_channel_cached('device', self.gather_device_report)
         elif report_type == 'all':
             return {'report': self.compile_report(channels=channels),
-                    'device_report': self.gather_device_report()}
+                    'device_report': self.get_channel_cached('device',
+                                                             self.gather_device_report)}
         return {}
 
     def self_test(self) -> None:
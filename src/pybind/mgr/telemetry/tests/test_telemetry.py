@@ -119,3 +119,73 @@ class TestTelemetry:
         assert m.is_opted_in() == expected['is_opted_in']
         assert m.is_enabled_collection(Collection.basic_base) == expected['is_enabled_collection']['basic_base']
         assert m.is_enabled_collection(Collection.basic_mds_metadata) == expected['is_enabled_collection']['basic_mds_metadata']
+
+    def test_tell_daemons(self) -> None:
+        m = telemetry.Module('telemetry', '', '')
+        m.gather_concurrency = 2
+        m.gather_timeout = 0
+        in_flight: List[Any] = []
+        max_in_flight = 0
+
+        def send_command(result, daemon_type, daemon_id, cmd, tag, inbuf=None):
+            nonlocal max_in_flight
+            in_flight.append(result)
+            max_in_flight = max(max_in_flight, len(in_flight))
+            if daemon_id != '3':
+                # answered right away, unlike osd.3
+                result.complete(0, daemon_id, '')
+
+        def wait(result, timeout=None):
+            in_flight.remove(result)
+            return wait.orig(result, timeout)
+
+        wait.orig = telemetry.module.CommandResult.wait
+        with mock.patch.object(m, 'send_command', side_effect=send_command), \
+                mock.patch.object(telemetry.module.CommandResult, 'wait', autospec=True,
+                                  side_effect=wait):
+            replies = list(m.tell_daemons([('osd', str(i), {'prefix': 'x'})
+                                           for i in range(5)]))
+
+        assert max_in_flight == 2
+        assert [r[1] for r in replies] == ['0', '1', '2', '', '4']
+        assert replies[3][0] == -telemetry.module.errno.ETIMEDOUT
+
+    def test_osd_histograms_aggregated(self) -> None:
+        m = telemetry.Module('telemetry', '', '')
+        axes = [{'buckets': 2, 'min': 0, 'name': 'n', 'quant_size': 1, 'scale_type': 'linear',
+                 'ranges': [{'max': 0}, {'min': 1}]}] * 2
+        dumps = {
+            '0': {'osd': {'op_r': {'axes': axes, 'values': [[1, 2], [3, 4]]}}},
+            '1': {'osd': {'op_r': {'axes': axes, 'values': [[10, 20], [30, 40]]}}},
+        }
+        m.get = mock.Mock(return_value={'0': {}, '1': {}})
+        with mock.patch.object(m, 'tell_daemons',
+                               side_effect=lambda targets: iter(
+                                   (0, json.dumps(dumps[t[1]]), '') for t in targets)):
+            result = m.get_osd_histograms('aggregated')
+
+        assert len(result) == 1
+        assert result[0]['op_r']['values'] == [[11, 22], [33, 44]]
+        assert result[0]['op_r']['num_combined_osds'] == 2
+        assert result[0]['op_r']['axes'][0]['ranges'] == [[None, 0], [1, None]]
+
+    def test_channel_cache(self) -> None:
+        m = telemetry.Module('telemetry', '', '')
+        m.db_collection = ['perf_perf']
+        m.report_cache_ttl = 60
+        gather = mock.Mock(return_value={'data': [1]})
+
+        first = m.get_channel_cached('perf', gather)
+        first['data'].append(2)
+        assert m.get_channel_cached('perf', gather) == {'data': [1]}
+        assert gather.call_count == 1
+
+        # other collections are gathered on their own
+        m.db_collection = ['perf_perf', 'perf_memory_metrics']
+        m.get_channel_cached('perf', gather)
+        assert gather.call_count == 2
+
+        m.report_cache_ttl = 0
+        m.get_channel_cached('perf', gather)
+        m.get_channel_cached('perf', gather)
+        assert gather.call_count == 4
@@ -100,6 +100,15 @@ if 'UNITTEST' in os.environ:
         def _ceph_get(self, data_name):
             return self.mock_store_get('_ceph_get', data_name, mock.MagicMock())
 
+        def _ceph_get_data_version(self, data_name):
+            return self.mock_store_get('_ceph_get_data_version', data_name, 0)
+
+        def _ceph_get_versioned(self, data_name, known_version):
+            version = self._ceph_get_data_version(data_name)
+            if version and version == known_version:
+                return version, None
+            return version, self._ceph_get(data_name)
+
         def _ceph_send_command(self, res, svc_type, svc_id, command, tag, inbuf, *, one_shot=False):
 
             cmd = json.loads(command)
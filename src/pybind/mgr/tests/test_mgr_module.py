@@ -0,0 +1,165 @@
+import errno
+import threading
+from array import array
+
+from tests import mock
+from mgr_module import CommandResult, MgrModule
+
+
+def _bulk(schema_version, daemons, schema, values, counts, present=None):
+    def bulk(svc_type, prio_limit, known_schema_version):
+        data = {
+            'schema_version': schema_version,
+            'daemons': daemons,
+            'values': array('q', values).tobytes(),
+            'counts': array('q', counts).tobytes(),
+            'present': bytes(present or [1] * len(values)),
+        }
+        if known_schema_version != schema_version:
+            data['schema'] = schema
+        return data
+    return mock.MagicMock(side_effect=bulk)
+
+
+SCHEMA = [
+    ('osd.op_r', 'Client read operations', '', 10, 8, 1),
+    ('osd.op_r_latency', 'Latency of read operation', 'r_lat', 5, 8, 1),
+]
+
+
+class TestPerfCounterSnapshot:
+
+    def setup_method(self):
+        self.mgr = MgrModule('test', None, None)
+
+    def test_snapshot(self):
+        self.mgr._ceph_get_unlabeled_perf_counters_bulk = _bulk(
+            7, ['0', '1'], SCHEMA, [10, 200, 20, 400], [0, 2, 0, 4])
+        snapshot = self.mgr.get_unlabeled_perf_counters_snapshot(services=('osd',))['osd']
+        assert snapshot.schema_version == 7
+        assert snapshot.paths == ['osd.op_r', 'osd.op_r_latency']
+        assert snapshot.schema[1] == {'description': 'Latency of read operation',
+                                      'nick': 'r_lat', 'type': 5, 'priority': 8, 'units': 1}
+        assert list(snapshot.counters(1)) == [
+            ('osd.op_r', snapshot.schema[0], 20, 0),
+            ('osd.op_r_latency', snapshot.schema[1], 400, 4),
+        ]
+
+    def test_schema_is_reused(self):
+        bulk = _bulk(7, ['0'], SCHEMA, [10, 200], [0, 2])
+        self.mgr._ceph_get_unlabeled_perf_counters_bulk = bulk
+        first = self.mgr.get_unlabeled_perf_counters_snapshot(services=('osd',))['osd']
+        second = self.mgr.get_unlabeled_perf_counters_snapshot(services=('osd',))['osd']
+        assert bulk.call_args_list[0][0] == ('osd', MgrModule.PRIO_USEFUL, 0)
+        assert bulk.call_args_list[1][0] == ('osd', MgrModule.PRIO_USEFUL, 7)
+        assert second.paths is first.paths
+
+    def test_unlabeled_perf_counters(self):
+        self.mgr._ceph_get_unlabeled_perf_counters_bulk = _bulk(
+            7, ['0'], SCHEMA, [10, 200], [0, 2])
+        counters = self.mgr.get_unlabeled_perf_counters(services=('osd',))
+        assert counters == {
+            'osd.0': {
+                'osd.op_r': {'description': 'Client read operations', 'type': 10,
+                             'priority': 8, 'units': 1, 'value': 10},
+                'osd.op_r_latency': {'description': 'Latency of read operation', 'nick': 'r_lat',
+                                     'type': 5, 'priority': 8, 'units': 1,
+                                     'value': 200, 'count': 2},
+            }
+        }
+
+    def test_absent_counters_are_skipped(self):
+        # osd.0 has no latency counter, osd.1 has no read counter
+        self.mgr._ceph_get_unlabeled_perf_counters_bulk = _bulk(
+            7, ['0', '1'], SCHEMA, [10, 0, 0, 400], [0, 0, 0, 4], [1, 0, 0, 1])
+        snapshot = self.mgr.get_unlabeled_perf_counters_snapshot(services=('osd',))['osd']
+        assert [c[0] for c in snapshot.counters(0)] == ['osd.op_r']
+        assert [c[0] for c in snapshot.counters(1)] == ['osd.op_r_latency']
+        counters = self.mgr.get_unlabeled_perf_counters(services=('osd',))
+        assert list(counters['osd.0']) == ['osd.op_r']
+        assert list(counters['osd.1']) == ['osd.op_r_latency']
+        assert counters['osd.1']['osd.op_r_latency']['count'] == 4
+
+
+class TestVersionedGet:
+
+    def setup_method(self):
+        self.mgr = MgrModule('test', None, None)
+        self.mgr._ceph_get = mock.MagicMock(return_value=b'{"epoch": 5}')
+
+    def _set_version(self, version):
+        self.mgr._ceph_get_data_version = mock.MagicMock(return_value=version)
+
+    def test_uncached(self):
+        self._set_version(5)
+        assert self.mgr.get('osd_map') == {'epoch': 5}
+        assert self.mgr.get('osd_map') == {'epoch': 5}
+        assert self.mgr._ceph_get.call_count == 2
+
+    def test_cached_same_version(self):
+        self._set_version(5)
+        first = self.mgr.get('osd_map', cached=True)
+        assert self.mgr.get('osd_map', cached=True) is first
+        assert self.mgr._ceph_get.call_count == 1
+
+    def test_cached_new_version(self):
+        self._set_version(5)
+        first = self.mgr.get('osd_map', cached=True)
+        self._set_version(6)
+        self.mgr._ceph_get.return_value = b'{"epoch": 6}'
+        second = self.mgr.get('osd_map', cached=True)
+        assert second == {'epoch': 6}
+        assert second is not first
+        assert self.mgr.get_version('osd_map') == 6
+
+    def test_cached_unversioned(self):
+        self._set_version(0)
+        self.mgr.get('health', cached=True)
+        self.mgr.get('health', cached=True)
+        assert self.mgr._ceph_get.call_count == 2
+        assert 'health' not in self.mgr._get_cache
+
+
+class TestSchemaUpgrade:
+
+    def setup_method(self):
+        self.mgr = MgrModule('test', None, None)
+        self.mgr.SCHEMA = ['CREATE TABLE B (x);']
+        self.mgr.SCHEMA_VERSIONED = [['CREATE TABLE A (x);'], ['CREATE TABLE B (x);']]
+        self.db = mock.MagicMock()
+        self.mgr.update_schema_version = mock.MagicMock()
+
+    def test_create(self):
+        self.mgr.maybe_upgrade(self.db, 0)
+        self.db.execute.assert_called_once_with('CREATE TABLE B (x);')
+        self.mgr.update_schema_version.assert_called_once_with(self.db, 2)
+
+    def test_upgrade(self):
+        self.mgr.maybe_upgrade(self.db, 1)
+        self.db.execute.assert_called_once_with('CREATE TABLE B (x);')
+        self.mgr.update_schema_version.assert_called_once_with(self.db, 2)
+
+    def test_latest(self):
+        self.mgr.maybe_upgrade(self.db, 2)
+        self.db.execute.assert_not_called()
+        self.mgr.update_schema_version.assert_not_called()
+
+
+class TestCommandResult:
+
+    def test_wait_returns_the_result(self):
+        result = CommandResult('')
+        threading.Timer(0.01, result.complete, (0, '{}', 'done')).start()
+        assert result.wait(10) == (0, '{}', 'done')
+
+    def test_wait_times_out(self):
+        result = CommandResult('')
+        r, outb, outs = result.wait(0.01)
+        assert r == -errno.ETIMEDOUT
+        assert outb == ''
+        assert 'timed out' in outs
+
+    def test_wait_without_timeout(self):
+        result = CommandResult('')
+        result.complete(-errno.ENOENT, '', 'no such daemon')
+        assert result.wait() == (-errno.ENOENT, '', 'no such daemon')